@@ -2,15 +2,18 @@ import os
 import json
 import argparse
 import sys
+from functools import lru_cache
 
 # 添加根目录到Python路径，以便导入根目录的api_call
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api_call import process_text
+from content_list import compact_blocks, load_section_blocks, restore_placeholders
 
 
+@lru_cache(maxsize=None)
 def load_config(config_path: str = None) -> dict:
     """
-    加载配置文件
+    加载配置文件（同一进程内只读取一次）
     """
     if config_path is None:
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,9 +26,10 @@ def load_config(config_path: str = None) -> dict:
     except Exception as e:
         raise Exception(f"加载配置文件失败: {str(e)}")
 
+@lru_cache(maxsize=None)
 def load_prompt_template(template_path: str) -> str:
     """
-    加载提示词模板
+    加载提示词模板（同一进程内每个模板只读取一次）
     """
     try:
         with open(template_path, 'r', encoding='utf-8') as f:
@@ -65,6 +69,32 @@ def save_result(result: str, markdown_path: str, model: str, output_dir: str) ->
     except Exception as e:
         raise Exception(f"保存结果到文件失败: {str(e)}")
 
+def build_prompt(markdown_path: str, prompt_template_path: str) -> str:
+    """
+    组合提示词模板和 Markdown 内容（交互式调用和批处理模式共用）
+
+    章节来自content_list时（旁边有 *_blocks.json），表格正文和公式以占位符代替，
+    模型只需划分文字，分割结果由 restore_result 还原。
+    """
+    prompt = load_prompt_template(prompt_template_path)
+    blocks = load_section_blocks(markdown_path)
+    if blocks:
+        content, _ = compact_blocks(blocks)
+    else:
+        content = load_markdown_content(markdown_path)
+    return f"{prompt}\n\n以下是需要划分的文本：\n\n{content}"
+
+def restore_result(result: str, markdown_path: str) -> str:
+    """把分割结果中的表格、公式占位符还原为原始内容（没有 *_blocks.json 时原样返回）"""
+    blocks = load_section_blocks(markdown_path)
+    if not blocks:
+        return result
+    _, placeholders = compact_blocks(blocks)
+    restored, missing = restore_placeholders(result, placeholders)
+    if missing:
+        print(f"[WARN]  分割结果中缺少 {len(missing)} 个占位符: {', '.join(missing)}")
+    return restored
+
 def process_markdown_with_prompt(markdown_path: str, prompt_template_path: str, api_key: str, output_dir: str, model: str = "gpt-4.5-preview") -> str:
     """
     处理 Markdown 文件内容
@@ -75,17 +105,11 @@ def process_markdown_with_prompt(markdown_path: str, prompt_template_path: str,
     5. 保存结果到文件
     """
     try:
-        # 加载提示词模板
-        prompt = load_prompt_template(prompt_template_path)
-        
-        # 加载 Markdown 内容
-        content = load_markdown_content(markdown_path)
-        
-        # 组合提示词和内容
-        combined_text = f"{prompt}\n\n以下是需要划分的文本：\n\n{content}"
+        # 加载提示词模板和 Markdown 内容并组合
+        combined_text = build_prompt(markdown_path, prompt_template_path)
         
         # 调用 API 处理文本
-        result = process_text(combined_text, api_key, model)
+        result = restore_result(process_text(combined_text, api_key, model), markdown_path)
         
         # 保存结果到文件
         output_file = save_result(result, markdown_path, model, output_dir)
@@ -147,6 +171,7 @@ def main():
         print(f"\n 分割结果已保存到: {output_file}")
     except Exception as e:
         print(f"[ERR] 分割失败: {str(e)}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
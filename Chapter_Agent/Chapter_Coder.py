@@ -1,16 +1,37 @@
 import os
+import re
 import json
 import argparse
 import sys
+from functools import lru_cache
 
 # 添加根目录到Python路径，以便导入根目录的api_call
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_call import process_text_with_images
+from api_call import process_text_with_images, stream_text_with_images
 
+# 代码前的说明文字（出现这些词的行在代码开始前会被跳过）
+PREAMBLE_KEYWORDS = ["这是", "以下是", "python代码", "代码实现", "实现代码"]
+# 流式模式下，代码的第一行出现这些内容说明模型在道歉或报错，而不是在输出代码
+NOT_CODE_PATTERN = re.compile(
+    r"(抱歉|对不起|很遗憾|无法(为你|为您|完成|生成|提供|处理)|错误[:：]|sorry|apolog|i can(?:'|no)t|i am unable|i'm unable|as an ai|error[:：])",
+    re.IGNORECASE
+)
+# 代码第一行应当是Python语句的开头
+PYTHON_START_PATTERN = re.compile(
+    r"^\s*(from\s|import\s|class\s|def\s|async\s|@|if\s|for\s|while\s|with\s|try:|\"\"\"|'''|[A-Za-z_][\w.]*\s*(=|\(|\[|:))"
+)
+MAX_PREAMBLE_CHARS = 2000  # 代码开始前允许的说明文字长度，超过则视为没有在输出代码
+EARLY_CHECK_CHARS = 40     # 代码开始前，未换行的内容累计到这个长度就提前校验，不必等到整行结束
 
+
+class CodeStreamAborted(Exception):
+    """流式输出明显不是Python代码，已提前终止"""
+
+
+@lru_cache(maxsize=None)
 def load_config(config_path: str = None) -> dict:
     """
-    加载配置文件
+    加载配置文件（同一进程内只读取一次）
     """
     if config_path is None:
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,9 +44,10 @@ def load_config(config_path: str = None) -> dict:
     except Exception as e:
         raise Exception(f"加载配置文件失败: {str(e)}")
 
+@lru_cache(maxsize=None)
 def load_prompt_template(template_path: str) -> str:
     """
-    加载提示词模板
+    加载提示词模板（同一进程内每个模板只读取一次）
     """
     try:
         with open(template_path, 'r', encoding='utf-8') as f:
@@ -48,8 +70,6 @@ def clean_code_result(result: str) -> str:
     清理模型返回的结果，确保是可执行的Python代码
     """
     # 处理可能的转义字符
-
-    print(result)
     if result.startswith('\\n'):
         result = result[2:]
     elif result.startswith('n'):
@@ -73,7 +93,7 @@ def clean_code_result(result: str) -> str:
     started = False
     
     for line in lines:
-        if not started and any(x in line.lower() for x in ["这是", "以下是", "python代码", "代码实现", "实现代码"]):
+        if not started and any(x in line.lower() for x in PREAMBLE_KEYWORDS):
             continue
         if line.strip() and not line.startswith('#'):
             started = True
@@ -90,6 +110,15 @@ def clean_code_result(result: str) -> str:
     
     return result.strip()
 
+def get_output_path(markdown_path: str, output_dir: str = None) -> str:
+    """
+    返回页面对应的代码文件路径，output_dir为None时使用默认的generated_code目录
+    """
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_code")
+    base_name = os.path.splitext(os.path.basename(markdown_path))[0]
+    return os.path.join(output_dir, f"{base_name}_code.py")
+
 def save_result(result: str, markdown_path: str, model: str, output_dir: str = None) -> str:
     """
     保存处理结果到Python文件
@@ -100,17 +129,9 @@ def save_result(result: str, markdown_path: str, model: str, output_dir: str = N
         output_dir: 输出目录路径，如果为None则使用默认的generated_code目录
     """
     try:
-        # 创建输出目录（如果不存在）
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        if output_dir is None:
-            output_dir = os.path.join(current_dir, "generated_code")
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 获取markdown文件名（不含扩展名）作为基础名
-        base_name = os.path.splitext(os.path.basename(markdown_path))[0]
-        
-        # 构建输出文件路径（使用.py扩展名）
-        output_file = os.path.join(output_dir, f"{base_name}_code.py")
+        # 构建输出文件路径（使用.py扩展名），并创建输出目录（如果不存在）
+        output_file = get_output_path(markdown_path, output_dir)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
         
         # 直接保存代码
         with open(output_file, 'w', encoding='utf-8') as f:
@@ -120,7 +141,99 @@ def save_result(result: str, markdown_path: str, model: str, output_dir: str = N
     except Exception as e:
         raise Exception(f"保存代码到文件失败: {str(e)}")
 
-def process_markdown_to_code(markdown_path: str, prompt_template_path: str, api_key: str, model: str = "gpt-4.5-preview", output_dir: str = None) -> str:
+def _check_first_code_line(line: str, complete: bool = True):
+    """
+    校验代码的第一行，明显不是Python时抛出CodeStreamAborted
+
+    complete为False表示这一行还没有接收完，只检查道歉/报错信息。
+    """
+    candidate = line[2:] if line.startswith('\\n') else line
+    if NOT_CODE_PATTERN.search(candidate):
+        raise CodeStreamAborted(f"模型输出的是说明或错误信息而不是代码: {line[:80]}")
+    if complete and not (PYTHON_START_PATTERN.match(candidate) or (candidate.startswith('n') and PYTHON_START_PATTERN.match(candidate[1:]))):
+        raise CodeStreamAborted(f"模型输出的开头不是Python代码: {line[:80]}")
+
+def write_code_stream(chunks, partial_path: str) -> str:
+    """
+    消费流式输出，边接收边去除markdown代码块标记并写入partial_path
+
+    代码开始前的空行、注释、说明文字和开头的```会被跳过；代码的第一行明显不是Python
+    （道歉、报错或大段说明文字）时立即关闭流并抛出CodeStreamAborted；遇到结尾的```后
+    不再继续接收，后面的解释文字不必再等待。
+
+    Returns:
+        str: 去除代码块标记和说明文字后的代码
+    """
+    code_lines = []
+    buffer = ""
+    started = False
+    preamble_chars = 0
+
+    def is_preamble(line):
+        stripped = line.strip()
+        if stripped.startswith("```") or not stripped or line.startswith('#') \
+                or any(x in line.lower() for x in PREAMBLE_KEYWORDS):
+            return True
+        # "Here is the code:" 之类以冒号结尾的引导语
+        return stripped.endswith((':', '：')) and not PYTHON_START_PATTERN.match(stripped)
+
+    def handle_line(line):
+        """处理一行，返回False表示代码已经结束"""
+        nonlocal started, preamble_chars
+        if not started:
+            if is_preamble(line):
+                preamble_chars += len(line)
+                if preamble_chars > MAX_PREAMBLE_CHARS:
+                    raise CodeStreamAborted("模型输出了大段说明文字而没有开始输出代码")
+                return True
+            _check_first_code_line(line)
+            started = True
+        elif line.strip().startswith("```"):
+            return False
+        code_lines.append(line)
+        partial_file.write(line + "\n")
+        partial_file.flush()
+        return True
+
+    os.makedirs(os.path.dirname(os.path.abspath(partial_path)), exist_ok=True)
+    try:
+        with open(partial_path, 'w', encoding='utf-8') as partial_file:
+            for chunk in chunks:
+                buffer += chunk
+                finished = False
+                while "\n" in buffer:
+                    line, buffer = buffer.split("\n", 1)
+                    if not handle_line(line):
+                        finished = True
+                        break
+                if finished:
+                    break
+                # 代码尚未开始且当前行已足够长时提前校验（道歉等内容往往是一整段不换行的文字）
+                if not started and len(buffer) >= EARLY_CHECK_CHARS:
+                    if preamble_chars + len(buffer) > MAX_PREAMBLE_CHARS:
+                        raise CodeStreamAborted("模型输出了大段说明文字而没有开始输出代码")
+                    if not is_preamble(buffer):
+                        _check_first_code_line(buffer, complete=False)
+            else:
+                if buffer:
+                    handle_line(buffer)
+    finally:
+        # 提前结束或中止时关闭HTTP流，不再接收剩余输出
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+    return "\n".join(code_lines)
+
+def build_prompt(markdown_path: str, prompt_template_path: str) -> str:
+    """
+    组合提示词模板和 Markdown 内容（交互式调用和批处理模式共用）
+    """
+    prompt = load_prompt_template(prompt_template_path)
+    content = load_markdown_content(markdown_path)
+    return f"{prompt}\n\n以下是需要转换为代码的文本：\n\n{content}"
+
+def process_markdown_to_code(markdown_path: str, prompt_template_path: str, api_key: str, model: str = "gpt-4.5-preview", output_dir: str = None, stream: bool = False) -> str:
     """
     处理 Markdown 文件内容并生成对应的Python代码
     1. 加载提示词模板
@@ -136,24 +249,27 @@ def process_markdown_to_code(markdown_path: str, prompt_template_path: str, api_
         api_key: API密钥
         model: 使用的模型名称
         output_dir: 输出目录路径
+        stream: 流式模式，边接收边写入 *_code.py.partial，输出明显不是代码时提前终止
     """
     try:
-        # 加载提示词模板
-        prompt = load_prompt_template(prompt_template_path)
-        
-        # 加载 Markdown 内容
-        content = load_markdown_content(markdown_path)
-        
-        # 组合提示词和内容
-        combined_text = f"{prompt}\n\n以下是需要转换为代码的文本：\n\n{content}"
+        # 加载提示词模板和 Markdown 内容并组合
+        combined_text = build_prompt(markdown_path, prompt_template_path)
         
         # 获取markdown文件所在目录作为图片路径基准
         markdown_dir = os.path.dirname(os.path.abspath(markdown_path))
         
         # 调用 API 处理文本，传递正确的base_path
-        result = process_text_with_images(combined_text, api_key, model, base_path=markdown_dir)
+        if stream:
+            partial_path = get_output_path(markdown_path, output_dir) + ".partial"
+            try:
+                result = write_code_stream(stream_text_with_images(combined_text, api_key, model, base_path=markdown_dir), partial_path)
+            finally:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+        else:
+            result = process_text_with_images(combined_text, api_key, model, base_path=markdown_dir)
         
-        # 清理代码结果
+        # 清理代码结果（流式模式下结果已去除代码块标记，这里只做最后的规范化）
         clean_result = clean_code_result(result)
         
         # 保存结果到文件
@@ -173,6 +289,7 @@ def main():
     parser.add_argument('markdown_path', help='输入的Markdown文件路径')
     parser.add_argument('--output-dir', help='输出目录路径', default=None)
     parser.add_argument('--prompt-template', help='提示词模板路径', default=None)
+    parser.add_argument('--stream', action='store_true', help='流式接收模型输出，输出明显不是代码时提前终止')
     args = parser.parse_args()
     
     # 如果没有提供提示词模板路径，则使用默认路径
@@ -190,10 +307,12 @@ def main():
     
     try:
         # 处理文件
-        result, output_file = process_markdown_to_code(args.markdown_path, prompt_template_path, api_key, model, output_dir=args.output_dir)
+        result, output_file = process_markdown_to_code(args.markdown_path, prompt_template_path, api_key, model, output_dir=args.output_dir, stream=args.stream)
+        print(result)
         print(f"\n代码已保存到文件：{output_file}")
     except Exception as e:
         print(f"错误：{str(e)}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -2,15 +2,17 @@ import os
 import json
 import argparse
 import sys
+from functools import lru_cache
 
 # 添加根目录到Python路径，以便导入根目录的api_call
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from api_call import process_text_with_images
 
 
+@lru_cache(maxsize=None)
 def load_config(config_path: str = None) -> dict:
     """
-    加载配置文件
+    加载配置文件（同一进程内只读取一次）
     """
     if config_path is None:
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,9 +25,10 @@ def load_config(config_path: str = None) -> dict:
     except Exception as e:
         raise Exception(f"加载配置文件失败: {str(e)}")
 
+@lru_cache(maxsize=None)
 def load_prompt_template(template_path: str) -> str:
     """
-    加载提示词模板
+    加载提示词模板（同一进程内每个模板只读取一次）
     """
     try:
         with open(template_path, 'r', encoding='utf-8') as f:
@@ -90,6 +93,16 @@ def save_result(result: str, markdown_path: str, python_path: str, model: str, o
     except Exception as e:
         raise Exception(f"保存演讲稿到文件失败: {str(e)}")
 
+def build_prompt(markdown_path: str, python_path: str, previous_speech_path: str, prompt_template_path: str) -> str:
+    """
+    组合提示词模板、论文内容、Manim代码和上一页讲稿（交互式调用和批处理模式共用）
+    """
+    prompt = load_prompt_template(prompt_template_path)
+    content = load_markdown_content(markdown_path)
+    code_content = load_python_content(python_path)
+    previous_speech = load_previous_speech(previous_speech_path)
+    return f"{prompt}\n\n上一个页面的讲稿内容如下：\n\n{previous_speech}\n\n论文原文的内容如下：\n\n{content}\n\n其对应的manim脚本内容如下：\n\n{code_content}"
+
 def process_content_to_speech(markdown_path: str, python_path: str, previous_speech_path: str, prompt_template_path: str, api_key: str, model: str = "gpt-4.5-preview", output_dir: str = None) -> str:
     """
     处理 Markdown 和 Python 文件内容并生成演讲稿
@@ -102,20 +115,8 @@ def process_content_to_speech(markdown_path: str, python_path: str, previous_spe
     7. 保存演讲稿到文件
     """
     try:
-        # 加载提示词模板
-        prompt = load_prompt_template(prompt_template_path)
-        
-        # 加载 Markdown 内容
-        content = load_markdown_content(markdown_path)
-        
-        # 加载 Python 代码内容
-        code_content = load_python_content(python_path)
-        
-        # 加载上一个页面的讲稿内容
-        previous_speech = load_previous_speech(previous_speech_path)
-        
-        # 组合提示词和内容
-        combined_text = f"{prompt}\n\n上一个页面的讲稿内容如下：\n\n{previous_speech}\n\n论文原文的内容如下：\n\n{content}\n\n其对应的manim脚本内容如下：\n\n{code_content}"
+        # 加载提示词模板、Markdown内容、Python代码和上一页讲稿并组合
+        combined_text = build_prompt(markdown_path, python_path, previous_speech_path, prompt_template_path)
         
         # 获取markdown文件所在目录作为图片路径基准
         markdown_dir = os.path.dirname(os.path.abspath(markdown_path))
@@ -181,6 +182,7 @@ def main():
         print(f"\n演讲稿已保存到文件：{output_file}")
     except Exception as e:
         print(f"错误：{str(e)}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,11 +1,21 @@
 import os
-import sys
 import glob
-import subprocess
-import re
+import io
+import sys
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
 from datetime import datetime
 
+from Chapter_Coder import load_config, process_markdown_to_code
+from run_manifest import code_stage_inputs
+
+# 添加根目录到Python路径，以便导入根目录的tracing和page_utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from page_utils import get_sort_key
+from tracing import propagate, traced
+
 def print_separator(char="=", length=50):
     """打印分隔线"""
     print(char * length)
@@ -32,7 +42,99 @@ def format_duration(seconds):
         minutes = (seconds % 3600) // 60
         return f"{hours:.0f}小时{minutes:.0f}分"
 
-def process_markdown_folder(input_folder: str, output_dir: str, prompt_template: str = None):
+def get_default_prompt_template() -> str:
+    """默认的代码生成提示词模板（与Chapter_Coder命令行的默认值一致）"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(current_dir)  # 上一级目录（根目录）
+    return os.path.join(parent_dir, "prompt_template", "Method_Coder.txt")
+
+@traced('page', name_arg='markdown_file', stage='code')
+def generate_code_for_page(markdown_file: str, output_dir: str, prompt_template: str = None, manifest=None, stream: bool = False) -> dict:
+    """
+    为单个页面生成Manim代码（在当前进程内直接调用Chapter_Coder）
+
+    Args:
+        markdown_file: 页面Markdown文件路径
+        output_dir: 代码输出目录
+        prompt_template: 提示词模板路径，为None时使用Method_Coder.txt
+        manifest: 运行清单（RunManifest），提供时输入未变化的页面直接复用已有代码
+        stream: 流式接收模型输出，输出明显不是代码时提前终止
+
+    Returns:
+        dict: 单页处理结果，包含status（success/reused/failed）、duration、output_file、error
+    """
+    if prompt_template is None:
+        prompt_template = get_default_prompt_template()
+    
+    config = load_config()
+    file_start_time = time.time()
+    page_key = os.path.basename(markdown_file)
+    
+    if manifest is not None:
+        inputs_hash = code_stage_inputs(markdown_file, prompt_template, config['model'])
+        if manifest.is_fresh('code', page_key, inputs_hash):
+            return {
+                'file': markdown_file,
+                'status': 'reused',
+                'duration': time.time() - file_start_time,
+                'output_file': manifest.get_entry('code', page_key)['outputs'][0],
+                'error': None
+            }
+    
+    output_file = None
+    error = None
+    try:
+        _, output_file = process_markdown_to_code(markdown_file, prompt_template, config['api_key'], config['model'], output_dir=output_dir, stream=stream)
+        if manifest is not None:
+            manifest.record('code', page_key, inputs_hash, [output_file])
+    except Exception as e:
+        error = str(e)
+    
+    return {
+        'file': markdown_file,
+        'status': 'success' if error is None else 'failed',
+        'duration': time.time() - file_start_time,
+        'output_file': output_file,
+        'error': error
+    }
+
+class PageOutput:
+    """
+    按线程分流的stdout：并行生成时每个工作线程把页面输出写入自己的缓冲区，
+    未设置缓冲区的线程（主线程）直接写到原来的stdout
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, text):
+        buffer = getattr(self.local, 'buffer', None)
+        return (buffer if buffer is not None else self.stream).write(text)
+    
+    def flush(self):
+        if getattr(self.local, 'buffer', None) is None:
+            self.stream.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def generate_code_buffered(page_output: PageOutput, *args) -> dict:
+    """在工作线程中生成单页代码，页面输出缓冲到结果的output字段，由主线程整段打印"""
+    buffer = io.StringIO()
+    page_output.local.buffer = buffer
+    try:
+        result = generate_code_for_page(*args)
+    finally:
+        page_output.local.buffer = None
+    return dict(result, output=buffer.getvalue())
+
+def print_page_output(page_name: str, output: str):
+    """整段打印工作线程中缓冲的页面输出"""
+    if output:
+        print(f"\n[FILE] {page_name} 的输出:")
+        print(output, end='' if output.endswith('\n') else '\n')
+
+def process_markdown_folder(input_folder: str, output_dir: str, prompt_template: str = None, workers: int = 1, manifest=None, stream: bool = False):
     """
     处理指定文件夹下的所有markdown文件
     
@@ -40,6 +142,12 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
         input_folder: 输入文件夹路径
         output_dir: 输出目录路径
         prompt_template: 提示词模板路径
+        workers: 并行处理的页面数量，各页面之间相互独立
+        manifest: 运行清单，提供时跳过输入未变化的页面
+        stream: 流式接收模型输出（见Chapter_Coder.write_code_stream）
+
+    Returns:
+        list: 按处理顺序排列的每页结果
     """
     print_separator()
     print(f"[{format_time()}] 开始批量处理任务")
@@ -53,7 +161,7 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
     # 确保输入文件夹存在
     if not os.path.exists(input_folder):
         print(f"\n[ERR] 错误：输入文件夹 '{input_folder}' 不存在")
-        return
+        return []
     
     # 创建输出目录（如果不存在）
     os.makedirs(output_dir, exist_ok=True)
@@ -66,96 +174,82 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
     
     if not markdown_files:
         print(f"\n[WARN]  警告：在文件夹 '{input_folder}' 中没有找到markdown文件")
-        return
-    
-    # 对文件进行排序
-    def get_sort_key(file_path):
-        # 获取文件名（不含路径和扩展名）
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        # 提取所有数字序列
-        numbers = re.findall(r'\d+', base_name)
-        # 如果找到数字，将其转换为整数列表；如果没有数字，返回空列表
-        return [int(num) for num in numbers] if numbers else []
+        return []
     
     # 按数字序列排序
     markdown_files.sort(key=get_sort_key)
     
     total_files = len(markdown_files)
+    workers = max(1, min(workers, total_files))
     print(f"\n 找到 {total_files} 个markdown文件待处理")
-    print(f"[TIME]  预估总时长: {total_files * 60}~{total_files * 90} 秒 (每个文件约60-90秒)")
+    print(f"[TIME]  预估总时长: {total_files * 60 // workers}~{total_files * 90 // workers} 秒 (每个文件约60-90秒, 并行数: {workers})")
     print("\n[LIST] 处理顺序：")
     for i, file in enumerate(markdown_files, 1):
         relative_path = os.path.relpath(file, input_folder)
         print(f"   {i}. {relative_path}")
     print_separator("-")
     
-    # 获取当前脚本所在目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    method_coder_path = os.path.join(current_dir, 'Chapter_Coder.py')
-    
     # 处理统计
-    success_count = 0
-    failed_files = []
+    results = [None] * total_files
+    completed_count = 0
     start_time = time.time()
+    print_lock = threading.Lock()
     
     print(f"\n 开始批量代码生成...")
     
-    # 处理每个markdown文件
-    for index, markdown_file in enumerate(markdown_files, 1):
-        relative_path = os.path.relpath(markdown_file, input_folder)
-        
-        # 显示当前文件信息
-        print(f"\n[FILE] 正在处理: {relative_path}")
-        print(f" 进度: {index}/{total_files}")
-        
-        # 显示进度条
-        print_progress_bar(index-1, total_files, prefix="总体进度")
-        print()  # 换行
-        
-        file_start_time = time.time()
-        
-        try:
-            print(f"[PROC] 启动Manim代码生成器...")
-            cmd_args = [
-                sys.executable,
-                method_coder_path,
-                markdown_file,
-                '--output-dir', output_dir
-            ]
-            
-            # 如果提供了prompt_template参数，添加到命令中
-            if prompt_template:
-                cmd_args.extend(['--prompt-template', prompt_template])
+    def report_result(index, result):
+        """在一个页面完成后更新进度，ETA按整体吞吐量估算"""
+        nonlocal completed_count
+        with print_lock:
+            completed_count += 1
+            results[index] = result
+            relative_path = os.path.relpath(result['file'], input_folder)
+            print_page_output(relative_path, result.get('output'))
+            if result['status'] == 'reused':
+                print(f"\n[SKIP] 输入未变化，复用已有代码: {relative_path}")
+            elif result['status'] == 'success':
+                print(f"\n[OK] 完成: {relative_path} 耗时: {format_duration(result['duration'])}")
+            else:
+                print(f"\n[ERR] 处理失败: {relative_path} (耗时: {format_duration(result['duration'])})")
+                print(f"   错误信息: {result['error']}")
             
-            subprocess.run(cmd_args, check=True)
+            # 按已完成页面的整体吞吐量计算预估剩余时间
+            elapsed_time = time.time() - start_time
+            throughput = completed_count / elapsed_time if elapsed_time > 0 else 0
+            remaining_files = total_files - completed_count
+            estimated_remaining = remaining_files / throughput if throughput > 0 else 0
             
-            file_duration = time.time() - file_start_time
-            success_count += 1
-            print(f"[OK] 完成！耗时: {format_duration(file_duration)}")
-            
-        except subprocess.CalledProcessError as e:
-            file_duration = time.time() - file_start_time
-            failed_files.append(relative_path)
-            print(f"[ERR] 处理失败 (耗时: {format_duration(file_duration)})")
-            print(f"   错误信息: {str(e)}")
-            continue
-        
-        # 计算预估剩余时间
-        elapsed_time = time.time() - start_time
-        avg_time_per_file = elapsed_time / index
-        remaining_files = total_files - index
-        estimated_remaining = avg_time_per_file * remaining_files
-        
-        # 更新完成的进度条
-        print_progress_bar(index, total_files, prefix="总体进度")
-        print(f" - 剩余: {remaining_files}个文件, 预估时间: {format_duration(estimated_remaining)}")
-        
-        if index < total_files:  # 不是最后一个文件
-            print_separator("-")
+            print_progress_bar(completed_count, total_files, prefix="总体进度")
+            print(f" - 剩余: {remaining_files}个文件, 预估时间: {format_duration(estimated_remaining)}")
+    
+    if workers == 1:
+        # 顺序处理每个markdown文件
+        for index, markdown_file in enumerate(markdown_files):
+            relative_path = os.path.relpath(markdown_file, input_folder)
+            print(f"\n[FILE] 正在处理: {relative_path}")
+            print(f" 进度: {index + 1}/{total_files}")
+            print(f"[PROC] 调用Manim代码生成器...")
+            report_result(index, generate_code_for_page(markdown_file, output_dir, prompt_template, manifest, stream))
+            if index + 1 < total_files:
+                print_separator("-")
+    else:
+        print(f"[PROC] 使用 {workers} 个并行工作线程")
+        # Chapter_Coder在当前进程内运行，各页面的输出先分别缓冲，完成时整段打印，避免相互穿插
+        page_output = PageOutput(sys.stdout)
+        with redirect_stdout(page_output), ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(propagate(generate_code_buffered), page_output, markdown_file, output_dir, prompt_template, manifest, stream): index
+                for index, markdown_file in enumerate(markdown_files)
+            }
+            for future in as_completed(futures):
+                report_result(futures[future], future.result())
     
     # 计算总耗时
     total_duration = time.time() - start_time
     avg_time = total_duration / total_files if total_files > 0 else 0
+    success_count = sum(1 for result in results if result['status'] in ('success', 'reused'))
+    reused_count = sum(1 for result in results if result['status'] == 'reused')
+    failed_files = [os.path.relpath(result['file'], input_folder) for result in results if result['status'] == 'failed']
     
     # 打印最终进度条（100%）
     print_progress_bar(total_files, total_files, prefix="总体进度")
@@ -165,13 +259,21 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
     print_separator()
     print(f"\n[TARGET] 代码生成完成! 成功生成 {success_count} 个Python代码文件")
     print_separator("-")
+    print(f"[LIST] 逐页结果:")
+    for i, result in enumerate(results, 1):
+        status = {'success': "[OK]", 'reused': "[SKIP]"}.get(result['status'], "[ERR]")
+        print(f"   {i:2d}. {status} {os.path.relpath(result['file'], input_folder)} ({format_duration(result['duration'])})")
     print(f"[PROG] 详细统计:")
     print(f"   • 总文件数: {total_files}")
     print(f"   • 成功生成: {success_count}")
+    if manifest is not None:
+        print(f"   • 其中复用: {reused_count}")
     print(f"   • 生成失败: {len(failed_files)}")
     print(f"   • 成功率: {(success_count/total_files*100):.1f}%")
+    print(f"   • 并行数: {workers}")
     print(f"   • 总耗时: {format_duration(total_duration)}")
     print(f"   • 平均耗时: {format_duration(avg_time)}/文件")
+    print(f"   • 单页累计耗时: {format_duration(sum(result['duration'] for result in results))}")
     
     if failed_files:
         print(f"\n[ERR] 以下 {len(failed_files)} 个文件处理失败:")
@@ -180,6 +282,8 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
     
     print(f"\n✨ 生成的代码已保存到: {os.path.relpath(output_dir, os.getcwd())}")
     print_separator()
+    
+    return results
 
 def main():
     """
@@ -192,11 +296,13 @@ def main():
     parser.add_argument('input_folder', help='包含markdown文件的输入文件夹路径')
     parser.add_argument('output_dir', help='代码输出目录路径')
     parser.add_argument('--prompt-template', help='提示词模板路径', default=None)
+    parser.add_argument('--workers', type=int, default=1, help='并行处理的页面数量 (默认: 1)')
+    parser.add_argument('--stream', action='store_true', help='流式接收模型输出，输出明显不是代码时提前终止')
     
     args = parser.parse_args()
     
     # 处理文件夹
-    process_markdown_folder(args.input_folder, args.output_dir, args.prompt_template)
+    process_markdown_folder(args.input_folder, args.output_dir, args.prompt_template, args.workers, stream=args.stream)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
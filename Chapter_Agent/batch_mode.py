@@ -0,0 +1,465 @@
+"""
+Chapter_Agent 批处理模式（OpenAI Batch API）
+
+把每一轮的全部提示词（AI分割、代码生成、可选的演讲稿生成）写成OpenAI Batch格式的JSONL，
+提交到批处理端点，轮询直到完成后把结果写回 *_segmentation / *_generated_code / *_generated_speech。
+适合夜间批量转换大量论文：批处理价格更低，也不受交互式接口的速率限制。
+
+端点：
+- OpenAIBatchEndpoint: 通过 files + batches 接口提交到OpenAI兼容服务
+- LocalBatchEndpoint: 基于本地目录的替身，<batch_dir>/local_endpoint/<batch_id>/input.jsonl 为输入，
+  output.jsonl 出现即视为完成；execute=True 时由本进程用交互式接口逐条执行（用于测试）
+
+每一轮的batch_id记录在 <batch_dir>/batch_state.json，中断后重新运行会继续轮询同一个批次而不是重新提交。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+# 添加根目录到Python路径，以便导入根目录的api_call
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_call import DEFAULT_BASE_URL, call_with_rate_limit, get_api_client
+
+import Chapter_Brain
+import Chapter_Coder
+import Chapter_Speecher
+from batch_speecher import extract_page_number, get_default_previous_speech
+from run_manifest import brain_stage_inputs, code_stage_inputs, file_hash, speech_stage_inputs
+from tracing import propagate, traced
+from usage_ledger import BudgetExceededError, record_call, release_budget, reserve_budget
+
+BATCH_ENDPOINT_URL = "/v1/chat/completions"
+BATCH_STATE_FILENAME = "batch_state.json"
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def get_template_path(chapter_type: str, role: str) -> str:
+    """返回 prompt_template/{chapter_type}_{role}.txt 的路径"""
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(parent_dir, "prompt_template", f"{chapter_type}_{role}.txt")
+
+
+def dedupe_image_parts(content: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一请求中多次引用的图片只内联一次"""
+    seen = set()
+    deduped = []
+    for part in content:
+        if part.get("type") == "image_url":
+            url = part["image_url"]["url"]
+            if url in seen:
+                continue
+            seen.add(url)
+        deduped.append(part)
+    return deduped
+
+
+def make_batch_request(custom_id: str, text: str, with_images: bool, base_path: str = None) -> Dict[str, Any]:
+    """构建一行Batch格式的请求，请求体与交互式调用完全相同（图片已内联为data URL）"""
+    config = Chapter_Brain.load_config()
+    client = get_api_client(config['api_key'], config['model'])
+    if with_images:
+        content = dedupe_image_parts(client.build_text_and_images_content(text, base_path))
+    else:
+        content = client.build_text_content(text)
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT_URL,
+        "body": client.build_request(content)
+    }
+
+
+def write_jsonl(records: List[Dict[str, Any]], path: str):
+    """写入JSONL（先写临时文件再替换）"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_batch_results(path: str) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    解析Batch结果文件
+
+    Returns:
+        dict: custom_id -> (模型输出文本, 错误信息)，成功时错误信息为None
+    """
+    results = {}
+    for record in read_jsonl(path):
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        error = record.get("error")
+        content = None
+        if not error and response.get("status_code", 200) == 200:
+            choices = body.get("choices") or []
+            if choices and (choices[0].get("message") or {}).get("content") is not None:
+                content = choices[0]["message"]["content"]
+            else:
+                error = f"响应中未找到content: {body}"
+        elif not error:
+            error = f"HTTP {response.get('status_code')}: {body}"
+        results[custom_id] = (content, None if content is not None else str(error))
+    return results
+
+
+def record_batch_usage(requests: List[Dict[str, Any]], output_path: str):
+    """按结果文件中每个请求的usage记账（Batch价格）"""
+    bodies = {request["custom_id"]: request["body"] for request in requests}
+    for record in read_jsonl(output_path):
+        body = bodies.get(record.get("custom_id"))
+        usage = ((record.get("response") or {}).get("body") or {}).get("usage")
+        if body is not None and usage:
+            record_call(body, usage, batch=True)
+
+
+def reserve_batch_budget(requests: List[Dict[str, Any]]) -> float:
+    """提交前为整批请求按最大可能费用预约预算，超出时抛出BudgetExceededError且不提交"""
+    reserved = 0.0
+    try:
+        for request in requests:
+            reserved += reserve_budget(request["body"], batch=True)
+    except BudgetExceededError:
+        release_budget(reserved)
+        raise
+    return reserved
+
+
+class LocalBatchEndpoint:
+    def __init__(self, root_dir: str, execute: bool = True, workers: int = 4):
+        """
+        Args:
+            root_dir: 本地批处理目录
+            execute: 为True时在查询状态时由本进程执行未完成的批次（使用交互式接口、限流器和响应缓存）；
+                为False时只等待外部程序写入output.jsonl
+            workers: execute模式下并行执行的请求数
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.execute = execute
+        self.workers = workers
+        # execute模式下的请求经过交互式接口，已在api_call中记账；否则按结果文件中的usage记账
+        self.reports_usage = not execute
+
+    def _batch_dir(self, batch_id: str) -> str:
+        return os.path.join(self.root_dir, batch_id)
+
+    def submit(self, input_path: str, metadata: Dict[str, str] = None) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        batch_dir = self._batch_dir(batch_id)
+        os.makedirs(batch_dir, exist_ok=True)
+        write_jsonl(read_jsonl(input_path), os.path.join(batch_dir, "input.jsonl"))
+        with open(os.path.join(batch_dir, "metadata.json"), 'w', encoding='utf-8') as f:
+            json.dump(metadata or {}, f, ensure_ascii=False)
+        return batch_id
+
+    def retrieve(self, batch_id: str) -> str:
+        """返回批次状态：completed / in_progress / failed"""
+        batch_dir = self._batch_dir(batch_id)
+        if not os.path.exists(os.path.join(batch_dir, "input.jsonl")):
+            return 'failed'
+        if os.path.exists(os.path.join(batch_dir, "output.jsonl")):
+            return 'completed'
+        if self.execute:
+            self._execute(batch_id)
+            return 'completed'
+        return 'in_progress'
+
+    def _execute(self, batch_id: str):
+        """用交互式接口逐条执行批次中的请求，按Batch结果格式写出output.jsonl"""
+        config = Chapter_Brain.load_config()
+        requests = read_jsonl(os.path.join(self._batch_dir(batch_id), "input.jsonl"))
+
+        def run(request):
+            body = request["body"]
+            record = {"id": f"local_req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"], "response": None, "error": None}
+            try:
+                client = get_api_client(config['api_key'], body["model"])
+                content = client._call_api(body["messages"][0]["content"])
+                record["response"] = {
+                    "status_code": 200,
+                    "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}
+                }
+            except Exception as e:
+                record["error"] = {"code": "local_execution_error", "message": str(e)}
+            return record
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            records = list(executor.map(propagate(run), requests))
+        write_jsonl(records, os.path.join(self._batch_dir(batch_id), "output.jsonl"))
+
+    def download_results(self, batch_id: str, output_path: str) -> str:
+        write_jsonl(read_jsonl(os.path.join(self._batch_dir(batch_id), "output.jsonl")), output_path)
+        return output_path
+
+
+class OpenAIBatchEndpoint:
+    def __init__(self, api_key: str, base_url: str = None, completion_window: str = "24h"):
+        from openai import OpenAI
+        # 上传、创建和轮询都经过共享限流器重试，关闭SDK自带的重试
+        self.client = OpenAI(api_key=api_key, base_url=base_url or DEFAULT_BASE_URL, max_retries=0)
+        self.completion_window = completion_window
+        self.reports_usage = True
+
+    def _upload(self, input_path: str, idempotency_key: str):
+        with open(input_path, 'rb') as f:
+            return self.client.files.create(file=f, purpose="batch",
+                                            extra_headers={"Idempotency-Key": f"{idempotency_key}-file"})
+
+    def submit(self, input_path: str, metadata: Dict[str, str] = None) -> str:
+        # 重试时沿用同一个幂等键，请求已被服务端接受但响应丢失时不会重复创建批次
+        idempotency_key = uuid.uuid4().hex
+        input_file = call_with_rate_limit(self._upload, input_path, idempotency_key)
+        batch = call_with_rate_limit(
+            self.client.batches.create,
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT_URL,
+            completion_window=self.completion_window,
+            metadata=metadata or None,
+            extra_headers={"Idempotency-Key": f"{idempotency_key}-batch"}
+        )
+        return batch.id
+
+    def retrieve(self, batch_id: str) -> str:
+        return call_with_rate_limit(self.client.batches.retrieve, batch_id).status
+
+    def download_results(self, batch_id: str, output_path: str) -> str:
+        """下载结果文件和错误文件（过期的批次也可能有部分结果），合并写入output_path"""
+        batch = call_with_rate_limit(self.client.batches.retrieve, batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = call_with_rate_limit(self.client.files.content, file_id)
+                lines.extend(line for line in content.text.splitlines() if line.strip())
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + ("\n" if lines else ""))
+        return output_path
+
+
+def create_endpoint(kind: str, batch_dir: str):
+    """根据 --batch 参数创建端点：local 或 openai"""
+    if kind == 'local':
+        return LocalBatchEndpoint(os.path.join(batch_dir, "local_endpoint"))
+    config = Chapter_Brain.load_config()
+    return OpenAIBatchEndpoint(config['api_key'], config.get('base_url'))
+
+
+def _load_state(batch_dir: str) -> Dict[str, Any]:
+    path = os.path.join(batch_dir, BATCH_STATE_FILENAME)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def _save_state(batch_dir: str, state: Dict[str, Any]):
+    path = os.path.join(batch_dir, BATCH_STATE_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _mark_round(batch_dir: str, state: Dict[str, Any], round_name: str, status: str):
+    """记录一轮批次的最终状态（completed以外的状态在重新运行时会重新提交）"""
+    state[round_name]["status"] = status
+    _save_state(batch_dir, state)
+
+
+def run_batch_round(endpoint, requests: List[Dict[str, Any]], round_name: str, batch_dir: str,
+                    poll_interval: float = 60) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    提交一轮请求并等待结果
+
+    输入文件与上次提交的相同时复用已记录的batch_id继续轮询，不会重复提交；上次的批次失败、
+    过期或被取消时重新提交（过期和取消的批次仍使用已产生的部分结果）。
+    端点在结果中返回usage时，新提交的批次先预约预算，结果下载后按Batch价格记账。
+
+    Returns:
+        dict: custom_id -> (模型输出文本, 错误信息)
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    input_path = os.path.join(batch_dir, f"{round_name}_input.jsonl")
+    output_path = os.path.join(batch_dir, f"{round_name}_output.jsonl")
+    write_jsonl(requests, input_path)
+    input_hash = file_hash(input_path)
+
+    state = _load_state(batch_dir)
+    round_state = state.get(round_name, {})
+    reports_usage = getattr(endpoint, 'reports_usage', False)
+    reserved = 0.0
+    resumable = round_state.get("status") in (None, 'completed')
+    if round_state.get("input_hash") == input_hash and round_state.get("batch_id") and resumable:
+        batch_id = round_state["batch_id"]
+        print(f"[PROC] 继续轮询已提交的批次: {batch_id}")
+    else:
+        if reports_usage:
+            reserved = reserve_batch_budget(requests)
+        batch_id = endpoint.submit(input_path, {"round": round_name})
+        state[round_name] = {"batch_id": batch_id, "input_hash": input_hash, "submitted": time.strftime('%Y-%m-%d %H:%M:%S')}
+        _save_state(batch_dir, state)
+        print(f"[OK] 已提交批次 {batch_id}: {len(requests)} 个请求 ({os.path.getsize(input_path)/1024:.0f} KB)")
+    # 之前的运行已经下载过结果的批次不重复记账
+    already_recorded = "status" in state[round_name]
+
+    try:
+        start_time = time.time()
+        while True:
+            status = endpoint.retrieve(batch_id)
+            if status in TERMINAL_STATUSES:
+                break
+            print(f"[PROG] 批次 {batch_id} 状态: {status}，已等待 {time.time() - start_time:.0f} 秒")
+            time.sleep(poll_interval)
+
+        print(f"[OK] 批次 {batch_id} 结束，状态: {status}")
+        if status == 'failed':
+            # 记录状态后重新运行时会重新提交，而不是继续轮询这个失败的批次
+            _mark_round(batch_dir, state, round_name, status)
+            raise RuntimeError(f"批次 {batch_id} 执行失败")
+        endpoint.download_results(batch_id, output_path)
+        if status != 'completed' and not read_jsonl(output_path):
+            _mark_round(batch_dir, state, round_name, status)
+            raise RuntimeError(f"批次 {batch_id} 状态为 {status}，没有任何结果")
+        if reports_usage and not already_recorded:
+            record_batch_usage(requests, output_path)
+    finally:
+        release_budget(reserved)
+    results = parse_batch_results(output_path)
+
+    _mark_round(batch_dir, state, round_name, status)
+    return results
+
+
+@traced('stage', 'brain')
+def batch_brain_round(paper_path: str, segmentation_dir: str, chapter_type: str, endpoint, batch_dir: str,
+                      manifest=None, poll_interval: float = 60) -> str:
+    """AI分割轮：提交一个请求，结果按Chapter_Brain的命名保存为 *_split.md，返回分割文件路径"""
+    config = Chapter_Brain.load_config()
+    brain_template = get_template_path(chapter_type, "Brain")
+    inputs_hash = brain_stage_inputs(paper_path, brain_template, config['model'])
+    if manifest is not None and manifest.is_fresh('brain', 'segmentation', inputs_hash):
+        output_file = manifest.get_entry('brain', 'segmentation')['outputs'][0]
+        print(f"[SKIP] 论文和模板未变化，复用已有分割结果: {output_file}")
+        return output_file
+
+    request = make_batch_request("brain", Chapter_Brain.build_prompt(paper_path, brain_template), with_images=False)
+    content, error = run_batch_round(endpoint, [request], "brain", batch_dir, poll_interval).get("brain", (None, "结果中缺少该请求"))
+    if content is None:
+        raise RuntimeError(f"AI智能分割失败: {error}")
+
+    output_file = Chapter_Brain.save_result(Chapter_Brain.restore_result(content, paper_path), paper_path, config['model'], segmentation_dir)
+    if manifest is not None:
+        manifest.record('brain', 'segmentation', inputs_hash, [output_file])
+    print(f"[FILE] 分割结果已保存到: {output_file}")
+    return output_file
+
+
+def _list_pages(split_pages_dir: str) -> List[str]:
+    page_files = [os.path.join(split_pages_dir, f) for f in os.listdir(split_pages_dir) if f.endswith(('.md', '.markdown'))]
+    page_files.sort(key=extract_page_number)
+    return page_files
+
+
+@traced('stage', 'code')
+def batch_code_round(split_pages_dir: str, generated_code_dir: str, chapter_type: str, endpoint, batch_dir: str,
+                     manifest=None, poll_interval: float = 60) -> List[str]:
+    """代码生成轮：所有页面（跳过输入未变化的页面）放入同一个批次，返回失败的页面"""
+    config = Chapter_Coder.load_config()
+    coder_template = get_template_path(chapter_type, "Coder")
+    pending = {}
+    for page_file in _list_pages(split_pages_dir):
+        page_key = os.path.basename(page_file)
+        inputs_hash = code_stage_inputs(page_file, coder_template, config['model'])
+        if manifest is not None and manifest.is_fresh('code', page_key, inputs_hash):
+            print(f"[SKIP] 输入未变化，复用已有代码: {page_key}")
+            continue
+        pending[f"code:{page_key}"] = (page_file, inputs_hash)
+
+    if not pending:
+        print("[OK] 所有页面的代码均可复用，无需提交批次")
+        return []
+
+    requests = [
+        make_batch_request(custom_id, Chapter_Coder.build_prompt(page_file, coder_template), with_images=True,
+                           base_path=os.path.dirname(os.path.abspath(page_file)))
+        for custom_id, (page_file, _) in pending.items()
+    ]
+    results = run_batch_round(endpoint, requests, "code", batch_dir, poll_interval)
+
+    failed = []
+    for custom_id, (page_file, inputs_hash) in pending.items():
+        content, error = results.get(custom_id, (None, "结果中缺少该请求"))
+        page_key = os.path.basename(page_file)
+        if content is None:
+            failed.append(page_key)
+            print(f"[ERR] 代码生成失败: {page_key} ({error})")
+            continue
+        output_file = Chapter_Coder.save_result(Chapter_Coder.clean_code_result(content), page_file, config['model'], generated_code_dir)
+        if manifest is not None:
+            manifest.record('code', page_key, inputs_hash, [output_file])
+        print(f"[OK] 已写入代码: {os.path.basename(output_file)}")
+    return failed
+
+
+@traced('stage', 'speech')
+def batch_speech_round(split_pages_dir: str, generated_code_dir: str, generated_speech_dir: str, chapter_type: str,
+                       endpoint, batch_dir: str, manifest=None, poll_interval: float = 60) -> List[str]:
+    """
+    演讲稿生成轮：所有页面放入同一个批次，返回失败的页面
+
+    交互式模式下每页以上一页的讲稿为上下文，只能逐页生成；批处理模式下所有页面同时提交，
+    因此每页都使用默认的上一页讲稿作为上下文，以一次批次换取页面间衔接的连贯性。
+    """
+    config = Chapter_Speecher.load_config()
+    speecher_template = get_template_path(chapter_type, "Speecher")
+    previous_speech_path = get_default_previous_speech()
+    pending = {}
+    for page_file in _list_pages(split_pages_dir):
+        page_key = os.path.basename(page_file)
+        code_file = os.path.join(generated_code_dir, f"{os.path.splitext(page_key)[0]}_code.py")
+        if not os.path.exists(code_file):
+            print(f"[WARN]  缺少代码文件，跳过演讲稿: {page_key}")
+            continue
+        inputs_hash = speech_stage_inputs(page_file, code_file, previous_speech_path, speecher_template, config['model'])
+        if manifest is not None and manifest.is_fresh('speech', page_key, inputs_hash):
+            print(f"[SKIP] 输入未变化，复用已有演讲稿: {page_key}")
+            continue
+        pending[f"speech:{page_key}"] = (page_file, code_file, inputs_hash)
+
+    if not pending:
+        print("[OK] 所有页面的演讲稿均可复用，无需提交批次")
+        return []
+
+    requests = [
+        make_batch_request(custom_id, Chapter_Speecher.build_prompt(page_file, code_file, previous_speech_path, speecher_template),
+                           with_images=True, base_path=os.path.dirname(os.path.abspath(page_file)))
+        for custom_id, (page_file, code_file, _) in pending.items()
+    ]
+    results = run_batch_round(endpoint, requests, "speech", batch_dir, poll_interval)
+
+    failed = []
+    for custom_id, (page_file, code_file, inputs_hash) in pending.items():
+        content, error = results.get(custom_id, (None, "结果中缺少该请求"))
+        page_key = os.path.basename(page_file)
+        if content is None:
+            failed.append(page_key)
+            print(f"[ERR] 演讲稿生成失败: {page_key} ({error})")
+            continue
+        output_file = Chapter_Speecher.save_result(content, page_file, code_file, config['model'], generated_speech_dir)
+        if manifest is not None:
+            manifest.record('speech', page_key, inputs_hash, [output_file])
+        print(f"[OK] 已写入演讲稿: {os.path.basename(output_file)}")
+    return failed
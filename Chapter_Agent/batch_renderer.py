@@ -0,0 +1,298 @@
+"""
+批量渲染生成的Manim代码
+
+从 *_code.py 中用AST找出Scene子类，每个场景启动一个manim进程渲染；同时运行的进程数
+默认等于CPU核数（渲染是CPU密集型任务，各页面之间互不依赖）。每个场景单独记录日志和耗时，
+渲染出的mp4统一链接（或复制）到输出目录的 videos/ 下。
+
+启用渲染缓存时，代码、引用素材、Manim版本和渲染质量都没有变化的场景直接复用上次的视频，
+因此重新运行或只修改了某一页时，只有变化的场景会被重新渲染。
+
+使用方法:
+python batch_renderer.py generated_code_dir output_dir [--quality low|medium|high|4k] [--workers N] [--files a_code.py ...] [--no-cache]
+"""
+
+import ast
+import glob
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch_coder import format_duration, format_time, load_config, print_progress_bar, print_separator
+
+# 添加根目录到Python路径，以便导入根目录的render_cache
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from page_utils import find_scene_classes as find_module_scene_classes, get_page_name, get_sort_key
+from render_cache import DEFAULT_CACHE_DIR as DEFAULT_RENDER_CACHE_DIR, RenderCache, link_or_copy
+from tracing import propagate, traced
+
+# -ql 预览（480p15），-qh 成片（1080p60）
+QUALITY_FLAGS = {'low': '-ql', 'medium': '-qm', 'high': '-qh', '4k': '-qk'}
+MANIM_COMMAND = [sys.executable, "-m", "manim"]
+DEFAULT_RENDER_TIMEOUT = 1800  # 单个场景的渲染超时（秒）
+
+def default_render_workers() -> int:
+    """默认的并行渲染进程数：CPU核数"""
+    return os.cpu_count() or 1
+
+def setup_render_cache(cache_config: dict = None, disable: bool = False):
+    """
+    根据config.json中的render_cache配置创建渲染缓存
+
+    渲染缓存默认开启（键包含代码、素材、Manim版本和质量参数，不会复用过期的视频）；
+    配置中enabled为false或传入--no-render-cache时返回None。
+    """
+    cache_config = cache_config or {}
+    if disable or not cache_config.get('enabled', True):
+        return None
+    return RenderCache(cache_config.get('dir') or DEFAULT_RENDER_CACHE_DIR, cache_config.get('max_size_mb', 4096))
+
+def find_scene_classes(code_file: str) -> list:
+    """找出代码文件中需要渲染的Scene类（按定义顺序，规则见page_utils.find_scene_classes），代码无法解析时返回空列表"""
+    with open(code_file, 'r', encoding='utf-8') as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source, filename=code_file)
+    except SyntaxError as e:
+        print(f"[WARN]  代码存在语法错误，无法查找场景: {os.path.basename(code_file)} (第{e.lineno}行)")
+        return []
+    return find_module_scene_classes(tree)
+
+def find_rendered_video(media_dir: str, code_file: str, scene: str) -> str:
+    """manim的输出位于 media_dir/videos/<模块名>/<分辨率帧率>/<场景>.mp4，返回最新的一个"""
+    module_name = os.path.splitext(os.path.basename(code_file))[0]
+    candidates = glob.glob(os.path.join(media_dir, 'videos', module_name, '*', f"{scene}.mp4"))
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+def remove_rendered_videos(media_dir: str, code_file: str, scene: str):
+    """删除该场景上一次渲染的输出，避免manim原地改写时影响仍链接着它的文件，或在渲染失败时误用旧视频"""
+    module_name = os.path.splitext(os.path.basename(code_file))[0]
+    for path in glob.glob(os.path.join(media_dir, 'videos', module_name, '*', f"{scene}.mp4")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def render_scene(code_file: str, scene: str, media_dir: str, log_dir: str, quality: str = 'low',
+                 timeout: float = DEFAULT_RENDER_TIMEOUT) -> dict:
+    """
+    调用manim渲染单个场景
+
+    在代码文件所在目录运行（代码中的图片路径相对该目录），标准输出和错误写入 log_dir/<页面>_<场景>.log
+
+    Returns:
+        dict: 渲染结果（code_file、scene、status、video、duration、log、error）
+    """
+    start_time = time.time()
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"{get_page_name(code_file)}_{scene}.log")
+    command = MANIM_COMMAND + [QUALITY_FLAGS[quality], '--media_dir', os.path.abspath(media_dir),
+                               os.path.abspath(code_file), scene]
+    result = {'code_file': code_file, 'scene': scene, 'status': 'failed', 'video': None, 'log': log_path, 'error': None}
+    remove_rendered_videos(media_dir, code_file, scene)
+
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        log_file.write(f"# [{format_time()}] {' '.join(command)}\n\n")
+        log_file.flush()
+        try:
+            completed = subprocess.run(
+                command, cwd=os.path.dirname(os.path.abspath(code_file)),
+                stdout=log_file, stderr=subprocess.STDOUT, timeout=timeout
+            )
+            if completed.returncode != 0:
+                result['error'] = f"manim退出码 {completed.returncode}"
+            else:
+                result['video'] = find_rendered_video(media_dir, code_file, scene)
+                if result['video'] is None:
+                    result['error'] = "manim已结束但未找到输出视频"
+                else:
+                    result['status'] = 'success'
+        except subprocess.TimeoutExpired:
+            result['error'] = f"渲染超时 ({timeout:.0f}秒)"
+        except OSError as e:
+            result['error'] = f"无法启动manim: {e}"
+        result['duration'] = time.time() - start_time
+        log_file.write(f"\n# 状态: {result['status']}，耗时: {result['duration']:.1f} 秒"
+                       f"{'，错误: ' + result['error'] if result['error'] else ''}\n")
+    return result
+
+def collect_video(result: dict, videos_dir: str, multi_scene: bool) -> str:
+    """把渲染出的视频链接到videos目录：单场景页面命名为 <页面>.mp4，多场景为 <页面>_<场景>.mp4"""
+    page_name = get_page_name(result['code_file'])
+    filename = f"{page_name}_{result['scene']}.mp4" if multi_scene else f"{page_name}.mp4"
+    dest_path = os.path.join(videos_dir, filename)
+    link_or_copy(result['video'], dest_path)
+    return dest_path
+
+@traced('page', name_arg='code_file', stage='render')
+def render_cached_scene(code_file: str, scene: str, media_dir: str, log_dir: str, quality: str = 'low',
+                        timeout: float = DEFAULT_RENDER_TIMEOUT, cache: RenderCache = None) -> dict:
+    """先查渲染缓存，未命中时调用manim渲染并把结果放入缓存"""
+    if cache is None:
+        return render_scene(code_file, scene, media_dir, log_dir, quality, timeout)
+
+    key = RenderCache.make_key(code_file, scene, QUALITY_FLAGS[quality])
+    cached_video = cache.get(key)
+    if cached_video:
+        return {'code_file': code_file, 'scene': scene, 'status': 'reused', 'video': cached_video,
+                'duration': 0.0, 'log': None, 'error': None}
+
+    result = render_scene(code_file, scene, media_dir, log_dir, quality, timeout)
+    if result['status'] == 'success':
+        cache.put(key, result['video'])
+    return result
+
+def render_code_files(code_files: list, output_dir: str, quality: str = 'low', workers: int = None,
+                      timeout: float = DEFAULT_RENDER_TIMEOUT, cache: RenderCache = None) -> list:
+    """
+    渲染给定代码文件中的场景
+
+    Args:
+        code_files: *_code.py 文件路径列表（按页面顺序）
+        output_dir: 渲染输出目录，包含 media/（manim中间文件）、logs/（每个场景的日志）、videos/（最终视频）
+        quality: low / medium / high / 4k，分别对应 -ql / -qm / -qh / -qk
+        workers: 同时运行的manim进程数，为None时等于CPU核数
+        timeout: 单个场景的渲染超时（秒）
+        cache: 渲染缓存，为None时每个场景都重新渲染
+
+    Returns:
+        list: 按页面和场景顺序排列的渲染结果，成功（success / reused）的结果带有final_video
+    """
+    print_separator()
+    print(f"[{format_time()}] 开始批量渲染")
+    print(f"代码目录: {os.path.dirname(os.path.abspath(code_files[0])) if code_files else ''}")
+    print(f"输出目录: {output_dir}")
+
+    jobs = []
+    scene_counts = {}
+    for code_file in code_files:
+        scenes = find_scene_classes(code_file)
+        scene_counts[code_file] = len(scenes)
+        if not scenes:
+            print(f"[WARN]  未找到Scene类，跳过: {os.path.basename(code_file)}")
+        jobs.extend((code_file, scene) for scene in scenes)
+    if not jobs:
+        print("\n[WARN]  没有可渲染的场景")
+        return []
+
+    media_dir = os.path.join(output_dir, 'media')
+    log_dir = os.path.join(output_dir, 'logs')
+    videos_dir = os.path.join(output_dir, 'videos')
+    os.makedirs(videos_dir, exist_ok=True)
+
+    total_jobs = len(jobs)
+    workers = max(1, min(workers or default_render_workers(), total_jobs))
+    print(f"\n 找到 {len(code_files)} 个代码文件，共 {total_jobs} 个场景")
+    print(f"[PROC] 渲染质量: {quality} ({QUALITY_FLAGS[quality]})，并行进程数: {workers}")
+    if cache is not None:
+        print(f"[CACHE] 渲染缓存: {cache.cache_dir}")
+    print_separator("-")
+
+    results = [None] * total_jobs
+    completed_count = 0
+    start_time = time.time()
+    print_lock = threading.Lock()
+
+    def report_result(index, result):
+        nonlocal completed_count
+        if result['status'] in ('success', 'reused'):
+            result['final_video'] = collect_video(result, videos_dir, scene_counts[result['code_file']] > 1)
+        with print_lock:
+            completed_count += 1
+            results[index] = result
+            name = f"{os.path.basename(result['code_file'])}::{result['scene']}"
+            if result['status'] == 'reused':
+                print(f"\n[CACHE] 复用缓存: {name}")
+            elif result['status'] == 'success':
+                print(f"\n[OK] 渲染完成: {name} 耗时: {format_duration(result['duration'])}")
+            else:
+                print(f"\n[ERR] 渲染失败: {name} (耗时: {format_duration(result['duration'])})")
+                print(f"   错误信息: {result['error']}，日志: {result['log']}")
+            print_progress_bar(completed_count, total_jobs, prefix="渲染进度")
+            print()
+
+    # 每个任务的线程只负责等待一个manim子进程，实际的并行渲染发生在这些子进程中
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(propagate(render_cached_scene), code_file, scene, media_dir, log_dir, quality, timeout, cache): index
+            for index, (code_file, scene) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            report_result(futures[future], future.result())
+
+    total_duration = time.time() - start_time
+    success_count = sum(1 for result in results if result['status'] in ('success', 'reused'))
+    reused_count = sum(1 for result in results if result['status'] == 'reused')
+    render_time = sum(result['duration'] for result in results)
+
+    print_separator()
+    print(f"\n[TARGET] 渲染完成! 成功 {success_count}/{total_jobs} 个场景")
+    print_separator("-")
+    print(f"[LIST] 逐场景结果:")
+    for i, result in enumerate(results, 1):
+        status = {'success': "[OK]", 'reused': "[CACHE]"}.get(result['status'], "[ERR]")
+        print(f"   {i:2d}. {status} {os.path.basename(result['code_file'])}::{result['scene']} ({format_duration(result['duration'])})")
+    print(f"[PROG] 详细统计:")
+    print(f"   • 并行进程数: {workers}")
+    if cache is not None:
+        print(f"   • 复用缓存: {reused_count} 个场景，实际渲染: {total_jobs - reused_count} 个场景")
+    print(f"   • 总耗时: {format_duration(total_duration)}")
+    print(f"   • 单场景累计耗时: {format_duration(render_time)}")
+    if total_duration > 0 and render_time > 0:
+        print(f"   • 并行加速: {render_time / total_duration:.1f}x")
+    print(f"\n✨ 渲染的视频已保存到: {videos_dir}")
+    print_separator()
+
+    return results
+
+def render_code_folder(code_dir: str, output_dir: str, quality: str = 'low', workers: int = None,
+                       timeout: float = DEFAULT_RENDER_TIMEOUT, cache: RenderCache = None) -> list:
+    """
+    渲染代码目录下所有 *_code.py 中的场景，参数和返回值同 render_code_files
+    """
+    code_files = sorted(glob.glob(os.path.join(code_dir, '*_code.py')), key=get_sort_key)
+    if not code_files:
+        print(f"\n[WARN]  警告：在 '{code_dir}' 中没有找到 *_code.py 文件")
+        return []
+    return render_code_files(code_files, output_dir, quality, workers, timeout, cache)
+
+def main():
+    """
+    主函数
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='批量渲染生成的Manim代码')
+    parser.add_argument('code_dir', help='包含 *_code.py 的代码目录')
+    parser.add_argument('output_dir', help='渲染输出目录')
+    parser.add_argument('--quality', choices=list(QUALITY_FLAGS), default='low',
+                        help='渲染质量: low 预览 (-ql, 默认); medium (-qm); high 成片 (-qh); 4k (-qk)')
+    parser.add_argument('--workers', type=int, default=None, help='并行渲染的进程数 (默认: CPU核数)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_RENDER_TIMEOUT, help='单个场景的渲染超时秒数')
+    parser.add_argument('--files', nargs='+', default=None, help='只渲染代码目录下的这些代码文件 (默认: 全部 *_code.py)')
+    parser.add_argument('--cache-dir', default=None, help='渲染缓存目录 (默认: config.json中render_cache.dir，或根目录下的 .render_cache)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用渲染缓存，所有场景重新渲染')
+
+    args = parser.parse_args()
+
+    cache_config = dict(load_config().get('render_cache') or {})
+    if args.cache_dir:
+        cache_config['dir'] = args.cache_dir
+    cache = setup_render_cache(cache_config, disable=args.no_cache)
+    if args.files:
+        code_files = [os.path.join(args.code_dir, os.path.basename(name)) for name in args.files]
+        missing = [path for path in code_files if not os.path.exists(path)]
+        if missing:
+            print(f"[ERR] 代码文件不存在: {', '.join(missing)}")
+            sys.exit(1)
+        results = render_code_files(code_files, args.output_dir, args.quality, args.workers, args.timeout, cache)
+    else:
+        results = render_code_folder(args.code_dir, args.output_dir, args.quality, args.workers, args.timeout, cache)
+    if not results or any(result['status'] not in ('success', 'reused') for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
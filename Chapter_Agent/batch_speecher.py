@@ -1,11 +1,13 @@
 import os
-import sys
 import glob
-import subprocess
 import re
 import time
 from datetime import datetime
 
+from Chapter_Speecher import load_config, process_content_to_speech
+from run_manifest import speech_stage_inputs
+from tracing import traced
+
 def print_separator(char="=", length=50):
     """打印分隔线"""
     print(char * length)
@@ -89,9 +91,70 @@ def find_matching_files(markdown_folder: str, python_folder: str):
     
     return matched_pairs, unmatched_markdowns
 
-def process_file_pairs(markdown_folder: str, python_folder: str, output_dir: str, prompt_template: str = None):
+def get_default_previous_speech() -> str:
+    """第一个页面使用的默认上下文讲稿（从上一级目录的prompt_template读取）"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(current_dir)  # 上一级目录（根目录）
+    return os.path.join(parent_dir, "prompt_template", "Speecher-1.txt")
+
+@traced('page', name_arg='md_file', stage='speech')
+def generate_speech_for_pair(md_file: str, py_file: str, previous_speech_path: str, output_dir: str, prompt_template: str = None, manifest=None) -> dict:
+    """
+    为单个页面（Markdown与代码文件对）生成演讲稿（在当前进程内直接调用Chapter_Speecher）
+
+    Args:
+        md_file: 页面Markdown文件路径
+        py_file: 页面对应的Manim代码文件路径
+        previous_speech_path: 上一个页面的讲稿路径，作为上下文
+        output_dir: 演讲稿输出目录
+        prompt_template: 提示词模板路径，为None时使用Method_Speecher.txt
+        manifest: 运行清单（RunManifest），提供时输入未变化的页面直接复用已有讲稿
+
+    Returns:
+        dict: 单页处理结果，包含status（success/reused/failed）、duration、speech_file、error
+    """
+    if prompt_template is None:
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        parent_dir = os.path.dirname(current_dir)  # 上一级目录（根目录）
+        prompt_template = os.path.join(parent_dir, "prompt_template", "Method_Speecher.txt")
+    
+    config = load_config()
+    pair_start_time = time.time()
+    page_key = os.path.basename(md_file)
+    
+    if manifest is not None:
+        inputs_hash = speech_stage_inputs(md_file, py_file, previous_speech_path, prompt_template, config['model'])
+        if manifest.is_fresh('speech', page_key, inputs_hash):
+            return {
+                'file': md_file,
+                'status': 'reused',
+                'duration': time.time() - pair_start_time,
+                'speech_file': manifest.get_entry('speech', page_key)['outputs'][0],
+                'error': None
+            }
+    
+    speech_file = None
+    error = None
+    try:
+        _, speech_file = process_content_to_speech(md_file, py_file, previous_speech_path, prompt_template, config['api_key'], config['model'], output_dir=output_dir)
+        if manifest is not None:
+            manifest.record('speech', page_key, inputs_hash, [speech_file])
+    except Exception as e:
+        error = str(e)
+    
+    return {
+        'file': md_file,
+        'status': 'success' if error is None else 'failed',
+        'duration': time.time() - pair_start_time,
+        'speech_file': speech_file,
+        'error': error
+    }
+
+def process_file_pairs(markdown_folder: str, python_folder: str, output_dir: str, prompt_template: str = None, manifest=None):
     """
     处理配对的文件
+
+    manifest: 运行清单，提供时跳过输入（含上一页讲稿）未变化的页面
     """
     print_separator()
     print(f"[{format_time()}] 开始批量处理任务")
@@ -144,18 +207,12 @@ def process_file_pairs(markdown_folder: str, python_folder: str, output_dir: str
     
     print_separator("-")
     
-    # 获取当前脚本所在目录
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    method_speecher_path = os.path.join(current_dir, 'Chapter_Speecher.py')
-    
-    # 默认的previous_speech文件路径（用于第一个文件，从上一级目录读取）
-    parent_dir = os.path.dirname(current_dir)  # 上一级目录（根目录）
-    default_previous_speech = os.path.join(parent_dir, "prompt_template", "Speecher-1.txt")
     
     # 处理统计
     success_count = 0
     failed_pairs = []
-    previous_speech_path = default_previous_speech  # 第一个文件使用默认路径
+    previous_speech_path = get_default_previous_speech()  # 第一个文件使用默认路径
     start_time = time.time()
     
     print(f"\n 开始批量演讲稿生成...")
@@ -176,48 +233,23 @@ def process_file_pairs(markdown_folder: str, python_folder: str, output_dir: str
         print_progress_bar(index-1, total_pairs, prefix="总体进度")
         print()  # 换行
         
-        pair_start_time = time.time()
+        print(f"[PROC] 调用演讲稿生成器...")
+        result = generate_speech_for_pair(md_file, py_file, previous_speech_path, output_dir, prompt_template, manifest)
         
-        try:
-            print(f"[PROC] 启动演讲稿生成器...")
-            
-            # 构建命令参数，包含输出目录
-            cmd_args = [
-                sys.executable,
-                method_speecher_path,
-                md_file,
-                py_file,
-                previous_speech_path,  # 上一个页面的讲稿路径
-                output_dir            # 输出目录
-            ]
-            
-            # 如果提供了prompt_template参数，添加到命令中
-            if prompt_template:
-                cmd_args.extend(['--prompt-template', prompt_template])
-            
-            subprocess.run(cmd_args, check=True)
-            
-            pair_duration = time.time() - pair_start_time
+        if result['status'] in ('success', 'reused'):
             success_count += 1
-            print(f"[OK] 完成！耗时: {format_duration(pair_duration)}")
-            
-            # 计算当前文件生成的演讲稿路径，作为下一个文件的previous_speech_path
-            md_base_name = os.path.splitext(os.path.basename(md_file))[0]
-            current_speech_path = os.path.join(output_dir, f"{md_base_name}_speech.txt")
-            
-            # 检查生成的演讲稿文件是否存在
-            if os.path.exists(current_speech_path):
-                previous_speech_path = current_speech_path  # 更新为下一次使用
-                print(f" 已为下一页面准备上下文: {os.path.basename(current_speech_path)}")
+            if result['status'] == 'reused':
+                print(f"[SKIP] 输入未变化，复用已有演讲稿")
             else:
-                print(f"[WARN]  警告：未找到生成的演讲稿文件 {current_speech_path}")
-                print(f"   下一个文件将继续使用: {os.path.relpath(previous_speech_path, current_dir)}")
+                print(f"[OK] 完成！耗时: {format_duration(result['duration'])}")
             
-        except subprocess.CalledProcessError as e:
-            pair_duration = time.time() - pair_start_time
+            # 当前文件生成的演讲稿作为下一个文件的上下文
+            previous_speech_path = result['speech_file']
+            print(f" 已为下一页面准备上下文: {os.path.basename(previous_speech_path)}")
+        else:
             failed_pairs.append((md_relative, py_relative))
-            print(f"[ERR] 处理失败 (耗时: {format_duration(pair_duration)})")
-            print(f"   错误信息: {str(e)}")
+            print(f"[ERR] 处理失败 (耗时: {format_duration(result['duration'])})")
+            print(f"   错误信息: {result['error']}")
             print(f"   下一个文件将继续使用: {os.path.relpath(previous_speech_path, current_dir)}")
             continue
         
@@ -0,0 +1,397 @@
+"""
+批量合成讲解音频（TTS）
+
+为演讲稿目录中的每个 *_speech.txt 合成讲解音频，输出为音频目录下的 <页面名>_speech.wav，
+可直接用于音频对齐（audio_timing.py）和视频合成（video_assembly.py）。
+
+- TTS后端可替换：openai（OpenAI兼容的语音接口）、cosyvoice（本地CosyVoice模型）、
+  tone（离线替身，按字数生成静音或提示音，用于测试和基准测试）；
+- 多个页面在线程池中并行合成，并发数同时受 --workers 和后端自身的上限约束；
+- 音频缓存的键为讲稿文本、后端名称和全部合成参数（音色、模型、语速等）的哈希，
+  配合运行清单，重新运行时只有讲稿发生变化的页面会重新合成。
+
+使用方法:
+python batch_tts.py generated_speech_dir audio_dir [--backend tone|openai|cosyvoice] [--voice V] [--workers N] [--no-cache]
+"""
+
+import glob
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from batch_coder import format_duration, format_time, load_config, print_progress_bar, print_separator
+
+# 添加根目录到Python路径，以便导入根目录的render_cache和api_call
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from page_utils import get_sort_key
+from render_cache import RenderCache, link_or_copy
+from run_manifest import hash_inputs
+from tracing import propagate, traced
+
+DEFAULT_TTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tts_cache")
+DEFAULT_TTS_WORKERS = 4
+SPEECH_SUFFIX = '_speech'
+
+
+class TTSBackend:
+    """
+    TTS后端接口
+
+    子类实现 synthesize，把一段文本合成为wav文件；settings 返回所有会影响输出音频的参数，
+    参与音频缓存的键。max_workers 为后端自身允许的并发上限（本地模型通常只能串行）。
+    """
+    name = ""
+    max_workers = None
+
+    def settings(self) -> dict:
+        return {}
+
+    def synthesize(self, text: str, output_path: str):
+        raise NotImplementedError
+
+
+class ToneBackend(TTSBackend):
+    """离线替身：按字数估算朗读时长，生成等长的静音或提示音，不依赖任何模型或网络"""
+    name = "tone"
+
+    def __init__(self, voice: str = "silence", chars_per_second: float = 4.5, sample_rate: int = 16000,
+                 frequency: int = 440, latency: float = 0.0):
+        """
+        Args:
+            voice: silence 静音；tone 正弦提示音
+            chars_per_second: 朗读速度（每秒字数），中文讲解约4~5字每秒
+            sample_rate: 采样率
+            frequency: 提示音频率（Hz）
+            latency: 每页额外等待的秒数，用于在基准测试中模拟真实引擎的耗时（不影响输出）
+        """
+        if voice not in ("silence", "tone"):
+            raise ValueError(f"tone后端的voice只能是silence或tone: {voice}")
+        self.voice = voice
+        self.chars_per_second = chars_per_second
+        self.sample_rate = sample_rate
+        self.frequency = frequency
+        self.latency = latency
+
+    def settings(self) -> dict:
+        return {"voice": self.voice, "chars_per_second": self.chars_per_second,
+                "sample_rate": self.sample_rate, "frequency": self.frequency}
+
+    def synthesize(self, text: str, output_path: str):
+        if self.latency:
+            time.sleep(self.latency)
+        char_count = len(''.join(text.split()))
+        total_samples = int(char_count / self.chars_per_second * self.sample_rate)
+        if self.voice == "tone":
+            # 整数频率下一秒恰好包含整数个周期，生成一秒后重复即可
+            second = b''.join(
+                struct.pack('<h', int(8000 * math.sin(2 * math.pi * self.frequency * i / self.sample_rate)))
+                for i in range(self.sample_rate)
+            )
+        else:
+            second = b'\x00\x00' * self.sample_rate
+        full_seconds, remainder = divmod(total_samples, self.sample_rate)
+        with wave.open(output_path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            for _ in range(full_seconds):
+                f.writeframes(second)
+            f.writeframes(second[:remainder * 2])
+
+
+class OpenAITTSBackend(TTSBackend):
+    """OpenAI兼容的语音合成接口（audio/speech），复用api_call中共享的客户端和连接池"""
+    name = "openai"
+
+    def __init__(self, api_key: str, base_url: str = None, model: str = "tts-1", voice: str = "alloy",
+                 speed: float = 1.0, max_workers: int = None):
+        from api_call import DEFAULT_BASE_URL
+
+        self.api_key = api_key
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self.model = model
+        self.voice = voice
+        self.speed = speed
+        self.max_workers = max_workers
+
+    def settings(self) -> dict:
+        return {"base_url": self.base_url, "model": self.model, "voice": self.voice, "speed": self.speed}
+
+    def synthesize(self, text: str, output_path: str):
+        from api_call import get_api_client
+
+        client = get_api_client(self.api_key, self.model, self.base_url).client
+        with client.audio.speech.with_streaming_response.create(
+            model=self.model, voice=self.voice, input=text, speed=self.speed, response_format="wav"
+        ) as response:
+            response.stream_to_file(output_path)
+
+
+class CosyVoiceBackend(TTSBackend):
+    """本地CosyVoice模型（需要在cosyvoice环境中运行），模型只加载一次，各页面串行合成"""
+    name = "cosyvoice"
+    max_workers = 1
+
+    def __init__(self, model_dir: str = "pretrained_models/CosyVoice-300M-SFT", voice: str = "中文女"):
+        """
+        Args:
+            model_dir: CosyVoice预训练模型目录
+            voice: SFT模型内置的说话人
+        """
+        self.model_dir = model_dir
+        self.voice = voice
+        self._model = None
+        self._lock = threading.Lock()
+
+    def settings(self) -> dict:
+        return {"model_dir": os.path.basename(os.path.normpath(self.model_dir)), "voice": self.voice}
+
+    def synthesize(self, text: str, output_path: str):
+        try:
+            import torch
+            import torchaudio
+            from cosyvoice.cli.cosyvoice import CosyVoice
+        except ImportError as e:
+            raise RuntimeError(f"cosyvoice后端需要安装CosyVoice及torchaudio（请在cosyvoice环境中运行）: {e}")
+
+        with self._lock:
+            if self._model is None:
+                self._model = CosyVoice(self.model_dir)
+            chunks = [output['tts_speech'] for output in self._model.inference_sft(text, self.voice, stream=False)]
+            torchaudio.save(output_path, torch.concat(chunks, dim=1), self._model.sample_rate)
+
+
+TTS_BACKENDS = {backend.name: backend for backend in (ToneBackend, OpenAITTSBackend, CosyVoiceBackend)}
+
+
+class TTSCache(RenderCache):
+    """按内容寻址的讲解音频缓存，淘汰策略与渲染缓存相同"""
+    extension = '.wav'
+
+    @staticmethod
+    def make_key(text: str, backend: TTSBackend) -> str:
+        """缓存键：讲稿文本、后端名称和全部合成参数"""
+        digest = hashlib.sha256()
+        for part in (text, backend.name, json.dumps(backend.settings(), sort_keys=True, ensure_ascii=False)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+
+def create_tts_backend(tts_config: dict = None, backend_name: str = None, voice: str = None) -> TTSBackend:
+    """
+    根据config.json中的tts配置创建TTS后端
+
+    tts.backend 选择后端（默认tone），tts.options 为传给后端的参数；openai后端默认使用
+    config.json中的api_key。backend_name、voice用于命令行覆盖配置。
+    """
+    tts_config = tts_config or {}
+    name = backend_name or tts_config.get('backend', 'tone')
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"未知的TTS后端: {name}，可选: {', '.join(TTS_BACKENDS)}")
+    # 配置中的options只在命令行没有切换后端时使用
+    options = dict(tts_config.get('options') or {}) if name == tts_config.get('backend', 'tone') else {}
+    if voice:
+        options['voice'] = voice
+    if name == 'openai':
+        options.setdefault('api_key', load_config()['api_key'])
+    return TTS_BACKENDS[name](**options)
+
+
+def setup_tts_cache(cache_config: dict = None, disable: bool = False):
+    """根据tts.cache配置创建音频缓存（默认开启），配置中enabled为false或传入--no-tts-cache时返回None"""
+    cache_config = cache_config or {}
+    if disable or not cache_config.get('enabled', True):
+        return None
+    return TTSCache(cache_config.get('dir') or DEFAULT_TTS_CACHE_DIR, cache_config.get('max_size_mb', 2048))
+
+
+def read_speech_text(speech_file: str) -> str:
+    """读取讲稿并合并连续空白，只改动换行或缩进的讲稿不会重新合成"""
+    with open(speech_file, 'r', encoding='utf-8') as f:
+        return ' '.join(f.read().split())
+
+
+def get_audio_path(speech_file: str, audio_dir: str) -> str:
+    """讲稿对应的音频路径：page_1_speech.txt -> audio_dir/page_1_speech.wav"""
+    base_name = os.path.splitext(os.path.basename(speech_file))[0]
+    if not base_name.endswith(SPEECH_SUFFIX):
+        base_name += SPEECH_SUFFIX
+    return os.path.join(audio_dir, f"{base_name}.wav")
+
+
+@traced('page', name_arg='speech_file', stage='tts')
+def synthesize_page(speech_file: str, audio_dir: str, backend: TTSBackend, cache: TTSCache = None, manifest=None) -> dict:
+    """
+    合成单个页面的讲解音频
+
+    运行清单中的讲稿与合成参数未变时直接复用已有音频，其次查音频缓存，都未命中时调用后端合成。
+
+    Returns:
+        dict: file、audio、status（synthesized / cached / reused / empty / failed）、duration、error
+    """
+    start_time = time.time()
+    audio_path = get_audio_path(speech_file, audio_dir)
+    result = {'file': speech_file, 'audio': audio_path, 'status': 'failed', 'duration': 0.0, 'error': None}
+    page_key = os.path.basename(speech_file)
+    try:
+        text = read_speech_text(speech_file)
+        if not text:
+            result['status'] = 'empty'
+            return result
+        key = TTSCache.make_key(text, backend)
+        # 输出目录也计入清单的输入，换了音频目录时不会误判为已合成
+        inputs_hash = hash_inputs(key, os.path.abspath(audio_path))
+        if manifest is not None and manifest.is_fresh('tts', page_key, inputs_hash):
+            result['status'] = 'reused'
+            return result
+
+        cached_audio = cache.get(key) if cache is not None else None
+        if cached_audio:
+            link_or_copy(cached_audio, audio_path)
+            result['status'] = 'cached'
+        else:
+            # 先写临时文件再替换，中断时不会留下半个音频
+            tmp_path = f"{audio_path}.part.wav"
+            try:
+                backend.synthesize(text, tmp_path)
+                os.replace(tmp_path, audio_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            if cache is not None:
+                cache.put(key, audio_path)
+            result['status'] = 'synthesized'
+        if manifest is not None:
+            manifest.record('tts', page_key, inputs_hash, [audio_path])
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['duration'] = time.time() - start_time
+    return result
+
+
+def synthesize_speech_folder(speech_dir: str, audio_dir: str, backend: TTSBackend, workers: int = DEFAULT_TTS_WORKERS,
+                             cache: TTSCache = None, manifest=None) -> list:
+    """
+    为演讲稿目录中所有 *_speech.txt 合成讲解音频
+
+    Args:
+        speech_dir: 演讲稿目录
+        audio_dir: 音频输出目录
+        backend: TTS后端
+        workers: 并行合成的页面数，不超过后端的max_workers
+        cache: 音频缓存，为None时不使用缓存
+        manifest: 运行清单（RunManifest），提供时讲稿未变化的页面直接复用已有音频
+
+    Returns:
+        list: 按页面顺序排列的合成结果
+    """
+    print_separator()
+    print(f"[{format_time()}] 开始批量合成讲解音频")
+    print(f"演讲稿目录: {speech_dir}")
+    print(f"音频目录: {audio_dir}")
+
+    speech_files = sorted(glob.glob(os.path.join(speech_dir, f"*{SPEECH_SUFFIX}.txt")), key=get_sort_key)
+    if not speech_files:
+        print(f"\n[WARN]  警告：在 '{speech_dir}' 中没有找到 *{SPEECH_SUFFIX}.txt 文件")
+        return []
+    os.makedirs(audio_dir, exist_ok=True)
+
+    total_files = len(speech_files)
+    workers = max(1, min(workers, backend.max_workers or workers, total_files))
+    print(f"\n 找到 {total_files} 个演讲稿")
+    print(f"[PROC] TTS后端: {backend.name} {json.dumps(backend.settings(), ensure_ascii=False)}，并行数: {workers}")
+    if cache is not None:
+        print(f"[CACHE] 音频缓存: {cache.cache_dir}")
+    print_separator("-")
+
+    results = [None] * total_files
+    completed_count = 0
+    start_time = time.time()
+    print_lock = threading.Lock()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(propagate(synthesize_page), speech_file, audio_dir, backend, cache, manifest): index
+            for index, speech_file in enumerate(speech_files)
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            with print_lock:
+                completed_count += 1
+                results[futures[future]] = result
+                name = os.path.basename(result['file'])
+                if result['status'] == 'synthesized':
+                    print(f"\n[OK] 合成完成: {name} 耗时: {format_duration(result['duration'])}")
+                elif result['status'] in ('cached', 'reused'):
+                    print(f"\n[CACHE] 复用音频: {name}")
+                elif result['status'] == 'empty':
+                    print(f"\n[SKIP] 演讲稿为空: {name}")
+                else:
+                    print(f"\n[ERR] 合成失败: {name} (耗时: {format_duration(result['duration'])})")
+                    print(f"   错误信息: {result['error']}")
+                print_progress_bar(completed_count, total_files, prefix="合成进度")
+                print()
+
+    total_duration = time.time() - start_time
+    counts = {status: sum(1 for result in results if result['status'] == status)
+              for status in ('synthesized', 'cached', 'reused', 'empty', 'failed')}
+    synth_time = sum(result['duration'] for result in results if result['status'] == 'synthesized')
+
+    print_separator()
+    print(f"\n[TARGET] 音频合成完成! 成功 {total_files - counts['failed'] - counts['empty']}/{total_files} 个页面")
+    print_separator("-")
+    print(f"[PROG] 详细统计:")
+    print(f"   • 重新合成: {counts['synthesized']} 页，复用缓存: {counts['cached']} 页，讲稿未变化: {counts['reused']} 页")
+    if counts['empty'] or counts['failed']:
+        print(f"   • 空讲稿: {counts['empty']} 页，失败: {counts['failed']} 页")
+    print(f"   • 总耗时: {format_duration(total_duration)}")
+    if total_duration > 0 and synth_time > 0:
+        print(f"   • 并行加速: {synth_time / total_duration:.1f}x")
+    print(f"\n✨ 讲解音频已保存到: {audio_dir}")
+    print_separator()
+
+    return results
+
+
+def main():
+    """
+    主函数
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='为演讲稿批量合成讲解音频')
+    parser.add_argument('speech_dir', help='包含 *_speech.txt 的演讲稿目录')
+    parser.add_argument('audio_dir', help='音频输出目录（输出 <页面名>_speech.wav）')
+    parser.add_argument('--backend', choices=list(TTS_BACKENDS), default=None,
+                        help='TTS后端 (默认: config.json中tts.backend，未配置时为tone)')
+    parser.add_argument('--voice', default=None, help='音色/说话人 (tone后端: silence 或 tone)')
+    parser.add_argument('--workers', type=int, default=None, help=f'并行合成的页面数 (默认: {DEFAULT_TTS_WORKERS})')
+    parser.add_argument('--cache-dir', default=None, help='音频缓存目录 (默认: 根目录下的 .tts_cache)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用音频缓存，所有页面重新合成')
+
+    args = parser.parse_args()
+
+    tts_config = load_config().get('tts') or {}
+    cache_config = dict(tts_config.get('cache') or {})
+    if args.cache_dir:
+        cache_config['dir'] = args.cache_dir
+    backend = create_tts_backend(tts_config, args.backend, args.voice)
+    cache = setup_tts_cache(cache_config, disable=args.no_cache)
+    results = synthesize_speech_folder(args.speech_dir, args.audio_dir, backend,
+                                       args.workers or tts_config.get('workers', DEFAULT_TTS_WORKERS), cache)
+    if not results or any(result['status'] == 'failed' for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
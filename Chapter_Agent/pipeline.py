@@ -3,6 +3,8 @@
 Method_Agent Complete Pipeline Script
 完整的学术论文到教学视频的自动化处理流程
 
+各步骤均在当前进程内直接调用对应模块的函数，命令行脚本仅作为独立使用时的入口。
+
 使用方法:
 python pipeline.py path/to/paper.md [--output-base-dir output_directory]
 
@@ -11,6 +13,16 @@ python pipeline.py path/to/paper.md [--output-base-dir output_directory]
 2. split.py - 物理分割为独立页面文件
 3. batch_coder.py - 批量生成Manim代码
 4. batch_speecher.py - 批量生成演讲稿
+   (--pipelined 时步骤3、4以流水线方式重叠执行)
+   (--batch 时步骤1、3（以及 --batch-speech 时的步骤4）通过Batch API离线执行，见batch_mode.py)
+5. batch_tts.py - 并行合成各页讲解音频，只重新合成讲稿变化的页面（--tts）
+6. audio_timing.py - 按各页讲解音频的时长补齐动画时长（--audio-dir 或 --tts）
+7. batch_renderer.py - 并行渲染所有场景（--render）
+8. video_assembly.py - 各页视频与讲解音频并行合成并拼接为最终视频（--assemble）
+
+各阶段的输入哈希和输出记录在输出目录的run_manifest.json中，重新运行时只重新生成
+输入发生变化的页面，中断的运行会从停下的位置继续（--force 强制全部重新生成）。
+每次API请求的token用量和费用记入输出目录的usage.jsonl，设置预算（--budget）时超出即中止运行。
 """
 
 import os
@@ -19,9 +31,33 @@ import subprocess
 import argparse
 import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
 from datetime import datetime
 from pathlib import Path
 
+# 添加根目录到Python路径，以便导入根目录的api_call
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_call import (
+    configure_connection_pool, configure_image_preprocessing, configure_rate_limit,
+    get_cache_stats, get_image_stats, get_rate_limit_stats, setup_response_cache
+)
+from Chapter_Brain import load_config, process_markdown_with_prompt
+from split import split_markdown_by_pages
+from batch_coder import PageOutput, generate_code_buffered, print_page_output, process_markdown_folder, format_duration
+from batch_speecher import extract_page_number, generate_speech_for_pair, get_default_previous_speech, process_file_pairs
+from run_manifest import RunManifest, brain_stage_inputs, file_hash
+from batch_mode import batch_brain_round, batch_code_round, batch_speech_round, create_endpoint
+from batch_renderer import QUALITY_FLAGS, default_render_workers, render_code_folder, setup_render_cache
+from batch_tts import DEFAULT_TTS_WORKERS, TTS_BACKENDS, create_tts_backend, setup_tts_cache, synthesize_speech_folder
+from audio_timing import find_audio_files, print_retime_report, retime_code_folder
+from video_assembly import assemble_video, print_assembly_report
+from tracing import (
+    DEFAULT_METRICS_HOST, print_trace_summary, propagate, setup_tracing, span, start_metrics_server, traced,
+    write_prometheus
+)
+from usage_ledger import BudgetExceededError, check_budget, print_usage_summary, setup_usage_ledger, write_usage_summary
+
 def print_separator(char="=", length=80):
     """打印分隔线"""
     print(char * length)
@@ -35,74 +71,6 @@ def print_step(step_number, step_name, description=""):
     print(f"   开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print_separator("-")
 
-def run_command(command, description="", real_time_output=False):
-    """执行命令并处理错误"""
-    print(f"[PROC] 执行命令: {' '.join(command)}")
-    if description:
-        print(f"   {description}")
-    
-    try:
-        if real_time_output:
-            # 实时输出模式，适用于长时间运行的命令
-            # 添加PYTHONUNBUFFERED环境变量强制无缓冲输出
-            env = os.environ.copy()
-            env['PYTHONUNBUFFERED'] = '1'
-            env['PYTHONIOENCODING'] = 'utf-8'
-            
-            print("[PROC] 启动实时输出模式...")
-            
-            process = subprocess.Popen(
-                command, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.STDOUT,
-                text=True,
-                universal_newlines=True,
-                bufsize=0,  # 改为0，完全无缓冲
-                env=env
-            )
-            
-            # 实时读取并打印输出
-            output_lines = []
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    clean_output = output.rstrip()
-                    if clean_output:  # 只打印非空行
-                        print(f"[PROG] {clean_output}")
-                        sys.stdout.flush()
-                        output_lines.append(clean_output)
-            
-            # 等待进程完成并获取返回码
-            return_code = process.poll()
-            if return_code == 0:
-                print("[OK] 命令执行成功")
-                return True
-            else:
-                print(f"[ERR] 命令执行失败，返回码: {return_code}")
-                return False
-        else:
-            # 传统模式，适用于快速命令
-            result = subprocess.run(command, check=True, capture_output=True, text=True)
-            print("[OK] 命令执行成功")
-            if result.stdout:
-                print("输出:")
-                print(result.stdout)
-            return True
-    except subprocess.CalledProcessError as e:
-        print(f"[ERR] 命令执行失败: {e}")
-        if e.stdout:
-            print("标准输出:")
-            print(e.stdout)
-        if e.stderr:
-            print("错误输出:")
-            print(e.stderr)
-        return False
-    except Exception as e:
-        print(f"[ERR] 命令执行出现异常: {e}")
-        return False
-
 def validate_input_file(paper_path):
     """验证输入文件"""
     if not os.path.exists(paper_path):
@@ -123,7 +91,9 @@ def setup_directories(paper_path, output_base_dir):
         'segmentation': os.path.join(output_base_dir, f"{paper_name}_segmentation"),
         'split_pages': os.path.join(output_base_dir, f"{paper_name}_segmentation", "split_pages"),
         'generated_code': os.path.join(output_base_dir, f"{paper_name}_generated_code"),
-        'generated_speech': os.path.join(output_base_dir, f"{paper_name}_generated_speech")
+        'generated_speech': os.path.join(output_base_dir, f"{paper_name}_generated_speech"),
+        'audio': os.path.join(output_base_dir, f"{paper_name}_audio"),
+        'render': os.path.join(output_base_dir, f"{paper_name}_render")
     }
     
     # 创建所有目录
@@ -133,9 +103,43 @@ def setup_directories(paper_path, output_base_dir):
     
     return dirs
 
+def sync_directory(source_dir, dest_dir):
+    """
+    增量同步目录：只复制新增或大小/修改时间变化的文件，并删除源目录中已不存在的文件
+
+    Returns:
+        tuple: (复制的文件数, 删除的文件数)
+    """
+    copied = 0
+    removed = 0
+    for root, _, files in os.walk(source_dir):
+        rel_root = os.path.relpath(root, source_dir)
+        target_root = os.path.normpath(os.path.join(dest_dir, rel_root))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            if os.path.exists(dst):
+                src_stat = os.stat(src)
+                dst_stat = os.stat(dst)
+                if src_stat.st_size == dst_stat.st_size and int(src_stat.st_mtime) == int(dst_stat.st_mtime):
+                    continue
+            # copy2保留修改时间，下次同步时可据此跳过
+            shutil.copy2(src, dst)
+            copied += 1
+    
+    for root, _, files in os.walk(dest_dir):
+        rel_root = os.path.relpath(root, dest_dir)
+        for name in files:
+            if not os.path.exists(os.path.join(source_dir, rel_root, name)):
+                os.remove(os.path.join(root, name))
+                removed += 1
+    
+    return copied, removed
+
 def copy_images_directory(images_dir, target_dirs):
     """
-    将图片目录复制到目标目录中
+    将图片目录复制到目标目录中（增量同步，未变化的图片不重复复制）
     
     Args:
         images_dir: 源图片目录路径
@@ -161,14 +165,9 @@ def copy_images_directory(images_dir, target_dirs):
             if os.path.exists(target_dir):
                 dest_path = os.path.join(target_dir, images_dirname)
                 
-                # 如果目标目录已存在，先删除
-                if os.path.exists(dest_path):
-                    shutil.rmtree(dest_path)
-                    print(f"   [DEL]  删除已存在的目录: {dest_path}")
-                
-                # 复制图片目录
-                shutil.copytree(images_dir, dest_path)
-                print(f"   [OK] 复制到: {dest_path}")
+                # 增量同步，保留未变化图片的修改时间，不影响已生成页面的复用
+                copied, removed = sync_directory(images_dir, dest_path)
+                print(f"   [OK] 同步到: {dest_path} (复制 {copied} 个，删除 {removed} 个)")
                 copied_count += 1
             else:
                 print(f"   [WARN]  目标目录不存在: {target_dir}")
@@ -180,8 +179,9 @@ def copy_images_directory(images_dir, target_dirs):
     
     print(f"[IMG] 图片目录复制完成: 成功 {copied_count} 个，失败 {failed_count} 个")
 
-def step1_brain_segmentation(paper_path, segmentation_dir, chapter_type):
-    """步骤1: 使用Chapter_Brain.py进行AI智能分割"""
+@traced('stage', 'brain')
+def step1_brain_segmentation(paper_path, segmentation_dir, chapter_type, manifest=None):
+    """步骤1: 使用Chapter_Brain.py进行AI智能分割（论文和模板未变化时复用上次的分割结果）"""
     print_step(1, "AI智能分割", f"使用Chapter_Brain.py将{chapter_type}章节分割为逻辑页面")
     
     print("[LIST] AI智能分割说明:")
@@ -194,19 +194,40 @@ def step1_brain_segmentation(paper_path, segmentation_dir, chapter_type):
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
     parent_dir = os.path.dirname(current_dir)
-    brain_script = os.path.join(current_dir, "Chapter_Brain.py")
     brain_template = os.path.join(parent_dir, "prompt_template", f"{chapter_type}_Brain.txt")
     
-    command = [sys.executable, brain_script, paper_path, segmentation_dir, "--prompt-template", brain_template]
+    config = load_config()
+    inputs_hash = brain_stage_inputs(paper_path, brain_template, config['model'])
+    if manifest is not None and manifest.is_fresh('brain', 'segmentation', inputs_hash):
+        output_file = manifest.get_entry('brain', 'segmentation')['outputs'][0]
+        print(f"[SKIP] 论文和模板未变化，复用已有分割结果: {output_file}")
+        return output_file
+    
+    print("[PROC] AI分析论文结构并生成分割版本...")
+    try:
+        result, output_file = process_markdown_with_prompt(paper_path, brain_template, config['api_key'], segmentation_dir, config['model'])
+    except BudgetExceededError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"AI智能分割失败: {e}")
+    if manifest is not None:
+        manifest.record('brain', 'segmentation', inputs_hash, [output_file])
     
-    success = run_command(command, "AI分析论文结构并生成分割版本")
-    if not success:
-        raise RuntimeError("AI智能分割失败")
+    print("[OK] 分割完成！处理结果预览：")
+    print("-" * 50)
+    print(result[:500] + "..." if len(result) > 500 else result)
+    print("-" * 50)
+    print(f"[FILE] 分割结果已保存到: {output_file}")
     
-    return True
+    return output_file
+
+@traced('stage', 'split')
+def step2_physical_split(segmentation_dir, split_pages_dir, segmentation_file=None, manifest=None):
+    """
+    步骤2: 使用split.py进行物理分割
 
-def step2_physical_split(segmentation_dir, split_pages_dir):
-    """步骤2: 使用split.py进行物理分割"""
+    分割后删除本次未生成的旧页面文件；提供manifest时同时清理这些页面的代码和演讲稿。
+    """
     print_step(2, "物理分割", "使用split.py将分割后的文档拆分为独立页面文件")
     
     print("[LIST] 物理分割说明:")
@@ -215,22 +236,36 @@ def step2_physical_split(segmentation_dir, split_pages_dir):
     print("   • 便于后续批量处理和管理")
     print()
     
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    split_script = os.path.join(current_dir, "split.py")
-    
     # 查找AI分割生成的文件
-    segmentation_files = [f for f in os.listdir(segmentation_dir) if f.endswith('_split.md')]
-    if not segmentation_files:
-        raise FileNotFoundError(f"在 {segmentation_dir} 中未找到AI分割生成的文件")
-    
-    segmentation_file = os.path.join(segmentation_dir, segmentation_files[0])
+    if segmentation_file is None:
+        segmentation_files = [f for f in os.listdir(segmentation_dir) if f.endswith('_split.md')]
+        if not segmentation_files:
+            raise FileNotFoundError(f"在 {segmentation_dir} 中未找到AI分割生成的文件")
+        segmentation_file = os.path.join(segmentation_dir, segmentation_files[0])
     print(f"[FILE] 找到分割文件: {segmentation_file}")
     
-    command = [sys.executable, split_script, segmentation_file, split_pages_dir]
+    inputs_hash = file_hash(segmentation_file)
+    if manifest is not None and manifest.is_fresh('split', 'pages', inputs_hash):
+        print("[SKIP] 分割文档未变化，复用已有页面文件")
+        return True
+    
+    print("[PROC] 将分割文档拆分为独立的页面文件...")
+    try:
+        page_paths = split_markdown_by_pages(segmentation_file, split_pages_dir)
+    except Exception as e:
+        raise RuntimeError(f"物理分割失败: {e}")
     
-    success = run_command(command, "将分割文档拆分为独立的页面文件")
-    if not success:
-        raise RuntimeError("物理分割失败")
+    # 页面数量减少时删除残留的旧页面，避免后续步骤继续处理它们
+    current_pages = {os.path.basename(path) for path in page_paths}
+    for f in os.listdir(split_pages_dir):
+        if f.endswith('.md') and f not in current_pages:
+            os.remove(os.path.join(split_pages_dir, f))
+            print(f"   [DEL]  删除旧页面: {f}")
+    if manifest is not None:
+        for stage in ('code', 'speech'):
+            for path in manifest.prune(stage, current_pages):
+                print(f"   [DEL]  删除旧页面的输出: {os.path.basename(path)}")
+        manifest.record('split', 'pages', inputs_hash, page_paths)
     
     # 验证分割结果
     page_files = [f for f in os.listdir(split_pages_dir) if f.endswith('.md')]
@@ -238,7 +273,8 @@ def step2_physical_split(segmentation_dir, split_pages_dir):
     
     return True
 
-def step3_batch_coding(split_pages_dir, generated_code_dir, chapter_type):
+@traced('stage', 'code')
+def step3_batch_coding(split_pages_dir, generated_code_dir, chapter_type, workers=1, manifest=None, stream=False):
     """步骤3: 使用batch_coder.py批量生成代码"""
     print_step(3, "批量代码生成", f"使用batch_coder.py为{chapter_type}章节页面生成Manim动画代码")
     
@@ -248,19 +284,17 @@ def step3_batch_coding(split_pages_dir, generated_code_dir, chapter_type):
     print("   • 包含动画效果: Write(), FadeIn(), 等")
     print("   • 控制视频时长在15秒以内")
     print("   • 处理时间: 每页约30-90秒")
+    print(f"   • 并行页面数: {workers}")
     print(f"   • 使用 {chapter_type}_Coder.txt 模板")
     print()
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
     parent_dir = os.path.dirname(current_dir)
-    batch_coder_script = os.path.join(current_dir, "batch_coder.py")
     coder_template = os.path.join(parent_dir, "prompt_template", f"{chapter_type}_Coder.txt")
     
-    command = [sys.executable, batch_coder_script, split_pages_dir, generated_code_dir, "--prompt-template", coder_template]
-    
     print("[PROC] 开始批量代码生成，将实时显示每个文件的处理进度...")
-    success = run_command(command, "为每个页面生成对应的Manim动画Python代码", real_time_output=True)
-    if not success:
+    results = process_markdown_folder(split_pages_dir, generated_code_dir, coder_template, workers, manifest, stream)
+    if not results:
         raise RuntimeError("批量代码生成失败")
     
     # 验证生成结果
@@ -269,7 +303,8 @@ def step3_batch_coding(split_pages_dir, generated_code_dir, chapter_type):
     
     return True
 
-def step4_batch_speech(split_pages_dir, generated_code_dir, generated_speech_dir, chapter_type):
+@traced('stage', 'speech')
+def step4_batch_speech(split_pages_dir, generated_code_dir, generated_speech_dir, chapter_type, manifest=None):
     """步骤4: 使用batch_speecher.py批量生成演讲稿"""
     print_step(4, "批量演讲稿生成", f"使用batch_speecher.py为{chapter_type}章节页面生成演讲稿")
     
@@ -284,15 +319,10 @@ def step4_batch_speech(split_pages_dir, generated_code_dir, generated_speech_dir
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
     parent_dir = os.path.dirname(current_dir)
-    batch_speecher_script = os.path.join(current_dir, "batch_speecher.py")
     speecher_template = os.path.join(parent_dir, "prompt_template", f"{chapter_type}_Speecher.txt")
     
-    command = [sys.executable, batch_speecher_script, split_pages_dir, generated_code_dir, generated_speech_dir, "--prompt-template", speecher_template]
-    
     print("[PROC] 开始批量演讲稿生成，将实时显示每个文件对的处理进度...")
-    success = run_command(command, "为每个页面生成对应的演讲稿", real_time_output=True)
-    if not success:
-        raise RuntimeError("批量演讲稿生成失败")
+    process_file_pairs(split_pages_dir, generated_code_dir, generated_speech_dir, speecher_template, manifest)
     
     # 验证生成结果
     speech_files = [f for f in os.listdir(generated_speech_dir) if f.endswith('.txt')]
@@ -300,6 +330,198 @@ def step4_batch_speech(split_pages_dir, generated_code_dir, generated_speech_dir
     
     return True
 
+@traced('stage', 'code+speech')
+def step3_4_pipelined_generation(split_pages_dir, generated_code_dir, generated_speech_dir, chapter_type, workers=1, manifest=None, stream=False):
+    """
+    步骤3+4: 流水线方式生成代码和演讲稿
+
+    代码生成由线程池并行处理；演讲稿仍按页面顺序生成（每页需要上一页的讲稿作为上下文），
+    但第k页的演讲稿只需等待第k页代码和第k-1页讲稿完成即可开始，不必等待全部代码生成结束。
+    """
+    print_step("3+4", "流水线生成代码与演讲稿", f"为{chapter_type}章节页面并行生成Manim代码，并在代码就绪后立即生成演讲稿")
+    
+    print("[LIST] 流水线生成说明:")
+    print(f"   • 代码生成并行页面数: {workers}")
+    print("   • 第k页演讲稿在第k页代码和第k-1页演讲稿完成后立即开始")
+    print(f"   • 使用 {chapter_type}_Coder.txt 和 {chapter_type}_Speecher.txt 模板")
+    print()
+    
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(current_dir)
+    coder_template = os.path.join(parent_dir, "prompt_template", f"{chapter_type}_Coder.txt")
+    speecher_template = os.path.join(parent_dir, "prompt_template", f"{chapter_type}_Speecher.txt")
+    
+    os.makedirs(generated_code_dir, exist_ok=True)
+    os.makedirs(generated_speech_dir, exist_ok=True)
+    
+    page_files = [os.path.join(split_pages_dir, f) for f in os.listdir(split_pages_dir) if f.endswith(('.md', '.markdown'))]
+    page_files.sort(key=extract_page_number)
+    if not page_files:
+        raise FileNotFoundError(f"在 {split_pages_dir} 中未找到页面文件")
+    
+    total_pages = len(page_files)
+    start_time = time.time()
+    previous_speech_path = get_default_previous_speech()
+    code_failed = []
+    speech_failed = []
+    speech_count = 0
+    
+    # 代码生成在工作线程中进行，与主线程的演讲稿生成同时输出；各页代码生成的输出先缓冲，就绪时整段打印
+    page_output = PageOutput(sys.stdout)
+    with redirect_stdout(page_output), ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # 按页面顺序提交，靠前的页面先完成代码生成
+        code_futures = [
+            executor.submit(propagate(generate_code_buffered), page_output, page_file, generated_code_dir, coder_template, manifest, stream)
+            for page_file in page_files
+        ]
+        
+        for index, (page_file, code_future) in enumerate(zip(page_files, code_futures), 1):
+            page_name = os.path.basename(page_file)
+            code_result = code_future.result()
+            print_page_output(page_name, code_result['output'])
+            
+            if code_result['status'] == 'failed':
+                code_failed.append(page_name)
+                print(f"[ERR] [{index}/{total_pages}] 代码生成失败: {page_name} ({code_result['error']})")
+                print(f"   跳过该页演讲稿，下一页继续使用: {os.path.basename(previous_speech_path)}")
+                continue
+            if code_result['status'] == 'reused':
+                print(f"[SKIP] [{index}/{total_pages}] 代码未变化，复用: {page_name}")
+            else:
+                print(f"[OK] [{index}/{total_pages}] 代码就绪: {page_name} (耗时: {format_duration(code_result['duration'])})")
+            
+            speech_result = generate_speech_for_pair(
+                page_file, code_result['output_file'], previous_speech_path,
+                generated_speech_dir, speecher_template, manifest
+            )
+            if speech_result['status'] in ('success', 'reused'):
+                speech_count += 1
+                previous_speech_path = speech_result['speech_file']
+                if speech_result['status'] == 'reused':
+                    print(f"[SKIP] [{index}/{total_pages}] 演讲稿未变化，复用: {page_name}")
+                else:
+                    print(f"[OK] [{index}/{total_pages}] 演讲稿完成: {page_name} (耗时: {format_duration(speech_result['duration'])})")
+            else:
+                speech_failed.append(page_name)
+                print(f"[ERR] [{index}/{total_pages}] 演讲稿生成失败: {page_name} ({speech_result['error']})")
+    
+    total_duration = time.time() - start_time
+    print_separator("-")
+    print(f"[TARGET] 流水线生成完成! 代码 {total_pages - len(code_failed)}/{total_pages}，演讲稿 {speech_count}/{total_pages}")
+    print(f"   • 总耗时: {format_duration(total_duration)}")
+    if code_failed:
+        print(f"   • 代码生成失败: {', '.join(code_failed)}")
+    if speech_failed:
+        print(f"   • 演讲稿生成失败: {', '.join(speech_failed)}")
+    
+    if speech_count == 0:
+        raise RuntimeError("流水线生成失败：未生成任何演讲稿")
+    
+    return True
+
+def step_batch_generation(dirs, chapter_type, endpoint, batch_dir, poll_interval, batch_speech, manifest):
+    """步骤3+4（批处理模式）: 代码生成通过Batch API提交，演讲稿按 --batch-speech 选择批处理或逐页生成"""
+    print_step(3, "批处理代码生成", f"将{chapter_type}章节全部页面的代码生成请求作为一个批次提交")
+    print(f"   • 批处理目录: {batch_dir}")
+    print(f"   • 轮询间隔: {poll_interval} 秒")
+    print()
+    
+    code_failed = batch_code_round(dirs['split_pages'], dirs['generated_code'], chapter_type, endpoint, batch_dir, manifest, poll_interval)
+    code_files = [f for f in os.listdir(dirs['generated_code']) if f.endswith('.py')]
+    print(f"[TARGET] 代码生成完成! 共 {len(code_files)} 个Python代码文件，失败 {len(code_failed)} 个")
+    
+    if not batch_speech:
+        return step4_batch_speech(dirs['split_pages'], dirs['generated_code'], dirs['generated_speech'], chapter_type, manifest)
+    
+    print_step(4, "批处理演讲稿生成", "全部页面的演讲稿请求作为一个批次提交（各页使用默认上一页讲稿作为上下文）")
+    speech_failed = batch_speech_round(dirs['split_pages'], dirs['generated_code'], dirs['generated_speech'], chapter_type, endpoint, batch_dir, manifest, poll_interval)
+    speech_files = [f for f in os.listdir(dirs['generated_speech']) if f.endswith('.txt')]
+    print(f"[TARGET] 演讲稿生成完成! 共 {len(speech_files)} 个演讲稿文件，失败 {len(speech_failed)} 个")
+    return True
+
+@traced('stage', 'tts')
+def step5_tts(generated_speech_dir, audio_dir, backend, workers=DEFAULT_TTS_WORKERS, tts_cache=None, manifest=None):
+    """步骤5: 为所有演讲稿合成讲解音频，讲稿和合成参数未变化的页面复用已有音频"""
+    print_step(5, "语音合成", f"使用batch_tts.py ({backend.name}后端) 为每个 *_speech.txt 合成讲解音频")
+    
+    print("[LIST] 合成说明:")
+    print(f"   • 音频目录: {audio_dir}")
+    print(f"   • 音频缓存: {tts_cache.cache_dir if tts_cache else '未启用'}")
+    print("   • 缓存键包含讲稿文本、后端和音色等合成参数，只有讲稿变化的页面会重新合成")
+    print()
+    
+    results = synthesize_speech_folder(generated_speech_dir, audio_dir, backend, workers, tts_cache, manifest)
+    failed = [result for result in results if result['status'] == 'failed']
+    if failed:
+        print(f"[WARN]  {len(failed)} 个页面合成失败，这些页面在对齐和合成视频时按没有音频处理")
+    if tts_cache is not None:
+        stats = tts_cache.stats()
+        print(f"[CACHE] 音频缓存命中 {stats['hits']}，未命中 {stats['misses']}，命中率 {stats['hit_rate']*100:.1f}%")
+    return results
+
+@traced('stage', 'retime')
+def step6_retime(generated_code_dir, audio_dir):
+    """步骤6: 按各页讲解音频的时长补齐动画时长"""
+    print_step(6, "音频对齐", "读取各页讲解音频的时长，在代码末尾补齐等待时间")
+    
+    print("[LIST] 对齐说明:")
+    print(f"   • 音频目录: {audio_dir}")
+    print("   • 只读取音频文件头中的时长，不解码音频")
+    print("   • 重新对齐时替换上次补齐的等待，不会重复累加")
+    print()
+    
+    results = retime_code_folder(generated_code_dir, audio_dir)
+    print_retime_report(results)
+    return results
+
+@traced('stage', 'render')
+def step7_render(generated_code_dir, render_dir, quality='low', workers=None, render_cache=None):
+    """步骤7: 使用batch_renderer.py并行渲染所有页面的Manim场景，未变化的场景从渲染缓存复用"""
+    print_step(7, "视频渲染", "使用batch_renderer.py渲染生成代码中的所有Scene")
+    
+    print("[LIST] 渲染说明:")
+    print(f"   • 渲染质量: {quality} ({QUALITY_FLAGS[quality]})")
+    print(f"   • 并行进程数: {workers or default_render_workers()}")
+    print(f"   • 渲染缓存: {render_cache.cache_dir if render_cache else '未启用'}")
+    print("   • 每个场景的日志保存在 logs/，视频汇总到 videos/")
+    print()
+    
+    results = render_code_folder(generated_code_dir, render_dir, quality, workers, cache=render_cache)
+    failed = [result for result in results if result['status'] not in ('success', 'reused')]
+    if failed:
+        print(f"[WARN]  {len(failed)} 个场景渲染失败，详见日志")
+    if render_cache is not None:
+        stats = render_cache.stats()
+        print(f"[CACHE] 渲染缓存命中 {stats['hits']}，未命中 {stats['misses']}，命中率 {stats['hit_rate']*100:.1f}%")
+    return results
+
+@traced('stage', 'assemble')
+def step8_assemble(render_results, audio_dir, output_path, workers=None):
+    """步骤8: 各页视频与讲解音频合成并拼接为最终视频"""
+    print_step(8, "视频合成", "使用video_assembly.py合成各页音视频并拼接（流复制，不重新编码视频）")
+    
+    # 按页面顺序分组，多场景页面的各场景视频依次串联后与该页音频合成
+    pages = []
+    for result in render_results:
+        if not result.get('final_video'):
+            print(f"[WARN]  {os.path.basename(result['code_file'])}::{result['scene']} 没有渲染成功的视频，合成时跳过")
+            continue
+        page_name = Path(result['code_file']).stem[:-len('_code')]
+        if pages and pages[-1][0] == page_name:
+            pages[-1][1].append(result['final_video'])
+        else:
+            pages.append((page_name, [result['final_video']]))
+    audio_files = find_audio_files(audio_dir) if audio_dir else {}
+    
+    print("[LIST] 合成说明:")
+    print(f"   • 页面数: {len(pages)}，有讲解音频的页面: {sum(1 for page, _ in pages if page in audio_files)}")
+    print("   • 没有讲解音频的页面补静音；输入未变化的页面复用 segments/ 中已合成的片段")
+    print()
+    
+    report = assemble_video(pages, audio_files, output_path, workers=workers)
+    print_assembly_report(report)
+    return report
+
 def collect_generated_files(dirs):
     """收集所有生成的文件信息"""
     files = {}
@@ -472,7 +694,7 @@ def interactive_file_editor(files):
             print(f"\n[BYE] 退出交互模式")
             break
 
-def print_final_summary(dirs, paper_path, start_time):
+def print_final_summary(dirs, paper_path, start_time, manifest=None):
     """打印最终总结"""
     end_time = time.time()
     duration = end_time - start_time
@@ -489,8 +711,14 @@ def print_final_summary(dirs, paper_path, start_time):
     print(f"   │   └── split_pages/ (独立页面文件)")
     print(f"   ├── [DIR] 代码文件: {os.path.relpath(dirs['generated_code'])}")
     print(f"   │   └── *_code.py (Manim动画Python代码)")
-    print(f"   └── [DIR] 演讲稿: {os.path.relpath(dirs['generated_speech'])}")
-    print(f"       └── *_speech.txt (配音文本)")
+    print(f"   ├── [DIR] 演讲稿: {os.path.relpath(dirs['generated_speech'])}")
+    print(f"   │   └── *_speech.txt (配音文本)")
+    print(f"   ├── [DIR] 讲解音频: {os.path.relpath(dirs['audio'])}")
+    print(f"   │   └── *_speech.wav (使用 --tts 时生成)")
+    print(f"   └── [DIR] 渲染结果: {os.path.relpath(dirs['render'])}")
+    print(f"       ├── videos/ (渲染出的视频，使用 --render 时生成)")
+    print(f"       ├── logs/ (每个场景的渲染日志)")
+    print(f"       └── segments/ (各页合成的音视频片段，使用 --assemble 时生成)")
     
     # 统计生成的文件数量
     try:
@@ -510,6 +738,37 @@ def print_final_summary(dirs, paper_path, start_time):
     except Exception as e:
         print(f"   统计文件数量时出错: {e}")
     
+    cache_stats = get_cache_stats()
+    if cache_stats is not None:
+        print(f"\n[CACHE] LLM响应缓存:")
+        print(f"    命中: {cache_stats['hits']}")
+        print(f"    未命中: {cache_stats['misses']}")
+        print(f"    命中率: {cache_stats['hit_rate']*100:.1f}%")
+    
+    rate_stats = get_rate_limit_stats()
+    if rate_stats['rate_limited'] or rate_stats['retries'] or rate_stats['failures']:
+        print(f"\n[WARN]  API限流与重试:")
+        print(f"    429限流: {rate_stats['rate_limited']} 次，重试: {rate_stats['retries']} 次，最终失败: {rate_stats['failures']} 次")
+        print(f"    限流等待: {format_duration(rate_stats['wait_seconds'])}，当前并发上限: {rate_stats['concurrency_limit']}")
+    
+    image_stats = get_image_stats()
+    if image_stats['misses']:
+        print(f"\n[IMG] 图片预处理:")
+        print(f"    处理图片: {image_stats['misses']} 张，复用: {image_stats['hits']} 次")
+        print(f"    体积: {image_stats['bytes_in']/1024:.0f} KB -> {image_stats['bytes_out']/1024:.0f} KB")
+    
+    print_usage_summary()
+    
+    print_trace_summary()
+    
+    if manifest is not None:
+        stage_names = {'brain': 'AI分割', 'split': '物理分割', 'code': '代码', 'speech': '演讲稿', 'tts': '讲解音频'}
+        print(f"\n[CACHE] 增量运行 (run_manifest.json):")
+        for stage, counts in manifest.summary().items():
+            if stage == 'tts' and not (counts['reused'] or counts['generated']):
+                continue
+            print(f"    {stage_names[stage]}: 复用 {counts['reused']}，重新生成 {counts['generated']}")
+    
     print_separator("=")
 
 def main():
@@ -548,6 +807,174 @@ def main():
         help='图片目录路径，将被复制到生成代码和分割页面目录中'
     )
     
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='代码生成阶段并行处理的页面数量 (默认: 1)'
+    )
+    
+    parser.add_argument(
+        '--pipelined',
+        action='store_true',
+        help='流水线模式：代码就绪后立即生成对应页面的演讲稿，与后续页面的代码生成重叠执行'
+    )
+    
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='启用LLM响应磁盘缓存（也可在config.json的response_cache.enabled中开启）'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='禁用LLM响应缓存，优先于配置文件'
+    )
+    
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='忽略已有缓存重新调用API，并用新结果更新缓存'
+    )
+    
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='代码生成时流式接收模型输出：边接收边写入 *_code.py.partial，输出明显不是代码时提前终止'
+    )
+    
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='忽略运行清单，重新生成所有阶段的所有页面'
+    )
+    
+    parser.add_argument(
+        '--tts',
+        action='store_true',
+        help='生成演讲稿后合成各页讲解音频，输出到 --audio-dir（默认 <论文名>_audio），并据此补齐动画时长'
+    )
+    
+    parser.add_argument(
+        '--tts-backend',
+        choices=list(TTS_BACKENDS),
+        help='TTS后端 (默认: config.json中tts.backend，未配置时为离线替身tone)'
+    )
+    
+    parser.add_argument(
+        '--tts-workers',
+        type=int,
+        default=None,
+        help=f'并行合成的页面数 (默认: config.json中tts.workers，未配置时为{DEFAULT_TTS_WORKERS})'
+    )
+    
+    parser.add_argument(
+        '--no-tts-cache',
+        action='store_true',
+        help='不使用音频缓存（讲稿未变化的页面仍按运行清单复用已有音频）'
+    )
+    
+    parser.add_argument(
+        '--audio-dir',
+        help='讲解音频目录（<页面名>[_speech].wav 等）：生成演讲稿后按各页音频时长补齐动画时长'
+    )
+    
+    parser.add_argument(
+        '--render',
+        action='store_true',
+        help='生成代码后用manim并行渲染所有场景，视频汇总到 <论文名>_render/videos'
+    )
+    
+    parser.add_argument(
+        '--render-quality',
+        choices=list(QUALITY_FLAGS),
+        default='low',
+        help='渲染质量: low 预览 (-ql, 默认); medium (-qm); high 成片 (-qh); 4k (-qk)'
+    )
+    
+    parser.add_argument(
+        '--render-workers',
+        type=int,
+        default=None,
+        help='并行渲染的manim进程数 (默认: CPU核数)'
+    )
+    
+    parser.add_argument(
+        '--assemble',
+        action='store_true',
+        help='渲染后把各页视频与 --audio-dir 中（或 --tts 合成）的讲解音频合成并拼接为 <论文名>_render/<论文名>_final.mp4（需要 --render 和ffmpeg）'
+    )
+    
+    parser.add_argument(
+        '--no-render-cache',
+        action='store_true',
+        help='不使用渲染缓存，所有场景重新渲染（缓存可在config.json的render_cache中配置）'
+    )
+    
+    parser.add_argument(
+        '--batch',
+        choices=['openai', 'local'],
+        help='批处理模式：AI分割和代码生成通过Batch API提交 (openai: OpenAI Batch接口; local: 本地目录替身，用于测试)'
+    )
+    
+    parser.add_argument(
+        '--batch-dir',
+        help='批处理输入/结果JSONL的保存目录 (默认: <输出目录>/batch)'
+    )
+    
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=60,
+        help='批处理模式下轮询批次状态的间隔秒数 (默认: 60)'
+    )
+    
+    parser.add_argument(
+        '--batch-speech',
+        action='store_true',
+        help='批处理模式下演讲稿也作为一个批次提交（各页不再以上一页讲稿为上下文）'
+    )
+    
+    parser.add_argument(
+        '--budget',
+        type=float,
+        help='本次运行的API费用上限（美元），达到后不再发出请求并中止运行（也可在config.json的usage.budget中设置）'
+    )
+    
+    parser.add_argument(
+        '--price-table',
+        help='模型价格表JSON文件 {模型: {input, cached_input, output}}（美元/百万token），覆盖内置价格和config.json的usage.prices'
+    )
+    
+    parser.add_argument(
+        '--trace',
+        action='store_true',
+        help='记录各阶段、页面和API调用的追踪（耗时、重试、token、图片字节、缓存命中），写入 <输出目录>/trace.jsonl'
+    )
+    
+    parser.add_argument(
+        '--trace-file',
+        help='追踪文件路径（指定时自动开启追踪，多次运行追加到同一文件）'
+    )
+    
+    parser.add_argument(
+        '--metrics-file',
+        help='运行结束时把追踪汇总为Prometheus文本格式写入该文件（自动开启追踪）'
+    )
+    
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='运行期间在该端口提供Prometheus /metrics 端点（自动开启追踪）'
+    )
+    
+    parser.add_argument(
+        '--metrics-host',
+        default=DEFAULT_METRICS_HOST,
+        help=f'/metrics 端点监听的地址 (默认: {DEFAULT_METRICS_HOST}，仅本机可访问；0.0.0.0 会暴露给所有网络)'
+    )
+    
     args = parser.parse_args()
     
     start_time = time.time()
@@ -565,28 +992,99 @@ def main():
         # 验证输入文件
         validate_input_file(args.paper_path)
         
-        # 设置目录结构
-        dirs = setup_directories(args.paper_path, args.output_base_dir)
+        # 所有页面共享同一个API客户端及其连接池，可在config.json的connection_pool中调整
+        configure_connection_pool(**load_config().get('connection_pool', {}))
         
-        # 执行Pipeline步骤
-        step1_brain_segmentation(args.paper_path, dirs['segmentation'], args.chapter)
-        step2_physical_split(dirs['segmentation'], dirs['split_pages'])
+        # 发送给模型前的图片缩放与压缩，可在config.json的image_preprocessing中调整
+        configure_image_preprocessing(**load_config().get('image_preprocessing', {}))
         
-        # 复制图片目录到相应位置
-        if args.images_dir:
-            print_separator("=")
-            print("[IMG] 图片目录复制")
-            print("   将指定的图片目录复制到生成代码和分割页面目录中")
-            print_separator("-")
-            
-            target_dirs = [dirs['split_pages'], dirs['generated_code']]
-            copy_images_directory(args.images_dir, target_dirs)
+        # RPM/TPM限流与自适应并发，可在config.json的rate_limit中配置（限额按进程计算）
+        configure_rate_limit(**load_config().get('rate_limit', {}))
+        
+        # LLM响应缓存（可在config.json的response_cache中开启，或使用--cache/--no-cache/--refresh）
+        if setup_response_cache(load_config().get('response_cache'), args.cache, args.no_cache, args.refresh):
+            print(f"[CACHE] 已启用LLM响应缓存{' (refresh模式)' if args.refresh else ''}")
+        
+        # 追踪：写入 --trace-file（--trace 时为 <输出目录>/trace.jsonl）；由master_pipeline启动时沿用其追踪文件
+        trace_file = args.trace_file or (os.path.join(args.output_base_dir, 'trace.jsonl') if args.trace or args.metrics_file or args.metrics_port else None)
+        trace_path = setup_tracing(trace_file)
+        if trace_path:
+            print(f"[TIME] 追踪文件: {trace_path}")
+            if args.metrics_port:
+                start_metrics_server(args.metrics_port, host=args.metrics_host)
+                print(f"[PROG] Prometheus指标端点: http://{args.metrics_host}:{args.metrics_port}/metrics")
         
-        step3_batch_coding(dirs['split_pages'], dirs['generated_code'], args.chapter)
-        step4_batch_speech(dirs['split_pages'], dirs['generated_code'], dirs['generated_speech'], args.chapter)
+        # 用量账本：<输出目录>/usage.jsonl；由master_pipeline启动时写入其账本，预算对整篇论文生效
+        ledger = setup_usage_ledger(load_config().get('usage'), args.output_base_dir, args.budget, args.price_table)
+        print(f"[PROG] 用量账本: {ledger.ledger_path}{f'，预算 ${ledger.budget:.2f}' if ledger.budget is not None else ''}")
+        
+        # 章节span覆盖从建立目录到视频合成的全部阶段（不包括之后的交互式编辑）
+        with span('chapter', args.chapter, paper=Path(args.paper_path).stem):
+            # 设置目录结构
+            dirs = setup_directories(args.paper_path, args.output_base_dir)
+            
+            # 运行清单：记录每个阶段每个页面的输入哈希，重新运行时跳过未变化的页面
+            manifest = RunManifest(dirs['base'], force=args.force)
+            
+            # 执行Pipeline步骤
+            if args.batch:
+                batch_dir = args.batch_dir or os.path.join(dirs['base'], 'batch')
+                endpoint = create_endpoint(args.batch, batch_dir)
+                print_step(1, "批处理AI智能分割", f"通过Batch API ({args.batch}) 提交{args.chapter}章节的分割请求")
+                segmentation_file = batch_brain_round(args.paper_path, dirs['segmentation'], args.chapter, endpoint, batch_dir, manifest, args.poll_interval)
+            else:
+                segmentation_file = step1_brain_segmentation(args.paper_path, dirs['segmentation'], args.chapter, manifest)
+            step2_physical_split(dirs['segmentation'], dirs['split_pages'], segmentation_file, manifest)
+            check_budget()
+            
+            # 复制图片目录到相应位置
+            if args.images_dir:
+                print_separator("=")
+                print("[IMG] 图片目录复制")
+                print("   将指定的图片目录复制到生成代码和分割页面目录中")
+                print_separator("-")
+                
+                target_dirs = [dirs['split_pages'], dirs['generated_code']]
+                copy_images_directory(args.images_dir, target_dirs)
+            
+            if args.batch:
+                step_batch_generation(dirs, args.chapter, endpoint, batch_dir, args.poll_interval, args.batch_speech, manifest)
+            elif args.pipelined:
+                step3_4_pipelined_generation(dirs['split_pages'], dirs['generated_code'], dirs['generated_speech'], args.chapter, args.workers, manifest, args.stream)
+            else:
+                step3_batch_coding(dirs['split_pages'], dirs['generated_code'], args.chapter, args.workers, manifest, args.stream)
+                check_budget()
+                step4_batch_speech(dirs['split_pages'], dirs['generated_code'], dirs['generated_speech'], args.chapter, manifest)
+            # 超出预算时部分页面的请求没有发出，不再继续后面的阶段
+            check_budget()
+            
+            audio_dir = args.audio_dir
+            if args.tts:
+                audio_dir = audio_dir or dirs['audio']
+                tts_config = load_config().get('tts') or {}
+                backend = create_tts_backend(tts_config, args.tts_backend)
+                tts_cache = setup_tts_cache(tts_config.get('cache'), args.no_tts_cache)
+                step5_tts(dirs['generated_speech'], audio_dir, backend,
+                          args.tts_workers or tts_config.get('workers', DEFAULT_TTS_WORKERS), tts_cache, manifest)
+            
+            if audio_dir:
+                step6_retime(dirs['generated_code'], audio_dir)
+            
+            if args.render:
+                render_cache = setup_render_cache(load_config().get('render_cache'), args.no_render_cache)
+                render_results = step7_render(dirs['generated_code'], dirs['render'], args.render_quality, args.render_workers, render_cache)
+                if args.assemble:
+                    final_video = os.path.join(dirs['render'], f"{Path(args.paper_path).stem}_final.mp4")
+                    step8_assemble(render_results, audio_dir, final_video, args.render_workers)
+            elif args.assemble:
+                print("[WARN]  --assemble 需要同时使用 --render，已跳过视频合成")
         
         # 打印最终总结
-        print_final_summary(dirs, args.paper_path, start_time)
+        print_final_summary(dirs, args.paper_path, start_time, manifest)
+        print(f"[OK] 用量汇总已保存到: {write_usage_summary()}")
+        if args.metrics_file and trace_path:
+            write_prometheus(args.metrics_file)
+            print(f"[OK] Prometheus指标已保存到: {args.metrics_file}")
         
         # 收集生成的文件
         generated_files = collect_generated_files(dirs)
@@ -611,6 +1109,11 @@ def main():
     except KeyboardInterrupt:
         print("\n[WARN] 用户中断了Pipeline执行")
         sys.exit(1)
+    except BudgetExceededError as e:
+        print(f"\n[ERR] 费用达到预算上限，Pipeline已中止: {e}")
+        print_usage_summary()
+        print(f"[OK] 用量汇总已保存到: {write_usage_summary()}")
+        sys.exit(1)
     except Exception as e:
         print(f"\n[ERR] Pipeline执行失败: {str(e)}")
         print("请检查错误信息并重试")
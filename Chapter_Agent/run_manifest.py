@@ -0,0 +1,168 @@
+"""
+Chapter_Agent 运行清单
+
+记录每个阶段（brain、split、code、speech、tts）每个页面的输入哈希与输出路径。
+重新运行时只重新生成输入发生变化的页面，中断的运行可以从停下的位置继续。
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from content_list import get_blocks_path
+from wait_time_calculator import strip_wait_padding
+
+MANIFEST_FILENAME = "run_manifest.json"
+MANIFEST_VERSION = 1
+
+STAGES = ['brain', 'split', 'code', 'speech', 'tts']
+
+
+def file_hash(path: str) -> str:
+    """计算文件内容的SHA-256，文件不存在时返回空字符串"""
+    if not path or not os.path.exists(path):
+        return ""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_hash(path: str) -> str:
+    """计算代码的SHA-256，不包括按音频时长自动补齐的等待（补齐不影响讲稿内容），文件不存在时返回空字符串"""
+    if not path or not os.path.exists(path):
+        return ""
+    # 按原样读取换行符，没有补齐内容的代码与 file_hash 结果相同，已有的运行清单仍然有效
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return hashlib.sha256(strip_wait_padding(f.read()).encode('utf-8')).hexdigest()
+
+
+def hash_inputs(*parts: str) -> str:
+    """把若干输入（已计算的哈希或普通字符串）组合成一个哈希"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode('utf-8'))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def referenced_images_hash(markdown_path: str) -> str:
+    """计算页面中引用的所有图片的组合哈希，图片变化时该页需要重新生成"""
+    with open(markdown_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    base_dir = os.path.dirname(os.path.abspath(markdown_path))
+    image_hashes = []
+    for img_path in re.findall(r"!\[\]\((.+?)\)", content):
+        resolved = img_path if os.path.isabs(img_path) else os.path.join(base_dir, img_path)
+        image_hashes.append(f"{img_path}:{file_hash(resolved)}")
+    return hash_inputs(*image_hashes)
+
+
+def brain_stage_inputs(paper_path: str, prompt_template: str, model: str) -> str:
+    """AI分割阶段的输入：章节内容、提示词模板和模型；章节来自content_list时还包括 *_blocks.json"""
+    parts = [file_hash(paper_path), file_hash(prompt_template), model]
+    blocks_path = get_blocks_path(paper_path)
+    if os.path.exists(blocks_path):
+        parts.append(file_hash(blocks_path))
+    return hash_inputs(*parts)
+
+
+def code_stage_inputs(markdown_file: str, prompt_template: str, model: str) -> str:
+    """代码生成阶段的输入：页面内容、引用的图片、提示词模板和模型"""
+    return hash_inputs(file_hash(markdown_file), referenced_images_hash(markdown_file), file_hash(prompt_template), model)
+
+
+def speech_stage_inputs(markdown_file: str, python_file: str, previous_speech_path: str, prompt_template: str, model: str) -> str:
+    """演讲稿生成阶段的输入：页面内容、引用的图片、代码、上一页讲稿、提示词模板和模型"""
+    return hash_inputs(
+        file_hash(markdown_file), referenced_images_hash(markdown_file), code_hash(python_file),
+        file_hash(previous_speech_path), file_hash(prompt_template), model
+    )
+
+
+class RunManifest:
+    def __init__(self, output_base_dir: str, force: bool = False):
+        """
+        Args:
+            output_base_dir: 章节输出目录，清单保存在其中的run_manifest.json
+            force: 为True时所有条目都视为过期（全部重新生成），但仍会记录新结果
+        """
+        self.path = os.path.join(output_base_dir, MANIFEST_FILENAME)
+        self.force = force
+        self._lock = threading.Lock()
+        self.reused = {stage: 0 for stage in STAGES}
+        self.generated = {stage: 0 for stage in STAGES}
+        self.data = {"version": MANIFEST_VERSION, "stages": {stage: {} for stage in STAGES}}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    for stage in STAGES:
+                        self.data["stages"][stage].update(data.get("stages", {}).get(stage, {}))
+            except Exception as e:
+                print(f"[WARN]  读取运行清单失败，将重新生成全部内容: {e}")
+
+    def get_entry(self, stage: str, key: str) -> dict:
+        with self._lock:
+            return dict(self.data["stages"][stage].get(key, {}))
+
+    def is_fresh(self, stage: str, key: str, inputs_hash: str) -> bool:
+        """输入哈希未变且所有输出文件仍存在时返回True，并计入复用统计"""
+        if self.force:
+            return False
+        entry = self.get_entry(stage, key)
+        fresh = (
+            bool(entry)
+            and entry.get("inputs") == inputs_hash
+            and all(os.path.exists(path) for path in entry.get("outputs", []))
+        )
+        if fresh:
+            with self._lock:
+                self.reused[stage] += 1
+        return fresh
+
+    def record(self, stage: str, key: str, inputs_hash: str, outputs: List[str]):
+        """记录一个条目并立即写盘，保证中断后可以续跑"""
+        with self._lock:
+            self.data["stages"][stage][key] = {
+                "inputs": inputs_hash,
+                "outputs": [os.path.abspath(path) for path in outputs],
+                "updated": time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self.generated[stage] += 1
+            self._save()
+
+    def prune(self, stage: str, keep_keys: List[str]) -> List[str]:
+        """删除不在keep_keys中的条目及其输出文件（页面被合并或删除后的残留），返回被删除的输出"""
+        removed = []
+        with self._lock:
+            entries = self.data["stages"][stage]
+            for key in [key for key in entries if key not in keep_keys]:
+                for path in entries.pop(key).get("outputs", []):
+                    if os.path.exists(path):
+                        os.remove(path)
+                        removed.append(path)
+            self._save()
+        return removed
+
+    def _save(self):
+        """先写临时文件再替换，避免中断时留下损坏的清单"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """各阶段复用与重新生成的数量"""
+        with self._lock:
+            return {stage: {"reused": self.reused[stage], "generated": self.generated[stage]} for stage in STAGES}
@@ -3,6 +3,7 @@ import re
 import argparse
 
 def split_markdown_by_pages(input_file: str, output_dir: str):
+    """按"# 页 x"标记拆分文件，返回生成的页面文件路径列表"""
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
 
@@ -16,6 +17,8 @@ def split_markdown_by_pages(input_file: str, output_dir: str):
     # 用正则匹配每一页（以"# 页 x"开头）
     pages = re.split(r'(?=# 页 \d+)', content)
 
+    output_files = []
+
     # 遍历每一页并保存为单独的 markdown 文件
     for i, page in enumerate(pages):
         if page.strip():  # 跳过空内容
@@ -30,6 +33,9 @@ def split_markdown_by_pages(input_file: str, output_dir: str):
             with open(output_path, 'w', encoding='utf-8') as out_file:
                 out_file.write(page.strip())
             print(f"[OK] 生成：{output_filename}")
+            output_files.append(output_path)
+
+    return output_files
 
 def main():
     """
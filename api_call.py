@@ -1,26 +1,281 @@
+import asyncio
 import base64
 import time
-from openai import OpenAI
+import threading
+import weakref
+import httpx
+from openai import AsyncOpenAI, OpenAI
 import json
 import socket
 import ssl
 import re
 import os
-from typing import List, Dict, Any, Union, Tuple
+from typing import Callable, Iterator, List, Dict, Any, Optional, Union, Tuple
 from PIL import Image
+from response_cache import DEFAULT_CACHE_DIR, ResponseCache
+from image_preprocessor import ImagePreprocessor, get_mime_type
+from rate_limiter import APICallError, RateLimiter, classify_error, estimate_request_tokens
+from tracing import record_usage, span
+from usage_ledger import record_call, release_budget, reserve_budget, reserve_budget_async
 
 # 常量定义
-MAX_RETRIES = 3
+MAX_RETRIES = 6  # 单个请求的最大尝试次数（可在rate_limit.max_retries中调整）
 TIMEOUT = 1200
+DEFAULT_BASE_URL = "https://yeysai.com/v1/"
+MAX_IN_FLIGHT_REQUESTS = 16  # 异步客户端同时在途的最大请求数
+
+# HTTP连接池配置，所有共享客户端复用同一组设置
+CONNECTION_POOL_SETTINGS = {
+    "max_connections": 64,             # 同时打开的最大连接数
+    "max_keepalive_connections": 32,   # 空闲时保留的长连接数
+    "keepalive_expiry": 120.0          # 空闲长连接的保留时间（秒）
+}
+
+# 图片引用 ![](path)，引号（' 或 `）的上下文在同一遍扫描中顺带判定
+_IMAGE_REF_PATTERN = re.compile(r"!\[\]\((.+?)\)")
+_QUOTE_CHARS = ("'", "`")
+
+# 进程级客户端注册表：(api_key, base_url, model) -> APIClient
+_client_registry: Dict[Tuple[str, str, str], "APIClient"] = {}
+# 按base_url共享的HTTP连接池，不同模型的客户端复用同一批TLS连接
+_http_clients: Dict[str, httpx.Client] = {}
+_registry_lock = threading.Lock()
+# 异步客户端和信号量与事件循环绑定，按事件循环分别保存
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str, str], AsyncAPIClient]]" = weakref.WeakKeyDictionary()
+_async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+# 可选的磁盘响应缓存，默认关闭，通过configure_response_cache开启
+_response_cache: Optional[ResponseCache] = None
+# 图片预处理器：每张图只读取一次，缩放压缩后的data URL和原始尺寸在进程内缓存
+_image_preprocessor = ImagePreprocessor()
+# 进程级限流器：RPM/TPM令牌桶 + AIMD自适应并发，同步和异步客户端共享
+_rate_limiter = RateLimiter(max_retries=MAX_RETRIES)
+
+
+def configure_connection_pool(max_connections: int = None, max_keepalive_connections: int = None, keepalive_expiry: float = None):
+    """
+    配置共享HTTP连接池的大小和长连接保留时间
+
+    只对之后新建的连接池生效，应在发起第一次请求之前调用。
+    """
+    with _registry_lock:
+        if max_connections is not None:
+            CONNECTION_POOL_SETTINGS["max_connections"] = max_connections
+        if max_keepalive_connections is not None:
+            CONNECTION_POOL_SETTINGS["max_keepalive_connections"] = max_keepalive_connections
+        if keepalive_expiry is not None:
+            CONNECTION_POOL_SETTINGS["keepalive_expiry"] = keepalive_expiry
+
+
+def configure_response_cache(enabled: bool = True, cache_dir: str = None, max_size_mb: float = 512, max_age_days: float = 30, refresh: bool = False):
+    """
+    开启或关闭LLM响应缓存
+
+    Args:
+        enabled: 是否启用缓存
+        cache_dir: 缓存目录，默认为仓库根目录下的.llm_cache
+        max_size_mb: 缓存总大小上限（MB）
+        max_age_days: 缓存条目最长保留天数
+        refresh: 忽略已有缓存强制重新调用API，并用新结果覆盖缓存
+    """
+    global _response_cache
+    if enabled:
+        _response_cache = ResponseCache(cache_dir or DEFAULT_CACHE_DIR, max_size_mb, max_age_days, refresh)
+    else:
+        _response_cache = None
+
+
+def setup_response_cache(cache_config: Dict[str, Any] = None, force_enable: bool = False, disable: bool = False, refresh: bool = False) -> bool:
+    """
+    根据config.json中的response_cache配置和命令行开关设置响应缓存
+
+    缓存默认关闭（opt-in）：配置中enabled为true或传入--cache/--refresh时开启，--no-cache优先级最高。
+
+    Returns:
+        bool: 缓存是否已启用
+    """
+    cache_config = cache_config or {}
+    enabled = (cache_config.get('enabled', False) or force_enable or refresh) and not disable
+    configure_response_cache(
+        enabled,
+        cache_dir=cache_config.get('dir'),
+        max_size_mb=cache_config.get('max_size_mb', 512),
+        max_age_days=cache_config.get('max_age_days', 30),
+        refresh=refresh
+    )
+    return enabled
+
+
+def configure_image_preprocessing(max_edge: int = None, jpeg_quality: int = None, enabled: bool = None, max_entries: int = None):
+    """
+    配置发送给模型的图片的缩放与压缩参数（对应config.json中的image_preprocessing）
+
+    Args:
+        max_edge: 图片长边上限（像素），为0时不缩放
+        jpeg_quality: 重新压缩为JPEG时的质量
+        enabled: 为False时按原图发送
+        max_entries: 进程内缓存的最大图片数
+    """
+    global _image_preprocessor
+    settings = {
+        "max_edge": _image_preprocessor.max_edge if max_edge is None else max_edge,
+        "jpeg_quality": _image_preprocessor.jpeg_quality if jpeg_quality is None else jpeg_quality,
+        "enabled": _image_preprocessor.enabled if enabled is None else enabled,
+        "max_entries": _image_preprocessor.max_entries if max_entries is None else max_entries
+    }
+    _image_preprocessor = ImagePreprocessor(**settings)
+
+
+def configure_rate_limit(requests_per_minute: float = None, tokens_per_minute: float = None,
+                         initial_concurrency: int = 8, min_concurrency: int = 1, max_concurrency: int = 32,
+                         max_retries: int = MAX_RETRIES, backoff_base: float = 2.0, backoff_cap: float = 60.0):
+    """
+    配置进程内共享的限流器（对应config.json中的rate_limit）
+
+    Args:
+        requests_per_minute: 每分钟请求数上限，None表示不限制
+        tokens_per_minute: 每分钟token数上限，None表示不限制
+        initial_concurrency / min_concurrency / max_concurrency: 自适应并发上限的初始值和范围
+        max_retries: 单个请求的最大尝试次数
+        backoff_base / backoff_cap: 指数退避的基数和单次最长等待（秒）
+    """
+    global _rate_limiter
+    _rate_limiter = RateLimiter(
+        requests_per_minute, tokens_per_minute, initial_concurrency, min_concurrency, max_concurrency,
+        max_retries, backoff_base, backoff_cap
+    )
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """返回限流统计：请求数、429次数、重试次数、失败次数、累计等待时间和当前并发上限"""
+    return _rate_limiter.stats()
+
+
+def _usage_total_tokens(response) -> Optional[int]:
+    """从响应中取出实际token用量，没有usage时返回None"""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def _image_bytes(content: List[Dict[str, Any]]) -> int:
+    """请求中随附的图片字节数（按data URL的长度计算，即实际发送的字节数）"""
+    return sum(len(part["image_url"]["url"]) for part in content if part.get("type") == "image_url")
+
+
+def get_image_stats() -> Dict[str, float]:
+    """返回图片预处理缓存的命中次数和压缩前后的字节数"""
+    return _image_preprocessor.stats()
+
+
+def get_cache_stats() -> Optional[Dict[str, Any]]:
+    """返回响应缓存的命中统计，未启用缓存时返回None"""
+    return _response_cache.stats() if _response_cache is not None else None
+
+
+def _cache_key_for(request: Dict[str, Any], content: List[Dict[str, Any]]) -> Optional[str]:
+    """计算请求的缓存键，未启用缓存时返回None"""
+    if _response_cache is None:
+        return None
+    return ResponseCache.make_key(request["model"], request["max_tokens"], request["temperature"], content)
+
+
+def _get_shared_http_client(base_url: str) -> httpx.Client:
+    """获取（或创建）指定base_url共享的HTTP连接池，调用方需持有_registry_lock"""
+    http_client = _http_clients.get(base_url)
+    if http_client is None:
+        http_client = httpx.Client(
+            limits=httpx.Limits(**CONNECTION_POOL_SETTINGS),
+            timeout=TIMEOUT,
+            follow_redirects=True
+        )
+        _http_clients[base_url] = http_client
+    return http_client
+
+
+def get_api_client(api_key: str, model: str, base_url: str = None) -> "APIClient":
+    """
+    获取进程内共享的APIClient
+
+    相同 (api_key, base_url, model) 的调用复用同一个客户端及其HTTP连接池，
+    避免每次请求都重新建立TLS连接。
+    """
+    base_url = base_url or DEFAULT_BASE_URL
+    key = (api_key, base_url, model)
+    with _registry_lock:
+        client = _client_registry.get(key)
+        if client is None:
+            client = APIClient(api_key=api_key, model=model, base_url=base_url,
+                               http_client=_get_shared_http_client(base_url))
+            _client_registry[key] = client
+        return client
+
+
+def close_api_clients():
+    """关闭所有共享的客户端和连接池"""
+    with _registry_lock:
+        for http_client in _http_clients.values():
+            http_client.close()
+        _http_clients.clear()
+        _client_registry.clear()
+
+
+def scan_image_references(text: str, annotate: Callable[[str], Optional[str]] = None) -> Tuple[List[Tuple[str, bool]], str]:
+    """
+    单遍扫描文本中的图片引用 ![](path)
+
+    引号判定规则与原先逐个rfind/find的实现一致：图片引用之前没有出现过引号，
+    或引用结束处紧跟引号，或引用位于文本末尾时才视为真实图片（不在引号内）。
+    引用内部出现的引号同样计入后续引用的"之前出现过引号"。
+
+    Args:
+        text: 要扫描的文本
+        annotate: 可选回调，参数为图片路径，返回追加在该引用之后的标注文本（None表示不标注）；
+            对所有引用（包括引号内的）都会调用
+
+    Returns:
+        tuple: ([(图片路径, 是否作为图片发送), ...], 插入标注后的文本)
+    """
+    refs = []
+    pieces = []
+    last = 0
+    scanned = 0  # 已检查过引号的位置，一旦出现引号就不再需要继续检查
+    seen_quote = False
+    text_length = len(text)
+
+    for match in _IMAGE_REF_PATTERN.finditer(text):
+        start, end = match.span()
+        if not seen_quote:
+            seen_quote = text.find("'", scanned, start) != -1 or text.find("`", scanned, start) != -1
+            scanned = start
+
+        img_path = match.group(1)
+        include = not seen_quote or end == text_length or text[end] in _QUOTE_CHARS
+        refs.append((img_path, include))
+
+        if annotate is not None:
+            suffix = annotate(img_path)
+            if suffix:
+                pieces.append(text[last:end])
+                pieces.append(suffix)
+                last = end
+
+    if not pieces:
+        return refs, text
+    pieces.append(text[last:])
+    return refs, "".join(pieces)
+
 
 class APIClient:
-    def __init__(self, api_key: str, model: str = "gpt-4o"):
+    def __init__(self, api_key: str, model: str = "gpt-4o", base_url: str = None, http_client: httpx.Client = None):
         self.api_key = api_key
         self.model = model
-        # 初始化 OpenAI 客户端
+        self.base_url = base_url or DEFAULT_BASE_URL
+        # 初始化 OpenAI 客户端，提供http_client时复用其连接池
+        # 关闭SDK自带的重试：重试统一由限流器负责（令牌桶、自适应并发和Retry-After暂停）
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://yeysai.com/v1/",
+            base_url=self.base_url,
+            http_client=http_client,
+            max_retries=0,
         )
     
     def encode_image(self, image_path: str) -> str:
@@ -33,35 +288,8 @@ class APIClient:
     
     def extract_images_from_text(self, text: str) -> List[str]:
         """从文本中提取图片路径，格式为 ![](xx/xxx.jpg)，但忽略被引号包裹的情况"""
-        # 先找出所有的图片引用
-        pattern = r"!\[\]\((.+?)\)"
-        matches = []
-        
-        # 对每个匹配项，检查它是否被引号包裹
-        for match in re.finditer(pattern, text):
-            start = match.start()
-            end = match.end()
-            
-            # 检查这个匹配是否被引号包裹
-            # 向前找最近的引号
-            prev_quote = text.rfind("'", 0, start)
-            prev_quote2 = text.rfind("`", 0, start)
-            prev_quote = max(prev_quote, prev_quote2)
-            
-            # 向后找最近的引号
-            next_quote = text.find("'", end)
-            next_quote2 = text.find("`", end)
-            if next_quote == -1:
-                next_quote = len(text)
-            if next_quote2 == -1:
-                next_quote2 = len(text)
-            next_quote = min(next_quote, next_quote2)
-            
-            # 如果这个图片引用不在引号内，就添加到结果中
-            if prev_quote == -1 or next_quote == -1 or not (prev_quote < start and end < next_quote):
-                matches.append(match.group(1))
-                
-        return matches
+        refs, _ = scan_image_references(text)
+        return [img_path for img_path, include in refs if include]
     
     def get_image_size(self, image_path: str) -> Tuple[int, int]:
         """获取图片的尺寸 (width, height)"""
@@ -70,17 +298,7 @@ class APIClient:
     
     def get_mime_type(self, file_path: str) -> str:
         """根据文件扩展名获取MIME类型"""
-        ext = os.path.splitext(file_path)[1].lower()
-        mime_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp',
-            '.bmp': 'image/bmp',
-            '.svg': 'image/svg+xml'
-        }
-        return mime_types.get(ext, 'application/octet-stream')
+        return get_mime_type(file_path)
     
     def resolve_image_path(self, img_path: str, base_path: str = None) -> str:
         """
@@ -113,24 +331,42 @@ class APIClient:
             text: 要处理的文本
             base_path: 图片路径的基准目录（通常是markdown文件所在目录）
         """
-        # 提取图片路径
-        image_paths = self.extract_images_from_text(text)
+        # 调用API
+        return self._call_api(self.build_text_and_images_content(text, base_path))
     
-        modified_text = text
-        offset = 0  # 由于插入新字符，原始索引会发生偏移
-
-        for match in re.finditer(r"!\[\]\((.+?)\)", text):
-            img_path = match.group(1)
+    def build_text_and_images_content(self, text: str, base_path: str = None) -> List[Dict[str, Any]]:
+        """
+        构建包含图片的消息内容：在图片引用后标注尺寸，并附加base64编码的图片
+        
+        每张图片只读取一次（见image_preprocessor），标注的是原始尺寸，
+        发送的是按配置缩放压缩后的图片。
+        
+        Args:
+            text: 要处理的文本
+            base_path: 图片路径的基准目录（通常是markdown文件所在目录）
+        """
+        prepared = {}  # 解析后的路径 -> (data URL, 原始尺寸)，同一文本中重复引用的图片只处理一次
+        
+        def prepare(img_path):
+            resolved_img_path = self.resolve_image_path(img_path, base_path)
+            if resolved_img_path not in prepared:
+                prepared[resolved_img_path] = _image_preprocessor.prepare(resolved_img_path)
+            return prepared[resolved_img_path]
+    
+        def size_annotation(img_path):
             try:
-                # 解析图片路径
-                resolved_img_path = self.resolve_image_path(img_path, base_path)
-                width, height = self.get_image_size(resolved_img_path)
-                size_str = f"（尺寸：{width}×{height}）"
-                insert_pos = match.end() + offset
-                modified_text = modified_text[:insert_pos] + size_str + modified_text[insert_pos:]
-                offset += len(size_str)  # 更新偏移量
+                _, size = prepare(img_path)
+                if size is None:
+                    raise ValueError("无法识别的图片格式")
+                width, height = size
+                return f"（尺寸：{width}×{height}）"
             except Exception as e:
                 print(f"读取图片尺寸失败 {img_path}: {e}")
+                return None
+
+        # 单遍扫描：同时得到图片引用、引号判定结果和标注了尺寸的文本
+        refs, modified_text = scan_image_references(text, size_annotation)
+        image_paths = [img_path for img_path, include in refs if include]
 
         # 准备消息内容
         content = []
@@ -141,11 +377,7 @@ class APIClient:
         # 添加图片内容
         for img_path in image_paths:
             try:
-                # 解析图片路径
-                resolved_img_path = self.resolve_image_path(img_path, base_path)
-                base64_image = self.encode_image(resolved_img_path)
-                mime_type = self.get_mime_type(resolved_img_path)
-                image_data_url = f"data:{mime_type};base64,{base64_image}"
+                image_data_url, _ = prepare(img_path)
                 
                 content.append({
                     "type": "image_url",
@@ -156,59 +388,360 @@ class APIClient:
             except Exception as e:
                 print(f"处理图片 {img_path} 时出错: {str(e)}")
         
-        # 调用API
-        return self._call_api(content)
+        return content
+    
+    def stream_api_with_text_and_images(self, text: str, base_path: str = None) -> Iterator[str]:
+        """call_api_with_text_and_images 的流式版本，逐段产出模型输出"""
+        return self._stream_api(self.build_text_and_images_content(text, base_path))
+    
+    def stream_api_with_text(self, text: str) -> Iterator[str]:
+        """call_api_with_text 的流式版本，逐段产出模型输出"""
+        return self._stream_api(self.build_text_content(text))
     
     def call_api_with_text(self, text: str) -> str:
         """简单的纯文本API调用，不处理图片"""
-        content = [
+        # 调用API
+        return self._call_api(self.build_text_content(text))
+    
+    def build_text_content(self, text: str) -> List[Dict[str, Any]]:
+        """构建纯文本的消息内容"""
+        return [
             {
                 "type": "text",
                 "text": text
             }
         ]
-        
-        # 调用API
-        return self._call_api(content)
+    
+    def build_request(self, content: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """构建chat.completions请求参数"""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ],
+            "max_tokens": 1000,
+            "temperature": 1
+        }
+    
+    def _extract_response_content(self, response) -> str:
+        """从响应中取出模型输出的文本，响应中没有内容时抛出APICallError"""
+        if response.choices and response.choices[0].message and response.choices[0].message.content is not None:
+            return response.choices[0].message.content
+        raise APICallError(f"响应中未找到预期的'content'。响应: {response}")
+    
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        """
+        处理一次失败的请求：释放并发槽位、调整并发上限，返回重试前的等待秒数
+
+        不可重试的错误或已达到最大尝试次数时抛出APICallError。
+        """
+        retryable, rate_limited, retry_after = classify_error(error)
+        _rate_limiter.release(rate_limited=rate_limited, retry_after=retry_after)
+        max_retries = _rate_limiter.max_retries
+        print(f"API调用错误 (尝试 {attempt}/{max_retries}{'，触发限流' if rate_limited else ''}): {error}")
+        if not retryable:
+            _rate_limiter.record_failure()
+            raise APICallError(f"API调用失败（不可重试）: {error}") from error
+        if attempt >= max_retries:
+            _rate_limiter.record_failure()
+            raise APICallError(f"达到最大重试次数后API调用失败。最后错误: {error}") from error
+        _rate_limiter.record_retry()
+        delay = _rate_limiter.backoff_delay(attempt, retry_after)
+        print(f"等待 {delay:.1f} 秒后重试...")
+        return delay
     
     def _call_api(self, content: List[Dict[str, Any]]) -> str:
-        """发送API请求并处理响应"""
-        retry_count = 0
-        response_content = None
+        """
+        发送API请求并处理响应（启用缓存时先查缓存）
+
+        每次尝试前经过共享限流器（RPM/TPM令牌桶、自适应并发、Retry-After暂停），
+        失败后按指数退避加抖动重试；重试耗尽后抛出APICallError，而不是把错误信息当作结果返回。
+        启用追踪时记录为一个api span（重试次数、token用量、图片字节数、是否命中缓存）。
+        实际发出的请求记入用量账本；发出前按最大可能费用预约预算，放不下时抛出BudgetExceededError。
+        """
+        request = self.build_request(content)
+        with span('api', 'chat.completions', model=self.model) as api_span:
+            api_span.add('image_bytes', _image_bytes(content))
+            cache_key = _cache_key_for(request, content)
+            if cache_key is not None:
+                cached = _response_cache.get(cache_key)
+                if cached is not None:
+                    api_span.add('cache_hits')
+                    return cached
 
-        while retry_count < MAX_RETRIES:
+            api_span.add('api_calls')
+            estimated_tokens = estimate_request_tokens(request)
+            reserved = reserve_budget(request)
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": content
-                        }
-                    ],
-                    max_tokens=1000,
-                    temperature=1
-                )
-                
-                if response.choices and response.choices[0].message:
-                    response_content = response.choices[0].message.content
-                else:
-                    response_content = f"错误：响应中未找到预期的'content'。响应: {response}"
-                break  # 成功，跳出重试循环
+                attempt = 0
+                while True:
+                    attempt += 1
+                    _rate_limiter.acquire(estimated_tokens)
+                    try:
+                        response = self.client.chat.completions.create(**request)
+                    except Exception as e:
+                        delay = self._retry_delay(e, attempt)
+                        api_span.add('retries')
+                        time.sleep(delay)
+                        continue
 
-            except Exception as e:
-                retry_count += 1
-                print(f"API调用错误 (尝试 {retry_count}/{MAX_RETRIES}): {e}")
-                if retry_count >= MAX_RETRIES:
-                    response_content = f"错误：达到最大重试次数后API调用失败。最后错误: {e}"
+                    _rate_limiter.release(success=True, estimated_tokens=estimated_tokens, actual_tokens=_usage_total_tokens(response))
+                    record_usage(api_span, response)
+                    response_content = self._extract_response_content(response)
+                    record_call(request, getattr(response, "usage", None), response_content)
+                    if cache_key is not None:
+                        _response_cache.put(cache_key, response_content)
+                    return response_content
+            finally:
+                release_budget(reserved)
+
+    def _stream_api(self, content: List[Dict[str, Any]]) -> Iterator[str]:
+        """
+        以stream=True发送请求，逐段产出模型输出（启用缓存时命中则一次性产出缓存内容）
+
+        建立连接前的失败与_call_api一样经过限流器重试；开始产出后中断则抛出APICallError。
+        调用方提前关闭生成器（例如发现输出不是代码）时会同时关闭HTTP流，不再为剩余的输出付费，
+        提前关闭或中断的结果不写入缓存。
+        """
+        request = self.build_request(content)
+        with span('api', 'chat.completions', activate=False, model=self.model, stream=True) as api_span:
+            api_span.add('image_bytes', _image_bytes(content))
+            cache_key = _cache_key_for(request, content)
+            if cache_key is not None:
+                cached = _response_cache.get(cache_key)
+                if cached is not None:
+                    api_span.add('cache_hits')
+                    yield cached
+                    return
+
+            api_span.add('api_calls')
+            request["stream"] = True
+            # 请求服务端在最后一个数据块中返回usage；忽略该选项的服务端按收到的内容估算
+            request["stream_options"] = {"include_usage": True}
+            estimated_tokens = estimate_request_tokens(request)
+            reserved = reserve_budget(request)
+            attempt = 0
+            while True:
+                attempt += 1
+                _rate_limiter.acquire(estimated_tokens)
+                try:
+                    stream = self.client.chat.completions.create(**request)
                     break
-                print(f"等待 {5 * retry_count} 秒后重试...")  # 简单的退避策略
-                time.sleep(5 * retry_count)
+                except Exception as e:
+                    try:
+                        delay = self._retry_delay(e, attempt)
+                    except APICallError:
+                        release_budget(reserved)
+                        raise
+                    api_span.add('retries')
+                    time.sleep(delay)
+
+            pieces = []
+            usage = None
+            completed = False
+            try:
+                for chunk in stream:
+                    # 服务端在最后一个数据块中返回usage时记录token用量
+                    record_usage(api_span, chunk)
+                    usage = getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    delta_content = getattr(chunk.choices[0].delta, "content", None)
+                    if delta_content:
+                        pieces.append(delta_content)
+                        yield delta_content
+                completed = True
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                raise APICallError(f"流式响应中断: {e}") from e
+            finally:
+                # 按最后一个数据块的usage修正TPM令牌桶；没有usage时按请求估算加已收到的输出估算，
+                # 提前关闭时不再按max_tokens计入
+                if usage is not None:
+                    actual_tokens = (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+                else:
+                    actual_tokens = estimated_tokens - (request.get("max_tokens") or 0) + len("".join(pieces)) // 4
+                _rate_limiter.release(success=completed, estimated_tokens=estimated_tokens, actual_tokens=actual_tokens)
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                # 提前关闭时已生成的部分同样计费，没有usage时按已收到的内容估算
+                record_call(request, usage, "".join(pieces))
+                release_budget(reserved)
+
+            if not pieces:
+                raise APICallError("流式响应中没有任何内容")
+            if cache_key is not None:
+                _response_cache.put(cache_key, "".join(pieces))
+
+
+def call_with_rate_limit(func: Callable, *args, **kwargs):
+    """
+    经过共享限流器调用func（如Batch API的文件上传、批次创建和状态查询）
 
-        return response_content if response_content else "未能获取模型响应"
+    与chat请求使用同一套规则：每次尝试前获取发送许可，429/5xx/网络错误按退避重试，
+    其余错误或重试耗尽时抛出APICallError。客户端需以max_retries=0创建，避免SDK在限流器之外重试。
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        _rate_limiter.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            time.sleep(APIClient._retry_delay(e, attempt))
+            continue
+        _rate_limiter.release(success=True)
+        return result
+
+
+class AsyncAPIClient(APIClient):
+    """
+    基于AsyncOpenAI的异步客户端
+
+    call_api_with_text / call_api_with_text_and_images 为协程，同一事件循环内的所有请求
+    共享一个全局信号量以限制同时在途的请求数，并与同步客户端共用同一个限流器；
+    限流等待和重试退避使用asyncio.sleep，不阻塞事件循环。
+    """
+
+    def __init__(self, api_key: str, model: str = "gpt-4o", base_url: str = None, http_client: httpx.AsyncClient = None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url or DEFAULT_BASE_URL
+        # 连接池与创建它的事件循环绑定，由aclose（或aclose_async_clients）在循环结束前关闭
+        self.http_client = http_client if http_client is not None else _create_async_http_client()
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=self.base_url,
+            http_client=self.http_client,
+            max_retries=0,
+        )
+
+    async def aclose(self):
+        """关闭客户端的HTTP连接池"""
+        await self.http_client.aclose()
+
+    async def call_api_with_text_and_images(self, text: str, base_path: str = None) -> str:
+        """异步处理文本中的图片引用并调用API，图片读取和编码放到线程中执行"""
+        content = await asyncio.to_thread(self.build_text_and_images_content, text, base_path)
+        return await self._call_api(content)
+
+    async def call_api_with_text(self, text: str) -> str:
+        """异步的纯文本API调用"""
+        return await self._call_api(self.build_text_content(text))
+
+    async def _call_api(self, content: List[Dict[str, Any]]) -> str:
+        """异步发送API请求并处理响应，在全局信号量内执行（启用缓存时先查缓存），重试耗尽后抛出APICallError"""
+        request = self.build_request(content)
+        with span('api', 'chat.completions', model=self.model) as api_span:
+            api_span.add('image_bytes', _image_bytes(content))
+            cache_key = _cache_key_for(request, content)
+            if cache_key is not None:
+                cached = _response_cache.get(cache_key)
+                if cached is not None:
+                    api_span.add('cache_hits')
+                    return cached
+
+            api_span.add('api_calls')
+            estimated_tokens = estimate_request_tokens(request)
+            reserved = await reserve_budget_async(request)
+            attempt = 0
+            try:
+                async with _get_async_semaphore():
+                    while True:
+                        attempt += 1
+                        await _rate_limiter.acquire_async(estimated_tokens)
+                        try:
+                            response = await self.client.chat.completions.create(**request)
+                        except Exception as e:
+                            delay = self._retry_delay(e, attempt)
+                            api_span.add('retries')
+                            await asyncio.sleep(delay)
+                            continue
 
+                        _rate_limiter.release(success=True, estimated_tokens=estimated_tokens, actual_tokens=_usage_total_tokens(response))
+                        record_usage(api_span, response)
+                        response_content = self._extract_response_content(response)
+                        record_call(request, getattr(response, "usage", None), response_content)
+                        if cache_key is not None:
+                            _response_cache.put(cache_key, response_content)
+                        return response_content
+            finally:
+                release_budget(reserved)
 
-def process_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-preview", base_path: str = None) -> str:
+
+def configure_async_concurrency(max_in_flight: int):
+    """设置异步客户端同时在途请求数的上限，只对之后创建的事件循环生效"""
+    global MAX_IN_FLIGHT_REQUESTS
+    MAX_IN_FLIGHT_REQUESTS = max_in_flight
+
+
+def _get_async_semaphore() -> asyncio.Semaphore:
+    """获取当前事件循环的全局信号量（信号量与事件循环绑定，每个循环各一个）"""
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_IN_FLIGHT_REQUESTS)
+        _async_semaphores[loop] = semaphore
+    return semaphore
+
+
+def _create_async_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(**CONNECTION_POOL_SETTINGS),
+        timeout=TIMEOUT,
+        follow_redirects=True
+    )
+
+
+def get_async_api_client(api_key: str, model: str, base_url: str = None) -> AsyncAPIClient:
+    """获取当前事件循环内共享的AsyncAPIClient"""
+    base_url = base_url or DEFAULT_BASE_URL
+    # 已关闭的事件循环上的客户端不能再使用（客户端引用着循环，弱引用字典不会自动移除它们）
+    for loop in [loop for loop in _async_clients if loop.is_closed()]:
+        del _async_clients[loop]
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (api_key, base_url, model)
+    if key not in clients:
+        clients[key] = AsyncAPIClient(api_key=api_key, model=model, base_url=base_url)
+    return clients[key]
+
+
+async def aclose_async_clients():
+    """关闭当前事件循环内共享的异步客户端及其连接池，应在每次异步运行结束前调用（见run_async）"""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def run_async(main):
+    """asyncio.run的封装：运行协程main，结束前（包括出错时）关闭本次事件循环内创建的异步客户端"""
+    async def runner():
+        try:
+            return await main
+        finally:
+            await aclose_async_clients()
+    return asyncio.run(runner())
+
+
+async def async_process_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-preview", base_path: str = None, base_url: str = None) -> str:
+    """process_text_with_images 的协程版本"""
+    client = get_async_api_client(api_key, model, base_url)
+    return await client.call_api_with_text_and_images(text, base_path)
+
+
+async def async_process_text(text: str, api_key: str, model: str = "gpt-4.5-preview", base_url: str = None) -> str:
+    """process_text 的协程版本"""
+    client = get_async_api_client(api_key, model, base_url)
+    return await client.call_api_with_text(text)
+
+
+def process_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-preview", base_path: str = None, base_url: str = None) -> str:
     """
     处理包含图片的文本
     
@@ -217,13 +750,19 @@ def process_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-prev
         api_key: API密钥
         model: 使用的模型
         base_path: 图片路径的基准目录（通常是markdown文件所在目录）
+        base_url: API地址，默认为DEFAULT_BASE_URL
     """
-    client = APIClient(api_key=api_key, model=model)
+    client = get_api_client(api_key, model, base_url)
     return client.call_api_with_text_and_images(text, base_path)
 
-def process_text(text: str, api_key: str, model: str = "gpt-4.5-preview") -> str:
+def stream_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-preview", base_path: str = None, base_url: str = None) -> Iterator[str]:
+    """process_text_with_images 的流式版本，返回逐段产出模型输出的生成器"""
+    client = get_api_client(api_key, model, base_url)
+    return client.stream_api_with_text_and_images(text, base_path)
+
+def process_text(text: str, api_key: str, model: str = "gpt-4.5-preview", base_url: str = None) -> str:
     """简单的纯文本处理函数"""
-    client = APIClient(api_key=api_key, model=model)
+    client = get_api_client(api_key, model, base_url)
     return client.call_api_with_text(text)
 
 
@@ -0,0 +1,334 @@
+"""
+讲解音频时长读取与动画对齐
+
+只读取容器头部的元数据获取音频时长，不解码音频：
+- mp4 / m4a / mov：moov 中音轨的 mdhd（没有音轨时用 mvhd）；
+- wav：fmt 块的字节率和 data 块的长度；
+- flac：STREAMINFO 中的采样率和总采样数；
+- mp3：Xing/Info 头中的帧数，没有时按首帧码率（CBR）计算；
+- 其他格式调用 ffprobe（只读取元数据）。
+
+对齐阶段批量读取音频目录中所有页面的时长，再用 wait_time_calculator 把每个 *_code.py
+补齐到对应页面的音频时长。
+
+使用方法:
+python audio_timing.py generated_code_dir audio_dir [--workers N] [--dry-run]
+python audio_timing.py --durations audio_dir
+"""
+
+import glob
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from page_utils import get_page_name, get_sort_key
+from wait_time_calculator import align_to_duration
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.mp4', '.mov', '.aac', '.ogg', '.opus')
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1 Layer III
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]       # MPEG-2/2.5 Layer III
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _iter_boxes(f, start: int, end: int):
+    """遍历 [start, end) 范围内的mp4 box，返回 (类型, 内容起点, 结束位置)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _find_box(f, start: int, end: int, box_type: bytes):
+    return next(((begin, stop) for kind, begin, stop in _iter_boxes(f, start, end) if kind == box_type), None)
+
+
+def _read_media_header(f, begin: int) -> Optional[float]:
+    """读取 mvhd / mdhd 的时长（两者的版本、时间尺度和时长字段布局相同）"""
+    f.seek(begin)
+    version = f.read(1)[0]
+    if version == 1:
+        f.seek(begin + 20)
+        timescale, duration = struct.unpack('>IQ', f.read(12))
+    else:
+        f.seek(begin + 12)
+        timescale, duration = struct.unpack('>II', f.read(8))
+    return duration / timescale if timescale else None
+
+
+def _find_audio_track_header(f, moov) -> Optional[tuple]:
+    """moov中音轨的mdhd位置，没有音轨时返回None"""
+    for box_type, begin, end in _iter_boxes(f, *moov):
+        if box_type != b'trak':
+            continue
+        mdia = _find_box(f, begin, end, b'mdia')
+        hdlr = mdia and _find_box(f, *mdia, b'hdlr')
+        mdhd = mdia and _find_box(f, *mdia, b'mdhd')
+        if hdlr and mdhd:
+            f.seek(hdlr[0] + 8)
+            if f.read(4) == b'soun':
+                return mdhd
+    return None
+
+
+def mp4_duration(path: str) -> Optional[float]:
+    """mp4 / m4a / mov 的时长：优先音轨，其次整个文件"""
+    with open(path, 'rb') as f:
+        moov = _find_box(f, 0, os.path.getsize(path), b'moov')
+        if moov is None:
+            return None
+        mdhd = _find_audio_track_header(f, moov)
+        if mdhd:
+            return _read_media_header(f, mdhd[0])
+        mvhd = _find_box(f, *moov, b'mvhd')
+        return _read_media_header(f, mvhd[0]) if mvhd else None
+
+
+def mp4_has_audio_track(path: str) -> Optional[bool]:
+    """mp4 / m4a / mov 是否包含音轨，无法解析时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            moov = _find_box(f, 0, os.path.getsize(path), b'moov')
+            if moov is None:
+                return None
+            return _find_audio_track_header(f, moov) is not None
+    except (OSError, struct.error, IndexError):
+        return None
+
+
+def wav_duration(path: str) -> Optional[float]:
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            return None
+        byte_rate = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                byte_rate = struct.unpack('<HHII', f.read(12))[3]
+                f.seek(chunk_size - 12 + (chunk_size & 1), os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if not byte_rate:
+                    return None
+                # 流式写出的wav中data长度可能未填写（0或0xFFFFFFFF），按文件剩余长度计算
+                remaining = os.path.getsize(path) - f.tell()
+                data_size = chunk_size if 0 < chunk_size <= remaining else remaining
+                return data_size / byte_rate
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def flac_duration(path: str) -> Optional[float]:
+    with open(path, 'rb') as f:
+        if f.read(4) != b'fLaC':
+            return None
+        f.seek(4 + 4 + 10)  # STREAMINFO块头4字节，采样率字段之前有10字节
+        packed = int.from_bytes(f.read(8), 'big')
+        sample_rate = packed >> 44
+        total_samples = packed & ((1 << 36) - 1)
+        return total_samples / sample_rate if sample_rate and total_samples else None
+
+
+def mp3_duration(path: str) -> Optional[float]:
+    with open(path, 'rb') as f:
+        header = f.read(10)
+        offset = 0
+        if header[:3] == b'ID3':
+            # ID3v2标签长度为同步安全整数
+            offset = 10 + ((header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9])
+        f.seek(offset)
+        data = f.read(4096)
+        for i in range(len(data) - 4):
+            if data[i] != 0xFF or (data[i + 1] & 0xE0) != 0xE0:
+                continue
+            version_bits = (data[i + 1] >> 3) & 0x3
+            layer_bits = (data[i + 1] >> 1) & 0x3
+            bitrate_index = data[i + 2] >> 4
+            rate_index = (data[i + 2] >> 2) & 0x3
+            if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or rate_index == 3:
+                continue
+            mpeg1 = version_bits == 3
+            sample_rate = MP3_SAMPLE_RATES[version_bits][rate_index]
+            samples_per_frame = 1152 if mpeg1 else 576
+            # Xing/Info头（VBR文件）记录了总帧数
+            mono = (data[i + 3] >> 6) == 3
+            side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+            xing = i + 4 + side_info
+            if data[xing:xing + 4] in (b'Xing', b'Info') and struct.unpack('>I', data[xing + 4:xing + 8])[0] & 1:
+                frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+                return frames * samples_per_frame / sample_rate
+            bitrate = MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+            return (os.path.getsize(path) - offset - i) * 8 / bitrate
+    return None
+
+
+def ffprobe_duration(path: str) -> Optional[float]:
+    """调用ffprobe读取容器中记录的时长（不解码）"""
+    if not shutil.which('ffprobe'):
+        return None
+    completed = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', path],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        return float(completed.stdout.strip())
+    except ValueError:
+        return None
+
+
+HEADER_PARSERS = {
+    '.wav': wav_duration, '.mp3': mp3_duration, '.flac': flac_duration,
+    '.m4a': mp4_duration, '.mp4': mp4_duration, '.mov': mp4_duration
+}
+
+
+def get_audio_duration(path: str) -> Optional[float]:
+    """
+    读取音频（或带音轨的视频）时长，只读元数据不解码
+
+    Returns:
+        float: 时长（秒），无法读取时返回None
+    """
+    parser = HEADER_PARSERS.get(os.path.splitext(path)[1].lower())
+    if parser is not None:
+        try:
+            duration = parser(path)
+        except (OSError, struct.error, IndexError):
+            duration = None
+        if duration is not None:
+            return duration
+    return ffprobe_duration(path)
+
+
+def find_audio_files(audio_dir: str) -> Dict[str, str]:
+    """音频目录中每个页面对应的音频文件 {页面名: 路径}"""
+    audio_files = {}
+    for path in sorted(glob.glob(os.path.join(audio_dir, '*'))):
+        if path.lower().endswith(AUDIO_EXTENSIONS):
+            audio_files.setdefault(get_page_name(path), path)
+    return audio_files
+
+
+def read_durations(paths: List[str], workers: int = 8) -> Dict[str, Optional[float]]:
+    """并行读取多个文件的时长（读取元数据是I/O操作，ffprobe也在子进程中运行）"""
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as executor:
+        return dict(zip(paths, executor.map(get_audio_duration, paths)))
+
+
+def retime_code_folder(code_dir: str, audio_dir: str, workers: int = 8, dry_run: bool = False) -> List[dict]:
+    """
+    按各页面讲解音频的时长批量对齐生成代码的时长
+
+    Args:
+        code_dir: 包含 *_code.py 的代码目录
+        audio_dir: 讲解音频目录，文件名为 <页面名>[_speech].<扩展名>
+        workers: 并行读取时长的线程数
+        dry_run: 只计算不修改代码
+
+    Returns:
+        list: 每个代码文件的对齐结果（见 wait_time_calculator.align_to_duration），没有音频的页面status为no_audio
+    """
+    print(f"[PROC] 读取音频时长: {audio_dir}")
+    start_time = time.time()
+    audio_files = find_audio_files(audio_dir)
+    durations = read_durations(list(audio_files.values()), workers)
+    read_time = time.time() - start_time
+    print(f"   找到 {len(audio_files)} 个音频文件，读取时长耗时 {read_time * 1000:.0f} 毫秒")
+
+    results = []
+    code_files = sorted(glob.glob(os.path.join(code_dir, '*_code.py')), key=get_sort_key)
+    for code_file in code_files:
+        audio_path = audio_files.get(get_page_name(code_file))
+        duration = durations.get(audio_path) if audio_path else None
+        if audio_path is None or duration is None:
+            status = 'no_audio' if audio_path is None else 'error'
+            error = None if audio_path is None else f"无法读取音频时长: {audio_path}"
+            results.append({'file': code_file, 'audio': audio_path, 'target': None, 'estimated': None,
+                            'padding': 0.0, 'status': status, 'error': error})
+            continue
+        result = align_to_duration(code_file, duration, dry_run=dry_run)
+        result['audio'] = audio_path
+        results.append(result)
+    return results
+
+
+def print_retime_report(results: List[dict], dry_run: bool = False):
+    """打印对齐结果"""
+    labels = {'padded': "[OK]", 'ok': "[OK]", 'too_long': "[WARN]", 'no_audio': "[SKIP]", 'error': "[ERR]"}
+    print(f"[LIST] 逐页对齐结果{'（预览，未修改文件）' if dry_run else ''}:")
+    for result in results:
+        name = os.path.basename(result['file'])
+        label = labels[result['status']]
+        if result['status'] == 'no_audio':
+            print(f"   {label} {name}: 没有对应的音频")
+        elif result['status'] == 'error':
+            print(f"   {label} {name}: {result['error']}")
+        elif result['status'] == 'too_long':
+            print(f"   {label} {name}: 动画 {result['estimated']:.2f} 秒长于音频 {result['target']:.2f} 秒，需要缩短动画")
+        else:
+            print(f"   {label} {name}: 动画 {result['estimated']:.2f} 秒，音频 {result['target']:.2f} 秒，补齐 {result['padding']:.2f} 秒")
+    counts = {status: sum(1 for result in results if result['status'] == status) for status in labels}
+    print(f"[PROG] 补齐 {counts['padded']} 页，无需调整 {counts['ok']} 页，动画过长 {counts['too_long']} 页，"
+          f"无音频 {counts['no_audio']} 页，失败 {counts['error']} 页")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='读取讲解音频时长，批量对齐生成代码的动画时长')
+    parser.add_argument('code_dir', nargs='?', help='包含 *_code.py 的代码目录')
+    parser.add_argument('audio_dir', nargs='?', help='讲解音频目录（文件名为 <页面名>[_speech].wav 等）')
+    parser.add_argument('--durations', metavar='AUDIO_DIR', help='只列出目录中各音频的时长')
+    parser.add_argument('--workers', type=int, default=8, help='并行读取时长的线程数 (默认: 8)')
+    parser.add_argument('--dry-run', action='store_true', help='只计算需要补齐的时长，不修改代码')
+    parser.add_argument('--output', help='把结果保存为JSON')
+    args = parser.parse_args()
+
+    if args.durations:
+        audio_files = find_audio_files(args.durations)
+        durations = read_durations(list(audio_files.values()), args.workers)
+        for page_name, path in audio_files.items():
+            duration = durations[path]
+            print(f"   {os.path.basename(path)}: {f'{duration:.2f} 秒' if duration is not None else '无法读取'}")
+        results = [{'page': page_name, 'audio': path, 'duration': durations[path]} for page_name, path in audio_files.items()]
+    else:
+        if not args.code_dir or not args.audio_dir:
+            parser.error("需要提供 code_dir 和 audio_dir，或使用 --durations AUDIO_DIR")
+        results = retime_code_folder(args.code_dir, args.audio_dir, args.workers, args.dry_run)
+        if not results:
+            print(f"[WARN]  在 '{args.code_dir}' 中没有找到 *_code.py 文件")
+            sys.exit(1)
+        print_retime_report(results, args.dry_run)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"[OK] 结果已保存到: {args.output}")
+    if any(result.get('status') == 'error' for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+动画时长估算的准确度对比
+
+用 demo_video 中已渲染的示例视频作为真值，对比原先的正则估算（self.wait 参数用eval求值、
+每个 self.play 按1秒计算）与基于AST的估算。视频时长从mp4的mvhd头中读取，不依赖ffprobe。
+
+使用方法:
+python benchmarks/bench_duration_estimate.py
+"""
+
+import contextlib
+import glob
+import io
+import os
+import re
+import struct
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from wait_time_calculator import estimate_file
+
+DEMO_DIR = os.path.join(ROOT_DIR, "demo_video")
+# 视频名与场景名、模块名都不一致的示例
+VIDEO_NAMES = {('MASLab-demo', 'ep'): 'Empirical_Study', ('MASLab-demo', 'final'): 'conclusion'}
+
+
+def legacy_extract_animation_times(file_path):
+    """原先的 extract_animation_times"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    total_time = 0
+    for wait_arg in re.findall(r'self\.wait\((.*?)\)', content):
+        if not wait_arg:
+            total_time += 1
+        else:
+            try:
+                total_time += float(eval(wait_arg))
+            except Exception:
+                print(f"警告：无法解析等待时间参数: {wait_arg}")
+    total_time += len(re.findall(r'self\.play\(', content))
+    return total_time
+
+
+def mp4_duration(path):
+    """读取mp4的mvhd头中的时长（秒）"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = data.find(b'mvhd')
+    if offset < 0:
+        return None
+    if data[offset + 4] == 0:
+        timescale, duration = struct.unpack('>II', data[offset + 16:offset + 24])
+    else:
+        timescale, duration = struct.unpack('>IQ', data[offset + 24:offset + 36])
+    return duration / timescale
+
+
+def find_video(code_file, scene):
+    demo_dir = os.path.dirname(code_file)
+    module = os.path.splitext(os.path.basename(code_file))[0]
+    for name in (scene, module, VIDEO_NAMES.get((os.path.basename(demo_dir), module))):
+        if name and os.path.exists(os.path.join(demo_dir, f"{name}.mp4")):
+            return os.path.join(demo_dir, f"{name}.mp4")
+    return None
+
+
+def main():
+    rows = []
+    estimate_time = 0.0
+    for code_file in sorted(glob.glob(os.path.join(DEMO_DIR, '*', '*.py'))):
+        start = time.perf_counter()
+        result = estimate_file(code_file)
+        estimate_time += time.perf_counter() - start
+        if result['error'] or len(result['scenes']) != 1:
+            continue
+        scene = result['scenes'][0]
+        video = find_video(code_file, scene['scene'])
+        if video is None:
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = legacy_extract_animation_times(code_file)
+        rows.append((os.path.relpath(code_file, DEMO_DIR), mp4_duration(video), legacy, scene['duration']))
+
+    if not rows:
+        print("[WARN]  demo_video 中没有找到可对比的示例")
+        return
+
+    print(f"{'示例':<40} {'实际':>8} {'正则估算':>10} {'AST估算':>10}")
+    for name, actual, legacy, estimate in rows:
+        print(f"{name:<40} {actual:>8.2f} {legacy:>10.2f} {estimate:>10.2f}")
+
+    legacy_error = sum(abs(legacy - actual) for _, actual, legacy, _ in rows) / len(rows)
+    estimate_error = sum(abs(estimate - actual) for _, actual, _, estimate in rows) / len(rows)
+    exact = sum(1 for _, actual, _, estimate in rows if abs(estimate - actual) < 0.05)
+    print(f"\n[PROG] 共 {len(rows)} 个示例")
+    print(f"   • 正则估算平均误差: {legacy_error:.2f} 秒")
+    print(f"   • AST估算平均误差: {estimate_error:.2f} 秒，与实际时长一致: {exact}/{len(rows)}")
+    print(f"   • AST估算总耗时: {estimate_time * 1000:.1f} 毫秒")
+
+
+if __name__ == "__main__":
+    main()
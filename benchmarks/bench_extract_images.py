@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+图片引用提取的微基准
+
+对比原先的实现（每个匹配都对全文做rfind/find，再用第二个正则逐个切片插入尺寸标注）
+与单遍扫描的 scan_image_references，先校验两者结果完全一致，再分别计时。
+
+使用方法:
+python benchmarks/bench_extract_images.py [--markdown 2024.acl-long.810.md] [--repeat 20] [--number 20]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from api_call import scan_image_references
+
+SIZE_STR = "（尺寸：1209×501）"
+
+
+def legacy_extract_images_from_text(text):
+    """原先的 APIClient.extract_images_from_text"""
+    matches = []
+    for match in re.finditer(r"!\[\]\((.+?)\)", text):
+        start = match.start()
+        end = match.end()
+        prev_quote = max(text.rfind("'", 0, start), text.rfind("`", 0, start))
+        next_quote = text.find("'", end)
+        next_quote2 = text.find("`", end)
+        if next_quote == -1:
+            next_quote = len(text)
+        if next_quote2 == -1:
+            next_quote2 = len(text)
+        next_quote = min(next_quote, next_quote2)
+        if prev_quote == -1 or next_quote == -1 or not (prev_quote < start and end < next_quote):
+            matches.append(match.group(1))
+    return matches
+
+
+def legacy_build(text):
+    """原先 call_api_with_text_and_images 中的两遍处理：提取引用 + 逐个切片插入尺寸"""
+    image_paths = legacy_extract_images_from_text(text)
+    modified_text = text
+    offset = 0
+    for match in re.finditer(r"!\[\]\((.+?)\)", text):
+        insert_pos = match.end() + offset
+        modified_text = modified_text[:insert_pos] + SIZE_STR + modified_text[insert_pos:]
+        offset += len(SIZE_STR)
+    return image_paths, modified_text
+
+
+def single_pass_build(text):
+    refs, modified_text = scan_image_references(text, lambda img_path: SIZE_STR)
+    return [img_path for img_path, include in refs if include], modified_text
+
+
+def random_text(rng, length):
+    """生成包含图片引用和引号的随机文本，用于校验两种实现的判定一致"""
+    atoms = ["a", " ", "\n", "'", "`", "![](img.jpg)", "![](a'b.png)", "![](", ")", "!", "[]"]
+    return "".join(rng.choice(atoms) for _ in range(length))
+
+
+def check_equivalence(texts):
+    for text in texts:
+        legacy = legacy_build(text)
+        current = single_pass_build(text)
+        if legacy != current:
+            raise AssertionError(f"结果不一致:\n文本: {text!r}\n原实现: {legacy!r}\n单遍扫描: {current!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图片引用提取微基准')
+    parser.add_argument('--markdown', default=os.path.join(ROOT_DIR, '2024.acl-long.810.md'), help='基准使用的Markdown文件')
+    parser.add_argument('--repeat', type=int, default=20, help='将文档重复拼接的次数，模拟图片很多的长提示词 (默认: 20)')
+    parser.add_argument('--number', type=int, default=20, help='每种实现的计时次数 (默认: 20)')
+    args = parser.parse_args()
+
+    with open(args.markdown, 'r', encoding='utf-8') as f:
+        document = f.read()
+
+    # 在文档末尾加入带引号的示例，覆盖引号判定分支
+    quoted_tail = "\n示例：`![](images/example.jpg)` 与 '![](images/other.jpg)' 不应作为图片发送\n"
+    cases = {
+        '原文': document,
+        '原文+引号示例': document + quoted_tail,
+        f'原文x{args.repeat}': (document + quoted_tail) * args.repeat,
+    }
+
+    rng = random.Random(0)
+    check_equivalence(list(cases.values()) + [random_text(rng, rng.randint(0, 60)) for _ in range(5000)])
+    print("[OK] 两种实现在全部样例上结果一致")
+
+    for name, text in cases.items():
+        image_count = len(re.findall(r"!\[\]\((.+?)\)", text))
+        legacy_time = timeit.timeit(lambda: legacy_build(text), number=args.number) / args.number
+        current_time = timeit.timeit(lambda: single_pass_build(text), number=args.number) / args.number
+        print(f"[PROG] {name}: {len(text)/1024:.0f} KB, {image_count} 个图片引用")
+        print(f"    原实现:   {legacy_time*1000:.3f} ms")
+        print(f"    单遍扫描: {current_time*1000:.3f} ms ({legacy_time/current_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+章节提取的微基准
+
+对比原先的实现（每个章节都重新拆分全文、重建正则、逐行扫描并打印每个检查过的标题）
+与只构建一次的 HeadingIndex，先校验两者在真实论文和合成论文上提取的内容完全一致，再分别计时。
+原实现的输出重定向到内存，计时包含格式化日志的开销，但不包含终端写入。
+
+使用方法:
+python benchmarks/bench_section_index.py [--chapters 200] [--subsections 10] [--number 3]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from document_processor import HeadingIndex, extract_section_number, find_section_content, is_subsection
+
+
+def legacy_find_section_content(markdown_content: str, section_identifier: str) -> str:
+    """原先的 find_section_content：每个章节重新拆分全文、逐行扫描并打印每个标题"""
+    lines = markdown_content.split('\n')
+    content_lines = []
+    in_section = False
+    found_line = None
+    
+    print(f"  正在搜索章节: '{section_identifier}'")
+    
+    # 创建多种可能的标题模式
+    # 1. 直接匹配：# 1 Introduction
+    pattern1 = rf'^#+\s*{re.escape(section_identifier)}\s*$'
+    # 2. 包含匹配：# 任何内容 1 Introduction 任何内容
+    pattern2 = rf'^#+\s*.*{re.escape(section_identifier)}.*$'
+    # 3. 如果有数字开头，也尝试只匹配后面的文字部分
+    section_text_only = re.sub(r'^\d+\s+', '', section_identifier).strip()
+    pattern3 = rf'^#+\s*\d+\s+{re.escape(section_text_only)}\s*$' if section_text_only != section_identifier else None
+    
+    patterns = [pattern1, pattern2]
+    if pattern3:
+        patterns.append(pattern3)
+    
+    print(f"  使用的匹配模式:")
+    for i, pattern in enumerate(patterns, 1):
+        print(f"    模式{i}: {pattern}")
+    
+    # 搜索匹配的标题行
+    for i, line in enumerate(lines):
+        line_stripped = line.strip()
+        if line_stripped.startswith('#'):
+            print(f"  检查第{i+1}行标题: '{line_stripped}'")
+            
+            # 检查是否匹配任何模式
+            for j, pattern in enumerate(patterns):
+                if re.match(pattern, line_stripped, re.IGNORECASE):
+                    print(f"    ✓ 匹配成功 (模式{j+1})")
+                    found_line = i
+                    in_section = True
+                    content_lines.append(line)
+                    break
+            
+            if found_line is not None:
+                break
+    
+    if found_line is None:
+        print(f"  ✗ 未找到匹配的标题行")
+        return ""
+    
+    print(f"  ✓ 找到起始行: 第{found_line+1}行")
+    
+    # 获取起始标题的级别和章节号
+    start_title_level = len(re.match(r'^(#+)', lines[found_line]).group(1))
+    start_section_number = extract_section_number(lines[found_line])
+    print(f"  章节级别: {start_title_level} 级标题")
+    print(f"  章节编号: '{start_section_number}'")
+    
+    # 从找到的行开始，收集内容直到下一个非子章节标题
+    for i in range(found_line + 1, len(lines)):
+        line = lines[i]
+        
+        # 检查是否是标题行
+        if re.match(r'^#+\s*\S', line):  # # 后面可以没有空格，但必须有内容
+            current_level = len(re.match(r'^(#+)', line).group(1))
+            current_section_number = extract_section_number(line)
+            print(f"    发现第{i+1}行标题: '{line.strip()}' (级别: {current_level}, 编号: '{current_section_number}')")
+            
+            # 判断是否应该停止收集
+            should_stop = False
+            
+            if current_level < start_title_level:
+                # 遇到更高级标题，停止
+                should_stop = True
+                print(f"    遇到更高级标题({current_level}级 < {start_title_level}级)，停止收集")
+            elif current_level == start_title_level:
+                # 同级标题，检查是否是子章节
+                if start_section_number and current_section_number:
+                    if is_subsection(start_section_number, current_section_number):
+                        print(f"    这是子章节({current_section_number} 是 {start_section_number} 的子章节)，继续收集")
+                    else:
+                        should_stop = True
+                        print(f"    这是同级或其他章节({current_section_number} 不是 {start_section_number} 的子章节)，停止收集")
+                else:
+                    # 无法判断章节号，按原逻辑处理
+                    should_stop = True
+                    print(f"    无法判断章节关系，按同级标题处理，停止收集")
+            else:
+                # 更低级标题，继续收集
+                print(f"    这是更低级标题({current_level}级 > {start_title_level}级)，继续收集")
+            
+            if should_stop:
+                print(f"  章节结束于第{i+1}行: '{line.strip()}'")
+                break
+        
+        content_lines.append(line)
+    
+    result = '\n'.join(content_lines)
+    print(f"  提取了 {len(content_lines)} 行内容")
+    return result
+
+
+def build_synthetic_paper(chapters, subsections, paragraph_lines=3):
+    """生成合成论文：chapters 个一级章节，每章 subsections 个同为一级标题的编号小节，各带几行正文和一个三级标题"""
+    lines = ["# Synthetic Paper", "", "# Abstract", "Lorem ipsum."]
+    for chapter in range(1, chapters + 1):
+        lines.append(f"# {chapter} Chapter {chapter}")
+        lines.extend(f"Body text of chapter {chapter}, line {k}." for k in range(paragraph_lines))
+        for sub in range(1, subsections + 1):
+            lines.append(f"# {chapter}.{sub} Subsection {chapter}.{sub}")
+            lines.extend(f"Body text of {chapter}.{sub}, line {k}." for k in range(paragraph_lines))
+            lines.append(f"### Paragraph {chapter}.{sub}")
+            lines.append("Details.")
+    lines.extend(["# References", "[1] Someone. Something."])
+    return "\n".join(lines)
+
+
+def legacy_extract(content, identifiers):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [legacy_find_section_content(content, identifier) for identifier in identifiers]
+
+
+def index_extract(content, identifiers):
+    with contextlib.redirect_stdout(io.StringIO()):
+        index = HeadingIndex(content)
+        return [find_section_content(content, identifier, index) for identifier in identifiers]
+
+
+def time_call(func, number):
+    best = float("inf")
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='章节提取微基准')
+    parser.add_argument('--markdown', default=os.path.join(ROOT_DIR, '2024.acl-long.810.md'), help='用于校验一致性的真实论文')
+    parser.add_argument('--chapters', type=int, default=200, help='合成论文的一级章节数 (默认: 200)')
+    parser.add_argument('--subsections', type=int, default=10, help='每章的编号小节数 (默认: 10)')
+    parser.add_argument('--sections', type=int, default=4, help='每次提取的章节数，与save_sections一致 (默认: 4)')
+    parser.add_argument('--number', type=int, default=3, help='计时次数，取最快一次 (默认: 3)')
+    args = parser.parse_args()
+
+    with open(args.markdown, 'r', encoding='utf-8') as f:
+        paper = f.read()
+    synthetic = build_synthetic_paper(args.chapters, args.subsections)
+
+    # 一致性校验：真实论文与一份小的合成论文上的所有标题，外加缩进标题等边界情况
+    # （原实现以缩进标题为起点时会抛异常，因此缩进标题只参与边界判断，不作为查询）
+    small = build_synthetic_paper(5, 3) + "\n  # 2.9 Indented\ntext\n#\n# 6 Last\n# 7 Straße\n## 7.1 STRASSE"
+    for content in (paper, small):
+        identifiers = [re.sub(r'^#+\s*', '', line.strip()) for line in content.split('\n')
+                       if re.match(r'^#+\s*\S', line)] + ["Missing Section"]
+        if legacy_extract(content, identifiers) != index_extract(content, identifiers):
+            raise AssertionError("两种实现提取的章节内容不一致")
+    print("[OK] 两种实现在全部标题上提取的内容一致")
+
+    # 计时：与save_sections一样提取分布在全文中的几个章节，以及提取全部一级章节
+    heading_count = sum(1 for line in synthetic.split('\n') if line.startswith('#'))
+    step = max(1, args.chapters // args.sections)
+    cases = {
+        f'{args.sections} 个章节': [f"{chapter} Chapter {chapter}" for chapter in range(1, args.chapters + 1, step)][:args.sections],
+        f'全部 {args.chapters} 个一级章节': [f"{chapter} Chapter {chapter}" for chapter in range(1, args.chapters + 1)],
+    }
+    print(f"[PROG] 合成论文: {len(synthetic)/1024:.0f} KB, {heading_count} 个标题")
+    for name, identifiers in cases.items():
+        legacy_time = time_call(lambda: legacy_extract(synthetic, identifiers), args.number)
+        index_time = time_call(lambda: index_extract(synthetic, identifiers), args.number)
+        print(f"  提取{name}:")
+        print(f"    原实现:   {legacy_time*1000:.1f} ms")
+        print(f"    标题索引: {index_time*1000:.1f} ms ({legacy_time/index_time:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+语音合成阶段的并行与增量效果
+
+用离线替身后端（tone，每页模拟固定的合成耗时）合成一组讲稿，对比：
+- 串行与线程池并行合成的耗时；
+- 只修改一页讲稿后重新运行时实际重新合成的页面数。
+
+使用方法:
+python benchmarks/bench_tts.py [--pages 40] [--latency 0.2] [--workers 8]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "Chapter_Agent"))
+from batch_tts import TTSCache, ToneBackend, synthesize_speech_folder
+
+
+def write_speeches(speech_dir, pages):
+    os.makedirs(speech_dir, exist_ok=True)
+    for i in range(1, pages + 1):
+        with open(os.path.join(speech_dir, f"paper_split_页{i}_speech.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"这是第{i}页的讲解内容。" * 20)
+
+
+def run(speech_dir, audio_dir, backend, workers, cache):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = synthesize_speech_folder(speech_dir, audio_dir, backend, workers, cache)
+    elapsed = time.perf_counter() - start
+    synthesized = sum(1 for result in results if result['status'] == 'synthesized')
+    return elapsed, synthesized
+
+
+def main():
+    parser = argparse.ArgumentParser(description='语音合成阶段的并行与增量效果')
+    parser.add_argument('--pages', type=int, default=40, help='页面数 (默认: 40)')
+    parser.add_argument('--latency', type=float, default=0.2, help='每页模拟的合成耗时秒数 (默认: 0.2)')
+    parser.add_argument('--workers', type=int, default=8, help='并行合成的页面数 (默认: 8)')
+    args = parser.parse_args()
+
+    backend = ToneBackend(latency=args.latency)
+    with tempfile.TemporaryDirectory() as work_dir:
+        speech_dir = os.path.join(work_dir, 'speech')
+        write_speeches(speech_dir, args.pages)
+
+        serial_time, _ = run(speech_dir, os.path.join(work_dir, 'serial'), backend, 1, None)
+        cache = TTSCache(os.path.join(work_dir, 'cache'))
+        parallel_time, _ = run(speech_dir, os.path.join(work_dir, 'audio'), backend, args.workers, cache)
+        rerun_time, rerun_count = run(speech_dir, os.path.join(work_dir, 'audio'), backend, args.workers, cache)
+        with open(os.path.join(speech_dir, "paper_split_页1_speech.txt"), 'a', encoding='utf-8') as f:
+            f.write("补充一句。")
+        edit_time, edit_count = run(speech_dir, os.path.join(work_dir, 'audio'), backend, args.workers, cache)
+
+    print(f"[PROG] {args.pages} 页，每页模拟合成 {args.latency:.2f} 秒")
+    print(f"   • 串行合成: {serial_time:.2f} 秒")
+    print(f"   • 并行合成 ({args.workers} 线程): {parallel_time:.2f} 秒，加速 {serial_time / parallel_time:.1f}x")
+    print(f"   • 讲稿未变化重新运行: {rerun_time:.2f} 秒，重新合成 {rerun_count} 页")
+    print(f"   • 修改一页后重新运行: {edit_time:.2f} 秒，重新合成 {edit_count} 页")
+
+
+if __name__ == "__main__":
+    main()
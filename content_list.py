@@ -0,0 +1,288 @@
+"""
+MinerU content_list.json 结构化输入
+
+MinerU 在生成 markdown 的同时输出 *_content_list.json：按阅读顺序排列的内容块，
+每块带有 type（text / equation / image / table）、page_idx，标题块带有 text_level，
+图片和表格带有 img_path、caption、footnote（表格还有 table_body）。
+
+本模块直接读取这些内容块：
+- 构建章节树（MinerU 给出的标题级别都是1，层级按编号推断：3.1 属于 3，C.2 属于附录 C）；
+- 每个内容块（包括图片和表格）都归属到所在的章节；
+- 按 MinerU markdown 的格式渲染章节内容，供后续流程直接使用，不必再用正则从扁平的 markdown 里找标题；
+- 为章节写出 *_blocks.json，AI 分割时表格正文和公式以占位符代替，分割完成后再原样还原。
+"""
+
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+BLOCKS_SUFFIX = "_blocks.json"
+# 编号标题：1 / 3.2 / 4.1.1；附录：A / C.1（字母需在编号章节之后按 A、B、C 顺序出现，避免把 "A Study of ..." 当作编号）
+NUMBER_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)\.?\s+\S')
+APPENDIX_NUMBER_PATTERN = re.compile(r'^([A-Z])((?:\.\d+)*)\.?\s+\S')
+PLACEHOLDER_PATTERN = re.compile(r'\[\[(表格|公式)(\d+)\]\]')
+
+
+def find_content_list(markdown_path: str) -> Optional[str]:
+    """
+    查找与论文markdown对应的 content_list.json
+
+    依次检查 markdown 同目录下的 <名称>_content_list.json 以及 MinerU 默认的 <名称>/auto/ 子目录
+    """
+    base_dir = os.path.dirname(os.path.abspath(markdown_path))
+    stem = os.path.splitext(os.path.basename(markdown_path))[0]
+    for candidate in (
+        os.path.join(base_dir, f"{stem}_content_list.json"),
+        os.path.join(base_dir, stem, "auto", f"{stem}_content_list.json"),
+    ):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def load_content_list(content_list_path: str) -> List[dict]:
+    """读取 content_list.json，过滤掉空的文本块"""
+    with open(content_list_path, 'r', encoding='utf-8') as f:
+        blocks = json.load(f)
+    if not isinstance(blocks, list):
+        raise ValueError(f"content_list格式错误，应为内容块列表: {content_list_path}")
+    return [block for block in blocks if block.get('type') != 'text' or block.get('text', '').strip()]
+
+
+def is_heading(block: dict) -> bool:
+    return block.get('type') == 'text' and bool(block.get('text_level'))
+
+
+def render_block(block: dict) -> str:
+    """按 MinerU markdown 的格式渲染单个内容块"""
+    block_type = block.get('type')
+    if block_type == 'text':
+        text = block.get('text', '').strip()
+        return f"{'#' * block['text_level']} {text}" if block.get('text_level') else text
+    if block_type == 'equation':
+        return block.get('text', '').strip()
+    if block_type == 'image':
+        parts = [f"![]({block['img_path']})"] if block.get('img_path') else []
+        parts += [text.strip() for text in block.get('img_caption', []) + block.get('img_footnote', [])]
+        return '\n'.join(part for part in parts if part)
+    if block_type == 'table':
+        parts = [text.strip() for text in block.get('table_caption', [])]
+        body = (block.get('table_body') or '').strip()
+        if body:
+            parts.append(body)
+        elif block.get('img_path'):
+            parts.append(f"![]({block['img_path']})")
+        parts += [text.strip() for text in block.get('table_footnote', [])]
+        return '\n\n'.join(part for part in parts if part)
+    return (block.get('text') or '').strip()
+
+
+def _heading_number(title: str, state: dict) -> str:
+    """提取标题编号；state记录是否已出现编号章节以及当前附录字母"""
+    match = NUMBER_PATTERN.match(title)
+    if match:
+        state['numbered'] = True
+        return match.group(1)
+    match = APPENDIX_NUMBER_PATTERN.match(title)
+    if match and state['numbered']:
+        letter, sub_number = match.groups()
+        current = state['appendix']
+        if sub_number and letter == current:
+            return letter + sub_number
+        if not sub_number and letter == (chr(ord(current) + 1) if current else 'A'):
+            state['appendix'] = letter
+            return letter
+    return ""
+
+
+def build_section_tree(blocks: List[dict]) -> List[dict]:
+    """
+    构建章节树
+
+    每个节点包含 title、number、level（编号深度，未编号为1）、page_idx、block（标题块下标）、
+    blocks（直属内容块下标，不含子章节）、children。第一个标题之前的内容块挂在第一个节点下。
+
+    层级规则：有编号的标题按编号挂到最近的祖先编号下；未编号的标题一般是顶级章节（摘要、致谢、参考文献），
+    但以句号结尾的段落式标题（如 "Error analysis in ..."）属于当前最深的章节。
+    """
+    roots = []
+    stack = []  # 当前打开的章节路径
+    number_state = {'numbered': False, 'appendix': ''}
+    leading_blocks = []
+
+    for index, block in enumerate(blocks):
+        if not is_heading(block):
+            if stack:
+                stack[-1]['blocks'].append(index)
+            else:
+                leading_blocks.append(index)
+            continue
+
+        title = block['text'].strip()
+        number = _heading_number(title, number_state)
+        node = {
+            'title': title,
+            'number': number,
+            'level': number.count('.') + 1 if number else 1,
+            'page_idx': block.get('page_idx'),
+            'block': index,
+            'blocks': [],
+            'children': []
+        }
+        if number:
+            # 弹出直到栈顶是当前编号的祖先
+            while stack and not (stack[-1]['number'] and number.startswith(stack[-1]['number'] + '.')):
+                stack.pop()
+        elif title.endswith('.') and stack:
+            # 段落式标题：挂在当前最深的章节下
+            node['level'] = stack[-1]['level'] + 1
+        else:
+            stack = []
+
+        if stack:
+            stack[-1]['children'].append(node)
+        else:
+            roots.append(node)
+        stack.append(node)
+
+    if roots and leading_blocks:
+        roots[0]['blocks'] = leading_blocks + roots[0]['blocks']
+    return roots
+
+
+def iter_sections(tree: List[dict]):
+    """按文档顺序遍历章节树的所有节点"""
+    for node in tree:
+        yield node
+        yield from iter_sections(node['children'])
+
+
+def section_block_indexes(node: dict) -> List[int]:
+    """章节（含子章节）覆盖的全部内容块下标，按文档顺序"""
+    indexes = [node['block']] + node['blocks']
+    for child in node['children']:
+        indexes += section_block_indexes(child)
+    return sorted(indexes)
+
+
+def build_outline(blocks: List[dict], tree: List[dict]) -> List[dict]:
+    """
+    转换为 document_processor 使用的大纲格式
+
+    Returns:
+        list: 每个标题一项，包含 line（标题块下标）、level、number、title、first_line
+    """
+    outline = []
+    for node in iter_sections(tree):
+        first_line = next((blocks[i].get('text', '').strip() for i in node['blocks'] if blocks[i].get('type') == 'text'), '')
+        outline.append({
+            'line': node['block'],
+            'level': node['level'],
+            'number': node['number'],
+            'title': node['title'],
+            'first_line': first_line[:120],
+            'node': node
+        })
+    return outline
+
+
+def index_media(blocks: List[dict], tree: List[dict]) -> List[dict]:
+    """列出所有图片和表格以及它们所在的章节"""
+    section_of = {}
+    for node in iter_sections(tree):
+        for index in [node['block']] + node['blocks']:
+            section_of[index] = node['title']
+    media = []
+    for index, block in enumerate(blocks):
+        if block.get('type') in ('image', 'table'):
+            captions = block.get('img_caption') or block.get('table_caption') or []
+            media.append({
+                'type': block['type'],
+                'img_path': block.get('img_path', ''),
+                'caption': ' '.join(text.strip() for text in captions),
+                'page_idx': block.get('page_idx'),
+                'block': index,
+                'section': section_of.get(index, '')
+            })
+    return media
+
+
+def render_blocks(blocks: List[dict]) -> str:
+    return '\n\n'.join(text for text in (render_block(block) for block in blocks) if text)
+
+
+def write_section(node: dict, blocks: List[dict], output_path: str) -> Tuple[str, str]:
+    """
+    写出章节的markdown和对应的 *_blocks.json
+
+    Returns:
+        tuple: (markdown路径, blocks.json路径)
+    """
+    section_blocks = []
+    for index in section_block_indexes(node):
+        block = dict(blocks[index])
+        block['index'] = index
+        section_blocks.append(block)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(render_blocks(section_blocks))
+
+    blocks_path = get_blocks_path(output_path)
+    with open(blocks_path, 'w', encoding='utf-8') as f:
+        json.dump({'section': node['title'], 'blocks': section_blocks}, f, ensure_ascii=False, indent=2)
+    return output_path, blocks_path
+
+
+def get_blocks_path(markdown_path: str) -> str:
+    return os.path.splitext(markdown_path)[0] + BLOCKS_SUFFIX
+
+
+def load_section_blocks(markdown_path: str) -> Optional[List[dict]]:
+    """读取章节markdown旁的 *_blocks.json；文件不存在或比markdown旧（markdown被手动修改过）时返回None"""
+    blocks_path = get_blocks_path(markdown_path)
+    if not os.path.exists(blocks_path) or os.path.getmtime(blocks_path) < os.path.getmtime(markdown_path):
+        return None
+    with open(blocks_path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('blocks')
+
+
+def compact_blocks(blocks: List[dict]) -> Tuple[str, Dict[str, str]]:
+    """
+    渲染给AI分割使用的精简文本：表格正文和公式替换为占位符，图片保留引用和图注
+
+    Returns:
+        tuple: (精简文本, {占位符: 原始内容})
+    """
+    placeholders = {}
+    parts = []
+    counters = {'表格': 0, '公式': 0}
+    for block in blocks:
+        block_type = block.get('type')
+        if block_type == 'table' and (block.get('table_body') or '').strip():
+            counters['表格'] += 1
+            token = f"[[表格{counters['表格']}]]"
+            placeholders[token] = block['table_body'].strip()
+            text = render_block(dict(block, table_body=token))
+        elif block_type == 'equation':
+            counters['公式'] += 1
+            token = f"[[公式{counters['公式']}]]"
+            placeholders[token] = render_block(block)
+            text = token
+        else:
+            text = render_block(block)
+        if text:
+            parts.append(text)
+    return '\n\n'.join(parts), placeholders
+
+
+def restore_placeholders(text: str, placeholders: Dict[str, str]) -> Tuple[str, List[str]]:
+    """
+    把分割结果中的占位符还原为原始内容
+
+    Returns:
+        tuple: (还原后的文本, 结果中缺失的占位符)
+    """
+    restored = PLACEHOLDER_PATTERN.sub(lambda match: placeholders.get(match.group(0), match.group(0)), text)
+    missing = [token for token in placeholders if token not in text]
+    return restored, missing
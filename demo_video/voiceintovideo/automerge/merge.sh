@@ -1,22 +1,6 @@
 #!/bin/bash
-# 1. 合并 voice1.mp4 和 video1.mp4
-ffmpeg -i 1.mp4 -i voice1.mp4 -c:v copy -c:a aac -strict experimental -map 0:v:0 -map 1:a:0 output1.mp4
-
-# 2. 合并 voice2.mp4 和 video2.mp4
-ffmpeg -i 2.mp4 -i voice2.mp4 -c:v copy -c:a aac -strict experimental -map 0:v:0 -map 1:a:0 output2.mp4
-
-# 3. 合并 voice3.mp4 和 video3.mp4
-ffmpeg -i 3.mp4 -i voice3.mp4 -c:v copy -c:a aac -strict experimental -map 0:v:0 -map 1:a:0 output3.mp4
-
-# 4. 创建拼接列表
-echo "file 'output1.mp4'" > file_list.txt
-echo "file 'output2.mp4'" >> file_list.txt
-echo "file 'output3.mp4'" >> file_list.txt
-
-# 5. 拼接所有视频
-ffmpeg -f concat -i file_list.txt -c copy final_output.mp4
-
-# 6. 清理临时文件
-rm file_list.txt output1.mp4 output2.mp4 output3.mp4
-
-echo "合并完成！最终视频：final_output.mp4"
\ No newline at end of file
+# 把 1.mp4 / 2.mp4 / 3.mp4 分别与 voice1.mp4 / voice2.mp4 / voice3.mp4 合成，再拼接为 final_output.mp4
+# 各页在多个ffmpeg进程中并行合成（视频流直接复制），片段保存在 segments/ 中供下次复用，
+# 最后用concat demuxer直接拼接，详见根目录的 video_assembly.py
+cd "$(dirname "$0")"
+python3 ../../../video_assembly.py . . final_output.mp4 --pages 1 2 3 --audio-template 'voice{page}.mp4'
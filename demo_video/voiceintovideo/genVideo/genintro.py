@@ -1,27 +1,25 @@
 from manim import *
-from moviepy.editor import VideoFileClip
 import os
+import sys
+
+# 只读取文件头中的时长，不必用moviepy解码整个视频
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from audio_timing import get_audio_duration as read_audio_duration, mp4_has_audio_track
 
 def get_audio_duration(video_path):
-    try:
-        # 获取绝对路径
-        abs_path = os.path.abspath(video_path)
-        print(f"正在读取: {abs_path}")
-        # 加载视频文件
-        clip = VideoFileClip(abs_path)
-        # 检查是否有音频轨道
-        if clip.audio:
-            duration = clip.audio.duration
-            print(f"音频时长: {duration:.2f} 秒")
-        else:
-            print("警告: 未检测到音频轨道")
-            duration = 10
-            
-        clip.close()
-        return duration
-    except Exception as e:
-        print(f"错误: {e}")
+    # 获取绝对路径
+    abs_path = os.path.abspath(video_path)
+    print(f"正在读取: {abs_path}")
+    # 检查是否有音频轨道
+    if mp4_has_audio_track(abs_path) is False:
+        print("警告: 未检测到音频轨道")
+        return 10
+    duration = read_audio_duration(abs_path)
+    if duration is None:
+        print("错误: 无法读取音频时长")
         return 10  # 默认返回值
+    print(f"音频时长: {duration:.2f} 秒")
+    return duration
     
 class Scene1(Scene):
     def construct(self):
@@ -14,16 +14,55 @@ import json
 
 简化版本：只需要输入markdown路径和输出目录，从config.json读取配置，从txt文件读取prompt
 添加章节切分功能
+
+默认（auto）先用本地规则按同义词表匹配一级标题，无需调用模型；规则无法确定时使用大纲模式：
+只把标题树（级别、编号、每节第一行）发给模型识别四个章节，模型给出的标题无法在文档中找到
+或章节不全时，回退为发送全文。
+
+--ingest content_list 时直接读取MinerU的content_list.json构建章节树，按内容块输出章节。
 """
 
 import os
 import sys
 import json
 import re
+import bisect
+import argparse
 from api_call import process_text
+from content_list import (build_outline as build_content_list_outline, build_section_tree, find_content_list,
+                          get_blocks_path, index_media, load_content_list, render_blocks, section_block_indexes,
+                          write_section)
+
+EXPECTED_SECTIONS = ["Introduction", "Methods", "Experiments", "Conclusion"]
+MIN_OUTLINE_HEADINGS = 3       # 标题少于这个数量时大纲信息不足，直接发送全文
+MIN_CONFIDENT_SECTIONS = 3     # 至少识别出这么多个章节（且标题都能在文档中找到）才认为大纲模式的结果可信
+OUTLINE_FIRST_LINE_CHARS = 120 # 大纲中每节第一行保留的最大字符数
+# 规则分类使用的章节同义词表（小写，去掉编号后与标题比较），可在config.json的section_synonyms中补充
+DEFAULT_SECTION_SYNONYMS = {
+    "Introduction": ["introduction", "引言", "介绍", "绪论"],
+    "Methods": ["method", "methods", "methodology", "methodologies", "approach", "our approach",
+                "proposed method", "proposed approach", "方法"],
+    "Experiments": ["experiment", "experiments", "experimental setup", "experimental results",
+                    "experiments and results", "evaluation", "evaluations", "实验", "实验结果"],
+    "Conclusion": ["conclusion", "conclusions", "conclusion and future work", "conclusions and future work",
+                   "concluding remarks", "discussion", "summary", "结论", "总结"]
+}
+# 位于引言和实验之间、但不属于方法的章节
+NON_METHOD_SECTIONS = ["related work", "related works", "background", "preliminaries", "preliminary",
+                       "problem formulation", "problem definition", "相关工作", "背景"]
+# 标题行或代码块围栏行（去掉首尾空白后以#或```开头）；分组1为标题行#的起始位置，行首没有缩进时与整行起点相同
+HEADING_LINE_PATTERN = re.compile(r'^[^\S\n]*(?:(#)|```)[^\n]*', re.MULTILINE)
+FIRST_TEXT_PATTERN = re.compile(r'\S[^\n]*')
+SECTION_NUMBER_PATTERN = re.compile(r'\s*(\d+(?:\.\d+)*)')
+OUTLINE_NOTE = "（注意：下面给出的不是全文，而是文章的标题大纲，每个标题下方附有该节正文的第一行。请直接从这些标题中选择，并原样输出标题文本。）"
 
 def load_config():
-    """从config.json加载配置"""
+    """
+    从config.json加载配置
+
+    配置文件不存在（此时创建默认配置）、未设置api_key或无法读取时抛出RuntimeError，
+    而不是直接退出进程：master_pipeline在同一进程内调用，需要打印失败信息和总结。
+    """
     config_file = "config.json"
     if not os.path.exists(config_file):
         # 创建默认配置文件（移除prompt_template_file配置项）
@@ -33,22 +72,19 @@ def load_config():
         }
         with open(config_file, 'w', encoding='utf-8') as f:
             json.dump(default_config, f, ensure_ascii=False, indent=2)
-        print(f"已创建默认配置文件 {config_file}，请修改其中的 api_key")
-        sys.exit(1)
+        raise RuntimeError(f"已创建默认配置文件 {config_file}，请修改其中的 api_key")
     
     try:
         with open(config_file, 'r', encoding='utf-8') as f:
             config = json.load(f)
-        
-        # 检查必要的配置项
-        if config.get("api_key") == "your-api-key-here":
-            print("请在 config.json 中设置正确的 api_key")
-            sys.exit(1)
-            
-        return config
     except Exception as e:
-        print(f"读取配置文件失败: {e}")
-        sys.exit(1)
+        raise RuntimeError(f"读取配置文件失败: {e}") from e
+    
+    # 检查必要的配置项
+    if config.get("api_key") == "your-api-key-here":
+        raise RuntimeError("请在 config.json 中设置正确的 api_key")
+    
+    return config
 
 def load_prompt_template() -> str:
     """从固定路径加载prompt模板"""
@@ -135,15 +171,91 @@ def is_subsection(parent_num: str, current_num: str) -> bool:
     # 如果current_num以parent_num开头且后面跟着小数点，则是子章节
     return current_num.startswith(parent_num + ".")
 
-def find_section_content(markdown_content: str, section_identifier: str) -> str:
-    """在markdown中找到指定章节的内容"""
-    lines = markdown_content.split('\n')
-    content_lines = []
-    in_section = False
-    found_line = None
-    
-    print(f"  正在搜索章节: '{section_identifier}'")
-    
+def scan_heading_lines(markdown_content: str) -> list:
+    """
+    找出代码块之外的标题行（标题大纲和HeadingIndex共用）
+
+    只用一次正则扫描，不逐行拆分全文；```围栏之间的行（如代码中的#注释）不是标题。
+
+    Returns:
+        list: 每个标题行一项，包含 line（行号，从0开始）、offset（行首字符偏移）、indented（#前有缩进）、
+              level、number、text（去掉首尾空白的整行）、title（#之后的文字，可能为空）、
+              first_line（到下一个有文字的标题之前，代码块之外的第一行正文；#后没有文字的行算作正文）
+    """
+    headings = []
+    in_code_block = False
+    line = 0
+    last_offset = 0
+    current = None     # 最近一个有文字的标题
+    text_start = None  # current之后、尚未查找过正文的文本起点；已找到第一行正文时为None
+    for match in HEADING_LINE_PATTERN.finditer(markdown_content):
+        offset = match.start()
+        if text_start is not None and not in_code_block:
+            first = FIRST_TEXT_PATTERN.search(markdown_content, text_start, offset)
+            if first:
+                current['first_line'] = first.group().strip()[:OUTLINE_FIRST_LINE_CHARS]
+                text_start = None
+        line += markdown_content.count('\n', last_offset, offset)
+        last_offset = offset
+        if match.start(1) == -1:
+            in_code_block = not in_code_block
+            if not in_code_block and text_start is not None:
+                text_start = match.end()
+            continue
+        if in_code_block:
+            continue
+        text = match.group().strip()
+        hashes = len(text) - len(text.lstrip('#'))
+        number_match = SECTION_NUMBER_PATTERN.match(text, hashes)
+        heading = {
+            'line': line,
+            'offset': offset,
+            'indented': offset != match.start(1),
+            'level': hashes,
+            'number': number_match.group(1) if number_match else "",
+            'text': text,
+            'title': text[hashes:].strip(),
+            'first_line': ''
+        }
+        headings.append(heading)
+        if heading['title']:
+            current = heading
+            text_start = match.end()
+        elif text_start is not None:
+            # 没有文字的标题行本身可以作为正文第一行
+            first = FIRST_TEXT_PATTERN.search(markdown_content, text_start, match.end())
+            if first:
+                current['first_line'] = first.group().strip()[:OUTLINE_FIRST_LINE_CHARS]
+                text_start = None
+    if text_start is not None and not in_code_block:
+        first = FIRST_TEXT_PATTERN.search(markdown_content, text_start)
+        if first:
+            current['first_line'] = first.group().strip()[:OUTLINE_FIRST_LINE_CHARS]
+    return headings
+
+def extract_heading_outline(markdown_content: str) -> list:
+    """
+    提取文档的标题树
+
+    Returns:
+        list: 每个标题一项，包含 line（行号，从0开始）、level、number、title、first_line（该节正文第一行）
+    """
+    return [
+        {key: heading[key] for key in ('line', 'level', 'number', 'title', 'first_line')}
+        for heading in scan_heading_lines(markdown_content) if heading['title']
+    ]
+
+def build_outline_text(outline: list) -> str:
+    """把标题树格式化为发给模型的大纲文本"""
+    lines = []
+    for heading in outline:
+        lines.append(f"{'#' * heading['level']} {heading['title']}")
+        if heading['first_line']:
+            lines.append(f"    {heading['first_line']}")
+    return '\n'.join(lines)
+
+def build_heading_patterns(section_identifier: str) -> list:
+    """构建匹配章节标题行的正则表达式列表"""
     # 创建多种可能的标题模式
     # 1. 直接匹配：# 1 Introduction
     pattern1 = rf'^#+\s*{re.escape(section_identifier)}\s*$'
@@ -156,83 +268,148 @@ def find_section_content(markdown_content: str, section_identifier: str) -> str:
     patterns = [pattern1, pattern2]
     if pattern3:
         patterns.append(pattern3)
+    return patterns
+
+def find_outline_heading(outline: list, section_identifier: str):
+    """返回大纲中第一个匹配section_identifier的标题，未找到时返回None"""
+    if not section_identifier:
+        return None
+    patterns = build_heading_patterns(section_identifier)
+    return next((
+        heading for heading in outline
+        if any(re.match(pattern, f"{'#' * heading['level']} {heading['title']}", re.IGNORECASE) for pattern in patterns)
+    ), None)
+
+def heading_exists(outline: list, section_identifier: str) -> bool:
+    """判断模型给出的章节标题能否在文档的标题中找到"""
+    return find_outline_heading(outline, section_identifier) is not None
+
+def is_confident_mapping(sections: dict, outline: list) -> bool:
+    """大纲模式结果是否可信：识别出足够多的章节，且每个标题都能在文档中找到"""
+    found = [key for key in EXPECTED_SECTIONS if key in sections]
+    if len(found) < MIN_CONFIDENT_SECTIONS:
+        return False
+    return all(heading_exists(outline, sections[key]) for key in found)
+
+class HeadingIndex:
+    """
+    文档的标题索引，每个文档只构建一次
+
+    记录每个标题行的行号、字符偏移、级别、编号以及父子关系，章节内容直接按偏移切片，
+    不必为每个章节重新拆分全文、逐行扫描。章节边界与逐行扫描的规则相同：遇到更高级标题时结束；
+    遇到同级标题时，只有两者都有编号且新标题是当前章节的子章节才继续，否则结束；更低级标题属于当前章节。
+    """
+
+    def __init__(self, markdown_content: str):
+        self.content = markdown_content
+        self.line_count = markdown_content.count('\n') + 1
+
+        # headings: 可作为章节起点的标题行（代码块之外、去掉首尾空白后以#开头），与标题大纲使用同一次扫描
+        # 每项包含 line、offset、level、number、text、boundary（能否结束章节）、
+        # parent（父标题在headings中的下标）、children、end（章节结束行，不含）、end_offset
+        self.headings = []
+        open_stack = []
+        for line_heading in scan_heading_lines(markdown_content):
+            heading = {
+                'line': line_heading['line'],
+                'offset': line_heading['offset'],
+                'level': line_heading['level'],
+                'number': line_heading['number'],
+                'text': line_heading['text'],
+                # 缩进的标题行或#后没有内容的行不会结束章节，也不进入栈；它们的结束位置在下面单独计算
+                'boundary': not line_heading['indented'] and bool(line_heading['title']),
+                'parent': None,
+                'children': [],
+                'end': self.line_count,
+                'end_offset': len(markdown_content)
+            }
+            if heading['boundary']:
+                while open_stack and self._ends_section(self.headings[open_stack[-1]], heading):
+                    self._close(self.headings[open_stack.pop()], heading)
+            if open_stack:
+                heading['parent'] = open_stack[-1]
+                self.headings[open_stack[-1]]['children'].append(len(self.headings))
+            if heading['boundary']:
+                open_stack.append(len(self.headings))
+            self.headings.append(heading)
+
+        # 所有标题文本拼接后做大小写折叠，查找时先用子串搜索定位候选标题，再用正则确认
+        self._joined_text = '\n'.join(heading['text'] for heading in self.headings)
+        self._joined_lower = self._joined_text.casefold()
+        self._joined_starts = []
+        position = 0
+        for heading in self.headings:
+            self._joined_starts.append(position)
+            position += len(heading['text']) + 1
+
+        for position, heading in enumerate(self.headings):
+            if not heading['boundary']:
+                closing = next((other for other in self.headings[position + 1:]
+                                if other['boundary'] and self._ends_section(heading, other)), None)
+                if closing is not None:
+                    self._close(heading, closing)
+
+    @staticmethod
+    def _close(section: dict, heading: dict):
+        """section在heading所在行之前结束"""
+        section['end'] = heading['line']
+        section['end_offset'] = heading['offset'] - 1
+
+    @staticmethod
+    def _ends_section(section: dict, heading: dict) -> bool:
+        """heading是否结束section"""
+        if heading['level'] < section['level']:
+            return True
+        if heading['level'] == section['level']:
+            return not (section['number'] and heading['number'] and is_subsection(section['number'], heading['number']))
+        return False
+
+    def find(self, section_identifier: str):
+        """返回第一个匹配section_identifier的标题，未找到时返回None"""
+        patterns = [re.compile(pattern, re.IGNORECASE) for pattern in build_heading_patterns(section_identifier)]
+        # 任一模式匹配的标题都包含去掉编号后的标题文字，先按子串定位候选；
+        # 个别字符（如ß）折叠后长度会变化，此时无法用偏移定位，逐个标题匹配
+        needle = re.sub(r'^\d+\s+', '', section_identifier).strip().casefold()
+        if not needle or len(self._joined_lower) != len(self._joined_text):
+            candidates = range(len(self.headings))
+        else:
+            candidates = self._candidates(needle)
+        for position in candidates:
+            heading = self.headings[position]
+            if any(pattern.match(heading['text']) for pattern in patterns):
+                return heading
+        return None
+
+    def _candidates(self, needle: str):
+        """按顺序返回文本中包含needle的标题下标"""
+        last = -1
+        found = self._joined_lower.find(needle)
+        while found != -1:
+            position = bisect.bisect_right(self._joined_starts, found) - 1
+            if position != last:
+                yield position
+                last = position
+            found = self._joined_lower.find(needle, self._joined_starts[position] + len(self.headings[position]['text']) + 1)
+
+    def section_text(self, heading: dict) -> str:
+        """按字符偏移切出标题所在章节的内容（含标题行）"""
+        return self.content[heading['offset']:heading['end_offset']]
+
+def find_section_content(markdown_content: str, section_identifier: str, index: HeadingIndex = None) -> str:
+    """在markdown中找到指定章节的内容（提取多个章节时传入同一个index，避免重复构建）"""
+    if index is None:
+        index = HeadingIndex(markdown_content)
     
-    print(f"  使用的匹配模式:")
-    for i, pattern in enumerate(patterns, 1):
-        print(f"    模式{i}: {pattern}")
-    
-    # 搜索匹配的标题行
-    for i, line in enumerate(lines):
-        line_stripped = line.strip()
-        if line_stripped.startswith('#'):
-            print(f"  检查第{i+1}行标题: '{line_stripped}'")
-            
-            # 检查是否匹配任何模式
-            for j, pattern in enumerate(patterns):
-                if re.match(pattern, line_stripped, re.IGNORECASE):
-                    print(f"    ✓ 匹配成功 (模式{j+1})")
-                    found_line = i
-                    in_section = True
-                    content_lines.append(line)
-                    break
-            
-            if found_line is not None:
-                break
-    
-    if found_line is None:
-        print(f"  ✗ 未找到匹配的标题行")
+    heading = index.find(section_identifier)
+    if heading is None:
+        print(f"  ✗ 未找到匹配的标题行: '{section_identifier}'")
         return ""
     
-    print(f"  ✓ 找到起始行: 第{found_line+1}行")
-    
-    # 获取起始标题的级别和章节号
-    start_title_level = len(re.match(r'^(#+)', lines[found_line]).group(1))
-    start_section_number = extract_section_number(lines[found_line])
-    print(f"  章节级别: {start_title_level} 级标题")
-    print(f"  章节编号: '{start_section_number}'")
-    
-    # 从找到的行开始，收集内容直到下一个非子章节标题
-    for i in range(found_line + 1, len(lines)):
-        line = lines[i]
-        
-        # 检查是否是标题行
-        if re.match(r'^#+\s*\S', line):  # # 后面可以没有空格，但必须有内容
-            current_level = len(re.match(r'^(#+)', line).group(1))
-            current_section_number = extract_section_number(line)
-            print(f"    发现第{i+1}行标题: '{line.strip()}' (级别: {current_level}, 编号: '{current_section_number}')")
-            
-            # 判断是否应该停止收集
-            should_stop = False
-            
-            if current_level < start_title_level:
-                # 遇到更高级标题，停止
-                should_stop = True
-                print(f"    遇到更高级标题({current_level}级 < {start_title_level}级)，停止收集")
-            elif current_level == start_title_level:
-                # 同级标题，检查是否是子章节
-                if start_section_number and current_section_number:
-                    if is_subsection(start_section_number, current_section_number):
-                        print(f"    这是子章节({current_section_number} 是 {start_section_number} 的子章节)，继续收集")
-                    else:
-                        should_stop = True
-                        print(f"    这是同级或其他章节({current_section_number} 不是 {start_section_number} 的子章节)，停止收集")
-                else:
-                    # 无法判断章节号，按原逻辑处理
-                    should_stop = True
-                    print(f"    无法判断章节关系，按同级标题处理，停止收集")
-            else:
-                # 更低级标题，继续收集
-                print(f"    这是更低级标题({current_level}级 > {start_title_level}级)，继续收集")
-            
-            if should_stop:
-                print(f"  章节结束于第{i+1}行: '{line.strip()}'")
-                break
-        
-        content_lines.append(line)
-    
-    result = '\n'.join(content_lines)
-    print(f"  提取了 {len(content_lines)} 行内容")
-    return result
+    end_line = heading['end']
+    end_desc = f"第{end_line+1}行" if end_line < index.line_count else "文末"
+    print(f"  ✓ 第{heading['line']+1}行 '{heading['text']}' ({heading['level']}级, 编号 '{heading['number']}')，"
+          f"结束于{end_desc}，共 {end_line - heading['line']} 行")
+    return index.section_text(heading)
 
 def save_sections(sections: dict, markdown_content: str, output_dir: str, base_filename: str):
     """保存切分的章节到指定目录"""
@@ -241,12 +418,14 @@ def save_sections(sections: dict, markdown_content: str, output_dir: str, base_f
         print(f"创建输出目录: {output_dir}")
     
     saved_sections = []
+    # 标题索引只构建一次，所有章节共用
+    index = HeadingIndex(markdown_content)
     
     for section_type, section_identifier in sections.items():
         print(f"\n正在提取章节: {section_type} -> {section_identifier}")
         
         # 在markdown中找到对应的内容
-        section_content = find_section_content(markdown_content, section_identifier)
+        section_content = find_section_content(markdown_content, section_identifier, index)
         
         if section_content:
             # 构建文件名
@@ -256,6 +435,9 @@ def save_sections(sections: dict, markdown_content: str, output_dir: str, base_f
             # 保存文件
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(section_content)
+            # 删除content_list模式留下的内容块文件，避免AI分割使用过期的结构
+            if os.path.exists(get_blocks_path(filepath)):
+                os.remove(get_blocks_path(filepath))
             
             print(f"✓ 已保存: {filepath}")
             saved_sections.append((section_type, filepath))
@@ -264,38 +446,180 @@ def save_sections(sections: dict, markdown_content: str, output_dir: str, base_f
     
     return saved_sections
 
-def process_document(markdown_path: str, output_dir: str, config: dict) -> str:
-    """处理markdown文档"""
+def _normalize_title(title: str) -> str:
+    """去掉编号和标点，转为小写，用于与同义词表比较"""
+    title = re.sub(r'^(\d+(?:\.\d+)*|[IVX]+)\.?\s*', '', title.strip())
+    return re.sub(r'[\s:：.,;]+', ' ', title).strip().lower()
+
+def _synonym_score(normalized: str, synonyms: list) -> int:
+    """完全相同得2分，以同义词作为单词开头或包含得1分，否则0分"""
+    best = 0
+    for synonym in synonyms:
+        if normalized == synonym:
+            return 2
+        if re.search(rf'(^|\s){re.escape(synonym)}(\s|$)', normalized) or (not synonym.isascii() and synonym in normalized):
+            best = 1
+    return best
+
+def classify_sections_by_rules(outline: list, synonyms: dict = None) -> dict:
+    """
+    用同义词表对一级章节标题进行确定性分类
+
+    候选标题为带编号的顶级标题（编号不含小数点）；文档没有编号时使用最高级别的全部标题。
+    每类取得分最高且唯一的标题；方法章节没有匹配时，若引言与实验之间（去掉相关工作、背景等）
+    恰好只剩一个章节，则视为方法章节（如 "3 ChatDev"）。
+
+    Returns:
+        dict: 与parse_section_mapping相同格式的映射；存在缺失或并列（规则无法确定）时返回空字典
+    """
+    synonyms = synonyms or DEFAULT_SECTION_SYNONYMS
+    candidates = [h for h in outline if h['number'] and '.' not in h['number']]
+    if not candidates and outline:
+        top_level = min(h['level'] for h in outline)
+        candidates = [h for h in outline if h['level'] == top_level]
+    if not candidates:
+        return {}
+
+    mapping = {}
+    positions = {}
+    for section_type in EXPECTED_SECTIONS:
+        scored = [(_synonym_score(_normalize_title(h['title']), synonyms.get(section_type, [])), index)
+                  for index, h in enumerate(candidates)]
+        best = max(score for score, _ in scored)
+        if best == 0:
+            continue
+        best_indexes = [index for score, index in scored if score == best]
+        if len(best_indexes) > 1:
+            print(f"  规则分类: {section_type} 有多个候选标题，无法确定")
+            return {}
+        positions[section_type] = best_indexes[0]
+        mapping[section_type] = candidates[best_indexes[0]]['title']
+
+    if "Methods" not in mapping and "Introduction" in positions and "Experiments" in positions:
+        between = [
+            h for h in candidates[positions["Introduction"] + 1:positions["Experiments"]]
+            if _synonym_score(_normalize_title(h['title']), NON_METHOD_SECTIONS) == 0
+        ]
+        if len(between) == 1:
+            mapping["Methods"] = between[0]['title']
+            print(f"  规则分类: 按位置将 '{between[0]['title']}' 识别为方法章节")
+
+    if any(section_type not in mapping for section_type in EXPECTED_SECTIONS):
+        missing = [section_type for section_type in EXPECTED_SECTIONS if section_type not in mapping]
+        print(f"  规则分类: 未能识别 {', '.join(missing)}")
+        return {}
+    if len(set(mapping.values())) < len(mapping):
+        print("  规则分类: 多个章节对应同一个标题，无法确定")
+        return {}
+    return {section_type: mapping[section_type] for section_type in EXPECTED_SECTIONS}
+
+def format_section_mapping(sections: dict) -> str:
+    """把章节映射格式化为与模型输出相同的文本"""
+    return '\n'.join(f"{section_type}: {title}" for section_type, title in sections.items())
+
+def request_section_mapping(prompt: str, config: dict) -> str:
+    """调用模型获取章节映射"""
+    try:
+        return process_text(
+            prompt, 
+            config["api_key"], 
+            config["model"]
+        )
+    except Exception as e:
+        raise Exception(f"API 调用失败: {str(e)}")
+
+def identify_sections(outline: list, document_content: str, config: dict, mode: str = "auto") -> tuple:
+    """
+    识别四个主要章节（markdown和content_list两种输入共用）
+
+    Args:
+        outline: 标题大纲
+        document_content: 全文，大纲模式不可信或mode为full时发送给模型
+        config: 配置（api_key、model，可选section_synonyms补充同义词表）
+        mode: auto / outline / full，含义同process_document
+
+    Returns:
+        tuple: (章节映射文本, 章节映射字典)
+    """
+    # 加载prompt模板（使用固定路径）
+    print(f"正在加载prompt模板: prompt_template/Central.txt")
+    prompt_template = load_prompt_template()
+    
+    result = None
+    sections = {}
+    
+    if mode == "auto":
+        # 本地规则分类：常见的章节命名无需调用模型
+        synonyms = {key: list(values) for key, values in DEFAULT_SECTION_SYNONYMS.items()}
+        for section_type, extra in config.get("section_synonyms", {}).items():
+            synonyms.setdefault(section_type, []).extend(word.lower() for word in extra)
+        sections = classify_sections_by_rules(outline, synonyms)
+        if sections:
+            print("[OK] 规则分类成功，跳过模型调用")
+            result = format_section_mapping(sections)
+        else:
+            print("[WARN]  规则分类无法确定章节，改用大纲模式调用模型")
+            mode = "outline"
+    
+    if result is None and mode == "outline" and len(outline) >= MIN_OUTLINE_HEADINGS:
+        # 大纲模式：只发送标题树
+        outline_text = build_outline_text(outline)
+        outline_prompt = f"{prompt_template}\n{OUTLINE_NOTE}\n\n\n{outline_text}"
+        print(f"正在使用模型 {config['model']} 分析标题大纲 ({len(outline)} 个标题，{len(outline_text)} 字符，全文 {len(document_content)} 字符)...")
+        result = request_section_mapping(outline_prompt, config)
+        sections = parse_section_mapping(result)
+        if not is_confident_mapping(sections, outline):
+            print("[WARN]  大纲模式的识别结果不完整或标题无法在文档中找到，改为发送全文")
+            result = None
+    elif result is None and mode == "outline":
+        print(f"[WARN]  文档只有 {len(outline)} 个标题，大纲信息不足，直接发送全文")
+    
+    if result is None:
+        # 构建完整的prompt
+        full_prompt = f"{prompt_template}\n\n\n{document_content}"
+        
+        # 调用API处理
+        print(f"正在使用模型 {config['model']} 处理文档...")
+        result = request_section_mapping(full_prompt, config)
+        sections = parse_section_mapping(result)
+    
+    return result, sections
+
+def process_document(markdown_path: str, output_dir: str, config: dict, mode: str = "auto",
+                     ingest: str = "markdown", content_list_path: str = None) -> str:
+    """
+    处理markdown文档
+
+    Args:
+        markdown_path: 论文markdown路径
+        output_dir: 章节输出目录
+        config: 配置（api_key、model，可选section_synonyms补充同义词表）
+        mode: auto 先用本地规则分类，无法确定时使用大纲模式；
+              outline 只发送标题大纲（结果不可信时回退为全文）；full 发送全文
+        ingest: markdown 从markdown标题解析结构；content_list 直接读取MinerU的content_list.json
+        content_list_path: content_list.json路径，为None时在markdown旁查找
+    """
     
     # 检查文件是否存在
     if not os.path.exists(markdown_path):
         raise FileNotFoundError(f"Markdown 文件不存在: {markdown_path}")
     
+    base_filename = os.path.splitext(os.path.basename(markdown_path))[0]
+    if ingest == "content_list":
+        content_list_path = content_list_path or find_content_list(markdown_path)
+        if content_list_path is None or not os.path.exists(content_list_path):
+            raise FileNotFoundError(f"未找到 {base_filename} 对应的 content_list.json")
+        return process_content_list(content_list_path, output_dir, config, mode, base_filename)
+    
     # 读取文档内容
     print(f"正在读取文档: {markdown_path}")
     document_content = read_file_content(markdown_path)
     
-    # 加载prompt模板（使用固定路径）
-    print(f"正在加载prompt模板: prompt_template/Central.txt")
-    prompt_template = load_prompt_template()
-    
-    # 构建完整的prompt
-    full_prompt = f"{prompt_template}\n\n\n{document_content}"
-    
-    # 调用API处理
-    print(f"正在使用模型 {config['model']} 处理文档...")
-    try:
-        result = process_text(
-            full_prompt, 
-            config["api_key"], 
-            config["model"]
-        )
-    except Exception as e:
-        raise Exception(f"API 调用失败: {str(e)}")
+    outline = extract_heading_outline(document_content)
+    result, sections = identify_sections(outline, document_content, config, mode)
     
     # 解析章节映射
     print("\n正在解析章节映射...")
-    sections = parse_section_mapping(result)
     
     if sections:
         print(f"找到 {len(sections)} 个章节:")
@@ -303,8 +627,6 @@ def process_document(markdown_path: str, output_dir: str, config: dict) -> str:
             print(f"  {section_type}: {section_id}")
         
         # 切分并保存章节
-        base_filename = os.path.splitext(os.path.basename(markdown_path))[0]
-        
         print(f"\n正在切分文档到目录: {output_dir}")
         saved_sections = save_sections(sections, document_content, output_dir, base_filename)
         
@@ -314,22 +636,77 @@ def process_document(markdown_path: str, output_dir: str, config: dict) -> str:
     
     return result
 
+def process_content_list(content_list_path: str, output_dir: str, config: dict, mode: str = "auto", base_filename: str = None) -> str:
+    """
+    从MinerU的content_list.json切分章节
+
+    章节树和图表归属直接来自内容块，章节内容按块渲染，不再用正则在markdown中查找标题；
+    每个章节旁额外写出 *_blocks.json，供AI分割使用。
+    """
+    print(f"正在读取内容块: {content_list_path}")
+    blocks = load_content_list(content_list_path)
+    tree = build_section_tree(blocks)
+    outline = build_content_list_outline(blocks, tree)
+    media = index_media(blocks, tree)
+    print(f"共 {len(blocks)} 个内容块，{len(outline)} 个标题，"
+          f"{sum(1 for item in media if item['type'] == 'image')} 张图片，{sum(1 for item in media if item['type'] == 'table')} 个表格")
+    
+    if base_filename is None:
+        base_filename = os.path.basename(content_list_path).replace("_content_list.json", "")
+    
+    result, sections = identify_sections(outline, render_blocks(blocks), config, mode)
+    
+    print("\n正在解析章节映射...")
+    if not sections:
+        print("未找到有效的章节映射信息")
+        return result
+    
+    os.makedirs(output_dir, exist_ok=True)
+    saved_sections = []
+    for section_type, section_identifier in sections.items():
+        heading = find_outline_heading(outline, section_identifier)
+        if heading is None:
+            print(f"✗ 警告: 未找到章节 '{section_identifier}' 的内容")
+            continue
+        filepath = os.path.join(output_dir, f"{base_filename}_{section_type}.md")
+        write_section(heading['node'], blocks, filepath)
+        section_media = [item for item in media if item['block'] in set(section_block_indexes(heading['node']))]
+        print(f"✓ 已保存: {filepath} ({section_type} -> {heading['title']}，"
+              f"{len(section_media)} 个图表)")
+        saved_sections.append((section_type, filepath))
+    
+    print(f"\n章节切分完成，共保存 {len(saved_sections)} 个文件")
+    return result
+
 def main():
     """主函数"""
-    if len(sys.argv) != 3:
-        print("使用方法: python document_processor.py <markdown文件路径> <输出目录>")
-        print("示例: python document_processor.py README.md ./sections")
-        sys.exit(1)
-    
-    markdown_path = sys.argv[1]
-    output_dir = sys.argv[2]
+    parser = argparse.ArgumentParser(
+        description='识别论文的四个主要章节并切分为独立文件',
+        epilog='示例: python document_processor.py README.md ./sections'
+    )
+    parser.add_argument('markdown_path', help='markdown文件路径')
+    parser.add_argument('output_dir', help='输出目录')
+    parser.add_argument(
+        '--mode',
+        choices=['auto', 'outline', 'full'],
+        default='auto',
+        help='auto: 先用本地规则识别，无法确定时使用大纲模式 (默认); outline: 只发送标题大纲，结果不可信时回退为全文; full: 始终发送全文'
+    )
+    parser.add_argument(
+        '--ingest',
+        choices=['markdown', 'content_list'],
+        default='markdown',
+        help='markdown: 从markdown标题解析结构 (默认); content_list: 直接读取MinerU输出的content_list.json'
+    )
+    parser.add_argument('--content-list', default=None, help='content_list.json路径（默认在markdown旁查找）')
+    args = parser.parse_args()
     
     try:
         # 加载配置
         config = load_config()
         
         # 处理文档
-        result = process_document(markdown_path, output_dir, config)
+        result = process_document(args.markdown_path, args.output_dir, config, args.mode, args.ingest, args.content_list)
         
         # 打印结果
         print("\n" + "="*80)
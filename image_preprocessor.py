@@ -0,0 +1,144 @@
+"""
+图片预处理与编码缓存
+
+每个图片文件只读取一次：同一次读取得到原始尺寸，并按需缩放、重新压缩后编码为data URL。
+结果按 (文件内容哈希, 处理参数) 缓存在进程内，同一张图被Coder、Speecher以及多个页面
+重复引用时不再重复读取和编码，请求体也因缩放而显著变小。
+"""
+
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+DEFAULT_MAX_EDGE = 1568      # 长边超过该像素数时等比缩小
+DEFAULT_JPEG_QUALITY = 85    # 重新压缩为JPEG时的质量
+DEFAULT_MAX_ENTRIES = 256    # 进程内最多缓存的图片数
+
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.bmp': 'image/bmp',
+    '.svg': 'image/svg+xml'
+}
+
+
+def get_mime_type(file_path: str) -> str:
+    """根据文件扩展名获取MIME类型"""
+    ext = os.path.splitext(file_path)[1].lower()
+    return MIME_TYPES.get(ext, 'application/octet-stream')
+
+
+class ImagePreprocessor:
+    def __init__(self, max_edge: int = DEFAULT_MAX_EDGE, jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+                 enabled: bool = True, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            max_edge: 发送给模型的图片长边上限（像素），为0或None时不缩放
+            jpeg_quality: 重新压缩为JPEG时的质量（1-95）
+            enabled: 为False时按原始字节发送（仍然只读取一次并缓存）
+            max_entries: 进程内缓存的最大图片数，超出时淘汰最久未使用的
+        """
+        self.max_edge = max_edge or 0
+        self.jpeg_quality = jpeg_quality
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[str, Optional[Tuple[int, int]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _settings_key(self) -> str:
+        return f"{self.enabled}:{self.max_edge}:{self.jpeg_quality}"
+
+    def prepare(self, image_path: str) -> Tuple[str, Optional[Tuple[int, int]]]:
+        """
+        读取并处理图片
+
+        Returns:
+            tuple: (data URL, 原始尺寸 (width, height))，PIL无法解析的格式（如SVG）尺寸为None
+        """
+        with open(image_path, 'rb') as f:
+            raw = f.read()
+        key = f"{hashlib.sha256(raw).hexdigest()}:{self._settings_key()}"
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+
+        data, mime_type, size = self._process(raw, image_path)
+        result = (f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}", size)
+
+        with self._lock:
+            self.misses += 1
+            self.bytes_in += len(raw)
+            self.bytes_out += len(data)
+            self._cache[key] = result
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def _process(self, raw: bytes, image_path: str) -> Tuple[bytes, str, Optional[Tuple[int, int]]]:
+        """缩放并重新压缩，结果比原图大时保留原图"""
+        mime_type = get_mime_type(image_path)
+        try:
+            img = Image.open(io.BytesIO(raw))
+            size = (img.width, img.height)
+        except Exception:
+            return raw, mime_type, None
+
+        if not self.enabled:
+            return raw, mime_type, size
+
+        needs_resize = self.max_edge and max(size) > self.max_edge
+        # 已经足够小的JPEG直接发送，避免二次压缩损失画质
+        if not needs_resize and img.format == 'JPEG':
+            return raw, mime_type, size
+
+        try:
+            img.load()
+            has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+            if needs_resize:
+                scale = self.max_edge / max(size)
+                new_size = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+                img = img.convert('RGBA' if has_alpha else 'RGB').resize(new_size, Image.LANCZOS)
+
+            buffer = io.BytesIO()
+            if has_alpha:
+                # 带透明通道的图保持PNG，避免透明区域变黑
+                img.convert('RGBA').save(buffer, format='PNG', optimize=True)
+                new_mime = 'image/png'
+            else:
+                img.convert('RGB').save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
+                new_mime = 'image/jpeg'
+        except Exception as e:
+            print(f"[WARN]  图片预处理失败，按原图发送 {image_path}: {e}")
+            return raw, mime_type, size
+
+        data = buffer.getvalue()
+        if not needs_resize and len(data) >= len(raw):
+            return raw, mime_type, size
+        return data, new_mime, size
+
+    def stats(self) -> Dict[str, float]:
+        """返回缓存命中与体积压缩统计"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out
+            }
@@ -8,8 +8,10 @@ python master_pipeline.py path/to/paper.md path/to/images [--output-base-dir out
 
 流程:
 1. 调用document_processor.py切分论文为四个章节
-2. 依次调用各个Agent的pipeline处理对应章节
+2. 调用各个Agent的pipeline处理对应章节（可通过 --max-parallel-chapters 并行）
 3. 最后统一进行人机交互
+
+各章节的API请求记入同一个用量账本 <输出目录>/usage.jsonl，预算（--budget）对整篇论文生效。
 """
 
 import os
@@ -19,9 +21,24 @@ import argparse
 import time
 import shutil
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
+from api_call import configure_rate_limit, get_cache_stats, setup_response_cache
+from document_processor import load_config as load_processor_config, process_document
+from tracing import (
+    DEFAULT_METRICS_HOST, print_trace_summary, propagate, read_trace, setup_tracing, span, start_metrics_server,
+    subprocess_env, traced, write_prometheus
+)
+from usage_ledger import (
+    BudgetExceededError, check_budget, print_usage_summary, setup_usage_ledger, usage_env, write_usage_summary
+)
+
+# 并行处理多个章节时，保证多路输出按整行交错打印
+_print_lock = threading.Lock()
+
 def print_separator(char="=", length=100):
     """打印分隔线"""
     print(char * length)
@@ -45,13 +62,26 @@ def run_command(command, description="", cwd=None, capture_output=False):
     """执行命令并处理错误"""
     return run_command_with_env(command, description, cwd, capture_output, None)
 
-def run_command_with_env(command, description="", cwd=None, capture_output=False, env=None):
-    """执行命令并处理错误，支持自定义环境变量"""
-    print(f"[PROC] 执行命令: {' '.join(command)}")
+def _prefixed_print(prefix, message):
+    """带前缀地输出一整行，用于并行模式下多路输出复用同一终端"""
+    with _print_lock:
+        print(f"   [{prefix}] {message}", flush=True)
+
+def run_command_with_env(command, description="", cwd=None, capture_output=False, env=None, output_prefix=None):
+    """
+    执行命令并处理错误，支持自定义环境变量
+
+    Args:
+        output_prefix: 输出前缀（如章节名）。指定后每行输出都带前缀并整行打印，
+                       进度条不再使用回车覆盖，适用于多个命令并行执行的场景
+    """
+    log = print if output_prefix is None else (lambda message: _prefixed_print(output_prefix, message.strip()))
+
+    log(f"[PROC] 执行命令: {' '.join(command)}")
     if description:
-        print(f"   {description}")
+        log(f"   {description}")
     if cwd:
-        print(f"   工作目录: {cwd}")
+        log(f"   工作目录: {cwd}")
     
     # 设置环境变量
     if env is None:
@@ -68,7 +98,7 @@ def run_command_with_env(command, description="", cwd=None, capture_output=False
     try:
         if capture_output:
             result = subprocess.run(command, check=True, capture_output=True, text=True, cwd=cwd, env=env)
-            print("[OK] 命令执行成功")
+            log("[OK] 命令执行成功")
             return result.stdout
         else:
             # 实时输出模式
@@ -106,11 +136,20 @@ def run_command_with_env(command, description="", cwd=None, capture_output=False
                             clean_output.startswith('\r')
                         ])
                         
-                        if is_progress:
+                        if is_progress and output_prefix is not None:
+                            # 并行模式：只保留最后一次刷新的进度，内容变化时才整行输出
+                            clean_line = clean_output.split('\r')[-1].strip()
+                            if clean_line and clean_line != current_progress_line:
+                                _prefixed_print(output_prefix, clean_line)
+                                current_progress_line = clean_line
+                        elif is_progress:
                             # 这是进度条，使用回车覆盖显示
                             clean_line = clean_output.lstrip('\r')
                             print(f"\r   {clean_line}", end='', flush=True)
                             current_progress_line = clean_line
+                        elif output_prefix is not None:
+                            if not clean_output.startswith('[PROG]'):
+                                _prefixed_print(output_prefix, clean_output)
                         else:
                             # 普通输出
                             if current_progress_line:
@@ -123,29 +162,29 @@ def run_command_with_env(command, description="", cwd=None, capture_output=False
                                 print(f"   {clean_output}")
                             sys.stdout.flush()
             
-            # 如果最后有进度条，确保换行
-            if current_progress_line:
+            # 如果最后有回车覆盖显示的进度条，确保换行（并行模式下进度已整行输出，不需要换行）
+            if current_progress_line and output_prefix is None:
                 print()
             
             return_code = process.poll()
             if return_code == 0:
-                print("[OK] 命令执行成功")
+                log("[OK] 命令执行成功")
                 return True
             else:
-                print(f"[ERR] 命令执行失败，返回码: {return_code}")
+                log(f"[ERR] 命令执行失败，返回码: {return_code}")
                 return False
                 
     except subprocess.CalledProcessError as e:
-        print(f"[ERR] 命令执行失败: {e}")
+        log(f"[ERR] 命令执行失败: {e}")
         if e.stdout:
-            print("标准输出:")
-            print(e.stdout)
+            log("标准输出:")
+            log(e.stdout)
         if e.stderr:
-            print("错误输出:")
-            print(e.stderr)
+            log("错误输出:")
+            log(e.stderr)
         return False
     except Exception as e:
-        print(f"[ERR] 命令执行出现异常: {e}")
+        log(f"[ERR] 命令执行出现异常: {e}")
         return False
 
 def validate_inputs(paper_path, images_dir):
@@ -192,21 +231,24 @@ def setup_master_directories(paper_path, output_base_dir):
     
     return dirs
 
-def step1_section_splitting(paper_path, sections_dir):
-    """步骤1: 调用document_processor.py切分论文"""
+@traced('stage', 'sections')
+def step1_section_splitting(paper_path, sections_dir, section_mode="auto", ingest="markdown", content_list_path=None):
+    """
+    步骤1: 调用document_processor.py切分论文
+
+    section_mode: auto 先用本地规则识别，outline 只发送标题大纲，full 发送全文
+    ingest: markdown 从markdown标题解析；content_list 直接读取MinerU的content_list.json
+    """
     print_step(1, "论文章节切分", "使用document_processor.py将论文切分为四个主要章节")
     
-    # 检查document_processor.py是否存在
-    document_processor_path = os.path.join(os.getcwd(), "document_processor.py")
-    if not os.path.exists(document_processor_path):
-        raise FileNotFoundError("未找到document_processor.py文件")
-    
-    # 执行切分命令
-    command = [sys.executable, "document_processor.py", paper_path, sections_dir]
-    success = run_command(command, "切分论文为Introduction、Methods、Experiments、Conclusion四个章节")
-    
-    if not success:
-        raise RuntimeError("论文切分失败")
+    # 在当前进程内直接调用document_processor
+    print("[PROC] 切分论文为Introduction、Methods、Experiments、Conclusion四个章节")
+    try:
+        process_document(paper_path, sections_dir, load_processor_config(), section_mode, ingest, content_list_path)
+    except BudgetExceededError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"论文切分失败: {e}")
     
     # 检查切分结果
     paper_name = Path(paper_path).stem
@@ -226,8 +268,82 @@ def step1_section_splitting(paper_path, sections_dir):
     
     return section_files
 
-def step2_process_agents(section_files, images_dir, dirs):
-    """步骤2: 依次调用Chapter_Agent处理对应章节"""
+def run_chapter_agent(agent_config, section_file, images_dir, output_prefix=None, page_workers=1, pipelined=False, extra_args=None):
+    """
+    调用Chapter_Agent的pipeline处理单个章节
+
+    Args:
+        agent_config: Agent配置（名称、目录、输出目录、章节类型）
+        section_file: 章节Markdown文件路径
+        images_dir: 图片目录路径
+        output_prefix: 并行模式下的输出前缀，为None时按原样实时输出
+        page_workers: 章节内代码生成阶段并行处理的页面数量
+        pipelined: 是否让章节内的代码生成与演讲稿生成以流水线方式重叠执行
+        extra_args: 透传给章节pipeline的其他命令行参数（如缓存开关）
+
+    Returns:
+        dict: 处理结果
+    """
+    agent_name = agent_config['name']
+    agent_folder = agent_config['folder']
+    output_dir = agent_config['output_dir']
+    chapter_type = agent_config['chapter_type']
+
+    # 构建命令（添加章节参数）
+    command = [
+        sys.executable, "pipeline.py", 
+        os.path.abspath(section_file),
+        "--chapter", chapter_type,
+        "--output-base-dir", os.path.abspath(output_dir),
+        "--images-dir", os.path.abspath(images_dir),
+        "--workers", str(page_workers)
+    ]
+    if pipelined:
+        command.append("--pipelined")
+    if extra_args:
+        command.extend(extra_args)
+    
+    log = print if output_prefix is None else (lambda message: _prefixed_print(output_prefix, message))
+    log(f"[OPEN] 输入文件: {section_file}")
+    log(f"[DIR] 输出目录: {output_dir}")
+    log(f"[IMG] 图片目录: {images_dir}")
+    
+    # 设置环境变量跳过交互式编辑；启用追踪时章节pipeline写入同一个追踪文件，章节span挂在论文span之下；
+    # 章节pipeline写入同一个用量账本并共用预算
+    env = usage_env(subprocess_env(os.environ.copy()))
+    env['SKIP_INTERACTIVE'] = '1'
+    
+    chapter_start_time = time.time()
+
+    # 执行Agent pipeline，传递修改后的环境变量
+    success = run_command_with_env(
+        command, 
+        f"处理{agent_name}章节",
+        cwd=agent_folder,
+        env=env,
+        output_prefix=output_prefix
+    )
+    
+    duration = time.time() - chapter_start_time
+    if success:
+        log(f"[OK] {agent_name} Agent 处理完成 (耗时: {duration:.1f} 秒)")
+    else:
+        log(f"[ERR] {agent_name} Agent 处理失败 (耗时: {duration:.1f} 秒)")
+
+    return {
+        'section_file': section_file,
+        'output_dir': output_dir,
+        'status': 'success' if success else 'failed',
+        'duration': duration
+    }
+
+def step2_process_agents(section_files, images_dir, dirs, max_parallel_chapters=1, page_workers=1, pipelined=False, extra_args=None):
+    """
+    步骤2: 调用Chapter_Agent处理对应章节
+
+    各章节读取不同的章节文件并写入独立的输出目录，互不依赖。
+    max_parallel_chapters 大于1时并行处理多个章节，每个章节的输出带上章节名前缀。
+    """
     print_step(2, "Chapter_Agent处理流程", "使用Chapter_Agent分别处理Introduction、Methods、Experiments、Conclusion章节")
     
     # Agent配置
@@ -262,24 +378,20 @@ def step2_process_agents(section_files, images_dir, dirs):
         }
     ]
     
-    processed_results = {}
-    
+    # 先筛选出可以执行的章节
+    runnable_agents = []
     for i, agent_config in enumerate(agents_config, 1):
         agent_name = agent_config['name']
         agent_folder = agent_config['folder']
-        output_dir = agent_config['output_dir']
         section_key = agent_config['section_key']
-        chapter_type = agent_config['chapter_type']
         
-        print(f"\n[BOT] 处理 {agent_name} Agent ({i}/4)")
-        print(f"   章节类型: {chapter_type}")
+        print(f"\n[BOT] 检查 {agent_name} Agent ({i}/4)")
+        print(f"   章节类型: {agent_config['chapter_type']}")
         
         # 检查章节文件是否存在
         if section_key not in section_files:
             print(f"[WARN]  跳过 {agent_name} Agent: 未找到对应的章节文件")
             continue
-            
-        section_file = section_files[section_key]
         
         # 检查Agent目录是否存在
         if not os.path.exists(agent_folder):
@@ -291,48 +403,37 @@ def step2_process_agents(section_files, images_dir, dirs):
             print(f"[WARN]  跳过 {agent_name} Agent: pipeline.py不存在")
             continue
         
-        # 构建命令（添加章节参数）
-        command = [
-            sys.executable, "pipeline.py", 
-            os.path.abspath(section_file),
-            "--chapter", chapter_type,
-            "--output-base-dir", os.path.abspath(output_dir),
-            "--images-dir", os.path.abspath(images_dir)
-        ]
-        
-        print(f"[OPEN] 输入文件: {section_file}")
-        print(f"[DIR] 输出目录: {output_dir}")
-        print(f"[IMG] 图片目录: {images_dir}")
-        
-        # 设置环境变量跳过交互式编辑
-        env = os.environ.copy()
-        env['SKIP_INTERACTIVE'] = '1'
-        
-        # 执行Agent pipeline，传递修改后的环境变量
-        success = run_command_with_env(
-            command, 
-            f"处理{agent_name}章节",
-            cwd=agent_folder,
-            env=env
-        )
-        
-        if success:
-            processed_results[agent_name] = {
-                'section_file': section_file,
-                'output_dir': output_dir,
-                'status': 'success'
-            }
-            print(f"[OK] {agent_name} Agent 处理完成")
-        else:
-            processed_results[agent_name] = {
-                'section_file': section_file,
-                'output_dir': output_dir,
-                'status': 'failed'
+        runnable_agents.append((agent_config, section_files[section_key]))
+    
+    results = {}
+    max_workers = max(1, min(max_parallel_chapters, len(runnable_agents)))
+    
+    if max_workers == 1:
+        # 顺序模式：保持原有的实时输出和进度条显示
+        for i, (agent_config, section_file) in enumerate(runnable_agents, 1):
+            print(f"\n[BOT] 处理 {agent_config['name']} Agent ({i}/{len(runnable_agents)})")
+            results[agent_config['name']] = run_chapter_agent(agent_config, section_file, images_dir, page_workers=page_workers, pipelined=pipelined, extra_args=extra_args)
+    else:
+        print(f"\n[PROC] 并行处理 {len(runnable_agents)} 个章节 (最大并行数: {max_workers})")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(propagate(run_chapter_agent), agent_config, section_file, images_dir, agent_config['name'], page_workers, pipelined, extra_args): agent_config['name']
+                for agent_config, section_file in runnable_agents
             }
-            print(f"[ERR] {agent_name} Agent 处理失败")
+            for future in as_completed(futures):
+                agent_name = futures[future]
+                results[agent_name] = future.result()
+                with _print_lock:
+                    print(f"[PROG] {agent_name} Agent 已结束 ({len(results)}/{len(runnable_agents)})")
+    
+    # 按章节顺序整理结果
+    processed_results = {}
+    for agent_config, _ in runnable_agents:
+        processed_results[agent_config['name']] = results[agent_config['name']]
     
     return processed_results
 
+@traced('stage', 'collect')
 def step3_collect_results(processed_results, final_results_dir):
     """步骤3: 收集和整理所有生成的文件"""
     print_step(3, "结果收集", "收集所有Agent生成的文件到最终结果目录")
@@ -341,7 +442,8 @@ def step3_collect_results(processed_results, final_results_dir):
         'segmentation': [],
         'split_pages': [],
         'code_files': [],
-        'speech_files': []
+        'speech_files': [],
+        'video_files': []
     }
     
     for agent_name, result in processed_results.items():
@@ -369,6 +471,9 @@ def step3_collect_results(processed_results, final_results_dir):
                     file_type = 'code_files'
                 elif file.endswith('_speech.txt'):
                     file_type = 'speech_files'
+                elif file.endswith('.mp4') and root.endswith(os.path.join('_render', 'videos')):
+                    # 只收集汇总后的视频，不收集manim的中间文件
+                    file_type = 'video_files'
                 else:
                     continue
                 
@@ -388,8 +493,64 @@ def step3_collect_results(processed_results, final_results_dir):
     
     return collected_files
 
-def step4_interactive_editor(collected_files):
-    """步骤4: 统一的人机交互编辑环节"""
+def rerender_edited_code(file_info, render_options):
+    """
+    把编辑后的代码写回章节的生成代码目录并重新渲染该页面
+
+    未修改的场景由渲染缓存直接复用，只有被编辑的页面会真正调用manim；
+    渲染出的视频同步更新到final_results。
+    """
+    code_path = file_info['original_path']
+    code_dir = os.path.dirname(code_path)
+    # <论文名>_generated_code 对应的渲染目录为 <论文名>_render
+    render_dir = code_dir[:-len('_generated_code')] + '_render' if code_dir.endswith('_generated_code') else code_dir + '_render'
+    shutil.copy2(file_info['path'], code_path)
+
+    cmd = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Chapter_Agent', 'batch_renderer.py'),
+        code_dir, render_dir, '--quality', render_options['quality'], '--files', os.path.basename(code_path)
+    ]
+    if render_options.get('no_cache'):
+        cmd.append('--no-cache')
+    print(f"[PROC] 重新渲染: {file_info['filename']}")
+    completed = subprocess.run(cmd)
+    if completed.returncode != 0:
+        print(f"[ERR] 重新渲染失败，详见 {os.path.join(render_dir, 'logs')}")
+        return
+
+    # 单场景页面的视频为 <页面>.mp4，多场景为 <页面>_<场景>.mp4
+    page_name = file_info['filename'][:-len('_code.py')]
+    videos_dir = os.path.join(render_dir, 'videos')
+    final_videos_dir = os.path.join(os.path.dirname(os.path.dirname(file_info['path'])), os.path.basename(render_dir), 'videos')
+    os.makedirs(final_videos_dir, exist_ok=True)
+    for video in os.listdir(videos_dir):
+        if video == f"{page_name}.mp4" or (video.startswith(f"{page_name}_") and video.endswith('.mp4')):
+            shutil.copy2(os.path.join(videos_dir, video), os.path.join(final_videos_dir, video))
+            print(f"[OK] 已更新视频: {video}")
+
+def edit_file(file_info, render_options=None):
+    """用vim编辑文件；启用渲染时，代码文件编辑完成后重新渲染对应页面"""
+    print(f"[OPEN] 打开文件: [{file_info['agent']}] {file_info['filename']}")
+    
+    try:
+        subprocess.run(['vim', file_info['path']], check=True)
+        print(f"[OK] 文件编辑完成")
+    except subprocess.CalledProcessError as e:
+        print(f"[ERR] 打开文件失败: {e}")
+        return
+    except FileNotFoundError:
+        print("[ERR] 未找到vim编辑器")
+        print(f"[TIP] 文件路径: {file_info['path']}")
+        return
+    except KeyboardInterrupt:
+        print(f"\n[WARN] 编辑被中断")
+        return
+    
+    if render_options and file_info['type'] == 'code_files':
+        rerender_edited_code(file_info, render_options)
+
+def step4_interactive_editor(collected_files, render_options=None):
+    """步骤4: 统一的人机交互编辑环节（render_options不为None时，编辑代码后重新渲染该页面）"""
     print_step(4, "人机交互编辑", "提供统一的文件编辑和查看界面")
     
     # 统计文件
@@ -421,7 +582,8 @@ def step4_interactive_editor(collected_files):
                 'type': file_type,
                 'agent': file_info['agent'],
                 'filename': file_info['filename'],
-                'path': file_info['final_path']
+                'path': file_info['final_path'],
+                'original_path': file_info['original_path']
             })
     
     while True:
@@ -460,18 +622,7 @@ def step4_interactive_editor(collected_files):
             if len(matched_files) == 1:
                 # 只有一个匹配，直接打开
                 file_info = matched_files[0]
-                print(f"[OPEN] 打开文件: [{file_info['agent']}] {file_info['filename']}")
-                
-                try:
-                    subprocess.run(['vim', file_info['path']], check=True)
-                    print(f"[OK] 文件编辑完成")
-                except subprocess.CalledProcessError as e:
-                    print(f"[ERR] 打开文件失败: {e}")
-                except FileNotFoundError:
-                    print("[ERR] 未找到vim编辑器")
-                    print(f"[TIP] 文件路径: {file_info['path']}")
-                except KeyboardInterrupt:
-                    print(f"\n[WARN] 编辑被中断")
+                edit_file(file_info, render_options)
             else:
                 # 多个匹配，让用户选择
                 print(f"[FIND] 找到 {len(matched_files)} 个匹配的文件:")
@@ -484,18 +635,7 @@ def step4_interactive_editor(collected_files):
                         index = int(choice) - 1
                         if 0 <= index < len(matched_files):
                             file_info = matched_files[index]
-                            print(f"[OPEN] 打开文件: [{file_info['agent']}] {file_info['filename']}")
-                            
-                            try:
-                                subprocess.run(['vim', file_info['path']], check=True)
-                                print(f"[OK] 文件编辑完成")
-                            except subprocess.CalledProcessError as e:
-                                print(f"[ERR] 打开文件失败: {e}")
-                            except FileNotFoundError:
-                                print("[ERR] 未找到vim编辑器")
-                                print(f"[TIP] 文件路径: {file_info['path']}")
-                            except KeyboardInterrupt:
-                                print(f"\n[WARN] 编辑被中断")
+                            edit_file(file_info, render_options)
                         else:
                             print("[ALERT] 无效的序号")
                 except ValueError:
@@ -522,8 +662,10 @@ def print_processing_summary(collected_files):
             for agent in sorted(agents):
                 agent_files = [f for f in files if f['agent'] == agent]
                 print(f"   • {agent}: {len(agent_files)} 个文件")
+    
+    print_usage_summary()
 
-def print_final_summary(dirs, paper_path, processed_results, start_time):
+def print_final_summary(dirs, paper_path, processed_results, start_time, trace_path=None):
     """打印最终总结"""
     end_time = time.time()
     duration = end_time - start_time
@@ -546,7 +688,12 @@ def print_final_summary(dirs, paper_path, processed_results, start_time):
     
     for agent_name, result in processed_results.items():
         status = "[OK]" if result['status'] == 'success' else "[ERR]"
-        print(f"   {status} {agent_name} Agent")
+        duration_info = f" ({result['duration']:.1f} 秒)" if 'duration' in result else ""
+        print(f"   {status} {agent_name} Agent{duration_info}")
+    
+    cache_stats = get_cache_stats()
+    if cache_stats is not None:
+        print(f"\n[CACHE] 章节切分阶段LLM响应缓存: 命中 {cache_stats['hits']}，未命中 {cache_stats['misses']}（各章节的缓存统计见章节日志）")
     
     print(f"\n[OPEN] 生成的文件结构:")
     print(f"   ├── [DIR] sections/ (论文章节切分)")
@@ -554,7 +701,16 @@ def print_final_summary(dirs, paper_path, processed_results, start_time):
     print(f"   ├── [DIR] method_agent_output/ (Methods章节处理结果)")
     print(f"   ├── [DIR] experiment_agent_output/ (Experiments章节处理结果)")
     print(f"   ├── [DIR] conclusion_agent_output/ (Conclusion章节处理结果)")
-    print(f"   └── [DIR] final_results/ (整理后的最终结果)")
+    print(f"   └── [DIR] final_results/ (整理后的最终结果，使用 --render 时包含各章节视频)")
+    
+    # 各章节子进程的用量记在同一个账本中
+    print_usage_summary()
+    
+    if trace_path:
+        # 各章节的span写在章节子进程中，从追踪文件中读取本次运行的全部span
+        records = read_trace(trace_path)
+        trace_id = records[-1].get("trace_id") if records else None
+        print_trace_summary([record for record in records if record.get("trace_id") == trace_id], trace_path)
     
     print_separator("=")
 
@@ -567,6 +723,7 @@ def main():
 示例用法:
     python master_pipeline.py paper/ChatDev.md ./ChatDev_images
     python master_pipeline.py paper/ChatDev.md ./images --output-base-dir ./output
+    python master_pipeline.py paper/ChatDev.md ./images --max-parallel-chapters 4
         """
     )
     
@@ -586,6 +743,135 @@ def main():
         help='输出基础目录路径 (默认: ./master_output)'
     )
     
+    parser.add_argument(
+        '--section-mode',
+        choices=['auto', 'outline', 'full'],
+        default='auto',
+        help='章节识别方式: auto 先用本地规则识别，无法确定时使用大纲模式 (默认); outline 只发送标题大纲，结果不可信时回退为全文; full 发送全文'
+    )
+    
+    parser.add_argument(
+        '--ingest',
+        choices=['markdown', 'content_list'],
+        default='markdown',
+        help='论文结构来源: markdown 从markdown标题解析 (默认); content_list 直接读取MinerU输出的content_list.json'
+    )
+    
+    parser.add_argument(
+        '--content-list',
+        default=None,
+        help='content_list.json路径（默认在论文markdown旁查找）'
+    )
+    
+    parser.add_argument(
+        '--render',
+        action='store_true',
+        help='各章节生成代码后用manim并行渲染所有场景，视频收集到final_results'
+    )
+    
+    parser.add_argument(
+        '--render-quality',
+        choices=['low', 'medium', 'high', '4k'],
+        default='low',
+        help='渲染质量: low 预览 (-ql, 默认); medium (-qm); high 成片 (-qh); 4k (-qk)'
+    )
+    
+    parser.add_argument(
+        '--render-workers',
+        type=int,
+        default=None,
+        help='每个章节并行渲染的manim进程数 (默认: CPU核数除以并行章节数)'
+    )
+    
+    parser.add_argument(
+        '--no-render-cache',
+        action='store_true',
+        help='不使用渲染缓存，所有场景重新渲染'
+    )
+    
+    parser.add_argument(
+        '--max-parallel-chapters',
+        type=int,
+        default=1,
+        help='同时处理的章节数量上限，1为顺序处理 (默认: 1)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='每个章节代码生成阶段并行处理的页面数量 (默认: 1)'
+    )
+    
+    parser.add_argument(
+        '--pipelined',
+        action='store_true',
+        help='章节内代码生成与演讲稿生成以流水线方式重叠执行'
+    )
+    
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='启用LLM响应磁盘缓存（也可在config.json的response_cache.enabled中开启）'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='禁用LLM响应缓存，优先于配置文件'
+    )
+    
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='忽略已有缓存重新调用API，并用新结果更新缓存'
+    )
+    
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='忽略各章节的运行清单，重新生成所有页面（默认只重新生成输入变化的页面）'
+    )
+    
+    parser.add_argument(
+        '--budget',
+        type=float,
+        help='整篇论文的API费用上限（美元），各章节共用，达到后不再发出请求并中止运行（也可在config.json的usage.budget中设置）'
+    )
+    
+    parser.add_argument(
+        '--price-table',
+        help='模型价格表JSON文件 {模型: {input, cached_input, output}}（美元/百万token），覆盖内置价格和config.json的usage.prices'
+    )
+    
+    parser.add_argument(
+        '--trace',
+        action='store_true',
+        help='记录论文、章节、阶段、页面和API调用的追踪，写入 <输出目录>/trace.jsonl（各章节写入同一文件）'
+    )
+    
+    parser.add_argument(
+        '--trace-file',
+        help='追踪文件路径（指定时自动开启追踪）'
+    )
+    
+    parser.add_argument(
+        '--metrics-file',
+        help='运行结束时把追踪汇总为Prometheus文本格式写入该文件（自动开启追踪）'
+    )
+    
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='运行期间在该端口提供Prometheus /metrics 端点，包含各章节子进程的数据（自动开启追踪）'
+    )
+    
+    parser.add_argument(
+        '--metrics-host',
+        default=DEFAULT_METRICS_HOST,
+        help=f'/metrics 端点监听的地址 (默认: {DEFAULT_METRICS_HOST}，仅本机可访问；0.0.0.0 会暴露给所有网络)'
+    )
+    
     args = parser.parse_args()
     
     start_time = time.time()
@@ -603,22 +889,59 @@ def main():
         # 设置目录结构
         dirs = setup_master_directories(args.paper_path, args.output_base_dir)
         
+        # LLM响应缓存与增量运行开关，同时透传给各章节pipeline
+        chapter_args = [flag for flag, enabled in (('--cache', args.cache), ('--no-cache', args.no_cache), ('--refresh', args.refresh), ('--force', args.force)) if enabled]
+        if args.render:
+            # 多个章节同时渲染时平分CPU核数，避免manim进程数超过核数
+            render_workers = args.render_workers or max(1, (os.cpu_count() or 1) // max(1, args.max_parallel_chapters))
+            chapter_args += ['--render', '--render-quality', args.render_quality, '--render-workers', str(render_workers)]
+            if args.no_render_cache:
+                chapter_args.append('--no-render-cache')
+        setup_response_cache(load_processor_config().get('response_cache'), args.cache, args.no_cache, args.refresh)
+        configure_rate_limit(**load_processor_config().get('rate_limit', {}))
+        
+        # 追踪：各章节子进程通过环境变量继承追踪文件
+        trace_file = args.trace_file or (os.path.join(dirs['base'], 'trace.jsonl') if args.trace or args.metrics_file or args.metrics_port else None)
+        trace_path = setup_tracing(trace_file)
+        if trace_path:
+            print(f"[TIME] 追踪文件: {trace_path}")
+            if args.metrics_port:
+                start_metrics_server(args.metrics_port, host=args.metrics_host)
+                print(f"[PROG] Prometheus指标端点: http://{args.metrics_host}:{args.metrics_port}/metrics")
+        
+        # 用量账本：各章节子进程通过环境变量写入同一个账本
+        ledger = setup_usage_ledger(load_processor_config().get('usage'), dirs['base'], args.budget, args.price_table)
+        print(f"[PROG] 用量账本: {ledger.ledger_path}{f'，预算 ${ledger.budget:.2f}' if ledger.budget is not None else ''}")
+        
         # 执行主流程
-        section_files = step1_section_splitting(args.paper_path, dirs['sections'])
-        processed_results = step2_process_agents(section_files, args.images_dir, dirs)
-        collected_files = step3_collect_results(processed_results, dirs['final_results'])
+        with span('paper', Path(args.paper_path).stem):
+            section_files = step1_section_splitting(args.paper_path, dirs['sections'], args.section_mode, args.ingest, args.content_list)
+            check_budget()
+            processed_results = step2_process_agents(section_files, args.images_dir, dirs, args.max_parallel_chapters, args.workers, args.pipelined, chapter_args)
+            check_budget()
+            collected_files = step3_collect_results(processed_results, dirs['final_results'])
         
         # 打印最终总结
-        print_final_summary(dirs, args.paper_path, processed_results, start_time)
+        print_final_summary(dirs, args.paper_path, processed_results, start_time, trace_path)
+        print(f"[OK] 用量汇总已保存到: {write_usage_summary()}")
+        if args.metrics_file and trace_path:
+            write_prometheus(args.metrics_file)
+            print(f"[OK] Prometheus指标已保存到: {args.metrics_file}")
         
         # 统一的人机交互
-        step4_interactive_editor(collected_files)
+        render_options = {'quality': args.render_quality, 'no_cache': args.no_render_cache} if args.render else None
+        step4_interactive_editor(collected_files, render_options)
         
         print("\n[DONE] 所有流程完成！感谢使用 EduAgent Master Pipeline！")
         
     except KeyboardInterrupt:
         print("\n[WARN] 用户中断了Pipeline执行")
         sys.exit(1)
+    except BudgetExceededError as e:
+        print(f"\n[ERR] 费用达到预算上限，Pipeline已中止: {e}")
+        print_usage_summary()
+        print(f"[OK] 用量汇总已保存到: {write_usage_summary()}")
+        sys.exit(1)
     except Exception as e:
         print(f"\n[ERR] Pipeline执行失败: {str(e)}")
         print("请检查错误信息并重试")
@@ -0,0 +1,62 @@
+"""
+页面文件的公共工具
+
+代码生成、渲染、时长估算和音频对齐都按同样的规则给页面文件排序、取页面名和查找场景：
+- get_sort_key: 按文件名中的数字序列排序（页2排在页10之前）；
+- get_page_name: 去掉扩展名以及 _code / _speech 等后缀得到页面名，代码文件与音频文件按页面名对应；
+- find_scene_classes: 从模块的AST中找出需要渲染的Scene类。
+"""
+
+import ast
+import os
+import re
+
+# 代码文件和音频文件名中页面名之后可能带的后缀，如 page_1_code.py、page_1_speech.wav
+CODE_NAME_SUFFIX = '_code'
+AUDIO_NAME_SUFFIXES = ('_speech', '_audio', '_voice')
+
+
+def get_sort_key(file_path):
+    """按文件名中的数字序列排序"""
+    # 获取文件名（不含路径和扩展名）
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    # 提取所有数字序列
+    numbers = re.findall(r'\d+', base_name)
+    # 如果找到数字，将其转换为整数列表；如果没有数字，返回空列表
+    return [int(num) for num in numbers] if numbers else []
+
+
+def get_page_name(path: str) -> str:
+    """音频或代码文件对应的页面名：去掉扩展名以及 _code / _speech 等后缀"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    for suffix in (CODE_NAME_SUFFIX,) + AUDIO_NAME_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _base_name(node) -> str:
+    """基类表达式的名称：Scene、manim.Scene、Generic[...] 均取最后的名称"""
+    if isinstance(node, ast.Subscript):
+        node = node.value
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return ""
+
+
+def find_scene_classes(tree) -> list:
+    """
+    模块中需要渲染的Scene类（按定义顺序）
+
+    继承自 Scene / ThreeDScene / MovingCameraScene 等（名称以Scene结尾）或继承自本文件中其他场景类的类
+    都是场景；被本文件其他场景继承的基类只作为公共父类，不单独渲染。
+    """
+    classes = [node for node in tree.body if isinstance(node, ast.ClassDef)]
+    scenes = []
+    for node in classes:
+        if any(_base_name(base).endswith('Scene') or _base_name(base) in scenes for base in node.bases):
+            scenes.append(node.name)
+    parent_scenes = {_base_name(base) for node in classes if node.name in scenes for base in node.bases}
+    return [name for name in scenes if name not in parent_scenes]
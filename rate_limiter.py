@@ -0,0 +1,254 @@
+"""
+API限流与自适应并发
+
+- 令牌桶：分别限制每分钟请求数（RPM）和每分钟token数（TPM），进程内所有客户端共享；
+- AIMD自适应并发：请求成功时并发上限缓慢增加，遇到429时减半，并在Retry-After期间暂停发送；
+- 指数退避加随机抖动，避免多个页面同时重试造成新的拥塞。
+
+同步客户端和异步客户端共用同一个RateLimiter：预约令牌的计算不阻塞，只是返回需要等待的秒数，
+由调用方分别用time.sleep或asyncio.sleep等待。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import openai
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BACKOFF_BASE = 2.0    # 首次重试的退避上限（秒）
+DEFAULT_BACKOFF_CAP = 60.0    # 单次退避的最长等待（秒）
+ASYNC_POLL_INTERVAL = 0.05    # 异步等待并发槽位时的轮询间隔（秒）
+# 没有HTTP状态码时只有这些传输层错误（连接失败、超时等）可以重试
+RETRYABLE_TRANSPORT_ERRORS = (openai.APIConnectionError, openai.APITimeoutError, httpx.TransportError)
+
+
+class APICallError(Exception):
+    """API调用在重试后仍然失败（或遇到不可重试的错误）"""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        """
+        Args:
+            rate_per_minute: 每分钟可用的令牌数，桶容量等于一分钟的额度
+        """
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        预约amount个令牌，返回需要等待的秒数
+
+        余额允许变为负数（提前预约），后来的请求会相应地等待更久，从而保证先到先得。
+        单次预约超过桶容量时按容量计算，避免超大请求永远无法发出。
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, delta: float):
+        """按实际消耗修正预约量（delta为实际减预估，正数表示多扣）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 initial_concurrency: int = 8, min_concurrency: int = 1, max_concurrency: int = 32,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_cap: float = DEFAULT_BACKOFF_CAP):
+        """
+        Args:
+            requests_per_minute: 每分钟请求数上限，None表示不限制
+            tokens_per_minute: 每分钟token数上限（按预估的输入+max_tokens计算，响应后按实际用量修正），None表示不限制
+            initial_concurrency: 初始并发上限
+            min_concurrency: 遇到限流后并发上限的下限
+            max_concurrency: 并发上限的上限
+            max_retries: 单个请求的最大尝试次数
+            backoff_base: 指数退避的基数（秒）
+            backoff_cap: 单次退避的最长等待（秒）
+        """
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.concurrency_limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self.max_retries = max(1, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.in_flight = 0
+        self.blocked_until = 0.0  # Retry-After期间暂停发送新请求
+        self._condition = threading.Condition()
+        self.stats_counters = {"requests": 0, "rate_limited": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0}
+
+    # ---------- 并发槽位 ----------
+
+    def _try_acquire_slot(self) -> bool:
+        with self._condition:
+            if self.in_flight < int(self.concurrency_limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        """预约令牌并返回需要等待的秒数（含Retry-After暂停）"""
+        wait = max(0.0, self.blocked_until - time.monotonic())
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.reserve(estimated_tokens))
+        with self._condition:
+            self.stats_counters["requests"] += 1
+            self.stats_counters["wait_seconds"] += wait
+        return wait
+
+    def acquire(self, estimated_tokens: int = 0):
+        """同步获取发送许可：等待并发槽位、令牌和Retry-After暂停结束"""
+        with self._condition:
+            while self.in_flight >= int(self.concurrency_limit):
+                self._condition.wait()
+            self.in_flight += 1
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, estimated_tokens: int = 0):
+        """acquire 的协程版本，等待期间不阻塞事件循环"""
+        while not self._try_acquire_slot():
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def release(self, rate_limited: bool = False, success: bool = False, retry_after: float = None,
+                estimated_tokens: int = 0, actual_tokens: int = None):
+        """
+        释放并发槽位并根据结果调整并发上限（AIMD）
+
+        Args:
+            rate_limited: 是否遇到429
+            success: 请求是否成功
+            retry_after: 服务端给出的Retry-After秒数
+            estimated_tokens: 预约时的token预估
+            actual_tokens: 响应中的实际token用量，用于修正TPM令牌桶
+        """
+        if actual_tokens is not None and self.token_bucket is not None:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                # 乘性减：并发上限减半，并在Retry-After期间暂停所有新请求
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+                self.stats_counters["rate_limited"] += 1
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            elif success:
+                # 加性增：每完成约一个并发上限数量的请求，上限加1
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    # ---------- 重试 ----------
+
+    def backoff_delay(self, attempt: int, retry_after: float = None) -> float:
+        """
+        第attempt次失败后的等待时间
+
+        有Retry-After时按其等待（加少量抖动，避免所有请求同时恢复），
+        否则使用带完全抖动的指数退避：uniform(0, min(cap, base * 2^(attempt-1)))。
+        """
+        if retry_after:
+            return retry_after + random.uniform(0, min(1.0, retry_after * 0.1))
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1))))
+
+    def record_retry(self):
+        with self._condition:
+            self.stats_counters["retries"] += 1
+
+    def record_failure(self):
+        with self._condition:
+            self.stats_counters["failures"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回限流统计和当前并发上限"""
+        with self._condition:
+            result = dict(self.stats_counters)
+            result["concurrency_limit"] = int(self.concurrency_limit)
+            return result
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """从响应头解析Retry-After（秒）或retry-after-ms（毫秒），无法解析时返回None"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP-date格式
+            try:
+                from email.utils import parsedate_to_datetime
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except Exception:
+                return None
+    return None
+
+
+def classify_error(error: Exception) -> Tuple[bool, bool, Optional[float]]:
+    """
+    判断API异常是否可以重试
+
+    Returns:
+        tuple: (是否可重试, 是否为429限流, Retry-After秒数)
+    """
+    status_code = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status_code is None and response is not None:
+        status_code = getattr(response, "status_code", None)
+    retry_after = parse_retry_after(getattr(response, "headers", None))
+
+    if status_code == 429:
+        return True, True, retry_after
+    if status_code is not None:
+        # 408/409及5xx可以重试，其余4xx（认证失败、请求格式错误等）重试也不会成功
+        return status_code in (408, 409) or status_code >= 500, False, retry_after
+    # 没有状态码：只有连接错误、超时等网络问题可以重试，其余异常（参数错误、代码错误等）重试也不会成功
+    return isinstance(error, RETRYABLE_TRANSPORT_ERRORS), False, retry_after
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """粗略估算请求消耗的token：文本按4字符1个token，每张图片按1000个token，再加上max_tokens"""
+    tokens = request.get("max_tokens") or 0
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                tokens += len(part["text"]) // 4
+            elif part.get("type") == "image_url":
+                tokens += 1000
+    return tokens
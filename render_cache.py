@@ -0,0 +1,176 @@
+"""
+Manim渲染缓存
+
+按内容寻址的磁盘缓存：键为场景所在代码文件的源码、场景名、代码中引用的图片等素材的字节、
+Manim版本和渲染质量参数的哈希，值为渲染出的mp4。重新运行渲染阶段（或在交互编辑中只修改了
+某一页）时，未变化的场景直接以硬链接复用，不再重新渲染。缓存总大小超过上限时按最近使用时间淘汰。
+
+写入缓存时复制一份而不是硬链接：manim（以及TTS后端）下次渲染时会原地改写同一个输出文件，
+硬链接会让旧键对应的缓存条目变成新的内容。
+"""
+
+import ast
+import hashlib
+import os
+import shutil
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".render_cache")
+ASSET_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg', '.mp4', '.mov', '.wav', '.mp3')
+
+
+@lru_cache(maxsize=None)
+def get_manim_version() -> str:
+    """已安装的Manim版本，未安装时返回unknown"""
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+        try:
+            return version("manim")
+        except PackageNotFoundError:
+            return "unknown"
+    except ImportError:
+        return "unknown"
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def referenced_assets(source: str) -> List[str]:
+    """代码中以字符串常量引用的素材路径（图片、SVG、音视频），按出现顺序去重"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+    assets = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.lower().endswith(ASSET_EXTENSIONS):
+            if node.value not in assets:
+                assets.append(node.value)
+    return assets
+
+
+def link_or_copy(source: str, dest: str):
+    """用硬链接把source放到dest（跨文件系统时退回复制），dest已存在时先删除，避免写穿已有的链接"""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+
+class RenderCache:
+    extension = '.mp4'  # 缓存文件的扩展名
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_mb: float = 4096):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_size_mb: 缓存总大小上限（MB），超出时删除最久未使用的视频
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def make_key(code_file: str, scene: str, quality_flag: str) -> str:
+        """
+        计算场景的缓存键
+
+        场景可能用到同一文件中的辅助函数和父类，因此按整个代码文件的源码计算；
+        引用的素材按文件内容计算，素材不存在时按路径计入。
+        """
+        with open(code_file, 'r', encoding='utf-8') as f:
+            source = f.read()
+        base_dir = os.path.dirname(os.path.abspath(code_file))
+        digest = hashlib.sha256()
+        for part in (source, scene, quality_flag, get_manim_version()):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\x00")
+        # 相对路径按代码文件所在目录解析（渲染时manim在该目录下运行）
+        for asset in referenced_assets(source):
+            path = asset if os.path.isabs(asset) else os.path.join(base_dir, asset)
+            digest.update(f"{asset}:{_file_digest(path) if os.path.isfile(path) else 'missing'}".encode('utf-8'))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}{self.extension}")
+
+    def get(self, key: str) -> Optional[str]:
+        """返回缓存的视频路径并更新其使用时间，未命中时返回None"""
+        path = self._entry_path(key)
+        found = os.path.exists(path)
+        if found:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path if found else None
+
+    def put(self, key: str, video_path: str) -> Optional[str]:
+        """把渲染结果复制到缓存（不与渲染输出共享inode，避免被下次渲染原地改写），返回缓存中的路径"""
+        path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copy2(video_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入渲染缓存失败 {path}: {e}")
+            return None
+        self.evict()
+        return path
+
+    def evict(self):
+        """总大小超过上限时从最久未使用的文件开始删除"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(self.extension):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= self.max_size_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
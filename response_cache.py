@@ -0,0 +1,143 @@
+"""
+LLM响应缓存
+
+按内容寻址的磁盘缓存：键为模型、max_tokens、temperature、文本内容及所有图片数据的哈希，
+值为模型输出的文本。重复运行流水线（崩溃后重跑、只修改了某一页的提示词）时，
+未变化的请求直接从缓存返回，不再重复调用API。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache")
+EVICT_EVERY_PUTS = 50  # 每写入多少条缓存检查一次容量
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_size_mb: float = 512, max_age_days: float = 30, refresh: bool = False):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_size_mb: 缓存总大小上限（MB），超出时删除最旧的条目
+            max_age_days: 缓存条目的最长保留时间（天）
+            refresh: 为True时忽略已有缓存（总是重新调用API），但仍写入新结果
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, max_tokens: int, temperature: float, content: List[Dict[str, Any]]) -> str:
+        """
+        计算请求的缓存键
+
+        图片以data URL（base64编码的原始字节）参与哈希，等价于按图片字节计算。
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"model": model, "max_tokens": max_tokens, "temperature": temperature}, sort_keys=True).encode('utf-8'))
+        for part in content:
+            if part.get("type") == "text":
+                digest.update(b"\x00text\x00")
+                digest.update(part["text"].encode('utf-8'))
+            elif part.get("type") == "image_url":
+                digest.update(b"\x00image\x00")
+                digest.update(part["image_url"]["url"].encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中、已过期或处于refresh模式时返回None"""
+        path = self._entry_path(key)
+        response = None
+        if not self.refresh and os.path.exists(path):
+            try:
+                if time.time() - os.path.getmtime(path) <= self.max_age_seconds:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        response = json.load(f)["response"]
+            except Exception as e:
+                print(f"读取响应缓存失败 {path}: {e}")
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def put(self, key: str, response: str):
+        """写入缓存（先写临时文件再替换，避免并发读到半个文件）"""
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"created": time.time(), "response": response}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"写入响应缓存失败 {path}: {e}")
+            self._remove(tmp_path)
+            return
+        with self._lock:
+            self._puts_since_evict += 1
+            should_evict = self._puts_since_evict >= EVICT_EVERY_PUTS
+            if should_evict:
+                self._puts_since_evict = 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并在总大小超过上限时从最旧的条目开始删除"""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age_seconds:
+                    self._remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        if total_size <= self.max_size_bytes:
+            return
+        for _, size, path in sorted(entries):
+            self._remove(path)
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "refresh": self.refresh
+            }
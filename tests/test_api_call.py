@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import httpx
+
+import api_call
+from rate_limiter import RateLimiter
+
+
+def chat_response(request):
+    prompt = json.loads(request.content)["messages"][0]["content"][0]["text"]
+    return httpx.Response(200, json={
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": f"re: {prompt}"}}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+    })
+
+
+def test_concurrent_async_calls_and_cleanup(monkeypatch):
+    created = []
+
+    def create_http_client():
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(chat_response))
+        created.append(http_client)
+        return http_client
+
+    monkeypatch.setattr(api_call, "_create_async_http_client", create_http_client)
+
+    async def convert(texts):
+        return await asyncio.gather(*(api_call.async_process_text(text, "key", "gpt-4o") for text in texts))
+
+    texts = [f"page {i}" for i in range(5)]
+    assert api_call.run_async(convert(texts)) == [f"re: {text}" for text in texts]
+    # 同一事件循环内共用一个客户端，运行结束时连接池已关闭，注册表中不再保留
+    assert len(created) == 1 and created[0].is_closed
+    assert len(api_call._async_clients) == 0
+
+    # 下一次运行使用新的事件循环和新的客户端
+    assert api_call.run_async(convert(texts[:2])) == [f"re: {text}" for text in texts[:2]]
+    assert len(created) == 2 and created[1].is_closed
+
+
+def test_clients_of_closed_loops_are_not_reused(monkeypatch):
+    monkeypatch.setattr(api_call, "_create_async_http_client",
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(chat_response)))
+
+    async def get_client():
+        return api_call.get_async_api_client("key", "gpt-4o")
+
+    # 没有通过run_async运行时，客户端留在已关闭的事件循环下
+    first = asyncio.run(get_client())
+    second = api_call.run_async(get_client())
+    assert second is not first
+    assert len(api_call._async_clients) == 0
+
+
+def sse_response(chunks):
+    body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body.encode("utf-8"))
+
+
+def content_chunk(text):
+    return {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o",
+            "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+
+
+def stream_client(monkeypatch, chunks):
+    limiter = RateLimiter(tokens_per_minute=100000)
+    monkeypatch.setattr(api_call, "_rate_limiter", limiter)
+    # 冻结时钟，令牌桶不会在测试期间回填
+    monkeypatch.setattr("rate_limiter.time.monotonic", lambda: 1000.0)
+    limiter.token_bucket.updated = 1000.0
+    client = api_call.APIClient("key", "gpt-4o", "https://api.example.com/v1",
+                                http_client=httpx.Client(transport=httpx.MockTransport(lambda request: sse_response(chunks))))
+    return client, limiter.token_bucket
+
+
+def test_stream_charges_the_token_bucket_with_the_final_usage(monkeypatch):
+    usage_chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o", "choices": [],
+                   "usage": {"prompt_tokens": 50, "completion_tokens": 20, "total_tokens": 70}}
+    client, bucket = stream_client(monkeypatch, [content_chunk("print(1)"), usage_chunk])
+    assert "".join(client.stream_api_with_text("hello")) == "print(1)"
+    assert bucket.capacity - bucket.tokens == 70
+
+
+def test_stream_closed_early_without_usage_is_not_charged_max_tokens(monkeypatch):
+    client, bucket = stream_client(monkeypatch, [content_chunk("x" * 40), content_chunk("y" * 40)])
+    stream = client.stream_api_with_text("p" * 400)
+    assert next(stream) == "x" * 40
+    stream.close()
+    # 提示约100个token，收到的输出约10个token，而不是预约时计入的max_tokens
+    assert bucket.capacity - bucket.tokens == 100 + 10
@@ -0,0 +1,41 @@
+import struct
+
+from audio_timing import get_audio_duration, mp4_has_audio_track
+
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def media_header(box_type, timescale, duration):
+    # version 0：version/flags、创建/修改时间，然后是时间尺度和时长
+    return box(box_type, bytes(12) + struct.pack('>II', timescale, duration) + bytes(8))
+
+
+def track(handler, timescale, duration):
+    hdlr = box(b'hdlr', bytes(8) + handler + bytes(12))
+    return box(b'trak', box(b'mdia', media_header(b'mdhd', timescale, duration) + hdlr))
+
+
+def write_mp4(path, *tracks):
+    moov = box(b'moov', media_header(b'mvhd', 1000, 5000) + b''.join(tracks))
+    path.write_bytes(box(b'ftyp', b'isom' + bytes(4)) + moov)
+    return str(path)
+
+
+def test_audio_track_duration(tmp_path):
+    path = write_mp4(tmp_path / "voice.mp4", track(b'vide', 1000, 5000), track(b'soun', 48000, 48000 * 3))
+    assert mp4_has_audio_track(path) is True
+    assert get_audio_duration(path) == 3.0
+
+
+def test_video_without_audio_track(tmp_path):
+    path = write_mp4(tmp_path / "silent.mp4", track(b'vide', 1000, 5000))
+    assert mp4_has_audio_track(path) is False
+    assert get_audio_duration(path) == 5.0
+
+
+def test_unreadable_file(tmp_path):
+    assert mp4_has_audio_track(str(tmp_path / "missing.mp4")) is None
+    (tmp_path / "broken.mp4").write_bytes(b"not an mp4")
+    assert mp4_has_audio_track(str(tmp_path / "broken.mp4")) is None
@@ -0,0 +1,33 @@
+import os
+import time
+
+import batch_coder
+
+
+def fake_process_markdown_to_code(markdown_file, prompt_template, api_key, model, output_dir=None, stream=False):
+    name = os.path.basename(markdown_file)
+    for step in range(3):
+        print(f"{name} step {step}")
+        time.sleep(0.02)
+    output_file = os.path.join(output_dir, name.replace('.md', '.py'))
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write("pass\n")
+    return None, output_file
+
+
+def test_parallel_pages_do_not_interleave_output(tmp_path, monkeypatch, capsys):
+    input_dir = tmp_path / "pages"
+    input_dir.mkdir()
+    for i in range(1, 4):
+        (input_dir / f"page_{i}.md").write_text(f"# page {i}\n", encoding="utf-8")
+    monkeypatch.setattr(batch_coder, "load_config", lambda: {"api_key": "k", "model": "m"})
+    monkeypatch.setattr(batch_coder, "process_markdown_to_code", fake_process_markdown_to_code)
+
+    results = batch_coder.process_markdown_folder(str(input_dir), str(tmp_path / "code"), "template.txt", workers=3)
+
+    assert [result['status'] for result in results] == ['success'] * 3
+    lines = [line for line in capsys.readouterr().out.splitlines() if " step " in line]
+    assert len(lines) == 9
+    for start in range(0, 9, 3):
+        page = lines[start].split()[0]
+        assert lines[start:start + 3] == [f"{page} step {step}" for step in range(3)]
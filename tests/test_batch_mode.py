@@ -0,0 +1,78 @@
+"""批处理轮次：失败或没有结果的批次在重新运行时重新提交"""
+
+import json
+
+import httpx
+import pytest
+
+import api_call
+import batch_mode
+from rate_limiter import RateLimiter
+
+
+class FakeEndpoint:
+    reports_usage = False
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.submitted = []
+
+    def submit(self, input_path, metadata=None):
+        batch_id = f"batch_{len(self.submitted)}"
+        self.submitted.append(batch_id)
+        return batch_id
+
+    def retrieve(self, batch_id):
+        return self.statuses[len(self.submitted) - 1]
+
+    def download_results(self, batch_id, output_path):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            if self.retrieve(batch_id) == 'completed':
+                body = {"choices": [{"message": {"content": "ok"}}]}
+                f.write(json.dumps({"custom_id": "brain", "response": {"status_code": 200, "body": body}}) + "\n")
+        return output_path
+
+
+REQUESTS = [{"custom_id": "brain", "method": "POST", "url": batch_mode.BATCH_ENDPOINT_URL,
+             "body": {"model": "gpt-4o", "max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}}]
+
+
+@pytest.mark.parametrize("first_status", ['failed', 'expired', 'cancelled'])
+def test_rerun_resubmits_after_unsuccessful_batch(tmp_path, first_status):
+    endpoint = FakeEndpoint([first_status, 'completed'])
+    with pytest.raises(RuntimeError):
+        batch_mode.run_batch_round(endpoint, REQUESTS, "brain", str(tmp_path), poll_interval=0)
+
+    results = batch_mode.run_batch_round(endpoint, REQUESTS, "brain", str(tmp_path), poll_interval=0)
+    assert endpoint.submitted == ["batch_0", "batch_1"]
+    assert results == {"brain": ("ok", None)}
+
+
+def test_rerun_resumes_completed_batch(tmp_path):
+    endpoint = FakeEndpoint(['completed'])
+    batch_mode.run_batch_round(endpoint, REQUESTS, "brain", str(tmp_path), poll_interval=0)
+    batch_mode.run_batch_round(endpoint, REQUESTS, "brain", str(tmp_path), poll_interval=0)
+    assert endpoint.submitted == ["batch_0"]
+
+
+def test_openai_endpoint_retries_through_the_shared_limiter(monkeypatch):
+    """SDK自带的重试关闭，轮询失败由共享限流器按退避重试"""
+    responses = [httpx.Response(503, headers={"retry-after-ms": "1"}, json={"error": {"message": "busy"}}),
+                 httpx.Response(200, json={"id": "batch_1", "object": "batch", "status": "in_progress",
+                                           "endpoint": "/v1/chat/completions", "input_file_id": "file_1",
+                                           "completion_window": "24h", "created_at": 0})]
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return responses[len(sent) - 1]
+
+    limiter = RateLimiter(max_retries=3, backoff_base=0.001)
+    monkeypatch.setattr(api_call, "_rate_limiter", limiter)
+    endpoint = batch_mode.OpenAIBatchEndpoint("key", "https://api.example.com/v1")
+    assert endpoint.client.max_retries == 0
+    endpoint.client = endpoint.client.with_options(http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+    assert endpoint.retrieve("batch_1") == "in_progress"
+    assert len(sent) == 2
+    assert limiter.stats()["requests"] == 2
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from batch_tts import OpenAITTSBackend, TTSCache, ToneBackend, synthesize_page
+from run_manifest import RunManifest
+
+
+class CountingBackend(ToneBackend):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.calls = 0
+
+    def synthesize(self, text, output_path):
+        self.calls += 1
+        super().synthesize(text, output_path)
+
+
+class FailingBackend(ToneBackend):
+    def synthesize(self, text, output_path):
+        with open(output_path, 'wb') as f:
+            f.write(b"RIFF half")
+        raise RuntimeError("engine crashed")
+
+
+@pytest.fixture
+def speech(tmp_path):
+    path = tmp_path / "page_1_speech.txt"
+    path.write_text("大家好，这一页介绍方法。", encoding="utf-8")
+    return path
+
+
+def test_identical_text_and_settings_hit_the_cache(tmp_path, speech):
+    (tmp_path / "audio1").mkdir()
+    (tmp_path / "audio2").mkdir()
+    cache = TTSCache(str(tmp_path / "cache"))
+    backend = CountingBackend()
+    first = synthesize_page(str(speech), str(tmp_path / "audio1"), backend, cache)
+    second = synthesize_page(str(speech), str(tmp_path / "audio2"), backend, cache)
+    assert (first['status'], second['status']) == ('synthesized', 'cached')
+    assert backend.calls == 1
+    assert open(first['audio'], 'rb').read() == open(second['audio'], 'rb').read()
+
+
+def test_whitespace_only_changes_keep_the_key():
+    backend = ToneBackend()
+    assert TTSCache.make_key("你好 世界", backend) == TTSCache.make_key("你好 世界", ToneBackend())
+
+
+@pytest.mark.parametrize("text, backend", [
+    ("另一段讲稿", ToneBackend()),
+    ("讲稿", ToneBackend(voice="tone")),
+    ("讲稿", ToneBackend(chars_per_second=3.0)),
+])
+def test_changed_text_or_voice_misses(text, backend):
+    assert TTSCache.make_key(text, backend) != TTSCache.make_key("讲稿", ToneBackend())
+
+
+def test_changed_model_or_voice_misses_for_openai():
+    base = OpenAITTSBackend("key")
+    assert TTSCache.make_key("讲稿", OpenAITTSBackend("key", model="tts-1-hd")) != TTSCache.make_key("讲稿", base)
+    assert TTSCache.make_key("讲稿", OpenAITTSBackend("key", voice="nova")) != TTSCache.make_key("讲稿", base)
+    # api_key不影响音频，不参与缓存键
+    assert TTSCache.make_key("讲稿", OpenAITTSBackend("other")) == TTSCache.make_key("讲稿", base)
+
+
+def test_manifest_reuses_audio_without_synthesizing(tmp_path, speech):
+    (tmp_path / "audio").mkdir()
+    backend = CountingBackend()
+    manifest = RunManifest(str(tmp_path))
+    assert synthesize_page(str(speech), str(tmp_path / "audio"), backend, manifest=manifest)['status'] == 'synthesized'
+    assert synthesize_page(str(speech), str(tmp_path / "audio"), backend, manifest=RunManifest(str(tmp_path)))['status'] == 'reused'
+    assert backend.calls == 1
+
+
+def test_failed_synthesis_leaves_no_audio(tmp_path, speech):
+    cache = TTSCache(str(tmp_path / "cache"))
+    audio_dir = tmp_path / "audio"
+    audio_dir.mkdir()
+    result = synthesize_page(str(speech), str(audio_dir), FailingBackend(), cache)
+    assert result['status'] == 'failed' and "engine crashed" in result['error']
+    assert os.listdir(audio_dir) == []
+    assert cache.get(TTSCache.make_key("大家好，这一页介绍方法。", ToneBackend())) is None
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+import Chapter_Coder
+from Chapter_Coder import CodeStreamAborted, write_code_stream
+
+
+class FakeStream:
+    """按块产出的流，记录被消费的块数以及是否被关闭"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+CODE = "from manim import *\n\nclass Intro(Scene):\n    def construct(self):\n        self.wait()"
+
+
+def test_apology_aborts_before_the_line_ends(tmp_path):
+    stream = FakeStream(["Sorry, I can't help with converting ", "this page into code because", " ...\n", "more"])
+    with pytest.raises(CodeStreamAborted):
+        write_code_stream(stream, str(tmp_path / "page_code.py.partial"))
+    assert stream.closed
+    assert stream.consumed < len(stream.chunks)
+
+
+def test_prose_instead_of_code_aborts(tmp_path):
+    with pytest.raises(CodeStreamAborted):
+        write_code_stream(FakeStream(["The slide shows the method overview and\n"]), str(tmp_path / "p.partial"))
+
+
+def test_fenced_code_stops_at_closing_fence(tmp_path):
+    stream = FakeStream(["```python\n", CODE[:30], CODE[30:] + "\n```\n", "This code draws the intro.\n", "unused"])
+    assert write_code_stream(stream, str(tmp_path / "p.partial")) == CODE
+    assert stream.closed
+    assert stream.consumed == 3
+
+
+def test_here_is_the_code_preamble_is_skipped(tmp_path):
+    stream = FakeStream(["Here is the code:\n", "以下是实现代码\n", "```python\n", CODE + "\n", "```"])
+    assert write_code_stream(stream, str(tmp_path / "p.partial")) == CODE
+
+
+def test_long_preamble_aborts(tmp_path):
+    preamble = "# " + "x" * 100 + "\n"
+    with pytest.raises(CodeStreamAborted):
+        write_code_stream(FakeStream([preamble] * 30), str(tmp_path / "p.partial"))
+
+
+@pytest.mark.parametrize("chunks, ok", [(["```python\n", CODE, "\n```"], True), (["I'm unable to do that, sorry.\n"], False)])
+def test_partial_file_is_removed(tmp_path, monkeypatch, chunks, ok):
+    markdown = tmp_path / "page_1.md"
+    markdown.write_text("# page 1\n", encoding="utf-8")
+    template = tmp_path / "Method_Coder.txt"
+    template.write_text("template", encoding="utf-8")
+    monkeypatch.setattr(Chapter_Coder, "stream_text_with_images", lambda *args, **kwargs: FakeStream(chunks))
+
+    output_dir = tmp_path / "code"
+    if ok:
+        code, output_file = Chapter_Coder.process_markdown_to_code(str(markdown), str(template), "key", "gpt-4o",
+                                                                   output_dir=str(output_dir), stream=True)
+        assert code == CODE
+        assert open(output_file, encoding="utf-8").read() == CODE
+    else:
+        with pytest.raises(Exception, match="不是代码"):
+            Chapter_Coder.process_markdown_to_code(str(markdown), str(template), "key", "gpt-4o",
+                                                   output_dir=str(output_dir), stream=True)
+    assert not any(name.endswith(".partial") for name in os.listdir(output_dir))
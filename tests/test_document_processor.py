@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+import document_processor
+
+
+def test_load_config_raises_instead_of_exiting(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config.json").write_text(json.dumps({"api_key": "your-api-key-here"}), encoding="utf-8")
+    with pytest.raises(RuntimeError, match="api_key"):
+        document_processor.load_config()
+
+
+def test_load_config_creates_default_and_raises(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(RuntimeError, match="默认配置文件"):
+        document_processor.load_config()
+    assert (tmp_path / "config.json").exists()
+
+
+FENCED_PAPER = """# 1 Introduction
+intro
+# 2 Method
+```python
+# not a heading
+x = 1
+```
+method text
+## 2.1 Details
+details
+# 3 Experiments
+results
+"""
+
+
+def test_outline_and_index_skip_fenced_code():
+    outline = document_processor.extract_heading_outline(FENCED_PAPER)
+    assert [heading['title'] for heading in outline] == ["1 Introduction", "2 Method", "2.1 Details", "3 Experiments"]
+    assert outline[1]['first_line'] == "method text"
+
+    index = document_processor.HeadingIndex(FENCED_PAPER)
+    assert [heading['text'] for heading in index.headings] == ["# 1 Introduction", "# 2 Method", "## 2.1 Details", "# 3 Experiments"]
+    method = index.section_text(index.find("2 Method"))
+    assert "# not a heading" in method and "details" in method and "results" not in method
@@ -0,0 +1,12 @@
+import sys
+
+import master_pipeline
+
+PROGRESS_SCRIPT = "print('总体进度: |███░░░| 1/2'); print('总体进度: |██████| 2/2')"
+
+
+def test_prefixed_output_has_no_unprefixed_lines(capsys):
+    master_pipeline.run_command_with_env([sys.executable, "-c", PROGRESS_SCRIPT], output_prefix="Methods")
+    lines = capsys.readouterr().out.splitlines()
+    assert lines
+    assert all(line.startswith("   [Methods] ") for line in lines)
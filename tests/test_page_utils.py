@@ -0,0 +1,24 @@
+import ast
+
+from page_utils import find_scene_classes, get_page_name, get_sort_key
+
+
+def test_sort_key_orders_pages_numerically():
+    files = ["page_10_code.py", "page_2_code.py", "page_1_code.py"]
+    assert sorted(files, key=get_sort_key) == ["page_1_code.py", "page_2_code.py", "page_10_code.py"]
+
+
+def test_page_name_strips_code_and_audio_suffixes():
+    assert get_page_name("out/page_3_code.py") == "page_3"
+    assert get_page_name("audio/page_3_speech.wav") == "page_3"
+    assert get_page_name("audio/page_3.mp3") == "page_3"
+
+
+def test_scene_classes_skip_shared_parents():
+    tree = ast.parse(
+        "class Base(Scene): pass\n"
+        "class Intro(Base): pass\n"
+        "class Graph(manim.MovingCameraScene): pass\n"
+        "class Helper: pass\n"
+    )
+    assert find_scene_classes(tree) == ["Intro", "Graph"]
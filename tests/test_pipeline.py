@@ -0,0 +1,54 @@
+import threading
+import time
+
+import batch_coder
+import pipeline
+
+# 第3页的代码生成最慢，第1、2页的演讲稿不应等它
+CODE_DELAYS = {1: 0.05, 2: 0.1, 3: 0.6}
+
+
+def test_pipelined_generation_order_and_output(tmp_path, monkeypatch, capsys):
+    pages_dir = tmp_path / "pages"
+    pages_dir.mkdir()
+    for page in CODE_DELAYS:
+        (pages_dir / f"page_{page}.md").write_text(f"# page {page}\n", encoding="utf-8")
+    events = []
+    lock = threading.Lock()
+
+    def record(event):
+        with lock:
+            events.append(event)
+
+    def fake_code(markdown_file, output_dir, prompt_template=None, manifest=None, stream=False):
+        page = pipeline.extract_page_number(markdown_file)[0]
+        for step in range(3):
+            print(f"code {page} line {step}")
+            time.sleep(CODE_DELAYS[page] / 3)
+        record(("code_done", page))
+        return {'file': markdown_file, 'status': 'success', 'duration': 0.0,
+                'output_file': str(tmp_path / f"page_{page}_code.py"), 'error': None}
+
+    def fake_speech(page_file, code_file, previous_speech_path, output_dir, prompt_template, manifest=None):
+        page = pipeline.extract_page_number(page_file)[0]
+        record(("speech_start", page))
+        print(f"speech {page}")
+        record(("speech_done", page))
+        return {'status': 'success', 'speech_file': str(tmp_path / f"page_{page}_speech.txt"), 'duration': 0.0, 'error': None}
+
+    monkeypatch.setattr(batch_coder, "generate_code_for_page", fake_code)
+    monkeypatch.setattr(pipeline, "generate_speech_for_pair", fake_speech)
+
+    pipeline.step3_4_pipelined_generation(str(pages_dir), str(tmp_path / "code"), str(tmp_path / "speech"),
+                                          "Method", workers=3)
+
+    for page in CODE_DELAYS:
+        start = events.index(("speech_start", page))
+        assert events.index(("code_done", page)) < start
+        if page > 1:
+            assert events.index(("speech_done", page - 1)) < start
+    # 第1页的演讲稿在全部代码完成之前开始
+    assert events.index(("speech_start", 1)) < events.index(("code_done", 3))
+
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith("code ")]
+    assert lines == [f"code {page} line {step}" for page in CODE_DELAYS for step in range(3)]
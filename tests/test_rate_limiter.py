@@ -0,0 +1,96 @@
+import httpx
+import openai
+import pytest
+
+import api_call
+from rate_limiter import APICallError, RateLimiter, TokenBucket, classify_error, parse_retry_after
+
+REQUEST = httpx.Request("POST", "https://api.example.com/v1/chat/completions")
+
+
+def status_error(status_code):
+    response = httpx.Response(status_code, request=REQUEST, headers={"retry-after": "3"})
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+@pytest.mark.parametrize("error", [
+    openai.APIConnectionError(request=REQUEST),
+    openai.APITimeoutError(request=REQUEST),
+    httpx.ConnectError("connection refused"),
+    httpx.ReadTimeout("read timed out"),
+])
+def test_transport_errors_are_retryable(error):
+    assert classify_error(error) == (True, False, None)
+
+
+@pytest.mark.parametrize("error", [TypeError("unexpected keyword argument"), ValueError("bad image"), KeyError("model")])
+def test_errors_without_status_are_fatal(error):
+    assert classify_error(error)[0] is False
+
+
+def test_status_codes():
+    assert classify_error(status_error(429)) == (True, True, 3.0)
+    assert classify_error(status_error(503))[0] is True
+    assert classify_error(status_error(400))[0] is False
+
+
+def test_sdk_retries_are_disabled(monkeypatch):
+    """每次限流器尝试只发出一个HTTP请求，重试全部经过限流器"""
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(429, headers={"retry-after-ms": "1"}, json={"error": {"message": "rate limited"}})
+
+    limiter = RateLimiter(max_retries=2, backoff_base=0.001)
+    monkeypatch.setattr(api_call, "_rate_limiter", limiter)
+    client = api_call.APIClient("key", "gpt-4o", "https://api.example.com/v1",
+                                http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    with pytest.raises(APICallError):
+        client.call_api_with_text("hello")
+
+    stats = limiter.stats()
+    assert stats["requests"] == 2 and stats["rate_limited"] == 2
+    assert len(sent) == stats["requests"]
+
+
+def test_token_bucket_waits_and_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("rate_limiter.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(60)  # 每秒1个令牌
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0)
+    now[0] += 5
+    assert bucket.reserve(1) == 0.0
+    bucket.adjust(-10)  # 实际用量比预估少10个，归还
+    assert bucket.tokens == pytest.approx(12.0)
+
+
+def test_aimd_halves_on_429_and_recovers():
+    limiter = RateLimiter(initial_concurrency=8, min_concurrency=2, max_concurrency=9)
+    limiter.acquire()
+    limiter.release(rate_limited=True, retry_after=0.01)
+    assert limiter.stats()["concurrency_limit"] == 4
+    assert limiter.blocked_until > 0
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(rate_limited=True)
+    assert limiter.stats()["concurrency_limit"] == 2
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(success=True)
+    assert limiter.concurrency_limit > 2
+    assert limiter.stats()["rate_limited"] == 4
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after-ms": "bad", "retry-after": "2"}, 2.0),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+    ({"retry-after": "soon"}, None),
+    ({}, None),
+    (None, None),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(headers) == expected
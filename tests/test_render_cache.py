@@ -0,0 +1,59 @@
+"""渲染缓存：修改代码后重新渲染不会改写旧代码对应的缓存条目"""
+
+import os
+import sys
+import textwrap
+
+import batch_renderer
+from render_cache import RenderCache
+
+# 替身manim：把代码文件的内容原地写入 media/videos/<模块>/480p15/<场景>.mp4（与manim一样覆盖同一路径）
+FAKE_MANIM = textwrap.dedent("""
+    import os, sys
+    args = sys.argv[1:]
+    media_dir = args[args.index('--media_dir') + 1]
+    code_file, scene = args[-2], args[-1]
+    module = os.path.splitext(os.path.basename(code_file))[0]
+    out_dir = os.path.join(media_dir, 'videos', module, '480p15')
+    os.makedirs(out_dir, exist_ok=True)
+    with open(code_file, encoding='utf-8') as src:
+        content = src.read()
+    # 'w'模式截断后写入，文件的inode不变
+    with open(os.path.join(out_dir, scene + '.mp4'), 'w', encoding='utf-8') as out:
+        out.write(content)
+""")
+
+
+def _render(code_file, media_dir, log_dir, cache):
+    return batch_renderer.render_cached_scene(code_file, "PageScene", media_dir, log_dir, 'low', 60, cache)
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_reverted_code_gets_its_own_video(tmp_path, monkeypatch):
+    fake_manim = tmp_path / "fake_manim.py"
+    fake_manim.write_text(FAKE_MANIM, encoding='utf-8')
+    monkeypatch.setattr(batch_renderer, "MANIM_COMMAND", [sys.executable, str(fake_manim)])
+
+    code_file = tmp_path / "page_code.py"
+    media_dir, log_dir = str(tmp_path / "media"), str(tmp_path / "logs")
+    cache = RenderCache(str(tmp_path / "cache"))
+    original = "class PageScene(Scene):\n    pass  # v1\n"
+    edited = "class PageScene(Scene):\n    pass  # v2\n"
+
+    code_file.write_text(original, encoding='utf-8')
+    first = _render(str(code_file), media_dir, log_dir, cache)
+    assert first['status'] == 'success'
+
+    code_file.write_text(edited, encoding='utf-8')
+    second = _render(str(code_file), media_dir, log_dir, cache)
+    assert second['status'] == 'success'
+    assert _read(second['video']) == edited
+
+    code_file.write_text(original, encoding='utf-8')
+    reverted = _render(str(code_file), media_dir, log_dir, cache)
+    assert reverted['status'] == 'reused'
+    assert _read(reverted['video']) == original
@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache
+
+CONTENT = [{"type": "text", "text": "page 1"}, {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}}]
+
+
+def key(model="gpt-4o", max_tokens=1000, temperature=1, content=CONTENT):
+    return ResponseCache.make_key(model, max_tokens, temperature, content)
+
+
+def test_hit_on_identical_request(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get(key()) is None
+    cache.put(key(), "code")
+    assert ResponseCache(str(tmp_path)).get(key()) == "code"
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("changed", [
+    {"model": "gpt-4.1"},
+    {"max_tokens": 2000},
+    {"temperature": 0},
+    {"content": [{"type": "text", "text": "page 2"}] + CONTENT[1:]},
+    {"content": CONTENT[:1] + [{"type": "image_url", "image_url": {"url": "data:image/png;base64,BBBB"}}]},
+])
+def test_miss_when_any_input_changes(tmp_path, changed):
+    cache = ResponseCache(str(tmp_path))
+    cache.put(key(), "code")
+    assert key(**changed) != key()
+    assert cache.get(key(**changed)) is None
+
+
+def test_refresh_ignores_but_still_writes(tmp_path):
+    ResponseCache(str(tmp_path)).put(key(), "old")
+    cache = ResponseCache(str(tmp_path), refresh=True)
+    assert cache.get(key()) is None
+    cache.put(key(), "new")
+    assert ResponseCache(str(tmp_path)).get(key()) == "new"
+
+
+def test_failed_write_leaves_no_entry(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+
+    def fail_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(response_cache.os, "replace", fail_replace)
+    cache.put(key(), "code")
+    monkeypatch.undo()
+    assert cache.get(key()) is None
+    assert [name for _, _, files in os.walk(tmp_path) for name in files] == []
+
+
+def test_eviction_removes_expired_then_oldest(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size_mb=1)
+    keys = [key(content=[{"type": "text", "text": f"page {i}"}]) for i in range(3)]
+    for i, k in enumerate(keys):
+        cache.put(k, "x" * 400_000)
+        mtime = time.time() - 100 + i
+        os.utime(cache._entry_path(k), (mtime, mtime))
+    cache.evict()
+    assert [cache.get(k) is not None for k in keys] == [False, True, True]
+
+    os.utime(cache._entry_path(keys[1]), (0, 0))
+    cache.evict()
+    assert cache.get(keys[1]) is None and cache.get(keys[2]) is not None
+
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from run_manifest import MANIFEST_FILENAME, RunManifest, code_stage_inputs
+
+
+@pytest.fixture
+def page(tmp_path):
+    markdown = tmp_path / "page_1.md"
+    markdown.write_text("# page 1\n![](fig.png)\n", encoding="utf-8")
+    (tmp_path / "fig.png").write_bytes(b"png")
+    template = tmp_path / "Method_Coder.txt"
+    template.write_text("template", encoding="utf-8")
+    output = tmp_path / "page_1_code.py"
+    output.write_text("pass\n", encoding="utf-8")
+    return markdown, template, output
+
+
+def record_page(run_dir, page):
+    markdown, template, output = page
+    manifest = RunManifest(str(run_dir))
+    manifest.record('code', markdown.name, code_stage_inputs(str(markdown), str(template), "gpt-4o"), [str(output)])
+    return manifest
+
+
+def is_fresh(run_dir, page, model="gpt-4o"):
+    markdown, template, _ = page
+    return RunManifest(str(run_dir)).is_fresh('code', markdown.name, code_stage_inputs(str(markdown), str(template), model))
+
+
+def test_unchanged_inputs_stay_fresh_across_runs(tmp_path, page):
+    record_page(tmp_path, page)
+    assert is_fresh(tmp_path, page)
+    assert is_fresh(tmp_path, page)
+
+
+@pytest.mark.parametrize("change", ["markdown", "template", "image", "output"])
+def test_changed_inputs_or_missing_output_are_stale(tmp_path, page, change):
+    record_page(tmp_path, page)
+    markdown, template, output = page
+    if change == "markdown":
+        markdown.write_text("# page 1 edited\n![](fig.png)\n", encoding="utf-8")
+    elif change == "template":
+        template.write_text("new template", encoding="utf-8")
+    elif change == "image":
+        (tmp_path / "fig.png").write_bytes(b"new png")
+    else:
+        os.remove(output)
+    assert not is_fresh(tmp_path, page)
+
+
+def test_changed_model_is_stale(tmp_path, page):
+    record_page(tmp_path, page)
+    assert not is_fresh(tmp_path, page, model="gpt-4.1")
+
+
+def test_force_regenerates_but_records(tmp_path, page):
+    record_page(tmp_path, page)
+    markdown, template, _ = page
+    manifest = RunManifest(str(tmp_path), force=True)
+    assert not manifest.is_fresh('code', markdown.name, code_stage_inputs(str(markdown), str(template), "gpt-4o"))
+
+
+@pytest.mark.parametrize("content", ["{not json", '{"version": 0, "stages": {"code": {"page_1.md": {}}}}'])
+def test_corrupted_or_old_manifest_starts_fresh(tmp_path, page, content):
+    (tmp_path / MANIFEST_FILENAME).write_text(content, encoding="utf-8")
+    manifest = RunManifest(str(tmp_path))
+    assert manifest.get_entry('code', page[0].name) == {}
+    assert not is_fresh(tmp_path, page)
+    # 损坏的清单在下一次记录时被完整的清单替换
+    record_page(tmp_path, page)
+    assert is_fresh(tmp_path, page)
+
+
+def test_missing_manifest_starts_fresh(tmp_path, page):
+    assert not (tmp_path / MANIFEST_FILENAME).exists()
+    assert not is_fresh(tmp_path, page)
+    assert RunManifest(str(tmp_path)).summary()['code'] == {"reused": 0, "generated": 0}
@@ -0,0 +1,17 @@
+import urllib.request
+
+from tracing import start_metrics_server
+
+
+def test_metrics_server_listens_on_localhost_by_default(tmp_path):
+    trace_path = tmp_path / "trace.jsonl"
+    trace_path.write_text("", encoding="utf-8")
+    server = start_metrics_server(0, str(trace_path))
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.status == 200
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from usage_ledger import DEFAULT_PRICES, BudgetExceededError, UsageLedger
+
+PRICES = {"m": {"input": 1.0, "output": 1.0}}
+
+
+def make_ledgers(tmp_path, count=2):
+    """同一运行的多个章节进程各自持有一个账本对象，写入同一个账本文件"""
+    path = str(tmp_path / "usage.jsonl")
+    return [UsageLedger(path, PRICES, budget=1.0, run_id="run") for _ in range(count)]
+
+
+def test_reservations_are_shared_between_processes(tmp_path):
+    first, second = make_ledgers(tmp_path)
+    reserved = first.reserve("m", 600_000, 0)
+    assert reserved == pytest.approx(0.6)
+    assert second.reserve("m", 600_000, 0, wait=False) is None
+
+    first.release(reserved)
+    assert second.reserve("m", 600_000, 0, wait=False) == pytest.approx(0.6)
+
+
+def test_spent_cost_from_other_process_counts_against_budget(tmp_path):
+    first, second = make_ledgers(tmp_path)
+    first.record("m", 900_000, 0)
+    with pytest.raises(BudgetExceededError):
+        second.reserve("m", 200_000, 0)
+
+
+def test_cleared_reservation_frees_budget(tmp_path):
+    first, second = make_ledgers(tmp_path)
+    first.reserve("m", 600_000, 0)
+    first._clear_reservation()
+    assert second.reserve("m", 600_000, 0, wait=False) == pytest.approx(0.6)
+    assert not os.path.exists(str(tmp_path / "usage.jsonl.lock"))
+
+
+@pytest.mark.parametrize("model, priced_as", [
+    ("gpt-4o", "gpt-4o"),
+    ("gpt-4o-2024-08-06", "gpt-4o"),
+    ("gpt-4o-2024-05-13", "gpt-4o-2024-05-13"),
+    ("o3-mini", "o3-mini"),
+    ("o3-mini-2025-01-31", "o3-mini"),
+    ("gpt-4.1-mini-2025-04-14", "gpt-4.1-mini"),
+])
+def test_variants_use_their_own_prices(tmp_path, model, priced_as):
+    ledger = UsageLedger(str(tmp_path / "usage.jsonl"))
+    assert ledger.price_for(model) == DEFAULT_PRICES[priced_as]
+
+
+def test_unknown_variant_is_unpriced_with_a_warning(tmp_path, capsys):
+    ledger = UsageLedger(str(tmp_path / "usage.jsonl"), {"o3": {"input": 2.0, "output": 8.0}})
+    assert ledger.cost("o3-mini", 1000, 1000) is None
+    record = ledger.record("o3-mini", 1000, 1000)
+    assert record["cost"] is None
+    assert capsys.readouterr().out.count("[WARN]") == 1
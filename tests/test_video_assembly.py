@@ -0,0 +1,71 @@
+import os
+import subprocess
+
+import pytest
+
+import video_assembly
+from video_assembly import AUDIO_ENCODE_ARGS, _concat_list_line, mux_page, read_page_list, write_concat_list
+
+
+def test_concat_list_quotes_paths_and_round_trips(tmp_path):
+    paths = [str(tmp_path / "page 1.mp4"), str(tmp_path / "it's page 2.mp4")]
+    assert _concat_list_line(paths[1]) == f"file '{tmp_path}/it'\\''s page 2.mp4'\n"
+    list_path = tmp_path / "videos.txt"
+    write_concat_list(paths, str(list_path))
+    assert list_path.read_text(encoding="utf-8").splitlines()[0] == f"file '{tmp_path}/page 1.mp4'"
+    assert read_page_list(str(list_path))[0] == paths[0]
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """把ffmpeg命令的最后一个参数（临时输出文件）写出来，记录调用次数"""
+    calls = []
+
+    def run(command, **kwargs):
+        calls.append(command)
+        with open(command[-1], 'wb') as f:
+            f.write(b"segment")
+        return subprocess.CompletedProcess(command, 0, stdout=None, stderr="")
+
+    monkeypatch.setattr(video_assembly.subprocess, "run", run)
+    monkeypatch.setattr(video_assembly, "get_audio_duration", lambda path: 2.0)
+    return calls
+
+
+@pytest.fixture
+def page_files(tmp_path):
+    video = tmp_path / "page_1.mp4"
+    audio = tmp_path / "page_1_speech.wav"
+    other_audio = tmp_path / "page_1_speech_v2.wav"
+    for path in (video, audio, other_audio):
+        path.write_bytes(b"data")
+        os.utime(path, (1000, 1000))
+    return str(video), str(audio), str(other_audio), str(tmp_path / "001_page_1.aac.mp4")
+
+
+def test_unchanged_inputs_reuse_the_segment(fake_ffmpeg, page_files):
+    video, audio, _, segment = page_files
+    assert mux_page("page_1", [video], audio, segment, AUDIO_ENCODE_ARGS)['status'] == 'muxed'
+    assert mux_page("page_1", [video], audio, segment, AUDIO_ENCODE_ARGS)['status'] == 'reused'
+    assert len(fake_ffmpeg) == 1
+
+
+@pytest.mark.parametrize("change", ["swap_audio", "drop_audio", "touch_video"])
+def test_changed_input_list_rebuilds_even_with_older_files(fake_ffmpeg, page_files, change):
+    video, audio, other_audio, segment = page_files
+    mux_page("page_1", [video], audio, segment, AUDIO_ENCODE_ARGS)
+    if change == "touch_video":
+        os.utime(video, (os.path.getmtime(segment) + 10,) * 2)
+        audio_after = audio
+    else:
+        # 换用的音频比片段旧，只比较修改时间会误判为可以复用
+        audio_after = other_audio if change == "swap_audio" else None
+    assert mux_page("page_1", [video], audio_after, segment, AUDIO_ENCODE_ARGS)['status'] == 'muxed'
+    assert len(fake_ffmpeg) == 2
+
+
+def test_segment_without_recorded_inputs_is_rebuilt(fake_ffmpeg, page_files):
+    video, audio, _, segment = page_files
+    with open(segment, 'wb') as f:
+        f.write(b"segment from an older run")
+    assert mux_page("page_1", [video], audio, segment, AUDIO_ENCODE_ARGS)['status'] == 'muxed'
@@ -0,0 +1,44 @@
+"""静态估算场景时长：绑定到变量的动画列表"""
+
+import textwrap
+
+from wait_time_calculator import estimate_scene_durations
+
+
+def _duration(construct_body: str) -> float:
+    source = "from manim import *\n\nclass PageScene(Scene):\n    def construct(self):\n" + textwrap.indent(
+        textwrap.dedent(construct_body), " " * 8)
+    (result,) = estimate_scene_durations(source)
+    return result['duration']
+
+
+def test_play_starred_animation_list_variable():
+    assert _duration("""
+        a, b = Circle(), Square()
+        anims = [FadeIn(a, run_time=3), FadeIn(b)]
+        self.play(*anims)
+    """) == 3.0
+
+
+def test_succession_of_animation_list_variable():
+    assert _duration("""
+        a, b = Circle(), Square()
+        anims = [FadeIn(a), FadeIn(b)]
+        self.play(Succession(*anims))
+    """) == 2.0
+
+
+def test_loop_over_animation_list_variable_keeps_length():
+    assert _duration("""
+        anims = (FadeIn(Circle()), FadeIn(Square()), FadeIn(Dot()))
+        for anim in anims:
+            self.play(anim)
+    """) == 3.0
+
+
+def test_unpacked_animation_tuple():
+    assert _duration("""
+        first, second = FadeIn(Circle(), run_time=2), FadeIn(Square())
+        self.play(first)
+        self.play(second)
+    """) == 3.0
@@ -0,0 +1,529 @@
+"""
+流水线追踪与指标
+
+按 论文(paper) → 章节(chapter) → 阶段(stage) → 页面(page) → API调用(api) 的层级记录span：
+- 每个span记录耗时、状态，以及重试次数、prompt/completion token（来自response.usage）、
+  发送的图片字节数、缓存命中次数；子span结束时把这些计数累加到父span；
+- span结束时写入JSONL追踪文件（一行一个span），章节子进程通过环境变量继承追踪文件和父span，
+  写入同一个文件；
+- Prometheus文本格式的指标由追踪文件汇总生成，可以写成文件（node_exporter textfile）
+  或通过HTTP端点（/metrics）提供。
+
+线程池中的任务需要用 propagate 包装，才能继承提交任务时所在的span。
+
+使用方法:
+python tracing.py trace.jsonl [--prometheus metrics.prom]
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+TRACE_FILE_ENV = "PAPER2VIDEO_TRACE_FILE"
+TRACE_PARENT_ENV = "PAPER2VIDEO_TRACE_PARENT"
+SPAN_KINDS = ('paper', 'chapter', 'stage', 'page', 'api')
+METRIC_FIELDS = ('api_calls', 'retries', 'prompt_tokens', 'completion_tokens', 'image_bytes', 'cache_hits')
+# 页面函数返回这些状态时说明结果来自缓存或运行清单
+CACHED_STATUSES = ('reused', 'cached')
+API_LATENCY_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600)
+METRIC_PREFIX = "paper2video"
+# /metrics 端点默认只监听本机；需要被其他机器抓取时显式传入 0.0.0.0 等地址
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+
+class Span:
+    def __init__(self, kind: str, name: str, trace_id: str, parent_id: Optional[str], labels: Dict[str, str],
+                 attributes: Dict[str, Any]):
+        """labels为从父span继承的层级名称（paper、chapter、stage、page），本span的名称按kind加入其中"""
+        self.kind = kind
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.labels = dict(labels)
+        self.labels[kind] = name
+        self.attributes = attributes
+        self.metrics = {field: 0 for field in METRIC_FIELDS}
+        self.status = 'ok'
+        self.error = None
+        self.start = time.time()
+        self.duration = None
+        self.remote_children = False
+        self._start_counter = time.perf_counter()
+
+    def add(self, metric: str, value: float = 1):
+        """累加计数（重试、token、图片字节、缓存命中等）"""
+        if value:
+            with _metrics_lock:
+                self.metrics[metric] = self.metrics.get(metric, 0) + value
+
+    def set(self, **attributes):
+        """记录附加属性（模型、场景名等）"""
+        self.attributes.update(attributes)
+
+    def fail(self, error: str):
+        self.status = 'error'
+        self.error = error
+
+    def to_record(self) -> Dict[str, Any]:
+        with _metrics_lock:
+            metrics = {field: value for field, value in self.metrics.items() if value}
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "kind": self.kind, "name": self.name, "labels": self.labels,
+            "start": round(self.start, 6), "duration": round(self.duration or 0.0, 6),
+            "status": self.status, "error": self.error, "pid": os.getpid(),
+            "metrics": metrics, "attributes": self.attributes
+        }
+
+
+class _NullSpan:
+    """未启用追踪时使用的空span，所有操作都不做任何事"""
+    span_id = None
+
+    def add(self, metric: str, value: float = 1):
+        pass
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, error: str):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self, trace_path: str):
+        """
+        Args:
+            trace_path: JSONL追踪文件，以追加方式写入（同一次运行的多个进程写入同一个文件）
+        """
+        self.trace_path = os.path.abspath(trace_path)
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+
+    def write(self, record: Dict[str, Any]):
+        # 每个span一次write调用，追加模式下多个进程的行不会互相穿插
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.records.append(record)
+            with open(self.trace_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+_tracer: Optional[Tracer] = None
+_current_span: contextvars.ContextVar = contextvars.ContextVar("paper2video_span", default=None)
+# 未启用追踪时仍然记录层级名称，供用量记账按章节、阶段、页面归类
+_current_labels: contextvars.ContextVar = contextvars.ContextVar("paper2video_labels", default=None)
+_metrics_lock = threading.Lock()
+
+
+def configure_tracing(trace_path: Optional[str]):
+    """开启（trace_path不为None）或关闭追踪"""
+    global _tracer
+    _tracer = Tracer(trace_path) if trace_path else None
+
+
+def setup_tracing(trace_path: str = None) -> Optional[str]:
+    """
+    设置追踪：优先使用传入的路径，其次使用父进程通过环境变量传入的追踪文件
+
+    Returns:
+        str: 追踪文件路径，未启用时返回None
+    """
+    trace_path = trace_path or os.environ.get(TRACE_FILE_ENV)
+    configure_tracing(trace_path)
+    return _tracer.trace_path if _tracer else None
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def current_span():
+    """当前上下文中的span，没有时返回空span"""
+    return _current_span.get() or NULL_SPAN
+
+
+def current_labels() -> Dict[str, str]:
+    """当前所在的层级名称（paper、chapter、stage、page），未启用追踪时同样可用"""
+    current = _current_span.get()
+    if current is not None:
+        return current.labels
+    labels = _current_labels.get()
+    if labels is None:
+        labels = (_remote_parent() or {}).get("labels") or {}
+    return labels
+
+
+def _remote_parent() -> Optional[Dict[str, Any]]:
+    """父进程通过环境变量传入的父span"""
+    value = os.environ.get(TRACE_PARENT_ENV)
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+@contextmanager
+def span(kind: str, name: str, activate: bool = True, labels: Dict[str, str] = None, **attributes):
+    """
+    记录一个span：进入时成为当前span，退出时写入追踪文件，并把计数累加到父span
+
+    代码块抛出异常时span状态为error并继续抛出；生成器被提前关闭时状态为cancelled。
+    在生成器中使用时传入activate=False：span不成为当前span（生成器在调用方的上下文中运行，
+    两次产出之间调用方看到的当前span不应改变）。labels覆盖从父span继承的层级名称，
+    例如流水线模式下代码和演讲稿页面共用一个阶段span，页面span分别指定stage。
+    未启用追踪时返回空span，只记录层级名称。
+    """
+    if _tracer is None:
+        merged = dict(current_labels(), **(labels or {}))
+        merged[kind] = name
+        token = _current_labels.set(merged) if activate else None
+        try:
+            yield NULL_SPAN
+        finally:
+            if token is not None:
+                _current_labels.reset(token)
+        return
+
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id, inherited = parent.trace_id, parent.span_id, parent.labels
+    else:
+        remote = _remote_parent() or {}
+        trace_id = remote.get("trace_id") or uuid.uuid4().hex
+        parent_id, inherited = remote.get("span_id"), remote.get("labels") or {}
+    current = Span(kind, name, trace_id, parent_id, dict(inherited, **(labels or {})), attributes)
+    token = _current_span.set(current) if activate else None
+    try:
+        yield current
+    except GeneratorExit:
+        current.status = 'cancelled'
+        raise
+    except BaseException as e:
+        current.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+        current.duration = time.perf_counter() - current._start_counter
+        if current.remote_children:
+            _absorb_remote_children(current)
+        if parent is not None:
+            for metric, value in current.metrics.items():
+                parent.add(metric, value)
+        _tracer.write(current.to_record())
+
+
+def traced(kind: str, name: str = None, name_arg: str = None, **labels):
+    """
+    把函数调用记录为span的装饰器
+
+    Args:
+        kind: span层级
+        name: span名称，默认为函数名
+        name_arg: 用该参数的值（文件路径取文件名）作为span名称，用于页面级函数
+        labels: 覆盖继承的层级名称，如 stage='code'
+
+    函数返回带status的结果字典时，reused/cached计为缓存命中，failed记为错误。
+    """
+    def decorator(func):
+        signature = inspect.signature(func) if name_arg else None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            span_name = name or func.__name__
+            if name_arg:
+                value = signature.bind(*args, **kwargs).arguments.get(name_arg)
+                span_name = os.path.basename(value) if isinstance(value, str) else str(value)
+            with span(kind, span_name, labels=labels) as current:
+                result = func(*args, **kwargs)
+                if isinstance(result, dict) and 'status' in result:
+                    if result['status'] in CACHED_STATUSES:
+                        current.add('cache_hits')
+                    elif result['status'] == 'failed':
+                        current.fail(str(result.get('error')))
+                return result
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """包装提交到线程池的函数，使其在提交时的上下文（当前span）中运行；同一个包装可以被多次并发调用"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+
+def subprocess_env(env: Dict[str, str] = None) -> Dict[str, str]:
+    """
+    为子进程准备环境变量：传入追踪文件和当前span，子进程中的span挂在当前span之下
+
+    子进程的span写在其他进程中，当前span结束时会从追踪文件中读取它们的计数。
+    未启用追踪时只传入层级名称。
+    """
+    env = dict(os.environ if env is None else env)
+    parent = _current_span.get()
+    if _tracer is None:
+        labels = current_labels()
+        if labels:
+            env[TRACE_PARENT_ENV] = json.dumps({"labels": labels}, ensure_ascii=False)
+        return env
+    env[TRACE_FILE_ENV] = _tracer.trace_path
+    if parent is not None:
+        parent.remote_children = True
+        env[TRACE_PARENT_ENV] = json.dumps(
+            {"trace_id": parent.trace_id, "span_id": parent.span_id, "labels": parent.labels}, ensure_ascii=False
+        )
+    return env
+
+
+def _absorb_remote_children(parent: Span):
+    """把子进程中直接挂在parent下的span的计数累加到parent"""
+    for record in read_trace(_tracer.trace_path):
+        if record.get("parent_id") == parent.span_id and record.get("pid") != os.getpid():
+            for metric, value in record.get("metrics", {}).items():
+                parent.add(metric, value)
+
+
+def record_usage(current, response):
+    """把响应中的token用量（response.usage）记到span上"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    current.add('prompt_tokens', getattr(usage, "prompt_tokens", 0) or 0)
+    current.add('completion_tokens', getattr(usage, "completion_tokens", 0) or 0)
+
+
+def read_trace(trace_path: str) -> List[Dict[str, Any]]:
+    """读取追踪文件，跳过写了一半的行"""
+    records = []
+    if not os.path.exists(trace_path):
+        return records
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def prometheus_text(records: List[Dict[str, Any]]) -> str:
+    """
+    把span汇总为Prometheus文本格式的指标
+
+    阶段和页面的耗时按章节、阶段汇总；API调用的延迟直方图、token、重试、图片字节和缓存命中
+    只按API调用span统计（不使用父span累加后的计数，避免重复计算）。
+    """
+    span_seconds: Dict[tuple, float] = {}
+    span_counts: Dict[tuple, int] = {}
+    api_counters: Dict[tuple, Dict[str, float]] = {}
+    api_histograms: Dict[tuple, List[int]] = {}
+    api_latency_sums: Dict[tuple, float] = {}
+
+    for record in records:
+        labels = record.get("labels", {})
+        kind = record.get("kind")
+        group = (kind, labels.get("chapter", ""), labels.get("stage", "") if kind != 'stage' else record.get("name"))
+        span_seconds[group] = span_seconds.get(group, 0.0) + record.get("duration", 0.0)
+        count_key = group + (record.get("status", "ok"),)
+        span_counts[count_key] = span_counts.get(count_key, 0) + 1
+        if kind != 'api':
+            continue
+        api_key = (labels.get("chapter", ""), labels.get("stage", ""))
+        counters = api_counters.setdefault(api_key, {field: 0 for field in METRIC_FIELDS if field != 'api_calls'})
+        for field in counters:
+            counters[field] += record.get("metrics", {}).get(field, 0)
+        buckets = api_histograms.setdefault(api_key, [0] * (len(API_LATENCY_BUCKETS) + 1))
+        duration = record.get("duration", 0.0)
+        for i, bound in enumerate(API_LATENCY_BUCKETS):
+            if duration <= bound:
+                buckets[i] += 1
+        buckets[-1] += 1
+        api_latency_sums[api_key] = api_latency_sums.get(api_key, 0.0) + duration
+
+    lines = [
+        f"# HELP {METRIC_PREFIX}_span_seconds_total 各层级span的累计耗时（秒）",
+        f"# TYPE {METRIC_PREFIX}_span_seconds_total counter"
+    ]
+    for (kind, chapter, stage), seconds in sorted(span_seconds.items()):
+        lines.append(f"{METRIC_PREFIX}_span_seconds_total{_format_labels({'kind': kind, 'chapter': chapter, 'stage': stage})} {seconds:.6f}")
+    lines += [f"# HELP {METRIC_PREFIX}_spans_total 各层级span的数量", f"# TYPE {METRIC_PREFIX}_spans_total counter"]
+    for (kind, chapter, stage, status), count in sorted(span_counts.items()):
+        lines.append(f"{METRIC_PREFIX}_spans_total{_format_labels({'kind': kind, 'chapter': chapter, 'stage': stage, 'status': status})} {count}")
+
+    lines += [f"# HELP {METRIC_PREFIX}_api_latency_seconds API调用耗时（含限流等待和重试）",
+              f"# TYPE {METRIC_PREFIX}_api_latency_seconds histogram"]
+    for api_key, buckets in sorted(api_histograms.items()):
+        base = {'chapter': api_key[0], 'stage': api_key[1]}
+        for bound, count in zip(API_LATENCY_BUCKETS + ('+Inf',), buckets):
+            lines.append(f"{METRIC_PREFIX}_api_latency_seconds_bucket{_format_labels(dict(base, le=bound))} {count}")
+        lines.append(f"{METRIC_PREFIX}_api_latency_seconds_sum{_format_labels(base)} {api_latency_sums[api_key]:.6f}")
+        lines.append(f"{METRIC_PREFIX}_api_latency_seconds_count{_format_labels(base)} {buckets[-1]}")
+
+    help_texts = {
+        'retries': "API重试次数", 'prompt_tokens': "prompt token数", 'completion_tokens': "completion token数",
+        'image_bytes': "随请求发送的图片字节数（data URL）", 'cache_hits': "LLM响应缓存命中次数"
+    }
+    for field, help_text in help_texts.items():
+        metric = f"{METRIC_PREFIX}_api_{field}_total"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for api_key, counters in sorted(api_counters.items()):
+            lines.append(f"{metric}{_format_labels({'chapter': api_key[0], 'stage': api_key[1]})} {counters[field]}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(output_path: str, trace_path: str = None):
+    """从追踪文件生成Prometheus指标文件（先写临时文件再替换，采集时不会读到半个文件）"""
+    trace_path = trace_path or (_tracer.trace_path if _tracer else None)
+    if not trace_path:
+        return
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(read_trace(trace_path)))
+    os.replace(tmp_path, output_path)
+
+
+def start_metrics_server(port: int, trace_path: str = None, host: str = DEFAULT_METRICS_HOST) -> ThreadingHTTPServer:
+    """在后台线程中启动 /metrics HTTP端点，每次请求时从追踪文件重新汇总（包括子进程写入的span）"""
+    trace_path = trace_path or _tracer.trace_path
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text(read_trace(trace_path)).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize_trace(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按阶段汇总耗时与API计数，用于回答“时间花在了哪里”
+
+    Returns:
+        dict: stages（{(章节, 阶段): 耗时、页面数、计数}）、api（调用次数和延迟分位数）
+    """
+    stages = {}
+    for record in records:
+        if record.get("kind") != 'stage':
+            continue
+        key = (record["labels"].get("chapter", ""), record["name"])
+        entry = stages.setdefault(key, {"duration": 0.0, "pages": 0, "metrics": {}})
+        entry["duration"] += record.get("duration", 0.0)
+        for metric, value in record.get("metrics", {}).items():
+            entry["metrics"][metric] = entry["metrics"].get(metric, 0) + value
+    for record in records:
+        if record.get("kind") == 'page':
+            key = (record["labels"].get("chapter", ""), record["labels"].get("stage", ""))
+            if key in stages:
+                stages[key]["pages"] += 1
+
+    latencies = sorted(record.get("duration", 0.0) for record in records
+                       if record.get("kind") == 'api' and not record.get("metrics", {}).get("cache_hits"))
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] if latencies else 0.0
+
+    return {
+        "stages": stages,
+        "api": {"calls": len(latencies), "p50": percentile(0.5), "p90": percentile(0.9), "max": latencies[-1] if latencies else 0.0}
+    }
+
+
+def print_trace_summary(records: List[Dict[str, Any]] = None, trace_path: str = None):
+    """打印各阶段耗时、页面数、token和重试，以及API调用延迟分位数（默认为当前进程记录的span）"""
+    if records is None:
+        if _tracer is None:
+            return
+        records, trace_path = _tracer.records, _tracer.trace_path
+    summary = summarize_trace(records)
+    if not summary["stages"]:
+        return
+    total = sum(entry["duration"] for entry in summary["stages"].values()) or 1.0
+    print(f"\n[TIME] 各阶段耗时{f' (追踪文件: {trace_path})' if trace_path else ''}:")
+    for (chapter, stage), entry in sorted(summary["stages"].items(), key=lambda item: -item[1]["duration"]):
+        metrics = entry["metrics"]
+        name = f"{chapter}/{stage}" if chapter else stage
+        details = []
+        if entry["pages"]:
+            details.append(f"{entry['pages']} 页")
+        if metrics.get("api_calls"):
+            details.append(f"API {metrics['api_calls']} 次")
+        if metrics.get("prompt_tokens") or metrics.get("completion_tokens"):
+            details.append(f"token {metrics.get('prompt_tokens', 0)}+{metrics.get('completion_tokens', 0)}")
+        if metrics.get("retries"):
+            details.append(f"重试 {metrics['retries']} 次")
+        if metrics.get("cache_hits"):
+            details.append(f"缓存命中 {metrics['cache_hits']}")
+        print(f"    {name}: {entry['duration']:.1f} 秒 ({entry['duration'] / total * 100:.0f}%)"
+              f"{'，' + '，'.join(details) if details else ''}")
+    api = summary["api"]
+    if api["calls"]:
+        print(f"    API调用延迟: p50 {api['p50']:.1f} 秒，p90 {api['p90']:.1f} 秒，最长 {api['max']:.1f} 秒")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='汇总流水线追踪文件')
+    parser.add_argument('trace_file', help='JSONL追踪文件')
+    parser.add_argument('--all', action='store_true', help='汇总文件中的所有运行 (默认: 只汇总最后一次运行)')
+    parser.add_argument('--prometheus', help='同时生成Prometheus指标文件（包含文件中的所有运行）')
+    args = parser.parse_args()
+
+    records = read_trace(args.trace_file)
+    if not records:
+        print(f"[WARN]  追踪文件中没有记录: {args.trace_file}")
+        return
+    if not args.all:
+        # 同一次运行的所有进程共享trace_id
+        records = [record for record in records if record.get("trace_id") == records[-1].get("trace_id")]
+    print(f"[PROG] 共 {len(records)} 个span")
+    print_trace_summary(records, args.trace_file)
+    if args.prometheus:
+        write_prometheus(args.prometheus, args.trace_file)
+        print(f"[OK] Prometheus指标已保存到: {args.prometheus}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+"""
+Token用量与费用记账
+
+每次实际发出的API请求（不含缓存命中）记一行到运行目录的usage.jsonl：模型、输入/输出token
+（来自response.usage，服务端没有返回时按字符数估算并标记estimated）、按价格表计算的费用，
+以及当前所在的论文、章节、阶段、页面（取自tracing的层级标签，未开启追踪时同样可用）。
+
+- 价格表：内置常用模型的参考价格，可被config.json的usage.prices和--price-table文件覆盖，
+  按模型名精确匹配，带日期的快照（gpt-4o-2024-08-06）没有单独的价格时使用去掉日期后的模型价格；
+  不会按前缀借用其他模型的价格（o3-mini 不按 o3 计费），价格表中没有的模型给出警告且不计入预算；
+- 预算上限：每次请求前按估算的最大费用（输入token估算加max_tokens）预约额度，放不下时等待在途请求结束；
+  即使在途请求都结束也放不下时抛出BudgetExceededError，不再发出请求，流水线在阶段之间检查预算并中止运行；
+- master_pipeline通过环境变量把账本文件、运行ID和预算传给章节子进程，各章节写入同一个账本，
+  预约额度记在账本旁的 usage.jsonl.reservations.json 中（由 usage.jsonl.lock 锁文件互斥），
+  并行的章节进程彼此可见，预算对整篇论文生效。被强制结束的进程来不及清除自己的预约，
+  其预约会一直占用额度，直到本次运行结束。
+
+使用方法:
+python usage_ledger.py usage.jsonl [--all] [--price-table prices.json]
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from rate_limiter import estimate_request_tokens
+from tracing import current_labels
+
+USAGE_ENV = "PAPER2VIDEO_USAGE"
+LEDGER_FILENAME = "usage.jsonl"
+SUMMARY_FILENAME = "usage_summary.json"
+RESERVATIONS_SUFFIX = ".reservations.json"  # 各进程在途请求的预约额度
+LOCK_SUFFIX = ".lock"
+LOCK_POLL_INTERVAL = 0.01     # 等待锁文件的轮询间隔（秒）
+LOCK_STALE_SECONDS = 30.0     # 锁文件超过该时间未释放时视为持有者已异常退出
+CHARS_PER_TOKEN = 4  # 与rate_limiter的估算一致
+DEFAULT_BATCH_DISCOUNT = 0.5  # Batch API按半价计费
+RESERVE_WAIT_INTERVAL = 1.0   # 等待在途请求释放预算时重新读取账本和预约的间隔（秒），其他进程的花费和释放不会通知本进程
+ASYNC_POLL_INTERVAL = 0.05    # 异步请求等待预算时的轮询间隔（秒）
+
+# 参考价格（美元/百万token），价格可能调整，以config.json的usage.prices为准
+DEFAULT_PRICES = {
+    "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.0},
+    "gpt-5-mini": {"input": 0.25, "cached_input": 0.025, "output": 2.0},
+    "gpt-5-nano": {"input": 0.05, "cached_input": 0.005, "output": 0.4},
+    "gpt-4.5-preview": {"input": 75.0, "cached_input": 37.5, "output": 150.0},
+    "gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10.0},
+    "gpt-4o-2024-05-13": {"input": 5.0, "output": 15.0},
+    "chatgpt-4o-latest": {"input": 5.0, "output": 15.0},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6},
+    "gpt-4.1": {"input": 2.0, "cached_input": 0.5, "output": 8.0},
+    "gpt-4.1-mini": {"input": 0.4, "cached_input": 0.1, "output": 1.6},
+    "gpt-4.1-nano": {"input": 0.1, "cached_input": 0.025, "output": 0.4},
+    "gpt-4-turbo": {"input": 10.0, "output": 30.0},
+    "o1": {"input": 15.0, "cached_input": 7.5, "output": 60.0},
+    "o1-mini": {"input": 1.1, "cached_input": 0.55, "output": 4.4},
+    "o1-pro": {"input": 150.0, "output": 600.0},
+    "o3": {"input": 2.0, "cached_input": 0.5, "output": 8.0},
+    "o3-mini": {"input": 1.1, "cached_input": 0.55, "output": 4.4},
+    "o3-pro": {"input": 20.0, "output": 80.0},
+    "o4-mini": {"input": 1.1, "cached_input": 0.275, "output": 4.4},
+}
+SNAPSHOT_SUFFIX = re.compile(r"-\d{4}-\d{2}-\d{2}$")  # 模型快照的日期后缀，如 gpt-4o-2024-08-06
+
+
+class BudgetExceededError(RuntimeError):
+    """本次运行的API费用达到预算上限"""
+
+
+@contextmanager
+def _file_lock(lock_path: str):
+    """跨进程互斥：以O_EXCL方式创建锁文件，退出时删除"""
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            time.sleep(LOCK_POLL_INTERVAL)
+    os.close(fd)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+class UsageLedger:
+    def __init__(self, ledger_path: str, prices: Dict[str, Dict[str, float]] = None, budget: float = None,
+                 run_id: str = None, batch_discount: float = DEFAULT_BATCH_DISCOUNT, price_table: str = None):
+        """
+        Args:
+            ledger_path: JSONL账本文件，以追加方式写入（同一次运行的多个进程写入同一个文件）
+            prices: 模型 -> {input, cached_input, output}，单位为美元/百万token
+            budget: 本次运行的费用上限（美元），None表示不限制
+            run_id: 运行ID，账本中只有该ID的记录计入预算和汇总
+            batch_discount: Batch API请求的价格系数
+            price_table: 覆盖价格的价格表文件，传给章节子进程
+        """
+        self.ledger_path = os.path.abspath(ledger_path)
+        self.prices = prices if prices is not None else dict(DEFAULT_PRICES)
+        self.budget = budget
+        self.run_id = run_id or uuid.uuid4().hex
+        self.batch_discount = batch_discount
+        self.price_table = os.path.abspath(price_table) if price_table else None
+        self.spent = 0.0
+        self.reserved = 0.0
+        self.exceeded = None
+        self._offset = 0
+        self._unpriced = set()
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._reservations_path = self.ledger_path + RESERVATIONS_SUFFIX
+        self._lock_path = self.ledger_path + LOCK_SUFFIX
+        self._reservation_key = f"{self.run_id}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(self.ledger_path), exist_ok=True)
+        if self.budget is not None:
+            atexit.register(self._clear_reservation)
+
+    def price_for(self, model: str) -> Optional[Dict[str, float]]:
+        """
+        查找模型价格：先精确匹配，再去掉快照日期后匹配；没有价格时警告一次并返回None
+
+        不按前缀借用其他模型的价格，否则 o3-mini、gpt-4o-audio-preview 等会按 o3、gpt-4o 计费。
+        """
+        price = self.prices.get(model) or self.prices.get(SNAPSHOT_SUFFIX.sub("", model))
+        if price is None and model not in self._unpriced:
+            self._unpriced.add(model)
+            print(f"[WARN]  价格表中没有模型 {model}，其费用记为0，不计入预算"
+                  f"（可在config.json的usage.prices或--price-table中补充）")
+        return price
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+             batch: bool = False) -> Optional[float]:
+        """计算费用（美元），价格表中没有该模型时返回None"""
+        price = self.price_for(model)
+        if price is None:
+            return None
+        cached_tokens = min(cached_tokens, prompt_tokens)
+        cost = ((prompt_tokens - cached_tokens) * price["input"]
+                + cached_tokens * price.get("cached_input", price["input"])
+                + completion_tokens * price["output"]) / 1_000_000
+        return cost * self.batch_discount if batch else cost
+
+    def _refresh(self):
+        """读取账本中新增的完整行，累加本次运行（包括其他进程）已花费的费用；调用方持有锁"""
+        if not os.path.exists(self.ledger_path):
+            return
+        with open(self.ledger_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        self._offset += len(complete)
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("run_id") == self.run_id:
+                self.spent += record.get("cost") or 0.0
+
+    def _read_reservations(self) -> Dict[str, float]:
+        """读取各进程的预约额度；调用方持有锁文件"""
+        try:
+            with open(self._reservations_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _publish_reserved(self, reservations: Dict[str, float] = None):
+        """把本进程当前的预约额度写入预约文件，额度为0时删除本进程的条目；调用方持有锁文件"""
+        reservations = self._read_reservations() if reservations is None else reservations
+        if self.reserved > 0:
+            reservations[self._reservation_key] = self.reserved
+        else:
+            reservations.pop(self._reservation_key, None)
+        tmp_path = f"{self._reservations_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(reservations, f)
+        os.replace(tmp_path, self._reservations_path)
+
+    def _clear_reservation(self):
+        """进程退出时清除本进程残留的预约"""
+        with self._lock:
+            self.reserved = 0.0
+            with _file_lock(self._lock_path):
+                self._publish_reserved()
+
+    def _try_reserve(self, estimate: float) -> bool:
+        """预约estimate，需要等待在途请求（包括其他进程的）结束时返回False；调用方持有锁"""
+        if self.budget is None:
+            self.reserved += estimate
+            return True
+        with _file_lock(self._lock_path):
+            self._refresh()
+            reservations = self._read_reservations()
+            prefix = self.run_id + ":"
+            others = sum(amount for key, amount in reservations.items()
+                         if key.startswith(prefix) and key != self._reservation_key)
+            if self.spent + others + self.reserved + estimate <= self.budget:
+                self.reserved += estimate
+                self._publish_reserved(reservations)
+                return True
+        if self.spent + estimate > self.budget:
+            self.exceeded = (f"已达到预算上限 ${self.budget:.2f}（已花费 ${self.spent:.4f}，"
+                             f"下一个请求最多 ${estimate:.4f}）")
+            raise BudgetExceededError(self.exceeded)
+        return False
+
+    def reserve(self, model: str, prompt_tokens: int, max_completion_tokens: int, batch: bool = False,
+                wait: bool = True) -> Optional[float]:
+        """
+        发出请求前按最大可能费用预约额度
+
+        加上在途请求的预约会超出预算时等待它们结束（wait=False时返回None，由调用方稍后重试）；
+        即使在途请求都结束也放不下时抛出BudgetExceededError，并记录为已超出预算。
+
+        Returns:
+            float: 预约的金额，请求结束后传给release
+        """
+        estimate = self.cost(model, prompt_tokens, max_completion_tokens, batch=batch) or 0.0
+        with self._released:
+            while not self._try_reserve(estimate):
+                if not wait:
+                    return None
+                self._released.wait(RESERVE_WAIT_INTERVAL)
+        return estimate
+
+    def release(self, reserved: float):
+        with self._released:
+            self.reserved = max(0.0, self.reserved - reserved)
+            if self.budget is not None:
+                with _file_lock(self._lock_path):
+                    self._publish_reserved()
+            self._released.notify_all()
+
+    def check(self):
+        """已有请求因预算被拒绝，或已花费的费用达到预算时抛出BudgetExceededError（在阶段之间调用）"""
+        if self.budget is None:
+            return
+        with self._lock:
+            self._refresh()
+            spent = self.spent
+        if self.exceeded:
+            raise BudgetExceededError(self.exceeded)
+        if spent >= self.budget:
+            raise BudgetExceededError(f"已达到预算上限 ${self.budget:.2f}（已花费 ${spent:.4f}）")
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+               estimated: bool = False, batch: bool = False) -> Dict[str, Any]:
+        """记录一次请求的用量，层级标签取自当前span"""
+        cost = self.cost(model, prompt_tokens, completion_tokens, cached_tokens, batch)
+        labels = current_labels()
+        record = {
+            "run_id": self.run_id, "time": round(time.time(), 3), "pid": os.getpid(), "model": model,
+            "paper": labels.get("paper", ""), "chapter": labels.get("chapter", ""),
+            "stage": labels.get("stage", ""), "page": labels.get("page", ""),
+            "prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens, "completion_tokens": completion_tokens,
+            "cost": round(cost, 6) if cost is not None else None, "estimated": estimated, "batch": batch
+        }
+        # 每条记录一次write调用，追加模式下多个进程的行不会互相穿插
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.ledger_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        return record
+
+    def records(self) -> List[Dict[str, Any]]:
+        """账本中本次运行的全部记录（包括章节子进程写入的记录）"""
+        return [record for record in read_ledger(self.ledger_path) if record.get("run_id") == self.run_id]
+
+
+_ledger: Optional[UsageLedger] = None
+
+
+def load_price_table(price_table_path: str) -> Dict[str, Dict[str, float]]:
+    """读取价格表JSON文件：{模型: {input, cached_input, output}}，单位为美元/百万token"""
+    with open(price_table_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def setup_usage_ledger(usage_config: Dict[str, Any] = None, run_dir: str = None, budget: float = None,
+                       price_table: str = None) -> Optional[UsageLedger]:
+    """
+    根据config.json中的usage配置和命令行参数设置记账
+
+    由master_pipeline启动的章节pipeline沿用父进程通过环境变量传入的账本、运行ID、预算和价格表；
+    否则账本写入 <run_dir>/usage.jsonl。价格表依次由内置价格、usage.prices、--price-table覆盖，
+    预算优先使用命令行参数，其次为usage.budget。
+
+    Returns:
+        UsageLedger: 账本，既没有继承的账本也没有run_dir时返回None
+    """
+    global _ledger
+    usage_config = usage_config or {}
+    inherited = {}
+    if os.environ.get(USAGE_ENV):
+        try:
+            inherited = json.loads(os.environ[USAGE_ENV])
+        except ValueError:
+            inherited = {}
+    ledger_path = inherited.get("path") or (os.path.join(run_dir, LEDGER_FILENAME) if run_dir else None)
+    if ledger_path is None:
+        _ledger = None
+        return None
+
+    prices = dict(DEFAULT_PRICES)
+    prices.update(usage_config.get('prices') or {})
+    price_table = inherited.get("price_table") or price_table
+    if price_table:
+        prices.update(load_price_table(price_table))
+    if "budget" in inherited:
+        budget = inherited["budget"]
+    elif budget is None:
+        budget = usage_config.get('budget')
+    _ledger = UsageLedger(ledger_path, prices, budget, inherited.get("run_id"),
+                          usage_config.get('batch_discount', DEFAULT_BATCH_DISCOUNT), price_table)
+    return _ledger
+
+
+def get_ledger() -> Optional[UsageLedger]:
+    return _ledger
+
+
+def usage_env(env: Dict[str, str] = None) -> Dict[str, str]:
+    """为章节子进程准备环境变量：共用同一个账本、运行ID、预算和价格表"""
+    env = dict(os.environ if env is None else env)
+    if _ledger is not None:
+        env[USAGE_ENV] = json.dumps({
+            "path": _ledger.ledger_path, "run_id": _ledger.run_id, "budget": _ledger.budget,
+            "price_table": _ledger.price_table
+        }, ensure_ascii=False)
+    return env
+
+
+def _estimate_prompt_tokens(request: Dict[str, Any]) -> int:
+    return estimate_request_tokens(request) - (request.get("max_tokens") or 0)
+
+
+def reserve_budget(request: Dict[str, Any], batch: bool = False) -> float:
+    """按请求的估算输入token和max_tokens预约预算，超出时抛出BudgetExceededError；未启用记账时返回0"""
+    if _ledger is None:
+        return 0.0
+    return _ledger.reserve(request["model"], _estimate_prompt_tokens(request), request.get("max_tokens") or 0, batch)
+
+
+async def reserve_budget_async(request: Dict[str, Any]) -> float:
+    """reserve_budget的异步版本：等待在途请求释放预算时不阻塞事件循环"""
+    if _ledger is None:
+        return 0.0
+    while True:
+        reserved = _ledger.reserve(request["model"], _estimate_prompt_tokens(request),
+                                   request.get("max_tokens") or 0, wait=False)
+        if reserved is not None:
+            return reserved
+        await asyncio.sleep(ASYNC_POLL_INTERVAL)
+
+
+def release_budget(reserved: float):
+    if _ledger is not None and reserved:
+        _ledger.release(reserved)
+
+
+def check_budget():
+    """已花费的费用达到预算时抛出BudgetExceededError，未启用记账或未设置预算时不做任何事"""
+    if _ledger is not None:
+        _ledger.check()
+
+
+def _usage_field(usage, name: str) -> int:
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return value or 0
+
+
+def record_call(request: Dict[str, Any], usage=None, output_text: str = None, batch: bool = False):
+    """
+    记录一次请求的用量
+
+    Args:
+        request: chat.completions请求参数
+        usage: response.usage（对象或Batch结果中的字典），为None时按请求和输出的字符数估算
+        output_text: 模型输出，仅在没有usage时用于估算输出token
+        batch: 是否为Batch API请求
+    """
+    if _ledger is None:
+        return
+    if usage is None:
+        _ledger.record(request["model"], _estimate_prompt_tokens(request),
+                       len(output_text or "") // CHARS_PER_TOKEN, estimated=True, batch=batch)
+        return
+    details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+    _ledger.record(request["model"], _usage_field(usage, "prompt_tokens"), _usage_field(usage, "completion_tokens"),
+                   _usage_field(details, "cached_tokens") if details else 0, batch=batch)
+
+
+def read_ledger(ledger_path: str) -> List[Dict[str, Any]]:
+    """读取账本文件，跳过写了一半的行"""
+    records = []
+    if not os.path.exists(ledger_path):
+        return records
+    with open(ledger_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost": 0.0, "estimated": 0}
+
+
+def _add(totals: Dict[str, Any], record: Dict[str, Any]):
+    totals["calls"] += 1
+    for field in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+        totals[field] += record.get(field) or 0
+    totals["cost"] += record.get("cost") or 0.0
+    totals["estimated"] += 1 if record.get("estimated") else 0
+
+
+def summarize_usage(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按论文、章节、阶段汇总用量和费用
+
+    Returns:
+        dict: total、papers（{论文: 合计}）、chapters（{论文/章节: 合计}）、stages（{论文/章节/阶段: 合计}）、models
+    """
+    summary = {"total": _empty_totals(), "papers": {}, "chapters": {}, "stages": {}, "models": {}}
+    for record in records:
+        paper, chapter, stage = record.get("paper", ""), record.get("chapter", ""), record.get("stage", "")
+        _add(summary["total"], record)
+        _add(summary["papers"].setdefault(paper, _empty_totals()), record)
+        _add(summary["chapters"].setdefault("/".join(filter(None, (paper, chapter))), _empty_totals()), record)
+        _add(summary["stages"].setdefault("/".join(filter(None, (paper, chapter, stage))), _empty_totals()), record)
+        _add(summary["models"].setdefault(record.get("model", ""), _empty_totals()), record)
+    return summary
+
+
+def _format_totals(totals: Dict[str, Any]) -> str:
+    average = totals["prompt_tokens"] // totals["calls"] if totals["calls"] else 0
+    cached = f"缓存 {totals['cached_tokens']}，" if totals["cached_tokens"] else ""
+    return (f"${totals['cost']:.4f}，{totals['calls']} 次请求，输入 {totals['prompt_tokens']} token"
+            f"（{cached}平均 {average}/次），输出 {totals['completion_tokens']} token")
+
+
+def print_usage_summary(records: List[Dict[str, Any]] = None, ledger_path: str = None):
+    """打印token用量与费用：合计、按论文/章节/阶段分组（按费用从高到低），以及预算使用情况"""
+    budget = None
+    if records is None:
+        if _ledger is None:
+            return
+        records, ledger_path, budget = _ledger.records(), _ledger.ledger_path, _ledger.budget
+    summary = summarize_usage(records)
+    total = summary["total"]
+    if not total["calls"]:
+        return
+    print(f"\n[PROG] Token用量与费用{f' ({ledger_path})' if ledger_path else ''}:")
+    print(f"    合计: {_format_totals(total)}")
+    if total["estimated"]:
+        print(f"    其中 {total['estimated']} 次请求的响应中没有usage，token数为按字符估算")
+    groups = [("论文", summary["papers"]), ("章节", summary["chapters"]), ("阶段", summary["stages"])]
+    for title, group in groups:
+        # 只有一个分组且与上一级相同时不重复打印
+        if len(group) <= 1 and title != "阶段":
+            continue
+        print(f"    按{title}:")
+        for name, totals in sorted(group.items(), key=lambda item: -item[1]["cost"]):
+            share = totals["cost"] / total["cost"] * 100 if total["cost"] else 0.0
+            print(f"      {name or '(未标记)'}: {_format_totals(totals)} ({share:.0f}%)")
+    if budget is not None:
+        print(f"    预算: ${total['cost']:.4f} / ${budget:.2f} ({total['cost'] / budget * 100 if budget else 100:.0f}%)")
+
+
+def write_usage_summary(output_path: str = None) -> Optional[str]:
+    """把本次运行的用量汇总和使用的价格表写入运行目录的usage_summary.json，返回文件路径"""
+    if _ledger is None:
+        return None
+    output_path = output_path or os.path.join(os.path.dirname(_ledger.ledger_path), SUMMARY_FILENAME)
+    summary = summarize_usage(_ledger.records())
+    summary.update({
+        "run_id": _ledger.run_id, "ledger": _ledger.ledger_path, "budget": _ledger.budget,
+        "currency": "USD", "price_unit": "per 1M tokens", "prices": _ledger.prices
+    })
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='汇总token用量与费用账本')
+    parser.add_argument('ledger_file', help='usage.jsonl账本文件')
+    parser.add_argument('--all', action='store_true', help='汇总文件中的所有运行 (默认: 只汇总最后一次运行)')
+    parser.add_argument('--price-table', help='按该价格表重新计算费用（JSON: {模型: {input, cached_input, output}}，美元/百万token）')
+    args = parser.parse_args()
+
+    records = read_ledger(args.ledger_file)
+    if not records:
+        print(f"[WARN]  账本中没有记录: {args.ledger_file}")
+        return
+    if not args.all:
+        records = [record for record in records if record.get("run_id") == records[-1].get("run_id")]
+    if args.price_table:
+        prices = dict(DEFAULT_PRICES)
+        prices.update(load_price_table(args.price_table))
+        ledger = UsageLedger(args.ledger_file, prices)
+        for record in records:
+            record["cost"] = ledger.cost(record.get("model", ""), record.get("prompt_tokens", 0),
+                                         record.get("completion_tokens", 0), record.get("cached_tokens", 0),
+                                         record.get("batch", False))
+    print_usage_summary(records, args.ledger_file)
+
+
+if __name__ == "__main__":
+    main()
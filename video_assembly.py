@@ -0,0 +1,316 @@
+"""
+视频合成
+
+把每页渲染出的视频和该页的讲解音频合成为一个片段，再把所有片段按顺序拼接成最终视频：
+- 视频流始终直接复制（-c:v copy），不重新编码；
+- 所有音频都是参数一致的AAC时音频也直接复制，否则统一转为AAC（只编码音频，耗时很短），
+  保证各片段的音频参数一致，拼接时可以直接复制；
+- 各页的合成在多个ffmpeg进程中并行执行，合成结果保存在 segments/ 中，旁边记录输入列表的哈希，
+  输入列表和文件都没有变化时直接复用；
+- 拼接使用concat demuxer，不重新编码；
+- 没有讲解音频的页面补一段静音，保证每个片段都有音轨。
+
+使用方法:
+python video_assembly.py video_dir audio_dir output.mp4 [--list videos.txt | --pages 1 2 3] [--audio-template voice{page}.mp4]
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from audio_timing import find_audio_files, get_audio_duration
+from tracing import propagate, traced
+
+# 需要转码时统一使用的音频参数
+AUDIO_ENCODE_ARGS = ['-c:a', 'aac', '-b:a', '192k', '-ar', '44100', '-ac', '2']
+SILENCE_SOURCE = 'anullsrc=r=44100:cl=stereo'
+DEFAULT_FFMPEG_TIMEOUT = 600  # 单个ffmpeg进程的超时（秒）
+
+
+def read_page_list(list_path: str) -> List[str]:
+    """
+    读取页面顺序列表（与ffmpeg concat列表相同的 file 'xxx.mp4' 格式，也可以每行一个文件名）
+
+    Returns:
+        list: 按顺序排列的视频路径（相对路径按列表所在目录解析）
+    """
+    base_dir = os.path.dirname(os.path.abspath(list_path))
+    videos = []
+    with open(list_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('file '):
+                line = line[5:].strip().strip("'\"")
+            videos.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return videos
+
+
+def probe_audio(path: str) -> Optional[dict]:
+    """用ffprobe读取第一个音轨的编码参数（codec_name、sample_rate、channels），无法读取时返回None"""
+    if not shutil.which('ffprobe'):
+        return None
+    completed = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=codec_name,sample_rate,channels',
+         '-of', 'json', path],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    try:
+        streams = json.loads(completed.stdout).get('streams', [])
+    except ValueError:
+        return None
+    return streams[0] if streams else None
+
+
+def choose_audio_args(audio_paths: List[Optional[str]]) -> Tuple[List[str], str]:
+    """
+    选择合成时的音频参数
+
+    所有页面都有音频且都是采样率、声道数相同的AAC时直接复制，否则统一转码为AAC。
+
+    Returns:
+        tuple: (ffmpeg音频参数, 模式 copy / aac)
+    """
+    if audio_paths and all(audio_paths):
+        infos = [probe_audio(path) for path in audio_paths]
+        if all(infos) and all(info.get('codec_name') == 'aac' for info in infos) \
+                and len({(info.get('sample_rate'), info.get('channels')) for info in infos}) == 1:
+            return ['-c:a', 'copy'], 'copy'
+    return AUDIO_ENCODE_ARGS, 'aac'
+
+
+def _concat_list_line(path: str) -> str:
+    escaped = os.path.abspath(path).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+def write_concat_list(paths: List[str], list_path: str):
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.writelines(_concat_list_line(path) for path in paths)
+
+
+def segment_inputs_hash(videos: List[str], audio: Optional[str], audio_args: List[str]) -> str:
+    """片段输入的哈希：各场景视频路径、音频路径（没有音频时为none）和音频参数，任何一项变化都需要重新合成"""
+    lines = [os.path.abspath(video) for video in videos]
+    lines.append(os.path.abspath(audio) if audio else 'none')
+    lines.append(' '.join(audio_args))
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def _inputs_hash_path(segment: str) -> str:
+    return f"{segment}.inputs"
+
+
+def _is_up_to_date(output: str, inputs: List[str], inputs_hash: str) -> bool:
+    """片段存在、记录的输入哈希一致且没有比片段更新的输入时才复用"""
+    if not os.path.exists(output):
+        return False
+    try:
+        with open(_inputs_hash_path(output), 'r', encoding='utf-8') as f:
+            if f.read().strip() != inputs_hash:
+                return False
+    except OSError:
+        return False
+    output_mtime = os.path.getmtime(output)
+    return all(os.path.getmtime(path) <= output_mtime for path in inputs)
+
+
+@traced('page', name_arg='page', stage='assemble')
+def mux_page(page: str, videos: List[str], audio: Optional[str], segment: str, audio_args: List[str],
+             timeout: float = DEFAULT_FFMPEG_TIMEOUT) -> dict:
+    """
+    合成一页：视频流复制，音频按audio_args复制或转码；多场景页面先用concat demuxer串联各场景视频
+
+    Returns:
+        dict: page、segment、status（muxed / reused / failed）、duration、error
+    """
+    start_time = time.time()
+    result = {'page': page, 'segment': segment, 'status': 'failed', 'duration': 0.0, 'error': None}
+    inputs = videos + ([audio] if audio else [])
+    inputs_hash = segment_inputs_hash(videos, audio, audio_args)
+    if _is_up_to_date(segment, inputs, inputs_hash):
+        result['status'] = 'reused'
+        return result
+
+    command = ['ffmpeg', '-y', '-v', 'error']
+    list_path = None
+    if len(videos) > 1:
+        list_path = f"{segment}.scenes.txt"
+        write_concat_list(videos, list_path)
+        command += ['-f', 'concat', '-safe', '0', '-i', list_path]
+    else:
+        command += ['-i', videos[0]]
+    if audio:
+        command += ['-i', audio]
+    else:
+        # 没有讲解音频时补一段与视频等长的静音
+        durations = [get_audio_duration(video) for video in videos]
+        if all(durations):
+            command += ['-f', 'lavfi', '-t', f"{sum(durations):.3f}", '-i', SILENCE_SOURCE]
+        else:
+            command += ['-f', 'lavfi', '-i', SILENCE_SOURCE, '-shortest']
+    tmp_path = f"{segment}.part.mp4"
+    command += ['-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy'] + audio_args + [tmp_path]
+
+    try:
+        completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=timeout)
+        if completed.returncode == 0:
+            os.replace(tmp_path, segment)
+            with open(_inputs_hash_path(segment), 'w', encoding='utf-8') as f:
+                f.write(inputs_hash)
+            result['status'] = 'muxed'
+        else:
+            result['error'] = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"ffmpeg退出码 {completed.returncode}"
+    except subprocess.TimeoutExpired:
+        result['error'] = f"合成超时 ({timeout:.0f}秒)"
+    finally:
+        for path in (tmp_path, list_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+    result['duration'] = time.time() - start_time
+    return result
+
+
+def concat_segments(segments: List[str], output_path: str, timeout: float = DEFAULT_FFMPEG_TIMEOUT) -> Optional[str]:
+    """用concat demuxer拼接所有片段（直接复制，不重新编码），成功返回None，失败返回错误信息"""
+    list_path = f"{output_path}.segments.txt"
+    write_concat_list(segments, list_path)
+    try:
+        completed = subprocess.run(
+            ['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return f"拼接超时 ({timeout:.0f}秒)"
+    finally:
+        os.remove(list_path)
+    if completed.returncode != 0:
+        return completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"ffmpeg退出码 {completed.returncode}"
+    return None
+
+
+def assemble_video(pages: List[Tuple[str, List[str]]], audio_files: Dict[str, str], output_path: str,
+                   work_dir: str = None, workers: int = None) -> dict:
+    """
+    合成最终视频
+
+    Args:
+        pages: 按顺序排列的 (页面名, 该页各场景的视频路径)
+        audio_files: {页面名: 讲解音频路径}，缺少音频的页面补静音
+        output_path: 最终视频路径
+        work_dir: 片段保存目录，默认为输出文件旁的 segments/
+        workers: 同时运行的ffmpeg进程数，默认为CPU核数
+
+    Returns:
+        dict: output、segments（每页的合成结果）、timings（各步骤耗时）、error
+    """
+    report = {'output': output_path, 'segments': [], 'timings': {}, 'error': None}
+    if not shutil.which('ffmpeg'):
+        report['error'] = "未找到ffmpeg，请先安装ffmpeg并加入PATH"
+        return report
+    if not pages:
+        report['error'] = "没有需要合成的页面"
+        return report
+
+    total_start = time.time()
+    work_dir = work_dir or os.path.join(os.path.dirname(os.path.abspath(output_path)), 'segments')
+    os.makedirs(work_dir, exist_ok=True)
+
+    start_time = time.time()
+    page_audio = [audio_files.get(page) for page, _ in pages]
+    audio_args, audio_mode = choose_audio_args(page_audio)
+    report['audio_mode'] = audio_mode
+    report['timings']['probe'] = time.time() - start_time
+
+    start_time = time.time()
+    results = [None] * len(pages)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pages)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for index, ((page, videos), audio) in enumerate(zip(pages, page_audio)):
+            segment = os.path.join(work_dir, f"{index + 1:03d}_{page}.{audio_mode}.mp4")
+            futures[executor.submit(propagate(mux_page), page, videos, audio, segment, audio_args)] = index
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    report['segments'] = results
+    report['timings']['mux'] = time.time() - start_time
+
+    failed = [result for result in results if result['status'] == 'failed']
+    if failed:
+        report['error'] = f"{len(failed)} 页合成失败"
+        report['timings']['total'] = time.time() - total_start
+        return report
+
+    start_time = time.time()
+    report['error'] = concat_segments([result['segment'] for result in results], output_path)
+    report['timings']['concat'] = time.time() - start_time
+    report['timings']['total'] = time.time() - total_start
+    return report
+
+
+def print_assembly_report(report: dict):
+    """打印合成结果和各步骤耗时"""
+    labels = {'muxed': "[OK]", 'reused': "[SKIP]", 'failed': "[ERR]"}
+    if report['segments']:
+        print(f"[LIST] 逐页合成结果 (音频{'直接复制' if report.get('audio_mode') == 'copy' else '统一转码为AAC'}):")
+        for result in report['segments']:
+            detail = {'muxed': f"{result['duration']:.2f} 秒", 'reused': "输入未变化，复用已有片段"}.get(result['status'], result['error'])
+            print(f"   {labels[result['status']]} {result['page']}: {detail}")
+    timings = report['timings']
+    if timings:
+        print(f"[TIME] 各步骤耗时:")
+        for step, label in (('probe', '读取音频参数'), ('mux', '并行合成各页'), ('concat', '拼接'), ('total', '总计')):
+            if step in timings:
+                print(f"   • {label}: {timings[step]:.2f} 秒")
+    if report['error']:
+        print(f"[ERR] 视频合成失败: {report['error']}")
+    else:
+        print(f"✨ 最终视频已保存到: {report['output']}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='把各页视频与讲解音频合成并拼接为最终视频（流复制，不重新编码视频）')
+    parser.add_argument('video_dir', help='各页视频所在目录')
+    parser.add_argument('audio_dir', help='讲解音频目录')
+    parser.add_argument('output', help='最终视频路径')
+    parser.add_argument('--list', help='页面顺序列表，格式同 videos.txt (file \'xxx.mp4\')')
+    parser.add_argument('--pages', nargs='+', help='按顺序列出页面名（对应 video_dir 中的 <页面名>.mp4）')
+    parser.add_argument('--audio-template', help='音频文件名模板，如 voice{page}.mp4 (默认: 按页面名匹配 <页面名>[_speech].wav 等)')
+    parser.add_argument('--workers', type=int, default=None, help='同时运行的ffmpeg进程数 (默认: CPU核数)')
+    args = parser.parse_args()
+
+    if args.list:
+        videos = read_page_list(args.list)
+    elif args.pages:
+        videos = [os.path.join(args.video_dir, f"{page}.mp4") for page in args.pages]
+    else:
+        parser.error("需要通过 --list 或 --pages 指定页面顺序")
+    missing = [video for video in videos if not os.path.exists(video)]
+    if missing:
+        print(f"[ERR] 视频不存在: {', '.join(missing)}")
+        sys.exit(1)
+
+    pages = [(os.path.splitext(os.path.basename(video))[0], [video]) for video in videos]
+    if args.audio_template:
+        audio_files = {page: os.path.join(args.audio_dir, args.audio_template.format(page=page)) for page, _ in pages}
+        audio_files = {page: path for page, path in audio_files.items() if os.path.exists(path)}
+    else:
+        audio_files = find_audio_files(args.audio_dir)
+
+    report = assemble_video(pages, audio_files, args.output, workers=args.workers)
+    print_assembly_report(report)
+    if report['error']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,679 @@
+"""
+Manim代码时长估算与补齐
+
+用AST静态估算每个Scene的动画时长（不执行代码），并可在文件末尾补上等待时间以对齐目标时长。
+
+估算规则（与Manim CE一致）：
+- self.wait() 默认1秒，self.play() 的时长为其中最长动画的 run_time（默认1秒）；
+- 显式的 run_time= / duration= 及 .set_run_time() 按给出的值计算，参数可以是常量、
+  模块级或类级常量以及它们的简单运算；
+- AnimationGroup / LaggedStart / Succession 按 lag_ratio（默认 0 / 0.05 / 1）计算整体时长；
+- Write 文字对象时按字形数取默认时长（少于15个1秒，否则2秒）；
+- for 循环按迭代次数展开，辅助方法（self.xxx()、模块级函数和构造方法中定义的局部函数）会进入函数体计算；
+- 注释掉的代码不计入；无法静态确定的参数、条件和循环次数按默认值估算并给出警告。
+
+补齐时在文件末尾加上标记注释、self.wait(差值) 和 FadeOut；再次对齐时先移除上次补齐的内容，可重复执行。
+
+使用方法:
+python wait_time_calculator.py <目标时长（秒）> <manim文件路径>
+python wait_time_calculator.py --batch generated_code_dir [--output durations.json]
+"""
+
+import argparse
+import ast
+import glob
+import json
+import operator
+import os
 import re
 import sys
-import ast
+
+from page_utils import find_scene_classes, get_sort_key
+
+DEFAULT_WAIT_TIME = 1.0   # self.wait() 不带参数时的等待时长
+DEFAULT_RUN_TIME = 1.0    # 动画默认的 run_time
+# 组合动画的默认 lag_ratio
+GROUP_LAG_RATIOS = {'AnimationGroup': 0.0, 'LaggedStart': 0.05, 'Succession': 1.0}
+# 默认 run_time 不是1秒的动画
+ANIMATION_RUN_TIMES = {'LaggedStartMap': 2.0}
+# Write 的默认时长取决于字形数：少于15个为1秒，否则为2秒
+WRITE_LONG_RUN_TIME = 2.0
+WRITE_LONG_GLYPHS = 15
+TEXT_CLASSES = {'Text', 'MarkupText', 'Paragraph', 'Tex', 'MathTex', 'Title', 'BulletedList'}
+GROUP_CLASSES = {'VGroup', 'Group'}
+MAX_LOOP_ITERATIONS = 1000  # 超过这个次数的循环不再逐次展开，按单次耗时乘以次数计算
+MAX_CALL_DEPTH = 20         # 辅助方法的最大递归深度
+FADE_OUT_TIME = 1.0         # 补齐时末尾 FadeOut 的时长
+PADDING_MARKER = "# 对齐目标时长（自动添加，重新对齐时会被替换）"
+PADDING_PATTERN = re.compile(
+    r'\n[ \t]*' + re.escape(PADDING_MARKER) + r'\n[ \t]*self\.wait\([^)\n]*\)\n[ \t]*self\.play\(FadeOut\(\*self\.mobjects\)\)[ \t]*(?=\n|$)'
+)
+
+_UNKNOWN = object()  # 无法静态求值
+_BINARY_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow
+}
+_COMPARE_OPERATORS = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt, ast.LtE: operator.le,
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.In: lambda a, b: a in b, ast.NotIn: lambda a, b: a not in b
+}
+_SAFE_FUNCTIONS = {
+    'min': min, 'max': max, 'abs': abs, 'round': round, 'float': float, 'int': int, 'len': len, 'sum': sum,
+    'range': range, 'list': list, 'tuple': tuple,
+    'enumerate': lambda *args: list(enumerate(*args)), 'zip': lambda *args: list(zip(*args)),
+    'reversed': lambda *args: list(reversed(*args)), 'sorted': sorted
+}
+
+
+class _Deferred:
+    """绑定到变量上的表达式（通常是动画对象），在用到时按定义处的变量求时长"""
+
+    def __init__(self, node, env):
+        self.node = node
+        self.env = env
+
+
+def _call_name(func) -> str:
+    """被调用对象的名称：FadeIn(...) 为 FadeIn，manim.FadeIn(...) / mob.shift(...) 为属性名"""
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return ""
+
+
+def _base_name(node) -> str:
+    if isinstance(node, ast.Subscript):
+        node = node.value
+    return _call_name(node)
+
+
+def _keyword(call, name):
+    return next((keyword.value for keyword in call.keywords if keyword.arg == name), None)
+
+
+def _group_duration(durations, lag_ratio) -> float:
+    """组合动画的时长：第i个动画在前一个动画开始 lag_ratio*其时长 后开始，整体到最后结束的动画为止"""
+    start = end = 0.0
+    for duration in durations:
+        end = max(end, start + duration)
+        start += duration * lag_ratio
+    return end
+
+
+class _SceneTimer:
+    """逐条"执行"一个Scene的构造方法，累计 wait 和 play 的时长"""
+
+    def __init__(self, classes, functions, module_env):
+        self.classes = classes
+        self.functions = functions
+        self.module_env = module_env
+        self.warnings = []
+        self.play_count = 0
+        self.wait_count = 0
+
+    def warn(self, node, message):
+        warning = f"第{getattr(node, 'lineno', '?')}行: {message}"
+        if warning not in self.warnings:
+            self.warnings.append(warning)
+
+    def find_method(self, class_name, method_name, visited=None):
+        """在类及其（本文件中定义的）父类中查找方法"""
+        visited = visited or set()
+        if class_name not in self.classes or class_name in visited:
+            return None
+        visited.add(class_name)
+        node = self.classes[class_name]
+        for item in node.body:
+            if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == method_name:
+                return item
+        for base in node.bases:
+            method = self.find_method(_base_name(base), method_name, visited)
+            if method is not None:
+                return method
+        return None
+
+    def class_attributes(self, class_name, visited=None):
+        """类体中的常量赋值（父类在前，子类覆盖）"""
+        visited = visited or set()
+        if class_name not in self.classes or class_name in visited:
+            return {}
+        visited.add(class_name)
+        node = self.classes[class_name]
+        attributes = {}
+        for base in node.bases:
+            attributes.update(self.class_attributes(_base_name(base), visited))
+        env = dict(self.module_env)
+        for item in node.body:
+            if isinstance(item, ast.Assign):
+                value = self.value(item.value, env)
+                for target in item.targets:
+                    if isinstance(target, ast.Name) and value is not _UNKNOWN:
+                        attributes[target.id] = value
+        return attributes
+
+    def run(self, class_name) -> float:
+        construct = self.find_method(class_name, 'construct')
+        if construct is None:
+            self.warn(self.classes[class_name], "未找到construct方法")
+            return 0.0
+        self.class_name = class_name
+        self.attributes = self.class_attributes(class_name)
+        env = dict(self.module_env)
+        env['__self__'] = {construct.args.args[0].arg} if construct.args.args else {'self'}
+        return self.block(construct.body, env, 0)[0]
+
+    # ---- 求值 ----
+
+    def is_self(self, node, env) -> bool:
+        return isinstance(node, ast.Name) and node.id in env.get('__self__', ())
+
+    def value(self, node, env):
+        """对常量表达式求值，无法确定时返回_UNKNOWN（不会执行任意代码）"""
+        try:
+            result = self._value(node, env)
+        except Exception:
+            return _UNKNOWN
+        return _UNKNOWN if isinstance(result, _Deferred) else result
+
+    def _value(self, node, env):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            binding = env.get(node.id, _UNKNOWN)
+            if isinstance(binding, _Deferred) and isinstance(binding.node, (ast.List, ast.Tuple)):
+                # 动画列表：按定义处求值，保留元素个数
+                return self._value(binding.node, binding.env)
+            return binding
+        if isinstance(node, ast.Attribute) and self.is_self(node.value, env):
+            return self.attributes.get(node.attr, _UNKNOWN)
+        if isinstance(node, (ast.List, ast.Tuple)):
+            # 元素未知时仍保留长度，供循环计算次数
+            return [self.value(element, env) for element in node.elts]
+        if isinstance(node, ast.UnaryOp):
+            operand = self._value(node.operand, env)
+            if operand is _UNKNOWN:
+                return _UNKNOWN
+            if isinstance(node.op, ast.USub):
+                return -operand
+            if isinstance(node.op, ast.UAdd):
+                return +operand
+            if isinstance(node.op, ast.Not):
+                return not operand
+            return _UNKNOWN
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            left, right = self._value(node.left, env), self._value(node.right, env)
+            if left is _UNKNOWN or right is _UNKNOWN:
+                return _UNKNOWN
+            if isinstance(node.op, ast.Pow) and abs(right) > 64:
+                return _UNKNOWN
+            return _BINARY_OPERATORS[type(node.op)](left, right)
+        if isinstance(node, ast.BoolOp):
+            values = [self._value(value, env) for value in node.values]
+            if any(value is _UNKNOWN for value in values):
+                return _UNKNOWN
+            return all(values) if isinstance(node.op, ast.And) else any(values)
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE_OPERATORS:
+            left, right = self._value(node.left, env), self._value(node.comparators[0], env)
+            if left is _UNKNOWN or right is _UNKNOWN:
+                return _UNKNOWN
+            return _COMPARE_OPERATORS[type(node.ops[0])](left, right)
+        if isinstance(node, ast.Subscript):
+            container, index = self._value(node.value, env), self._value(node.slice, env)
+            if container is _UNKNOWN or index is _UNKNOWN:
+                return _UNKNOWN
+            return container[index]
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _SAFE_FUNCTIONS \
+                and node.func.id not in env and not node.keywords:
+            args = [self._value(arg, env) for arg in node.args]
+            if any(arg is _UNKNOWN or isinstance(arg, ast.AST) for arg in args):
+                return _UNKNOWN
+            return _SAFE_FUNCTIONS[node.func.id](*args)
+        return _UNKNOWN
+
+    def bind(self, node, env):
+        """
+        变量绑定的值：能求值时为常量，否则保留表达式以便之后计算动画时长
+
+        列表和元组中有元素无法求值时（如 [FadeIn(a, run_time=3), FadeIn(b)]）同样保留表达式，
+        否则元素会变成未知值，*anims 展开时丢失各动画的时长。
+        """
+        value = self.value(node, env)
+        if value is _UNKNOWN or (isinstance(node, (ast.List, ast.Tuple)) and any(item is _UNKNOWN for item in value)):
+            return _Deferred(node, env)
+        return value
+
+    def assign(self, target, value, env):
+        if isinstance(target, ast.Name):
+            env[target.id] = value
+        elif isinstance(target, ast.Attribute) and self.is_self(target.value, env):
+            self.attributes[target.attr] = value
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            if isinstance(value, _Deferred) and isinstance(value.node, (ast.Tuple, ast.List)) \
+                    and len(value.node.elts) == len(target.elts) \
+                    and not any(isinstance(element, ast.Starred) for element in value.node.elts):
+                for element, item in zip(target.elts, value.node.elts):
+                    self.assign(element, self.bind(item, value.env), env)
+            elif isinstance(value, (list, tuple)) and len(value) == len(target.elts):
+                for element, item in zip(target.elts, value):
+                    self.assign(element, item, env)
+            else:
+                for element in target.elts:
+                    self.assign(element, _UNKNOWN, env)
+
+    def number(self, node, env, default, description) -> float:
+        value = self.value(node, env)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            self.warn(node, f"无法静态确定{description}: {ast.unparse(node)}，按 {default:g} 秒计算")
+            return default
+        return float(value)
+
+    # ---- 语句 ----
+
+    def block(self, statements, env, depth):
+        """顺序执行语句，返回 (耗时, 是否遇到return)"""
+        total = 0.0
+        for statement in statements:
+            elapsed, returned = self.statement(statement, env, depth)
+            total += elapsed
+            if returned:
+                return total, True
+        return total, False
+
+    def statement(self, node, env, depth):
+        if isinstance(node, ast.Expr):
+            return self.expression(node.value, env, depth), False
+        if isinstance(node, ast.Return):
+            return (self.expression(node.value, env, depth) if node.value else 0.0), True
+        if isinstance(node, (ast.Assign, ast.AnnAssign)):
+            if node.value is None:
+                return 0.0, False
+            elapsed = self.expression(node.value, env, depth)
+            value = self.bind(node.value, env)
+            for target in (node.targets if isinstance(node, ast.Assign) else [node.target]):
+                self.assign(target, value, env)
+            return elapsed, False
+        if isinstance(node, ast.AugAssign):
+            elapsed = self.expression(node.value, env, depth)
+            current = self.value(node.target, env)
+            increment = self.value(node.value, env)
+            result = _UNKNOWN
+            if current is not _UNKNOWN and increment is not _UNKNOWN and type(node.op) in _BINARY_OPERATORS:
+                try:
+                    result = _BINARY_OPERATORS[type(node.op)](current, increment)
+                except Exception:
+                    result = _UNKNOWN
+            self.assign(node.target, result, env)
+            return elapsed, False
+        if isinstance(node, ast.For):
+            return self.loop(node, env, depth)
+        if isinstance(node, ast.While):
+            self.warn(node, "while循环的次数无法静态确定，按执行1次计算")
+            return self.block(node.body, env, depth)
+        if isinstance(node, ast.If):
+            condition = self.value(node.test, env)
+            if condition is not _UNKNOWN:
+                return self.block(node.body if condition else node.orelse, env, depth)
+            self.warn(node, f"条件无法静态判断: {ast.unparse(node.test)}，按耗时较长的分支计算")
+            branches = [self.block(node.body, dict(env), depth), self.block(node.orelse, dict(env), depth)]
+            return max(branches)
+        if isinstance(node, (ast.With, ast.AsyncWith)):
+            return self.block(node.body, env, depth)
+        if isinstance(node, ast.Try):
+            elapsed, returned = self.block(node.body, env, depth)
+            if not returned:
+                extra, returned = self.block(node.orelse, env, depth)
+                elapsed += extra
+            extra, final_returned = self.block(node.finalbody, env, depth)
+            return elapsed + extra, returned or final_returned
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            env[node.name] = node
+        return 0.0, False
+
+    def loop(self, node, env, depth):
+        iterable = self.value(node.iter, env)
+        try:
+            count = len(iterable) if iterable is not _UNKNOWN else None
+        except TypeError:
+            count = None
+
+        if count is None:
+            self.warn(node, f"循环次数无法静态确定: {ast.unparse(node.iter)}，按执行1次计算")
+            self.assign(node.target, _UNKNOWN, env)
+            elapsed, returned = self.block(node.body, env, depth)
+        elif count <= MAX_LOOP_ITERATIONS:
+            elapsed, returned = 0.0, False
+            for item in iterable:
+                self.assign(node.target, item, env)
+                extra, returned = self.block(node.body, env, depth)
+                elapsed += extra
+                if returned:
+                    break
+        else:
+            self.assign(node.target, _UNKNOWN, env)
+            elapsed, returned = self.block(node.body, env, depth)
+            elapsed *= count
+        if not returned and node.orelse:
+            extra, returned = self.block(node.orelse, env, depth)
+            elapsed += extra
+        return elapsed, returned
+
+    # ---- 调用 ----
+
+    def expression(self, node, env, depth) -> float:
+        """表达式语句中 self.wait / self.play / 辅助函数调用的耗时"""
+        if not isinstance(node, ast.Call):
+            return 0.0
+        func = node.func
+        if isinstance(func, ast.Attribute) and self.is_self(func.value, env):
+            if func.attr == 'wait':
+                self.wait_count += 1
+                duration = node.args[0] if node.args else _keyword(node, 'duration')
+                return DEFAULT_WAIT_TIME if duration is None else self.number(duration, env, DEFAULT_WAIT_TIME, "等待时长")
+            if func.attr == 'play':
+                self.play_count += 1
+                return self.play_duration(node, env)
+        function, bound = self.resolve_function(func, env)
+        if function is not None:
+            return self.invoke(function, node, env, depth, bound)
+        return 0.0
+
+    def resolve_function(self, func, env):
+        """被调用的本文件函数：返回 (函数定义, 是否为self的方法)，不是本文件定义的函数时为 (None, False)"""
+        if isinstance(func, ast.Attribute) and self.is_self(func.value, env):
+            return self.find_method(self.class_name, func.attr), True
+        if isinstance(func, ast.Name):
+            function = env.get(func.id)
+            if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                function = self.functions.get(func.id)
+            return function, False
+        return None, False
+
+    def invoke(self, function, call, env, depth, bound) -> float:
+        """进入辅助函数体计算耗时"""
+        if depth >= MAX_CALL_DEPTH:
+            self.warn(call, f"调用层数超过 {MAX_CALL_DEPTH}，{function.name} 不再展开")
+            return 0.0
+        return self.block(function.body, self.bind_arguments(function, call, env, bound), depth + 1)[0]
+
+    def bind_arguments(self, function, call, env, bound) -> dict:
+        """按调用处的实参构造函数体的变量环境，能确定的参数按常量绑定，传入的self记为别名"""
+        local_env = dict(self.module_env)
+        local_env.update({name: value for name, value in env.items() if isinstance(value, (ast.FunctionDef, ast.AsyncFunctionDef))})
+        params = function.args.posonlyargs + function.args.args
+        self_names = set()
+        if bound and params:
+            self_names.add(params[0].arg)
+            params = params[1:]
+
+        defaults = function.args.defaults
+        for param, default in zip(params[len(params) - len(defaults):], defaults):
+            local_env[param.arg] = self.bind(default, self.module_env)
+        for param, default in zip(function.args.kwonlyargs, function.args.kw_defaults):
+            if default is not None:
+                local_env[param.arg] = self.bind(default, self.module_env)
+
+        for param, arg in zip(params, call.args):
+            if isinstance(arg, ast.Starred):
+                break
+            if self.is_self(arg, env):
+                self_names.add(param.arg)
+            else:
+                local_env[param.arg] = self.bind(arg, env)
+        for keyword in call.keywords:
+            if keyword.arg is None:
+                continue
+            if self.is_self(keyword.value, env):
+                self_names.add(keyword.arg)
+            else:
+                local_env[keyword.arg] = self.bind(keyword.value, env)
+
+        local_env['__self__'] = self_names
+        return local_env
+
+    def play_duration(self, call, env) -> float:
+        """self.play 的时长：显式run_time优先，否则为其中最长的动画"""
+        run_time = _keyword(call, 'run_time')
+        if run_time is not None:
+            return self.number(run_time, env, DEFAULT_RUN_TIME, "run_time")
+        lag_ratio = _keyword(call, 'lag_ratio')
+        lag_override = self.value(lag_ratio, env) if lag_ratio is not None else None
+        durations = self.animation_list(call.args, env, lag_override)
+        return max(durations) if durations else DEFAULT_RUN_TIME
+
+    def animation_list(self, args, env, lag_override=None) -> list:
+        """参数列表中各动画的时长，展开 *[...] 和绑定到变量的列表"""
+        durations = []
+        for arg in args:
+            if isinstance(arg, ast.Starred):
+                durations.extend(self.starred_durations(arg.value, env, lag_override))
+            else:
+                durations.append(self.animation_duration(arg, env, lag_override))
+        return durations
+
+    def starred_durations(self, node, env, lag_override) -> list:
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return self.animation_list(node.elts, env, lag_override)
+        if isinstance(node, (ast.ListComp, ast.GeneratorExp)):
+            # 推导式的元素个数一般无法确定，按一个元素计算（对 play 和 AnimationGroup 的最长时长没有影响）
+            generator = node.generators[0]
+            iterable = self.value(generator.iter, env)
+            local_env = dict(env)
+            self.assign(generator.target, _UNKNOWN, local_env)
+            duration = self.animation_duration(node.elt, local_env, lag_override)
+            try:
+                return [duration] * max(1, len(iterable)) if iterable is not _UNKNOWN else [duration]
+            except TypeError:
+                return [duration]
+        binding = env.get(node.id) if isinstance(node, ast.Name) else None
+        if isinstance(binding, _Deferred):
+            return self.starred_durations(binding.node, binding.env, lag_override)
+        return [DEFAULT_RUN_TIME]
+
+    def glyph_count(self, node, env, depth=0) -> int:
+        """
+        文字对象中非空白字符的个数（近似字形数），无法确定时返回0
+
+        支持 VGroup 中的多个文字、Text(...).to_edge(UP) 之类的链式调用，
+        以及返回文字对象的辅助函数（按函数体中的赋值和return语句计算）。
+        """
+        if isinstance(node, ast.Name):
+            binding = env.get(node.id)
+            return self.glyph_count(binding.node, binding.env, depth) if isinstance(binding, _Deferred) else 0
+        if not isinstance(node, ast.Call) or depth >= MAX_CALL_DEPTH:
+            return 0
+
+        name = _call_name(node.func)
+        if name in TEXT_CLASSES:
+            count = 0
+            for arg in node.args:
+                value = self.value(arg, env)
+                if isinstance(value, str):
+                    count += sum(1 for char in value if not char.isspace())
+            return count
+        if name in GROUP_CLASSES:
+            count = 0
+            for arg in node.args:
+                if isinstance(arg, ast.Starred):
+                    count += self.starred_glyph_count(arg.value, env, depth)
+                else:
+                    count += self.glyph_count(arg, env, depth)
+            return count
+
+        function, bound = self.resolve_function(node.func, env)
+        if function is not None:
+            local_env = self.bind_arguments(function, node, env, bound)
+            for statement in function.body:
+                if isinstance(statement, ast.Assign):
+                    value = self.bind(statement.value, local_env)
+                    for target in statement.targets:
+                        self.assign(target, value, local_env)
+                elif isinstance(statement, ast.Return) and statement.value is not None:
+                    return self.glyph_count(statement.value, local_env, depth + 1)
+            return 0
+        # 链式调用返回的仍是同一个对象
+        return self.glyph_count(node.func.value, env, depth) if isinstance(node.func, ast.Attribute) else 0
+
+    def starred_glyph_count(self, node, env, depth) -> int:
+        """VGroup(*[...]) 中各文字对象的字形数之和"""
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return sum(self.glyph_count(element, env, depth) for element in node.elts)
+        if isinstance(node, ast.ListComp) and len(node.generators) == 1:
+            generator = node.generators[0]
+            iterable = self.value(generator.iter, env)
+            if not isinstance(iterable, (list, tuple, range)):
+                return 0
+            count = 0
+            for item in iterable:
+                local_env = dict(env)
+                self.assign(generator.target, item, local_env)
+                count += self.glyph_count(node.elt, local_env, depth)
+            return count
+        binding = env.get(node.id) if isinstance(node, ast.Name) else None
+        if isinstance(binding, _Deferred):
+            return self.starred_glyph_count(binding.node, binding.env, depth)
+        return 0
+
+    def animation_duration(self, node, env, lag_override=None) -> float:
+        """单个动画对象的时长"""
+        if isinstance(node, ast.Name):
+            binding = env.get(node.id)
+            if isinstance(binding, _Deferred):
+                return self.animation_duration(binding.node, binding.env, lag_override)
+            return DEFAULT_RUN_TIME
+        if not isinstance(node, ast.Call):
+            return DEFAULT_RUN_TIME
+
+        name = _call_name(node.func)
+        run_time = _keyword(node, 'run_time')
+        if name == 'set_run_time' and node.args:
+            return self.number(node.args[0], env, DEFAULT_RUN_TIME, "run_time")
+        if run_time is not None:
+            return self.number(run_time, env, DEFAULT_RUN_TIME, "run_time")
+        if name in GROUP_LAG_RATIOS:
+            lag_ratio = _keyword(node, 'lag_ratio')
+            if lag_ratio is not None:
+                lag = self.number(lag_ratio, env, GROUP_LAG_RATIOS[name], "lag_ratio")
+            elif isinstance(lag_override, (int, float)):
+                lag = float(lag_override)
+            else:
+                lag = GROUP_LAG_RATIOS[name]
+            return _group_duration(self.animation_list(node.args, env), lag)
+        if name == 'Wait' and node.args:
+            return self.number(node.args[0], env, DEFAULT_RUN_TIME, "run_time")
+        if name in ANIMATION_RUN_TIMES:
+            return ANIMATION_RUN_TIMES[name]
+        if name == 'Write' and node.args and self.glyph_count(node.args[0], env) >= WRITE_LONG_GLYPHS:
+            return WRITE_LONG_RUN_TIME
+        # mob.animate(run_time=2).shift(UP) 的 run_time 在 animate 的调用上
+        inner = node.func
+        while isinstance(inner, (ast.Attribute, ast.Call)):
+            if isinstance(inner, ast.Call):
+                if _call_name(inner.func) == 'animate' and _keyword(inner, 'run_time') is not None:
+                    return self.number(_keyword(inner, 'run_time'), env, DEFAULT_RUN_TIME, "run_time")
+                inner = inner.func
+            else:
+                inner = inner.value
+        return DEFAULT_RUN_TIME
+
+
+def estimate_scene_durations(source: str, filename: str = "<code>") -> list:
+    """
+    静态估算代码中每个Scene的时长
+
+    Returns:
+        list: 每个场景一项，包含 scene、duration（秒）、play_count、wait_count、warnings
+    """
+    tree = ast.parse(source, filename=filename)
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+    functions = {node.name: node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+
+    # 模块级常量（按顺序求值，后面的常量可以引用前面的）
+    timer = _SceneTimer(classes, functions, {})
+    timer.attributes = {}
+    module_env = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            value = timer.value(node.value, module_env)
+            for target in node.targets:
+                if isinstance(target, ast.Name) and value is not _UNKNOWN:
+                    module_env[target.id] = value
+
+    results = []
+    for scene in find_scene_classes(tree):
+        timer = _SceneTimer(classes, functions, module_env)
+        duration = timer.run(scene)
+        results.append({
+            'scene': scene,
+            'duration': duration,
+            'play_count': timer.play_count,
+            'wait_count': timer.wait_count,
+            'warnings': timer.warnings
+        })
+    return results
+
+
+def estimate_file(file_path: str) -> dict:
+    """
+    估算代码文件中各场景的时长
+
+    Returns:
+        dict: file、scenes（见estimate_scene_durations）、total（所有场景时长之和）、error
+    """
+    result = {'file': file_path, 'scenes': [], 'total': 0.0, 'error': None}
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        result['scenes'] = estimate_scene_durations(source, file_path)
+    except SyntaxError as e:
+        result['error'] = f"代码存在语法错误 (第{e.lineno}行)"
+    except (OSError, UnicodeDecodeError) as e:
+        result['error'] = str(e)
+    result['total'] = sum(scene['duration'] for scene in result['scenes'])
+    return result
+
+
+def estimate_directory(code_dir: str) -> list:
+    """估算目录下所有 *_code.py 的时长（按页码顺序）"""
+    code_files = sorted(glob.glob(os.path.join(code_dir, '*_code.py')), key=get_sort_key)
+    return [estimate_file(code_file) for code_file in code_files]
+
+def strip_wait_padding(source: str) -> str:
+    """去掉 add_wait_time 在末尾补齐的等待和淡出"""
+    return PADDING_PATTERN.sub('', source)
+
+def remove_wait_padding(file_path) -> bool:
+    """移除文件中上次补齐的等待和淡出，返回文件是否有改动"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    stripped = strip_wait_padding(source)
+    if stripped == source:
+        return False
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(stripped)
+    return True
 
 def get_indentation(file_path):
     """
-    获取文件最后一个非空行的缩进
+    获取文件末尾语句应使用的缩进
+
+    优先用AST找到文件中最后结束的函数（通常是最后一个场景的construct），取其函数体的缩进，
+    避免最后一行位于循环或条件内部时补齐的语句被加进代码块里；无法解析时退回最后一个非空行的缩进。
     """
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+            source = f.read()
+        lines = source.splitlines(keepends=True)
+        
+        try:
+            functions = [node for node in ast.walk(ast.parse(source)) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+        except SyntaxError:
+            functions = []
+        if functions:
+            last_function = max(functions, key=lambda node: node.end_lineno)
+            if not any(line.strip() for line in lines[last_function.end_lineno:]):
+                return last_function.body[0].col_offset
         
         # 从后向前查找最后一个非空行
         for line in reversed(lines):
@@ -21,53 +686,26 @@ def get_indentation(file_path):
 
 def extract_animation_times(file_path):
     """
-    从manim代码文件中提取所有self.wait()和self.play()调用的时间总和
+    估算manim代码文件中所有场景的动画和等待时间总和
     
     Args:
         file_path (str): manim代码文件的路径
     
     Returns:
-        float: 所有动画和等待时间的总和
+        float: 所有场景的时长总和，文件无法读取或解析时返回None
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        total_time = 0
-        
-        # 计算wait时间
-        wait_pattern = r'self\.wait\((.*?)\)'
-        wait_calls = re.findall(wait_pattern, content)
-        
-        for wait_arg in wait_calls:
-            if not wait_arg:  # 如果wait()没有参数
-                total_time += 1  # 默认等待时间为1秒
-            else:
-                try:
-                    # 尝试评估参数（处理数字表达式）
-                    wait_time = eval(wait_arg)
-                    total_time += float(wait_time)
-                except:
-                    print(f"警告：无法解析等待时间参数: {wait_arg}")
-                    continue
-        
-        # 计算play次数
-        play_pattern = r'self\.play\('
-        play_calls = re.findall(play_pattern, content)
-        total_time += len(play_calls)  # 每个play算作1秒
-        
-        return total_time
-    
-    except FileNotFoundError:
-        print(f"错误：找不到文件 {file_path}")
-        return None
-    except Exception as e:
-        print(f"错误：处理文件时发生错误: {str(e)}")
+    result = estimate_file(file_path)
+    if result['error']:
+        print(f"错误：处理文件 {file_path} 时发生错误: {result['error']}")
         return None
+    for scene in result['scenes']:
+        for warning in scene['warnings']:
+            print(f"警告：[{scene['scene']}] {warning}")
+    return result['total']
 
-def add_wait_time(file_path, additional_time):
+def add_wait_time(file_path, additional_time, verbose=True):
     """
-    在文件末尾添加额外的wait时间和FadeOut效果
+    在文件末尾添加额外的wait时间和FadeOut效果（带标记注释，再次对齐时可被移除）
     """
     try:
         # 获取当前文件的缩进
@@ -75,49 +713,131 @@ def add_wait_time(file_path, additional_time):
         indent_str = " " * indent
         
         # 在文件末尾添加wait语句和FadeOut效果
-        with open(file_path, 'a') as f:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            source = f.read().rstrip()
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(source)
+            f.write(f"\n{indent_str}{PADDING_MARKER}")
             f.write(f"\n{indent_str}self.wait({additional_time:.2f})")
-            f.write(f"\n{indent_str}self.play(FadeOut(*self.mobjects))")
+            f.write(f"\n{indent_str}self.play(FadeOut(*self.mobjects))\n")
         
-        print(f"已在文件末尾添加：")
-        print(f"1. self.wait({additional_time:.2f})")
-        print(f"2. self.play(FadeOut(*self.mobjects))")
+        if verbose:
+            print(f"已在文件末尾添加：")
+            print(f"1. self.wait({additional_time:.2f})")
+            print(f"2. self.play(FadeOut(*self.mobjects))")
         return True
     except Exception as e:
         print(f"错误：添加动画效果时发生错误: {str(e)}")
         return False
 
+def align_to_duration(file_path, target_duration, dry_run=False) -> dict:
+    """
+    把代码文件的时长对齐到目标时长（如该页讲解音频的时长）
+
+    先移除上次补齐的内容再估算，因此可以重复执行；时长不足时在末尾补齐等待和FadeOut，
+    动画本身比目标更长时不修改文件。
+
+    Returns:
+        dict: file、target、estimated（不含补齐的估算时长）、padding（补齐的等待秒数）、
+              status（padded / ok / too_long / error）、error
+    """
+    result = {'file': file_path, 'target': target_duration, 'estimated': None, 'padding': 0.0, 'status': 'error', 'error': None}
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            source = strip_wait_padding(f.read())
+        scenes = estimate_scene_durations(source, file_path)
+    except SyntaxError as e:
+        result['error'] = f"代码存在语法错误 (第{e.lineno}行)"
+        return result
+    except (OSError, UnicodeDecodeError) as e:
+        result['error'] = str(e)
+        return result
+    if not scenes:
+        result['error'] = "未找到Scene类"
+        return result
+
+    result['estimated'] = sum(scene['duration'] for scene in scenes)
+    difference = target_duration - result['estimated'] - FADE_OUT_TIME
+    if difference > 0.005:
+        result['status'] = 'padded'
+        result['padding'] = difference
+    elif difference < -0.005:
+        result['status'] = 'too_long'
+    else:
+        result['status'] = 'ok'
+    if dry_run:
+        return result
+
+    remove_wait_padding(file_path)
+    if result['status'] == 'padded' and not add_wait_time(file_path, difference, verbose=False):
+        result['status'] = 'error'
+        result['error'] = "补齐等待时间失败"
+    return result
+
+def print_batch_report(results):
+    """打印批量估算结果"""
+    print(f"[LIST] 逐文件估算时长:")
+    for result in results:
+        name = os.path.basename(result['file'])
+        if result['error']:
+            print(f"   [ERR] {name}: {result['error']}")
+            continue
+        warning_count = sum(len(scene['warnings']) for scene in result['scenes'])
+        print(f"   {name}: {result['total']:.2f} 秒{f' ({warning_count} 条警告)' if warning_count else ''}")
+        for scene in result['scenes']:
+            print(f"      • {scene['scene']}: {scene['duration']:.2f} 秒 (play {scene['play_count']} 次，wait {scene['wait_count']} 次)")
+            for warning in scene['warnings']:
+                print(f"        [WARN] {warning}")
+    total = sum(result['total'] for result in results)
+    print(f"[PROG] 共 {len(results)} 个文件，总时长 {total:.2f} 秒")
+
 def main():
-    if len(sys.argv) != 3:
-        print("用法: python wait_time_calculator.py <目标时长（秒）> <manim文件路径>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description='静态估算manim代码的动画时长，并在末尾补齐等待时间以达到目标时长')
+    parser.add_argument('target_duration', nargs='?', type=float, help='目标时长（秒）')
+    parser.add_argument('file_path', nargs='?', help='manim代码文件路径')
+    parser.add_argument('--batch', metavar='CODE_DIR', help='批量估算目录下所有 *_code.py 的时长（不修改文件）')
+    parser.add_argument('--output', help='批量模式下把估算结果保存为JSON')
+    args = parser.parse_args()
     
-    try:
-        target_duration = float(sys.argv[1])
-        file_path = sys.argv[2]
-        
-        total_time = extract_animation_times(file_path)
-        
-        if total_time is not None:
-            print(f"\n分析结果：")
-            print(f"总时长 (wait + play): {total_time:.2f} 秒")
-            print(f"目标时长: {target_duration:.2f} 秒")
-            difference = target_duration - total_time - 1  
-            print(f"时间差值: {difference:.2f} 秒")
-            
-            if difference > 0:
-                print(f"建议：需要增加 {difference:.2f} 秒的时间")
-                # 自动添加额外的wait时间和FadeOut效果
-                if add_wait_time(file_path, difference):
-                    print("✓ 已自动添加所需的等待时间和淡出效果")
-            elif difference < 0:
-                print(f"建议：需要减少 {abs(difference):.2f} 秒的时间")
-            else:
-                print("完美匹配！当前总时长正好达到目标时长")
+    if args.batch:
+        results = estimate_directory(args.batch)
+        if not results:
+            print(f"[WARN]  在 '{args.batch}' 中没有找到 *_code.py 文件")
+            sys.exit(1)
+        print_batch_report(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"[OK] 估算结果已保存到: {args.output}")
+        return
+    
+    if args.target_duration is None or args.file_path is None:
+        parser.error("需要提供 <目标时长（秒）> <manim文件路径>，或使用 --batch CODE_DIR")
     
-    except ValueError:
-        print("错误：目标时长必须是一个有效的数字")
-        sys.exit(1)
+    target_duration = args.target_duration
+    file_path = args.file_path
+    
+    # 重新对齐时先移除上次自动添加的等待和淡出
+    if remove_wait_padding(file_path):
+        print("已移除上次自动添加的等待时间和淡出效果")
+    total_time = extract_animation_times(file_path)
+    
+    if total_time is not None:
+        print(f"\n分析结果：")
+        print(f"总时长 (wait + play): {total_time:.2f} 秒")
+        print(f"目标时长: {target_duration:.2f} 秒")
+        difference = target_duration - total_time - 1  
+        print(f"时间差值: {difference:.2f} 秒")
+        
+        if difference > 0:
+            print(f"建议：需要增加 {difference:.2f} 秒的时间")
+            # 自动添加额外的wait时间和FadeOut效果
+            if add_wait_time(file_path, difference):
+                print("✓ 已自动添加所需的等待时间和淡出效果")
+        elif difference < 0:
+            print(f"建议：需要减少 {abs(difference):.2f} 秒的时间")
+        else:
+            print("完美匹配！当前总时长正好达到目标时长")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()